@@ -181,6 +181,8 @@ TRANSFER_ENCRYPTED_VOLUME = '3.70'
 
 EXTEND_VOLUME_COMPLETION = '3.71'
 
+IMAGE_VOLUME_CACHE_PREWARM = '3.72'
+
 
 def get_mv_header(version):
     """Gets a formatted HTTP microversion header.
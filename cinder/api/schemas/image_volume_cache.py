@@ -0,0 +1,36 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Schema for V3 Image Volume Cache API.
+
+"""
+
+from cinder.api.validation import parameter_types
+
+# The backend is required, so it can't be null
+backend = dict(parameter_types.hostname, type='string')
+
+prewarm = {
+    'type': 'object',
+    'properties': {
+        'image_id': parameter_types.uuid,
+        'host': backend,
+        'cluster_name': backend,
+    },
+    'required': ['image_id'],
+    'oneOf': [
+        {'required': ['host'], 'not': {'required': ['cluster_name']}},
+        {'required': ['cluster_name'], 'not': {'required': ['host']}},
+    ],
+    'additionalProperties': False,
+}
@@ -0,0 +1,45 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The image volume cache api."""
+
+from http import HTTPStatus
+
+from cinder.api import microversions as mv
+from cinder.api.openstack import wsgi
+from cinder.api.schemas import image_volume_cache as schema
+from cinder.api import validation
+from cinder.policies import image_volume_cache as policy
+from cinder import volume
+
+
+class ImageVolumeCacheController(wsgi.Controller):
+
+    def __init__(self, *args, **kwargs):
+        self.volume_api = volume.API()
+        super(ImageVolumeCacheController, self).__init__(*args, **kwargs)
+
+    @wsgi.Controller.api_version(mv.IMAGE_VOLUME_CACHE_PREWARM)
+    @wsgi.response(HTTPStatus.ACCEPTED)
+    @validation.schema(schema.prewarm)
+    def prewarm(self, req, body):
+        """Add an image to the image volume cache of a backend."""
+        ctxt = req.environ['cinder.context']
+        ctxt.authorize(policy.PREWARM_POLICY)
+
+        self.volume_api.prewarm_image_volume_cache(
+            ctxt, body['image_id'], host=body.get('host'),
+            cluster_name=body.get('cluster_name'))
+
+
+def create_resource():
+    return wsgi.Resource(ImageVolumeCacheController())
@@ -35,6 +35,7 @@ from cinder.api.v3 import group_snapshots
 from cinder.api.v3 import group_specs
 from cinder.api.v3 import group_types
 from cinder.api.v3 import groups
+from cinder.api.v3 import image_volume_cache
 from cinder.api.v3 import limits
 from cinder.api.v3 import messages
 from cinder.api.v3 import resource_filters
@@ -316,6 +317,12 @@ class APIRouter(base_wsgi.Router):
                         controller=self.resources['workers'],
                         collection={'cleanup': 'POST'})
 
+        self.resources['image_volume_cache'] = (
+            image_volume_cache.create_resource())
+        mapper.resource('image_volume_cache', 'image_volume_cache',
+                        controller=self.resources['image_volume_cache'],
+                        collection={'prewarm': 'POST'})
+
         self.resources['resource_filters'] = resource_filters.create_resource(
             ext_mgr)
         mapper.resource('resource_filter', 'resource_filters',
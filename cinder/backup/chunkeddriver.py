@@ -22,15 +22,24 @@
 """
 
 import abc
+import collections
+import errno
 import hashlib
+import io
 import json
 import os
+import stat
+import threading
+import time
 
+import futurist
+from futurist import waiters
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_service import loopingcall
 from oslo_utils import excutils
 from oslo_utils import units
+from oslo_utils import uuidutils
 
 from cinder.backup import driver
 from cinder import exception
@@ -55,11 +64,117 @@ backup_opts = [
                         ('bzip2', "Same as 'bz2'"),
                         ('zstd', 'Use the Zstandard compression algorithm')],
                help="Compression algorithm for backups ('none' to disable)"),
+    cfg.IntOpt('backup_compression_level',
+               min=-100,
+               max=22,
+               help='Compression level used by chunked backup drivers. It '
+                    'must be in the range of the algorithm: -1 to 9 for '
+                    'zlib, 1 to 9 for bz2 and -100 to 22 for zstd. When not '
+                    'set the default level of the algorithm is used.'),
+    cfg.IntOpt('backup_compression_threads',
+               default=0,
+               min=0,
+               max=200,
+               help='Number of native threads used to compress each chunk '
+                    'when backup_compression_algorithm is zstd. 0 means one '
+                    'per CPU core. Other algorithms compress a chunk on a '
+                    'single thread, use backup_upload_workers to compress '
+                    'several chunks at a time.'),
+    cfg.FloatOpt('backup_compression_min_ratio',
+                 default=1.0,
+                 min=1.0,
+                 help='Minimum ratio between the size of a chunk and its '
+                      'compressed size for the compressed data to be '
+                      'stored. Chunks that do not compress at least this '
+                      'well are stored uncompressed, so they do not have to '
+                      'be decompressed on restore.'),
+    cfg.BoolOpt('backup_compression_adaptive',
+                default=False,
+                help='Compress a small sample of each chunk first, and '
+                     'store the chunk uncompressed without compressing the '
+                     'rest of it when the sample does not reach '
+                     'backup_compression_min_ratio. This saves CPU time on '
+                     'data that does not compress, such as encrypted '
+                     'volumes, at the cost of compressing the samples.'),
     cfg.BoolOpt('backup_create_containers',
                 default=True,
                 help="Attempt to create new container for supported drivers, "
                      "when it does not exist. When set to False, operator "
                      "must ensure presence of configured container."),
+    cfg.BoolOpt('backup_dedup',
+                default=False,
+                help='Store each distinct chunk of data only once per '
+                     'container for chunked backup drivers. Chunks are '
+                     'identified by their sha256 and reference counted '
+                     'across all the backups in the container, so only '
+                     'chunks that are not already in the container are '
+                     'uploaded, and a chunk is deleted along with the last '
+                     'backup that references it. This only helps when '
+                     'backups share a container. The references are kept '
+                     'in the Cinder database, so containers holding '
+                     'deduplicated backups must not be shared with the '
+                     'backup services of another Cinder deployment, and '
+                     'their deduplicated objects must not be deleted '
+                     'outside of Cinder.'),
+    cfg.IntOpt('backup_upload_workers',
+               default=1,
+               min=1,
+               help='Number of chunks of a single backup that chunked '
+                    'backup drivers compress and upload concurrently. '
+                    'The default of 1 uploads chunks one at a time.'),
+    cfg.IntOpt('backup_sha_workers',
+               default=1,
+               min=1,
+               help='Number of native threads that calculate the sha256 of '
+                    'the blocks of a chunk, each of them hashing a '
+                    'contiguous part of the chunk. The default of 1 hashes '
+                    'chunks on a single thread.'),
+    cfg.IntOpt('backup_restore_workers',
+               default=1,
+               min=1,
+               help='Number of objects of a single restore that chunked '
+                    'backup drivers download and decompress concurrently, '
+                    'ahead of the object being written to the volume. The '
+                    'default of 1 downloads objects one at a time.'),
+    cfg.IntOpt('backup_checkpoint_interval',
+               default=0,
+               min=0,
+               help='Number of chunks after which chunked backup drivers '
+                    'checkpoint the progress of a backup to the backup '
+                    'repository. A backup interrupted by a restart of the '
+                    'backup service is resumed from its last checkpoint, '
+                    'as long as the data being backed up cannot have '
+                    'changed. Only the backup service that was creating '
+                    'the backup resumes it, once it is restarted with the '
+                    'same host. 0 disables checkpoints.'),
+    cfg.IntOpt('backup_buffer_pool_size',
+               default=0,
+               min=0,
+               help='Maximum number of chunk sized buffers used by chunked '
+                    'backup drivers, shared by all the backups and restores '
+                    'of the service. Volume data is read straight into '
+                    'these buffers, which are reused, and backups and '
+                    'restores wait for a free buffer, so the memory used '
+                    'for chunk data does not grow with the number of '
+                    'concurrent operations. It must be at least '
+                    'backup_max_inflight_chunks plus 1 for a backup to use '
+                    'all its upload workers. 0 allocates a new buffer for '
+                    'every chunk.'),
+    cfg.IntOpt('backup_max_inflight_chunks',
+               default=0,
+               min=0,
+               help='Maximum number of chunks of a single backup or restore '
+                    'that may be held in memory waiting to be uploaded or '
+                    'written to the volume. 0 means twice the number of '
+                    'upload or restore workers.'),
+    cfg.IntOpt('backup_max_inflight_memory_mb',
+               default=0,
+               min=0,
+               help='Maximum amount of volume data, in MiB, that a single '
+                    'backup or restore may hold in memory waiting to be '
+                    'uploaded or written to the volume. At least one chunk '
+                    'is always allowed in flight. 0 means no limit other '
+                    'than backup_max_inflight_chunks.'),
 ]
 
 CONF = cfg.CONF
@@ -79,6 +194,50 @@ def _write_nonzero(volume_file, volume_offset, content):
             volume_file.write(chunk.tobytes())
 
 
+def _hole_chunk_length(volume_file, offset, chunk_size):
+    """Return the length of the chunk at `offset` if it's entirely a hole.
+
+    Uses SEEK_DATA to check whether the chunk starting at `offset`, which
+    is truncated at the end of the file, contains any allocated data.
+    Returns 0 if it does, at the end of the file, or when this can't be
+    determined, e.g. because `volume_file` is not a regular file or the
+    filesystem doesn't support SEEK_DATA.
+    """
+    try:
+        fileno = volume_file.fileno()
+        file_stat = os.fstat(fileno)
+    except Exception:
+        return 0
+    if not stat.S_ISREG(file_stat.st_mode) or offset >= file_stat.st_size:
+        return 0
+
+    length = min(chunk_size, file_stat.st_size - offset)
+    # The file object may be buffering data, so leave the file descriptor
+    # where it was.
+    position = os.lseek(fileno, 0, os.SEEK_CUR)
+    try:
+        data_offset = os.lseek(fileno, offset, os.SEEK_DATA)
+    except OSError as exc:
+        # ENXIO means there's no data after offset
+        if exc.errno != errno.ENXIO:
+            return 0
+        data_offset = file_stat.st_size
+    finally:
+        os.lseek(fileno, position, os.SEEK_SET)
+    return length if data_offset >= offset + length else 0
+
+
+def _write_zeros(volume_file, volume_offset, length):
+    """Write `length` bytes of zeros into `volume_file`."""
+    zeros = bytes(min(length, 1024 * 1024))
+    end = volume_offset + length
+    volume_file.seek(volume_offset)
+    while volume_offset < end:
+        size = min(len(zeros), end - volume_offset)
+        volume_file.write(zeros[:size] if size < len(zeros) else zeros)
+        volume_offset += size
+
+
 def _write_volume(volume_is_new, volume_file, volume_offset, content):
     if volume_is_new:
         _write_nonzero(volume_file, volume_offset, content)
@@ -87,6 +246,310 @@ def _write_volume(volume_is_new, volume_file, volume_offset, content):
         volume_file.write(content)
 
 
+def _read_into(volume_file, buf, size):
+    """Read up to `size` bytes of `volume_file` into the bytearray `buf`.
+
+    Returns a read-only memoryview of the data in `buf`, which is empty at
+    the end of the file.  Files that don't support readinto are read the
+    regular way, and a view of the data read is returned instead.
+    """
+    view = memoryview(buf)[:size]
+    try:
+        total = volume_file.readinto(view)
+    except (AttributeError, NotImplementedError, io.UnsupportedOperation):
+        return memoryview(volume_file.read(size))
+    # Raw files may return less data than requested before the end.
+    while total and total < size:
+        read = volume_file.readinto(view[total:])
+        if not read:
+            break
+        total += read
+    return view[:total or 0].toreadonly()
+
+
+class _BufferPool(object):
+    """Bounded pool of reusable chunk buffers.
+
+    Buffers are allocated on demand, up to ``max_buffers``, and kept for
+    reuse once released.  Acquiring a buffer waits while all of them are in
+    use, which bounds the memory used for chunk data by all the backups and
+    restores of the service.
+    """
+
+    def __init__(self, buffer_size, max_buffers):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self._free = []
+        self._semaphore = threading.Semaphore(max_buffers)
+
+    def acquire(self):
+        """Return a _PooledBuffer, waiting for one to be free."""
+        self._semaphore.acquire()
+        buf = self._free.pop() if self._free else bytearray(self.buffer_size)
+        return _PooledBuffer(self, buf)
+
+    def _put(self, buf):
+        self._free.append(buf)
+        self._semaphore.release()
+
+
+class _PooledBuffer(object):
+    """Buffer of a _BufferPool, returned to it once its users release it."""
+
+    def __init__(self, pool, buf):
+        self.buffer = buf
+        self._pool = pool
+        self._users = 1
+        self._lock = threading.Lock()
+
+    def hold(self):
+        """Add a user of the buffer, which must call release."""
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            unused = self._users == 0
+        if unused:
+            self._pool._put(self.buffer)
+
+
+_BUFFER_POOLS = {}
+_BUFFER_POOLS_LOCK = threading.Lock()
+
+
+def _get_buffer_pool(buffer_size):
+    """Return the service wide pool of `buffer_size` buffers, if enabled."""
+    max_buffers = CONF.backup_buffer_pool_size
+    if not max_buffers:
+        return None
+    with _BUFFER_POOLS_LOCK:
+        pool = _BUFFER_POOLS.get(buffer_size)
+        if pool is None or pool.max_buffers != max_buffers:
+            pool = _BUFFER_POOLS[buffer_size] = _BufferPool(buffer_size,
+                                                            max_buffers)
+    return pool
+
+
+def _get_executor(workers):
+    """Return a pool of `workers` threads, or None for a single worker."""
+    if workers <= 1:
+        return None
+    if utils.concurrency_mode_threading():
+        return futurist.ThreadPoolExecutor(workers)
+    return futurist.GreenThreadPoolExecutor(workers)
+
+
+def _calculate_block_shas(data, block_size):
+    """Return the sha256 of each `block_size` block of `data`.
+
+    This function cannot log anything as it is called on a native thread.
+    """
+    # NOTE(geguileo): Using memoryview to avoid data copying when slicing
+    # for the sha256 call.
+    chunk = memoryview(data)
+    sha256 = hashlib.sha256
+    return [sha256(chunk[off:off + block_size]).hexdigest()
+            for off in range(0, len(chunk), block_size)]
+
+
+class _BlockHasher(object):
+    """Calculate the sha256 of the blocks of chunks on several threads.
+
+    The blocks of a chunk are split in one contiguous batch of memoryview
+    slices per worker, and each batch is hashed by a single call on a native
+    thread, where hashlib releases the GIL.  So there's neither a thread
+    dispatch nor a copy per block.
+
+    With a single worker the whole chunk is hashed by one native thread call.
+    """
+
+    def __init__(self, block_size, workers):
+        self.block_size = block_size
+        self.workers = workers
+        self._executor = _get_executor(workers)
+        self._calculate = utils.tpool_wrap(_calculate_block_shas)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def calculate(self, data):
+        """Return the sha256 list of the blocks of `data`."""
+        blocks = -(-len(data) // self.block_size)
+        if self._executor is None or blocks < 2:
+            return self._calculate(data, self.block_size)
+        batch_size = -(-blocks // self.workers) * self.block_size
+        chunk = memoryview(data)
+        futures = [self._executor.submit(self._calculate,
+                                         chunk[off:off + batch_size],
+                                         self.block_size)
+                   for off in range(0, len(chunk), batch_size)]
+        shalist = []
+        for future in futures:
+            shalist.extend(future.result())
+        return shalist
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _ChunkPipeline(object):
+    """Bounded window of chunks processed concurrently.
+
+    Chunks run on a pool of ``workers`` threads (green threads when running
+    under eventlet, since the object readers, writers and compressors are
+    already proxied to native threads).  No more than ``max_chunks`` chunks
+    or ``max_bytes`` bytes are in flight at any time, which bounds the
+    memory used by a single backup or restore, though one chunk is always
+    allowed regardless of its size.
+
+    With a single worker no pool is created and chunks are processed inline.
+    """
+
+    def __init__(self, workers, max_chunks=0, max_bytes=0):
+        self.workers = workers
+        self.max_chunks = max_chunks or 2 * workers
+        self.max_bytes = max_bytes
+        self.inflight_bytes = 0
+        self._pending = collections.deque()
+        self._executor = _get_executor(workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        self.shutdown()
+
+    def _is_full(self, size):
+        if not self._pending:
+            return False
+        if len(self._pending) >= self.max_chunks:
+            return True
+        return bool(self.max_bytes and
+                    self.inflight_bytes + size > self.max_bytes)
+
+    def abort(self):
+        """Cancel queued chunks and wait for the running ones."""
+        for future, _size in self._pending:
+            future.cancel()
+        if self._pending:
+            waiters.wait_for_all([future for future, _size in self._pending])
+        self._pending.clear()
+        self.inflight_bytes = 0
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _ChunkUploader(_ChunkPipeline):
+    """Concurrent chunk uploads for a backup.
+
+    Chunks are submitted in volume order, and submission blocks while the
+    window is full.  The first upload failure is raised from ``submit`` or
+    ``wait``.
+    """
+
+    def _reap(self, block):
+        """Collect finished uploads, waiting for one if block is True."""
+        if block:
+            waiters.wait_for_any([future for future, _size in self._pending])
+        still_pending = collections.deque()
+        error = None
+        while self._pending:
+            future, size = self._pending.popleft()
+            if not future.done():
+                still_pending.append((future, size))
+                continue
+            self.inflight_bytes -= size
+            if error is None and future.exception() is not None:
+                error = future.exception()
+        self._pending = still_pending
+        if error is not None:
+            raise error
+
+    def submit(self, size, func, *args, release=None, **kwargs):
+        """Run func(*args, **kwargs), then call release if given.
+
+        release is called once func is done, including when it fails or is
+        cancelled.
+        """
+        if self._executor is None:
+            try:
+                func(*args, **kwargs)
+            finally:
+                if release is not None:
+                    release()
+            return
+        try:
+            self._reap(block=False)
+            while self._is_full(size):
+                self._reap(block=True)
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if release is not None:
+                    release()
+        if release is not None:
+            future.add_done_callback(lambda _future: release())
+        self._pending.append((future, size))
+        self.inflight_bytes += size
+
+    def wait(self):
+        """Wait for all submitted uploads to finish."""
+        while self._pending:
+            self._reap(block=True)
+
+
+class _ChunkReadAhead(_ChunkPipeline):
+    """Concurrent chunk downloads for a restore.
+
+    ``fetch(item)`` is called for each ``(item, size)`` tuple of ``items``,
+    running ahead of the consumer as far as the window allows, and
+    iterating yields ``(item, fetch(item))`` tuples in the original order.
+    A fetch failure is raised when its result is reached.
+    """
+
+    def __init__(self, fetch, items, workers, max_chunks=0, max_bytes=0):
+        super(_ChunkReadAhead, self).__init__(workers, max_chunks, max_bytes)
+        self._fetch = fetch
+        self._items = items
+
+    def _fetch_item(self, item):
+        return item, self._fetch(item)
+
+    def __iter__(self):
+        if self._executor is None:
+            for item, _size in self._items:
+                yield self._fetch_item(item)
+            return
+
+        items = iter(self._items)
+        next_item = next(items, None)
+        while next_item is not None or self._pending:
+            while next_item is not None and not self._is_full(next_item[1]):
+                item, size = next_item
+                future = self._executor.submit(self._fetch_item, item)
+                self._pending.append((future, size))
+                self.inflight_bytes += size
+                next_item = next(items, None)
+
+            future, size = self._pending[0]
+            result = future.result()
+            self._pending.popleft()
+            self.inflight_bytes -= size
+            yield result
+
+
 # Object writer and reader returned by inheriting classes must not have any
 # logging calls, as well as the compression libraries, as eventlet has a bug
 # (https://github.com/eventlet/eventlet/issues/432) that would result in
@@ -105,7 +568,24 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
     """
 
     DRIVER_VERSION = '1.0.0'
-    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1'}
+    # Version 1.1.0 adds the list of zero filled ranges of the volume that
+    # were skipped, it's only used for backups that have them so they can't
+    # be restored by services that would ignore them.
+    SPARSE_DRIVER_VERSION = '1.1.0'
+    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1',
+                              '1.1.0': '_restore_v1'}
+
+    # Deduplicated chunks are stored as DEDUP_PREFIX<key>_data_<algorithm>,
+    # and every backup referencing them adds a DEDUP_PREFIX<key>_ref_<id>
+    # empty object.
+    DEDUP_PREFIX = 'dedup_'
+
+    # Valid compression levels of each algorithm
+    COMPRESSION_LEVELS = {'zlib': (-1, 9), 'bz2': (1, 9), 'zstd': (-100, 22)}
+    # Adaptive compression samples this many bytes from several places of a
+    # chunk.
+    COMPRESSION_SAMPLE_SIZE = 64 * units.Ki
+    COMPRESSION_SAMPLES = 4
 
     def _get_compressor(self, algorithm):
         try:
@@ -132,6 +612,29 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
         err = _('unsupported compression algorithm: %s') % algorithm
         raise ValueError(err)
 
+    def _get_compression_args(self, algorithm):
+        """Return the extra arguments passed to the compress function."""
+        algorithm = {'gzip': 'zlib',
+                     'bzip2': 'bz2'}.get(algorithm.lower(), algorithm.lower())
+        level = CONF.backup_compression_level
+        if level is not None and algorithm in self.COMPRESSION_LEVELS:
+            min_level, max_level = self.COMPRESSION_LEVELS[algorithm]
+            if not min_level <= level <= max_level:
+                err = (_('backup_compression_level must be between %(min)d '
+                         'and %(max)d for %(algorithm)s compression.') %
+                       {'min': min_level, 'max': max_level,
+                        'algorithm': algorithm})
+                raise ValueError(err)
+        if algorithm == 'zstd':
+            threads = CONF.backup_compression_threads
+            if level is None and not threads:
+                return ()
+            # zstd.compress(data, level, threads), 3 is the default level.
+            return (3 if level is None else level, threads)
+        if level is None or algorithm not in self.COMPRESSION_LEVELS:
+            return ()
+        return (level,)
+
     def __init__(
         self, context, chunk_size_bytes, sha_block_size_bytes,
         backup_default_container, enable_progress_timer,
@@ -149,7 +652,15 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
         self.backup_create_containers = CONF.backup_create_containers
         self.compressor = \
             self._get_compressor(CONF.backup_compression_algorithm)
+        self._compression_args = self._get_compression_args(
+            CONF.backup_compression_algorithm)
+        self.compression_min_ratio = CONF.backup_compression_min_ratio
+        self.compression_adaptive = CONF.backup_compression_adaptive
+        self.backup_dedup = CONF.backup_dedup
         self.support_force_delete = True
+        self.support_changed_extents = True
+        self.checkpoint_interval = CONF.backup_checkpoint_interval
+        self._zero_block_sha = None
 
     def _get_object_writer(self, container, object_name, extra_metadata=None):
         """Return writer proxy-wrapped to execute methods in native thread."""
@@ -270,14 +781,133 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
         filename = '%s_sha256file' % object_name
         return filename
 
+    def _checkpoint_filename(self, backup):
+        object_name = backup['service_metadata']
+        filename = '%s_checkpoint' % object_name
+        return filename
+
+    def _checkpoint_segment_filename(self, backup, segment):
+        return '%s-%05d' % (self._checkpoint_filename(backup), segment)
+
+    @staticmethod
+    def _checkpoint_marks(checkpoint=None):
+        """Return what the checkpoints of a backup have written so far.
+
+        That is the number of segments and the length of the object, hole
+        and sha256 lists they add up to.
+        """
+        if checkpoint is None:
+            return {'segments': 0, 'objects': 0, 'holes': 0, 'sha256s': 0}
+        return {'segments': checkpoint['segments'],
+                'objects': len(checkpoint['objects']),
+                'holes': len(checkpoint['holes']),
+                'sha256s': len(checkpoint['sha256s'])}
+
+    def _write_checkpoint(self, backup, container, object_meta, sha256_list,
+                          offset, marks):
+        """Record the progress of a backup up to `offset` of the volume.
+
+        Every chunk before `offset` must have been stored already. Only what
+        changed since the previous checkpoint, as given by `marks`, is
+        written to a new segment, so all the checkpoints of a backup write
+        about as much as its final metadata. `marks` is updated with the new
+        segment.
+        """
+        holes = object_meta.get('holes', [])
+        sha256_end = min(-(-offset // self.sha_block_size_bytes),
+                         len(sha256_list))
+        # The last hole is extended by the holes right after it.
+        holes_start = max(marks['holes'] - 1, 0)
+        segment = {}
+        segment['objects'] = [marks['objects'],
+                              object_meta['list'][marks['objects']:]]
+        segment['holes'] = [holes_start, holes[holes_start:]]
+        segment['sha256s'] = [marks['sha256s'],
+                              sha256_list[marks['sha256s']:sha256_end]]
+        filename = self._checkpoint_segment_filename(backup,
+                                                     marks['segments'])
+        with self._get_object_writer(container, filename) as writer:
+            writer.write(json.dumps(segment).encode('utf-8'))
+
+        # The checkpoint only references its segments once they are stored.
+        filename = self._checkpoint_filename(backup)
+        checkpoint = {}
+        checkpoint['version'] = self.DRIVER_VERSION
+        checkpoint['backup_id'] = backup['id']
+        checkpoint['chunk_size'] = self.chunk_size_bytes
+        checkpoint['sha_block_size'] = self.sha_block_size_bytes
+        checkpoint['offset'] = offset
+        checkpoint['object_id'] = object_meta['id']
+        checkpoint['segments'] = marks['segments'] + 1
+        checkpoint_json = json.dumps(checkpoint, sort_keys=True)
+        with self._get_object_writer(container, filename) as writer:
+            writer.write(checkpoint_json.encode('utf-8'))
+        marks.update(segments=marks['segments'] + 1,
+                     objects=len(object_meta['list']), holes=len(holes),
+                     sha256s=sha256_end)
+        LOG.debug('Checkpointed backup %(id)s at offset %(offset)d.',
+                  {'id': backup['id'], 'offset': offset})
+
+    def _read_checkpoint(self, backup):
+        """Return the last checkpoint of an interrupted backup, or None.
+
+        The lists of its segments are merged into the returned checkpoint.
+        Checkpoints written with a different chunk or hash block size can't
+        be resumed and are ignored.
+        """
+        if not (self.checkpoint_interval and backup['service_metadata'] and
+                backup['container']):
+            return None
+        container = backup['container']
+        filename = self._checkpoint_filename(backup)
+        try:
+            if filename not in self.get_container_entries(container,
+                                                          filename):
+                return None
+            with self._get_object_reader(container, filename) as reader:
+                checkpoint = json.loads(reader.read().decode('utf-8'))
+            if (checkpoint['backup_id'] != backup['id'] or
+                    checkpoint['chunk_size'] != self.chunk_size_bytes or
+                    checkpoint['sha_block_size'] !=
+                    self.sha_block_size_bytes):
+                LOG.info('Ignoring the checkpoint of backup %s, it was '
+                         'written with a different configuration.',
+                         backup['id'])
+                return None
+            checkpoint.update(objects=[], holes=[], sha256s=[])
+            for index in range(checkpoint['segments']):
+                filename = self._checkpoint_segment_filename(backup, index)
+                with self._get_object_reader(container, filename) as reader:
+                    segment = json.loads(reader.read().decode('utf-8'))
+                for key, (start, values) in segment.items():
+                    checkpoint[key][start:] = values
+        except Exception:
+            LOG.warning('Could not read the checkpoint of backup %s.',
+                        backup['id'], exc_info=True)
+            return None
+        return checkpoint
+
+    def _delete_checkpoint(self, backup, container):
+        filename = self._checkpoint_filename(backup)
+        # Remove the checkpoint before the segments it references.
+        self.delete_object(container, filename)
+        for object_name in self.get_container_entries(container, filename):
+            self.delete_object(container, object_name)
+
+    def can_resume_backup(self, backup):
+        return self._read_checkpoint(backup) is not None
+
     def _write_metadata(self, backup, volume_id, container, object_list,
-                        volume_meta, extra_metadata=None):
+                        volume_meta, extra_metadata=None, holes=None):
         filename = self._metadata_filename(backup)
         LOG.debug('_write_metadata started, container name: %(container)s,'
                   ' metadata filename: %(filename)s.',
                   {'container': container, 'filename': filename})
         metadata = {}
         metadata['version'] = self.DRIVER_VERSION
+        if holes:
+            metadata['version'] = self.SPARSE_DRIVER_VERSION
+            metadata['holes'] = holes
         metadata['backup_id'] = backup['id']
         metadata['volume_id'] = volume_id
         metadata['backup_name'] = backup['display_name']
@@ -340,8 +970,12 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
         LOG.debug('_read_sha256file finished.')
         return sha256file
 
-    def _prepare_backup(self, backup):
-        """Prepare the backup process and return the backup metadata."""
+    def _prepare_backup(self, backup, checkpoint=None):
+        """Prepare the backup process and return the backup metadata.
+
+        When resuming a backup from `checkpoint` its objects names prefix is
+        kept and its metadata is the checkpointed one.
+        """
         volume = self.db.volume_get(self.context, backup.volume_id)
 
         if volume['size'] <= 0:
@@ -350,9 +984,12 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
 
         container = self._create_container(backup)
 
-        object_prefix = self._generate_object_name_prefix(backup)
-        backup.service_metadata = object_prefix
-        backup.save()
+        if checkpoint is None:
+            object_prefix = self._generate_object_name_prefix(backup)
+            backup.service_metadata = object_prefix
+            backup.save()
+        else:
+            object_prefix = backup.service_metadata
 
         volume_size_bytes = volume['size'] * units.Gi
         availability_zone = self.az
@@ -369,6 +1006,12 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
         object_meta = {'id': 1, 'list': [], 'prefix': object_prefix,
                        'volume_meta': None}
         object_sha256 = {'id': 1, 'sha256s': [], 'prefix': object_prefix}
+        if checkpoint is not None:
+            object_meta['id'] = checkpoint['object_id']
+            object_meta['list'] = checkpoint['objects']
+            if checkpoint['holes']:
+                object_meta['holes'] = checkpoint['holes']
+            object_sha256['sha256s'] = checkpoint['sha256s']
         extra_metadata = self.get_extra_metadata(backup, volume)
         if extra_metadata is not None:
             object_meta['extra_metadata'] = extra_metadata
@@ -377,47 +1020,243 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                 volume_size_bytes)
 
     def _backup_chunk(self, backup, container, data, data_offset,
-                      object_meta, extra_metadata):
-        """Backup data chunk based on the object metadata and offset."""
+                      object_meta, extra_metadata, uploader=None,
+                      shalist=None, chunk_buffer=None):
+        """Backup data chunk based on the object metadata and offset.
+
+        The object name and its position in the metadata object list are
+        assigned here, in volume order.  The compression and upload are
+        done inline, or handed over to `uploader` when one is given, in
+        which case the object's metadata entry is completed once the
+        upload finishes.
+
+        When deduplication is enabled the chunk is named after the sha256
+        of its blocks, `shalist`, which is calculated if not provided.
+
+        `data` may be a view of `chunk_buffer`, a pooled buffer which is held
+        until the chunk is stored.
+        """
         object_prefix = object_meta['prefix']
         object_list = object_meta['list']
 
         object_id = object_meta['id']
-        object_name = '%s-%05d' % (object_prefix, object_id)
         obj = {}
-        obj[object_name] = {}
+        if self.backup_dedup:
+            if shalist is None:
+                shalist = utils.tpool_wrap(self._calculate_sha)(data)
+            dedup_key = self._dedup_key(shalist)
+            object_name = self.DEDUP_PREFIX + dedup_key
+            obj[object_name] = {'dedup': dedup_key}
+        else:
+            object_name = '%s-%05d' % (object_prefix, object_id)
+            obj[object_name] = {}
         obj[object_name]['offset'] = data_offset
         obj[object_name]['length'] = len(data)
+        object_list.append(obj)
+        object_id += 1
+        object_meta['list'] = object_list
+        object_meta['id'] = object_id
+
+        release = None
+        if chunk_buffer is not None:
+            chunk_buffer.hold()
+            release = chunk_buffer.release
+        if uploader is None:
+            try:
+                self._upload_chunk(backup, container, object_name, obj, data,
+                                   extra_metadata)
+            finally:
+                if release is not None:
+                    release()
+        else:
+            uploader.submit(len(data), self._upload_chunk, backup,
+                            container, object_name, obj, data,
+                            extra_metadata, release=release)
+
+        utils.cooperative_yield()
+
+    def _upload_chunk(self, backup, container, object_name, obj, data,
+                      extra_metadata):
+        """Compress and store a chunk, completing its metadata entry."""
         LOG.debug('Backing up chunk of data from volume.')
+        entry = dict(obj[object_name])
+        if 'dedup' in entry:
+            entry['object'], algorithm = self._write_dedup_chunk(
+                backup, container, entry['dedup'], data, extra_metadata)
+        else:
+            algorithm = self._write_chunk(container, object_name, data,
+                                          extra_metadata)
+        entry['compression'] = algorithm
+        md5 = utils.tpool_wrap(hashlib.md5)(
+            data, usedforsecurity=False).hexdigest()
+        entry['md5'] = md5
+        LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
+                  {'object_name': object_name, 'md5': md5})
+        # NOTE: Replace the entry instead of adding keys to it, the object
+        # list may be serialized by a progress notification concurrently.
+        obj[object_name] = entry
+
+    def _backup_hole(self, object_meta, data_offset, length):
+        """Record a range of the volume that only contains zeros."""
+        holes = object_meta.setdefault('holes', [])
+        if holes and holes[-1][0] + holes[-1][1] == data_offset:
+            holes[-1][1] += length
+        else:
+            holes.append([data_offset, length])
+        LOG.debug('Skipping %(length)d bytes of zeros at offset %(offset)d.',
+                  {'length': length, 'offset': data_offset})
+
+    def _changed_extents(self, shalist, parent_shalist, length):
+        """Return the (start, end) byte ranges whose sha256 has changed."""
+        extents = []
+        extent_off = -1
+        for idx, sha in enumerate(shalist):
+            if sha != parent_shalist[idx]:
+                if extent_off == -1:
+                    # Start of new extent.
+                    extent_off = idx * self.sha_block_size_bytes
+            elif extent_off != -1:
+                # We've reached the end of extent.
+                extents.append((extent_off, idx * self.sha_block_size_bytes))
+                extent_off = -1
+        # The last extent extends to the end of data buffer.
+        if extent_off != -1:
+            extents.append((extent_off, length))
+        return extents
+
+    def _changed_regions(self, changed_extents, length):
+        """Return the (offset, length) regions to read for changed extents.
+
+        The extents reported by the volume driver are merged, aligned to
+        sha256 blocks, limited to the first `length` bytes of the volume and
+        split in chunks.
+        """
+        block_size = self.sha_block_size_bytes
+        merged = []
+        for offset, extent_length in sorted(changed_extents):
+            start = offset // block_size * block_size
+            end = min(-(-(offset + extent_length) // block_size) * block_size,
+                      length)
+            if start >= end:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        regions = collections.deque()
+        for start, end in merged:
+            for offset in range(start, end, self.chunk_size_bytes):
+                regions.append(
+                    (offset, min(self.chunk_size_bytes, end - offset)))
+        return regions
+
+    def _zero_block_shas(self, length):
+        """Return the sha256 list of `length` bytes of zeros."""
+        block_size = self.sha_block_size_bytes
+        if self._zero_block_sha is None:
+            self._zero_block_sha = hashlib.sha256(
+                bytes(block_size)).hexdigest()
+        shalist = [self._zero_block_sha] * (length // block_size)
+        if length % block_size:
+            shalist.append(
+                hashlib.sha256(bytes(length % block_size)).hexdigest())
+        return shalist
+
+    def _write_chunk(self, container, object_name, data, extra_metadata):
+        """Compress and store a chunk, returning the algorithm used."""
         algorithm, output_data = self._prepare_output_data(data)
-        obj[object_name]['compression'] = algorithm
         LOG.debug('About to put_object')
         with self._get_object_writer(
                 container, object_name, extra_metadata=extra_metadata
         ) as writer:
             writer.write(output_data)
-        md5 = utils.tpool_wrap(hashlib.md5)(
-            data, usedforsecurity=False).hexdigest()
-        obj[object_name]['md5'] = md5
-        LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
-                  {'object_name': object_name, 'md5': md5})
-        object_list.append(obj)
-        object_id += 1
-        object_meta['list'] = object_list
-        object_meta['id'] = object_id
+        return algorithm
 
-        utils.cooperative_yield()
+    def _dedup_key(self, shalist):
+        """Return the key of a chunk from the sha256 of its blocks."""
+        return hashlib.sha256(''.join(shalist).encode('utf-8')).hexdigest()
+
+    def _write_dedup_chunk(self, backup, container, dedup_key, data,
+                           extra_metadata):
+        """Reference a deduplicated chunk, storing it if it's not there yet.
+
+        Returns the name of the object holding the chunk and the
+        compression algorithm used to store it.
+        """
+        while True:
+            chunk = self.db.backup_dedup_chunk_reference(
+                self.context, container, dedup_key, backup['id'])
+            if chunk is not None:
+                LOG.debug('Chunk %(key)s is already stored as %(name)s.',
+                          {'key': dedup_key, 'name': chunk.object_name})
+                return chunk.object_name, chunk.compression
+
+            # Each stored copy of a chunk has its own object, so a release
+            # deleting a previous copy of the chunk never deletes this one.
+            algorithm, output_data = self._prepare_output_data(data)
+            object_name = '%s%s_data_%s' % (self.DEDUP_PREFIX, dedup_key,
+                                            uuidutils.generate_uuid())
+            with self._get_object_writer(
+                    container, object_name, extra_metadata=extra_metadata
+            ) as writer:
+                writer.write(output_data)
+            try:
+                self.db.backup_dedup_chunk_create(
+                    self.context, container, dedup_key, backup['id'],
+                    object_name, algorithm)
+                return object_name, algorithm
+            except exception.BackupDedupChunkExists:
+                LOG.debug('Chunk %s was stored concurrently, referencing '
+                          'it instead.', dedup_key)
+                self.delete_object(container, object_name)
+
+    def _release_dedup_chunks(self, backup):
+        """Drop the backup's references to deduplicated chunks.
+
+        Chunks that are no longer referenced by any backup are deleted.
+        References are kept in the database, which also covers backups that
+        didn't complete and have no metadata.
+        """
+        container = backup['container']
+        for object_name in self.db.backup_dedup_chunks_release(
+                self.context, backup['id']):
+            self.delete_object(container, object_name)
+            LOG.debug('deleted unreferenced chunk: %(object_name)s'
+                      ' in container: %(container)s.',
+                      {'object_name': object_name,
+                       'container': container})
+            utils.cooperative_yield()
+
+    def _compression_effective(self, data_size_bytes, comp_size_bytes):
+        return comp_size_bytes * self.compression_min_ratio < data_size_bytes
+
+    def _sample_compresses(self, data):
+        """Estimate from samples of data whether compressing it pays off."""
+        sample_size = self.COMPRESSION_SAMPLE_SIZE
+        samples = self.COMPRESSION_SAMPLES
+        if len(data) <= sample_size * samples:
+            return True
+        step = len(data) // samples
+        sample = b''.join(data[offset:offset + sample_size]
+                          for offset in range(0, step * samples, step))
+        compressed = self.compressor.compress(sample, *self._compression_args)
+        return self._compression_effective(len(sample), len(compressed))
 
     def _prepare_output_data(self, data):
         if self.compressor is None:
             return 'none', data
         data_size_bytes = len(data)
+        if self.compression_adaptive and not self._sample_compresses(data):
+            LOG.debug('Compression of a sample of this chunk was '
+                      'ineffective, using original data for this chunk.')
+            return 'none', data
         # Execute compression in native thread so it doesn't prevent
         # cooperative greenthread switching.
-        compressed_data = self.compressor.compress(data)
+        compressed_data = self.compressor.compress(data,
+                                                   *self._compression_args)
         comp_size_bytes = len(compressed_data)
         algorithm = CONF.backup_compression_algorithm.lower()
-        if comp_size_bytes >= data_size_bytes:
+        if not self._compression_effective(data_size_bytes, comp_size_bytes):
             LOG.debug('Compression of this chunk was ineffective: '
                       'original length: %(data_size_bytes)d, '
                       'compressed length: %(compressed_size_bytes)d. '
@@ -450,7 +1289,8 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                              container,
                              object_list,
                              volume_meta,
-                             extra_metadata)
+                             extra_metadata,
+                             object_meta.get('holes'))
         # NOTE(whoami-rajat) : The object_id variable is used to name
         # the backup objects and hence differs from the object_count
         # variable, therefore the increment of object_id value in the last
@@ -475,6 +1315,20 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
 
         object_meta["volume_meta"] = json_meta
 
+    def _get_chunk_uploader(self):
+        """Return the pipeline used to upload the chunks of a backup."""
+        return _ChunkUploader(CONF.backup_upload_workers,
+                              max_chunks=CONF.backup_max_inflight_chunks,
+                              max_bytes=(CONF.backup_max_inflight_memory_mb *
+                                         units.Mi))
+
+    def _get_chunk_read_ahead(self, fetch, items):
+        """Return the pipeline used to download the objects of a restore."""
+        return _ChunkReadAhead(fetch, items, CONF.backup_restore_workers,
+                               max_chunks=CONF.backup_max_inflight_chunks,
+                               max_bytes=(CONF.backup_max_inflight_memory_mb *
+                                          units.Mi))
+
     def _send_progress_end(self, context, backup, object_meta):
         object_meta['backup_percent'] = 100
         volume_utils.notify_about_backup_usage(context,
@@ -493,30 +1347,40 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                                                extra_usage_info=
                                                object_meta)
 
+    def _send_restore_progress_notification(self, context, backup,
+                                            restored_bytes, total_bytes,
+                                            elapsed):
+        restore_info = {
+            'restore_percent': (restored_bytes * 100 / total_bytes
+                                if total_bytes else 100),
+            'restored_bytes': restored_bytes,
+            'restore_rate': int(restored_bytes / elapsed) if elapsed else 0,
+        }
+        volume_utils.notify_about_backup_usage(context,
+                                               backup,
+                                               "restoreprogress",
+                                               extra_usage_info=
+                                               restore_info)
+
     def _calculate_sha(self, data):
         """Calculate SHA256 of a data chunk.
 
         This method cannot log anything as it is called on a native thread.
         """
-        # NOTE(geguileo): Using memoryview to avoid data copying when slicing
-        # for the sha256 call.
-        chunk = memoryview(data)
-        shalist = []
-        off = 0
-        datalen = len(chunk)
-        while off < datalen:
-            chunk_end = min(datalen, off + self.sha_block_size_bytes)
-            block = chunk[off:chunk_end]
-            sha = hashlib.sha256(block).hexdigest()
-            shalist.append(sha)
-            off += self.sha_block_size_bytes
-        return shalist
+        return _calculate_block_shas(data, self.sha_block_size_bytes)
 
-    def backup(self, backup, volume_file, backup_metadata=True):
+    def _get_block_hasher(self):
+        return _BlockHasher(self.sha_block_size_bytes,
+                            CONF.backup_sha_workers)
+
+    def backup(self, backup, volume_file, backup_metadata=True,
+               changed_extents=None):
         """Backup the given volume.
 
            If backup['parent_id'] is given, then an incremental backup
-           is performed.
+           is performed. In that case changed_extents, the [offset, length]
+           ranges of the volume changed since the parent backup, limits the
+           data read from volume_file to those ranges.
         """
         if self.chunk_size_bytes % self.sha_block_size_bytes:
             err = _('Chunk size is not multiple of '
@@ -547,8 +1411,17 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                         'backup. Do a full backup.')
                 raise exception.InvalidBackup(reason=err)
 
+        checkpoint = self._read_checkpoint(backup)
+        checkpoint_marks = self._checkpoint_marks(checkpoint)
+        resume_offset = 0
+        if checkpoint is not None:
+            resume_offset = checkpoint['offset']
+            LOG.info('Resuming backup %(id)s from offset %(offset)d.',
+                     {'id': backup.id, 'offset': resume_offset})
+            volume_file.seek(resume_offset)
+
         (object_meta, object_sha256, extra_metadata, container,
-         volume_size_bytes) = self._prepare_backup(backup)
+         volume_size_bytes) = self._prepare_backup(backup, checkpoint)
 
         counter = 0
         total_block_sent_num = 0
@@ -569,80 +1442,145 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
             timer.start(interval=self.backup_timer_interval)
 
         sha256_list = object_sha256['sha256s']
-        shaindex = 0
+        block_size = self.sha_block_size_bytes
+        regions = None
+        if parent_backup and changed_extents is not None:
+            # Only the changed regions are read, the sha256 of the other
+            # blocks are the same as in the parent backup.
+            sha256_list.extend(parent_backup_shalist[len(sha256_list):])
+            regions = self._changed_regions(
+                changed_extents, len(parent_backup_shalist) * block_size)
+            while regions and regions[0][0] < resume_offset:
+                regions.popleft()
+            LOG.debug('Backing up %(size)d changed bytes of %(id)s.',
+                      {'size': sum(length for _offset, length in regions),
+                       'id': backup.id})
         is_backup_canceled = False
-        while True:
-            # First of all, we check the status of this backup. If it
-            # has been changed to delete or has been deleted, we cancel the
-            # backup process to do forcing delete.
-            with backup.as_read_deleted():
-                backup.refresh()
-            if backup.status in (fields.BackupStatus.DELETING,
-                                 fields.BackupStatus.DELETED):
-                is_backup_canceled = True
-                # To avoid the chunk left when deletion complete, need to
-                # clean up the object of chunk again.
-                self.delete_backup(backup)
-                LOG.debug('Cancel the backup process of %s.', backup.id)
-                break
-            data_offset = volume_file.tell()
-            read_bytes = self.chunk_size_bytes
-            data = volume_file.read(read_bytes)
-
-            if data == b'':
-                break
-
-            # Calculate new shas with the datablock.
-            shalist = utils.tpool_wrap(self._calculate_sha)(data)
-            sha256_list.extend(shalist)
-
-            # If parent_backup is not None, that means an incremental
-            # backup will be performed.
-            if parent_backup:
-                # Find the extent that needs to be backed up.
-                extent_off = -1
-                for idx, sha in enumerate(shalist):
-                    if sha != parent_backup_shalist[shaindex]:
-                        if extent_off == -1:
-                            # Start of new extent.
-                            extent_off = idx * self.sha_block_size_bytes
+        throttle = self._get_io_throttle(backup.volume_id)
+        checkpointed = checkpoint is not None
+        unchecked_chunks = 0
+        buffer_pool = _get_buffer_pool(self.chunk_size_bytes)
+        with self._get_chunk_uploader() as uploader, \
+                self._get_block_hasher() as hasher:
+            while True:
+                # First of all, we check the status of this backup. If it
+                # has been changed to delete or has been deleted, we cancel the
+                # backup process to do forcing delete.
+                with backup.as_read_deleted():
+                    backup.refresh()
+                if backup.status in (fields.BackupStatus.DELETING,
+                                     fields.BackupStatus.DELETED):
+                    is_backup_canceled = True
+                    # Wait for the uploads already in flight so the cleanup
+                    # below doesn't race with them.
+                    uploader.abort()
+                    # To avoid the chunk left when deletion complete, need to
+                    # clean up the object of chunk again.
+                    self.delete_backup(backup)
+                    LOG.debug('Cancel the backup process of %s.', backup.id)
+                    break
+                if regions is None:
+                    data_offset = volume_file.tell()
+                    read_bytes = self.chunk_size_bytes
+                elif regions:
+                    data_offset, read_bytes = regions.popleft()
+                    volume_file.seek(data_offset)
+                else:
+                    break
+                hole_length = _hole_chunk_length(volume_file, data_offset,
+                                                 read_bytes)
+                chunk_buffer = None
+                try:
+                    if hole_length:
+                        # The whole chunk is unallocated, skip reading it.
+                        volume_file.seek(data_offset + hole_length)
+                        data = None
+                        data_length = hole_length
+                        shalist = self._zero_block_shas(hole_length)
                     else:
-                        if extent_off != -1:
-                            # We've reached the end of extent.
-                            extent_end = idx * self.sha_block_size_bytes
-                            segment = data[extent_off:extent_end]
-                            self._backup_chunk(backup, container, segment,
-                                               data_offset + extent_off,
-                                               object_meta,
-                                               extra_metadata)
-                            extent_off = -1
-                    shaindex += 1
-
-                # The last extent extends to the end of data buffer.
-                if extent_off != -1:
-                    extent_end = len(data)
-                    segment = data[extent_off:extent_end]
-                    self._backup_chunk(backup, container, segment,
-                                       data_offset + extent_off,
-                                       object_meta, extra_metadata)
-                    extent_off = -1
-            else:  # Do a full backup.
-                self._backup_chunk(backup, container, data, data_offset,
-                                   object_meta, extra_metadata)
-
-            # Notifications
-            total_block_sent_num += self.data_block_num
-            counter += 1
-            if counter == self.data_block_num:
-                # Send the notification to Ceilometer when the chunk
-                # number reaches the data_block_num.  The backup percentage
-                # is put in the metadata as the extra information.
-                self._send_progress_notification(self.context, backup,
-                                                 object_meta,
-                                                 total_block_sent_num,
-                                                 volume_size_bytes)
-                # Reset the counter
-                counter = 0
+                        if buffer_pool is None:
+                            data = volume_file.read(read_bytes)
+                        else:
+                            # Read straight into a reusable buffer, which is
+                            # referenced without copies until the chunk is
+                            # stored.
+                            chunk_buffer = buffer_pool.acquire()
+                            data = _read_into(volume_file, chunk_buffer.buffer,
+                                              read_bytes)
+
+                        if not data:
+                            break
+
+                        data_length = len(data)
+                        throttle(data_length)
+                        # Calculate new shas with the datablock.
+                        shalist = hasher.calculate(data)
+                    shaindex = data_offset // block_size
+                    sha256_list[shaindex:shaindex + len(shalist)] = shalist
+
+                    # If parent_backup is not None, that means an incremental
+                    # backup will be performed.
+                    if parent_backup:
+                        # Find the extents that need to be backed up.
+                        extents = self._changed_extents(
+                            shalist,
+                            parent_backup_shalist[shaindex:
+                                                  shaindex + len(shalist)],
+                            data_length)
+                    else:  # Do a full backup.
+                        extents = [(0, data_length)]
+
+                    for extent_off, extent_end in extents:
+                        if data is None or volume_utils.is_all_zero(
+                                memoryview(data)[extent_off:extent_end]):
+                            self._backup_hole(object_meta,
+                                              data_offset + extent_off,
+                                              extent_end - extent_off)
+                            continue
+                        if extent_off == 0 and extent_end == data_length:
+                            segment = data
+                        else:
+                            segment = memoryview(data)[extent_off:extent_end]
+                        self._backup_chunk(
+                            backup, container, segment,
+                            data_offset + extent_off, object_meta,
+                            extra_metadata, uploader,
+                            shalist[extent_off // block_size:
+                                    -(-extent_end // block_size)],
+                            chunk_buffer)
+                finally:
+                    if chunk_buffer is not None:
+                        chunk_buffer.release()
+
+                unchecked_chunks += 1
+                if (self.checkpoint_interval and
+                        unchecked_chunks >= self.checkpoint_interval):
+                    # The checkpoint may only reference stored chunks.
+                    uploader.wait()
+                    self._write_checkpoint(backup, container, object_meta,
+                                           sha256_list,
+                                           data_offset + data_length,
+                                           checkpoint_marks)
+                    checkpointed = True
+                    unchecked_chunks = 0
+
+                # Notifications
+                total_block_sent_num += self.data_block_num
+                counter += 1
+                if counter == self.data_block_num:
+                    # Send the notification to Ceilometer when the chunk
+                    # number reaches the data_block_num.  The backup percentage
+                    # is put in the metadata as the extra information.
+                    self._send_progress_notification(self.context, backup,
+                                                     object_meta,
+                                                     total_block_sent_num,
+                                                     volume_size_bytes)
+                    # Reset the counter
+                    counter = 0
+
+            # Make sure every chunk has been stored before writing the
+            # metadata that references them.
+            uploader.wait()
 
         # Stop the timer.
         timer.stop()
@@ -664,6 +1602,8 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                     self.delete_backup(backup)
 
         self._finalize_backup(backup, container, object_meta, object_sha256)
+        if checkpointed:
+            self._delete_checkpoint(backup, container)
 
     def _restore_v1(self, backup, volume_id, metadata, volume_file,
                     volume_is_new, requested_backup):
@@ -680,26 +1620,24 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
         metadata_objects = metadata['objects']
         metadata_object_names = []
         for obj in metadata_objects:
-            metadata_object_names.extend(obj.keys())
+            # Deduplicated chunks are shared with other backups and stored
+            # outside of the backup's prefix.
+            metadata_object_names.extend(
+                name for name, entry in obj.items() if 'dedup' not in entry)
         LOG.debug('metadata_object_names = %s.', metadata_object_names)
         prune_list = [self._metadata_filename(backup),
                       self._sha256_filename(backup)]
+        checkpoint_name = self._checkpoint_filename(backup)
         object_names = [object_name for object_name in
                         self._generate_object_names(backup)
-                        if object_name not in prune_list]
+                        if object_name not in prune_list and
+                        not object_name.startswith(checkpoint_name)]
         if sorted(object_names) != sorted(metadata_object_names):
             err = _('restore_backup aborted, actual object list '
                     'does not match object list stored in metadata.')
             raise exception.InvalidBackup(reason=err)
 
-        for metadata_object in metadata_objects:
-            # Abort when status changes to error, available, or anything else
-            with requested_backup.as_read_deleted():
-                requested_backup.refresh()
-            if requested_backup.status != fields.BackupStatus.RESTORING:
-                raise exception.BackupRestoreCancel(back_id=backup.id,
-                                                    vol_id=volume_id)
-
+        def _fetch(metadata_object):
             object_name, obj = list(metadata_object.items())[0]
             LOG.debug('restoring object. backup: %(backup_id)s, '
                       'container: %(container)s, object name: '
@@ -710,45 +1648,110 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                           'object_name': object_name,
                           'volume_id': volume_id,
                       })
-
-            with self._get_object_reader(
-                    container, object_name,
-                    extra_metadata=extra_metadata) as reader:
-                body = reader.read()
-            compression_algorithm = metadata_object[object_name]['compression']
-            decompressor = self._get_compressor(compression_algorithm)
-            if decompressor is not None:
-                LOG.debug('decompressing data using %s algorithm',
-                          compression_algorithm)
-                decompressed = decompressor.decompress(body)
-                body = None  # Allow Python to free it
-                _write_volume(volume_is_new,
-                              volume_file, obj['offset'], decompressed)
-                decompressed = None  # Allow Python to free it
-            else:
-                _write_volume(volume_is_new,
-                              volume_file, obj['offset'], body)
+            return self._fetch_chunk(container,
+                                     obj.get('object', object_name), obj,
+                                     extra_metadata)
+
+        total_bytes = sum(list(metadata_object.values())[0]['length']
+                          for metadata_object in metadata_objects)
+        throttle = self._get_io_throttle(volume_id)
+        restored_bytes = 0
+        counter = 0
+        start_time = time.monotonic()
+        read_ahead = self._get_chunk_read_ahead(
+            _fetch,
+            [(metadata_object, list(metadata_object.values())[0]['length'])
+             for metadata_object in metadata_objects])
+        with read_ahead:
+            for metadata_object, body in read_ahead:
+                # Abort when status changes to error, available, or anything
+                # else
+                with requested_backup.as_read_deleted():
+                    requested_backup.refresh()
+                if requested_backup.status != fields.BackupStatus.RESTORING:
+                    raise exception.BackupRestoreCancel(back_id=backup.id,
+                                                        vol_id=volume_id)
+
+                obj = list(metadata_object.values())[0]
+                throttle(obj['length'])
+                _write_volume(volume_is_new, volume_file, obj['offset'], body)
                 body = None  # Allow Python to free it
 
-            # force flush every write to avoid long blocking write on close
-            volume_file.flush()
+                # force flush every write to avoid long blocking write on
+                # close
+                volume_file.flush()
+
+                # Be tolerant to IO implementations that do not support
+                # fileno()
+                try:
+                    fileno = volume_file.fileno()
+                except IOError:
+                    LOG.debug("volume_file does not support fileno() so "
+                              "skipping fsync()")
+                else:
+                    os.fsync(fileno)
+
+                restored_bytes += obj['length']
+                counter += 1
+                if counter == self.data_block_num:
+                    self._send_restore_progress_notification(
+                        self.context, requested_backup, restored_bytes,
+                        total_bytes, time.monotonic() - start_time)
+                    counter = 0
+
+                # Restoring a backup to a volume can take some time. Yield so
+                # other threads can run, allowing for among other things the
+                # service status to be updated
+                utils.cooperative_yield()
 
-            # Be tolerant to IO implementations that do not support fileno()
-            try:
-                fileno = volume_file.fileno()
-            except IOError:
-                LOG.debug("volume_file does not support fileno() so skipping "
-                          "fsync()")
-            else:
-                os.fsync(fileno)
+        # A new volume is already zeroed, unless an earlier backup in the
+        # chain has written data there.
+        if not (volume_is_new and not backup.parent_id):
+            for hole_offset, hole_length in metadata.get('holes', []):
+                throttle(hole_length)
+                _write_zeros(volume_file, hole_offset, hole_length)
+                utils.cooperative_yield()
+            volume_file.flush()
 
-            # Restoring a backup to a volume can take some time. Yield so other
-            # threads can run, allowing for among other things the service
-            # status to be updated
-            utils.cooperative_yield()
+        self._send_restore_progress_notification(
+            self.context, requested_backup, restored_bytes, total_bytes,
+            time.monotonic() - start_time)
         LOG.debug('v1 volume backup restore of %s finished.',
                   backup_id)
 
+    def _fetch_chunk(self, container, object_name, obj, extra_metadata):
+        """Download an object and return its decompressed contents.
+
+        Compressed objects are read into a pooled buffer, when the buffer
+        pool is enabled, and decompressed from there.
+        """
+        compression_algorithm = obj['compression']
+        decompressor = self._get_compressor(compression_algorithm)
+        buffer_pool = _get_buffer_pool(self.chunk_size_bytes)
+        # A compressed object is smaller than its data.
+        if (decompressor is None or buffer_pool is None or
+                obj['length'] > buffer_pool.buffer_size):
+            chunk_buffer = None
+        else:
+            chunk_buffer = buffer_pool.acquire()
+        try:
+            with self._get_object_reader(
+                    container, object_name,
+                    extra_metadata=extra_metadata) as reader:
+                if chunk_buffer is None:
+                    body = reader.read()
+                else:
+                    body = _read_into(reader, chunk_buffer.buffer,
+                                      obj['length'])
+            if decompressor is None:
+                return body
+            LOG.debug('decompressing data using %s algorithm',
+                      compression_algorithm)
+            return decompressor.decompress(body)
+        finally:
+            if chunk_buffer is not None:
+                chunk_buffer.release()
+
     def restore(self, backup, volume_id, volume_file, volume_is_new):
         """Restore the given volume backup from backup repository.
 
@@ -825,6 +1828,7 @@ class ChunkedBackupDriver(driver.BackupDriver, metaclass=abc.ABCMeta):
                    'pre': object_prefix})
 
         if container is not None and object_prefix is not None:
+            self._release_dedup_chunks(backup)
             object_names = []
             try:
                 object_names = self._generate_object_names(backup)
@@ -16,6 +16,8 @@
 """Base class for all backup drivers."""
 
 import abc
+import functools
+import threading
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -24,6 +26,8 @@ from oslo_serialization import jsonutils
 from cinder.db import base
 from cinder import exception
 from cinder.i18n import _
+from cinder.volume import throttling
+from cinder.volume import volume_utils
 
 backup_opts = [
     cfg.IntOpt('backup_metadata_version', default=2,
@@ -38,6 +42,31 @@ backup_opts = [
                default=120,
                help='Interval, in seconds, between two progress notifications '
                     'reporting the backup status'),
+    cfg.IntOpt('backup_bps_limit',
+               default=0,
+               min=0,
+               help='Maximum bytes per second read from or written to volumes '
+                    'by all the backups and restores of the backup service. '
+                    'Concurrent backups and restores share it fairly. '
+                    '0 means unlimited.'),
+    cfg.IntOpt('backup_iops_limit',
+               default=0,
+               min=0,
+               help='Maximum volume read or write operations per second of '
+                    'all the backups and restores of the backup service. '
+                    '0 means unlimited.'),
+    cfg.IntOpt('backup_backend_bps_limit',
+               default=0,
+               min=0,
+               help='Maximum bytes per second read from or written to the '
+                    'volumes of each volume backend by the backups and '
+                    'restores of the backup service. 0 means unlimited.'),
+    cfg.IntOpt('backup_backend_iops_limit',
+               default=0,
+               min=0,
+               help='Maximum volume read or write operations per second of '
+                    'the backups and restores of the backup service on each '
+                    'volume backend. 0 means unlimited.'),
 ]
 
 CONF = cfg.CONF
@@ -45,6 +74,22 @@ CONF.register_opts(backup_opts)
 
 LOG = logging.getLogger(__name__)
 
+_THROTTLE = None
+_THROTTLE_LOCK = threading.Lock()
+
+
+def get_throttle():
+    """Return the IO throttle shared by the backups and restores."""
+    global _THROTTLE
+    with _THROTTLE_LOCK:
+        if _THROTTLE is None:
+            _THROTTLE = throttling.StreamThrottle(
+                bps_limit=CONF.backup_bps_limit,
+                iops_limit=CONF.backup_iops_limit,
+                backend_bps_limit=CONF.backup_backend_bps_limit,
+                backend_iops_limit=CONF.backup_backend_iops_limit)
+        return _THROTTLE
+
 
 class BackupMetadataAPI(base.Base):
 
@@ -355,10 +400,28 @@ class BackupDriver(base.Base, metaclass=abc.ABCMeta):
         # deletion. So it should be set to True if the driver that inherits
         # from BackupDriver supports the force deletion function.
         self.support_force_delete = False
+        # This flag indicates if the backup method of the driver accepts a
+        # changed_extents argument, the byte ranges of the volume that
+        # changed since the snapshot the parent backup was taken from.
+        self.support_changed_extents = False
 
     def get_metadata(self, volume_id):
         return self.backup_meta_api.get(volume_id)
 
+    def _get_io_throttle(self, volume_id):
+        """Return a function throttling the IO on the given volume.
+
+        The function takes the number of bytes read or written by an
+        operation and waits until the operation fits the bandwidth and IOPS
+        budgets of the service and of the volume's backend.
+        """
+        try:
+            host = self.db.volume_get(self.context, volume_id)['host']
+        except exception.VolumeNotFound:
+            host = None
+        backend = volume_utils.extract_host(host, 'backend') if host else None
+        return functools.partial(get_throttle().consume, backend)
+
     def put_metadata(self, volume_id, json_metadata):
         self.backup_meta_api.put(volume_id, json_metadata)
 
@@ -425,6 +488,18 @@ class BackupDriver(base.Base, metaclass=abc.ABCMeta):
         """
         return
 
+    def can_resume_backup(self, backup):
+        """Return whether an interrupted backup can be resumed.
+
+        Drivers that checkpoint the progress of their backups return True
+        when a checkpoint of the given backup exists, in which case calling
+        backup again continues it from that checkpoint.
+
+        :param backup: backup object that was being created
+        :returns: bool
+        """
+        return False
+
     def check_for_setup_error(self):
         """Method for checking if backup backend is successfully installed.
 
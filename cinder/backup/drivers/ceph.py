@@ -50,7 +50,7 @@ import subprocess
 import tempfile
 import textwrap
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import eventlet
 from os_brick.initiator import linuxrbd
@@ -436,8 +436,13 @@ class CephBackupDriver(driver.BackupDriver):
                        dest: linuxrbd.RBDVolumeIOWrapper,
                        dest_name: str,
                        length: int,
-                       discard_zeros: bool = False) -> None:
-        """Transfer data between files (Python IO objects)."""
+                       discard_zeros: bool = False,
+                       throttle: Optional[Callable] = None) -> None:
+        """Transfer data between files (Python IO objects).
+
+        When given, throttle is called with the size of every chunk before
+        transferring it.
+        """
         LOG.debug("Transferring data between '%(src)s' and '%(dest)s'",
                   {'src': src_name, 'dest': dest_name})
 
@@ -447,6 +452,8 @@ class CephBackupDriver(driver.BackupDriver):
 
         for chunk in range(0, chunks):
             before = time.time()
+            if throttle:
+                throttle(self.chunk_size)
             data = src.read(self.chunk_size)
             # If we have reach end of source, discard any extraneous bytes from
             # destination volume if trim is enabled and stop writing.
@@ -478,6 +485,8 @@ class CephBackupDriver(driver.BackupDriver):
         rem = int(length % self.chunk_size)
         if rem:
             LOG.debug("Transferring remaining %s bytes", rem)
+            if throttle:
+                throttle(rem)
             data = src.read(rem)
             if data == b'':
                 if CONF.restore_discard_excess_bytes:
@@ -1028,8 +1037,9 @@ class CephBackupDriver(driver.BackupDriver):
                                                      self._ceph_backup_conf)
                 rbd_fd = linuxrbd.RBDVolumeIOWrapper(rbd_meta)
                 meta_io_proxy = eventlet.tpool.Proxy(rbd_fd)
-                self._transfer_data(src_volume, src_name, meta_io_proxy,
-                                    backup_name, length)
+                self._transfer_data(
+                    src_volume, src_name, meta_io_proxy, backup_name, length,
+                    throttle=self._get_io_throttle(volume_id))
             finally:
                 # Closing the wrapper will close the image as well
                 if meta_io_proxy:
@@ -1207,7 +1217,8 @@ class CephBackupDriver(driver.BackupDriver):
                       dest_name: str,
                       length: int,
                       volume_is_new: bool,
-                      src_snap=None) -> None:
+                      src_snap=None,
+                      throttle: Optional[Callable] = None) -> None:
         """Restore volume using full copy i.e. all extents.
 
         This will result in all extents being copied from source to
@@ -1220,6 +1231,7 @@ class CephBackupDriver(driver.BackupDriver):
         :param volume_is_new: True if the destination volume is new.
         :param src_snap: A string, the name of the restore point snapshot,
         optional, used for incremental backups or RBD backup.
+        :param throttle: Optional function throttling the transfer.
         """
         with eventlet.tpool.Proxy(rbd_driver.RADOSClient(self,
                                   backup.container)) as client:
@@ -1279,7 +1291,8 @@ class CephBackupDriver(driver.BackupDriver):
                 rbd_fd = linuxrbd.RBDVolumeIOWrapper(rbd_meta)
                 self._transfer_data(eventlet.tpool.Proxy(rbd_fd), backup_name,
                                     dest_file, dest_name, length,
-                                    discard_zeros=volume_is_new)
+                                    discard_zeros=volume_is_new,
+                                    throttle=throttle)
             finally:
                 src_rbd.close()
 
@@ -1490,7 +1503,8 @@ class CephBackupDriver(driver.BackupDriver):
             # Otherwise full copy
             LOG.debug("Running full restore.")
             self._full_restore(backup, volume_file, volume.name,
-                               length, volume_is_new, src_snap=restore_point)
+                               length, volume_is_new, src_snap=restore_point,
+                               throttle=self._get_io_throttle(volume.id))
 
     def _restore_metadata(self,
                           backup: 'objects.Backup',
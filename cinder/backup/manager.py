@@ -45,6 +45,7 @@ from oslo_utils import excutils
 from oslo_utils import importutils
 from oslo_utils import timeutils
 
+from cinder.backup import driver as backup_driver
 from cinder.backup import rpcapi as backup_rpcapi
 from cinder import context
 from cinder import exception
@@ -195,8 +196,11 @@ class BackupManager(manager.SizedThreadPoolManager):
 
         LOG.info("Cleaning up incomplete backup operations.")
 
-        # TODO(smulcahy) implement full resume of backup and restore
-        # operations on restart (rather than simply resetting).
+        # TODO(smulcahy) implement full resume of restore operations on
+        # restart (rather than simply resetting).  Backups are resumed when
+        # the backup driver checkpointed them, only by the service that was
+        # creating them: a service that looks down to its peers could still
+        # be writing the backup.
         # We only need to deal with the backups that aren't complete.
         # N.B. NULL status is possible and we consider it incomplete.
         incomplete_status = list(fields.BackupStatus.ALL)
@@ -256,8 +260,47 @@ class BackupManager(manager.SizedThreadPoolManager):
             snapshot.status = fields.SnapshotStatus.AVAILABLE
             snapshot.save()
 
+    def _resume_backup(self, ctxt, backup):
+        """Resume an interrupted backup from the driver's checkpoint.
+
+        A backup is only resumed when the data it was reading can't have
+        changed since it was interrupted: it backs up a snapshot, or a volume
+        that was available when the backup started.  Returns whether the
+        backup has been resumed.
+        """
+        try:
+            volume = objects.Volume.get_by_id(ctxt, backup.volume_id)
+            snapshot = objects.Snapshot.get_by_id(
+                ctxt, backup.snapshot_id) if backup.snapshot_id else None
+        except (exception.VolumeNotFound, exception.SnapshotNotFound):
+            return False
+        if snapshot:
+            if snapshot.status != fields.SnapshotStatus.BACKING_UP:
+                return False
+        elif (volume.status != 'backing-up' or
+                volume.previous_status != 'available'):
+            return False
+
+        try:
+            backup_service = self.service(context=ctxt)
+            if not backup_service.can_resume_backup(backup):
+                return False
+
+            LOG.info('Resuming backup %s (was creating).', backup.id)
+            self._detach_all_attachments(ctxt, volume)
+            # The backup device will be created again.
+            self._cleanup_temp_volumes_snapshots_when_backup_created(ctxt,
+                                                                     backup)
+            self._start_backup(ctxt, backup, volume)
+        except Exception:
+            LOG.exception('Unable to resume backup %s.', backup.id)
+            return False
+        return True
+
     def _cleanup_one_backup(self, ctxt, backup):
         if backup['status'] == fields.BackupStatus.CREATING:
+            if self._resume_backup(ctxt, backup):
+                return
             LOG.info('Resetting backup %s to error (was creating).',
                      backup['id'])
             self._cleanup_one_volume(ctxt, backup.volume_id)
@@ -495,6 +538,12 @@ class BackupManager(manager.SizedThreadPoolManager):
         backup_service = self.service(context)
         properties = volume_utils.brick_get_connector_properties(
             CONF.use_multipath_for_image_xfer, enforce_multipath=False)
+        backup_kwargs = {}
+        if backup_service.support_changed_extents:
+            changed_extents = self._get_changed_extents(context, backup,
+                                                        volume, backup_device)
+            if changed_extents is not None:
+                backup_kwargs['changed_extents'] = changed_extents
 
         updates = {}
         try:
@@ -518,17 +567,20 @@ class BackupManager(manager.SizedThreadPoolManager):
                     if backup_device.secure_enabled:
                         with open(device_path, 'rb') as device_file:
                             updates = backup_service.backup(
-                                backup, utils.tpool_wrap(device_file))
+                                backup, utils.tpool_wrap(device_file),
+                                **backup_kwargs)
                     else:
                         with utils.temporary_chown(device_path):
                             with open(device_path, 'rb') as device_file:
                                 updates = backup_service.backup(
                                     backup,
-                                    utils.tpool_wrap(device_file))
+                                    utils.tpool_wrap(device_file),
+                                    **backup_kwargs)
                 # device_path is already file-like so no need to open it
                 else:
                     updates = backup_service.backup(
-                        backup, utils.tpool_wrap(device_path))
+                        backup, utils.tpool_wrap(device_path),
+                        **backup_kwargs)
             except Exception:
                 with excutils.save_and_reraise_exception():
                     if not message_created:
@@ -578,6 +630,50 @@ class BackupManager(manager.SizedThreadPoolManager):
 
         self._finish_backup(context, backup, volume, updates)
 
+    def _get_changed_extents(self, context, backup, volume, backup_device):
+        """Get the extents changed since the parent backup was taken.
+
+        This is only possible when the parent backup was taken from a
+        snapshot that still exists and the volume driver can tell what
+        changed since then. Returns None otherwise.
+        """
+        if not backup.parent_id:
+            return None
+        try:
+            parent_backup = objects.Backup.get_by_id(context,
+                                                     backup.parent_id)
+            if not parent_backup.snapshot_id:
+                return None
+            base_snapshot = objects.Snapshot.get_by_id(
+                context, parent_backup.snapshot_id)
+        except (exception.BackupNotFound, exception.SnapshotNotFound):
+            return None
+        if base_snapshot.status != fields.SnapshotStatus.AVAILABLE:
+            return None
+
+        # The changes must be computed up to the contents being backed up.
+        if backup.snapshot_id:
+            snapshot = objects.Snapshot.get_by_id(context, backup.snapshot_id)
+        elif backup_device.is_snapshot:
+            snapshot = backup_device.snapshot
+        elif backup_device.volume.id == volume.id:
+            snapshot = None
+        else:
+            # A temporary clone of the volume, which may have diverged from
+            # the volume since it was created.
+            return None
+
+        try:
+            return self.volume_rpcapi.get_changed_extents(
+                context, volume, base_snapshot, snapshot=snapshot)
+        except Exception:
+            LOG.warning('Could not get the extents changed since snapshot '
+                        '%(snap)s, backup %(backup)s will read the whole '
+                        'volume.',
+                        {'snap': base_snapshot.id, 'backup': backup.id},
+                        exc_info=True)
+            return None
+
     def _finish_backup(self, context, backup, volume, updates):
         volume_id = backup.volume_id
         snapshot_id = backup.snapshot_id
@@ -1165,6 +1261,23 @@ class BackupManager(manager.SizedThreadPoolManager):
         backup_service = self.service(context)
         return backup_service.support_force_delete
 
+    def set_throttle_limits(self, context, limits):
+        """Change the IO limits of the backups and restores at runtime.
+
+        :param context: running context
+        :param limits: dict with some of the bps_limit, iops_limit,
+                       backend_bps_limit and backend_iops_limit keys
+        """
+        LOG.info('Setting backup IO limits to %s.', limits)
+        backup_driver.get_throttle().set_limits(**limits)
+
+    def get_throttle_limits(self, context):
+        """Return the IO limits of the backups and restores.
+
+        :param context: running context
+        """
+        return backup_driver.get_throttle().get_limits()
+
     def _attach_device(self, ctxt, backup_device,
                        properties, is_snapshot=False):
         """Attach backup device."""
@@ -49,9 +49,10 @@ class BackupAPI(rpc.RPCAPI):
         2.2 - Adds publish_service_capabilities
         2.3 - Adds continue_backup call
         2.4 - Add the volume_is_new flag to the restore_backup method
+        2.5 - Adds set_throttle_limits and get_throttle_limits
     """
 
-    RPC_API_VERSION = '2.4'
+    RPC_API_VERSION = '2.5'
     RPC_DEFAULT_VERSION = '2.0'
     TOPIC = constants.BACKUP_TOPIC
     BINARY = 'cinder-backup'
@@ -126,6 +127,16 @@ class BackupAPI(rpc.RPCAPI):
         cctxt = self._get_cctxt(server=service.host, version='2.1')
         return cctxt.call(context, 'get_log_levels', log_request=log_request)
 
+    @rpc.assert_min_rpc_version('2.5')
+    def set_throttle_limits(self, context, service, limits):
+        cctxt = self._get_cctxt(server=service.host, version='2.5')
+        cctxt.cast(context, 'set_throttle_limits', limits=limits)
+
+    @rpc.assert_min_rpc_version('2.5')
+    def get_throttle_limits(self, context, service):
+        cctxt = self._get_cctxt(server=service.host, version='2.5')
+        return cctxt.call(context, 'get_throttle_limits')
+
     @rpc.assert_min_rpc_version('2.2')
     def publish_service_capabilities(self, ctxt):
         cctxt = self._get_cctxt(version='2.2', fanout=True)
@@ -725,6 +725,51 @@ class BackupCommands(object):
             bk.host = newhost
             bk.save()
 
+    @args('host', help='Host of the backup service')
+    @args('--bps-limit', type=int, default=None,
+          help='Bytes per second of all the backups and restores')
+    @args('--iops-limit', type=int, default=None,
+          help='Operations per second of all the backups and restores')
+    @args('--backend-bps-limit', type=int, default=None,
+          help='Bytes per second of the backups and restores of each '
+               'volume backend')
+    @args('--backend-iops-limit', type=int, default=None,
+          help='Operations per second of the backups and restores of each '
+               'volume backend')
+    def throttle(self, host: str,
+                 bps_limit: Optional[int] = None,
+                 iops_limit: Optional[int] = None,
+                 backend_bps_limit: Optional[int] = None,
+                 backend_iops_limit: Optional[int] = None) -> Optional[int]:
+        """Show or change the IO limits of a running backup service.
+
+        Limits that aren't given are left unchanged and 0 removes a limit.
+        The configured limits apply again when the service is restarted.
+        """
+        ctxt = context.get_admin_context()
+        try:
+            service = objects.Service.get_by_args(ctxt, host,
+                                                  constants.BACKUP_BINARY)
+        except exception.ServiceNotFound as e:
+            print(_("Backup service not found on host %s.") % host)
+            print(u"%s" % e.args)
+            return 2
+
+        limits = {'bps_limit': bps_limit,
+                  'iops_limit': iops_limit,
+                  'backend_bps_limit': backend_bps_limit,
+                  'backend_iops_limit': backend_iops_limit}
+        limits = {name: value for name, value in limits.items()
+                  if value is not None}
+        rpc.init(CONF)
+        rpcapi = backup_rpcapi.BackupAPI()
+        if limits:
+            rpcapi.set_throttle_limits(ctxt, service, limits)
+        for name, value in sorted(
+                rpcapi.get_throttle_limits(ctxt, service).items()):
+            print('%-20s\t%d' % (name, value))
+        return None
+
 
 class BaseCommand(object):
     @staticmethod
@@ -22,6 +22,7 @@ from cinder import monkey_patch; monkey_patch.patch()  # noqa
 import logging as python_logging  # noqa: I100
 import sys
 
+from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_reports import guru_meditation_report as gmr
@@ -29,6 +30,7 @@ from oslo_reports import opts as gmr_opts
 
 # Need to register global_opts
 from cinder.common import config  # noqa
+from cinder.db import api as session
 from cinder import i18n
 i18n.enable_lazy()
 from cinder import objects
@@ -36,7 +38,18 @@ from cinder import service
 from cinder import version
 
 
+scheduler_cmd_opts = [
+    cfg.IntOpt('scheduler_workers',
+               default=1, min=1, max=processutils.get_worker_count(),
+               sample_default=8,
+               help='Number of scheduler processes to launch. Each process '
+                    'filters and weighs its share of the requests. Enable '
+                    'scheduler_capacity_claims when using more than one '
+                    'process, or they may over-commit pools.'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(scheduler_cmd_opts)
 
 
 def main() -> None:
@@ -48,5 +61,13 @@ def main() -> None:
     python_logging.captureWarnings(True)
     gmr.TextGuruMeditation.setup_autorun(version, conf=CONF)
     server = service.Service.create(binary='cinder-scheduler')
-    service.serve(server)
-    service.wait()
+    if CONF.scheduler_workers > 1:
+        launcher = service.process_launcher()
+        # Dispose of the whole DB connection pool here before starting the
+        # processes, so they don't share DB connections.
+        session.dispose_engine()
+        launcher.launch_service(server, workers=CONF.scheduler_workers)
+        launcher.wait()
+    else:
+        service.serve(server)
+        service.wait()
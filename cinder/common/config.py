@@ -171,6 +171,23 @@ image_opts = [
                min=0,
                default=3,
                help='Number retries when downloading an image from glance'),
+    cfg.IntOpt('glance_download_ranges',
+               min=1,
+               default=1,
+               help='Number of byte ranges of an image downloaded '
+                    'concurrently from glance, each over its own '
+                    'connection, when the image store honours Range '
+                    'requests. Images get at most one range per 64 MiB. '
+                    'The checksum of images downloaded in ranges is '
+                    'verified by reading them back once all the ranges '
+                    'were written. The default, 1, downloads images over a '
+                    'single connection.'),
+    cfg.IntOpt('glance_download_range_retries',
+               min=0,
+               default=3,
+               help='Number of retries of a byte range of an image that '
+                    'failed to download, each resuming from the last byte '
+                    'received.'),
     cfg.BoolOpt('glance_api_insecure',
                 default=False,
                 help='Allow to perform insecure SSL (https) requests to '
@@ -8466,15 +8466,43 @@ def image_volume_cache_create(
     cache_entry.volume_id = volume_id
     cache_entry.size = size
     context.session.add(cache_entry)
+    _image_volume_cache_usage_add(context, host, cluster_name, size, 1)
     return cache_entry
 
 
+def _image_volume_cache_usage_add(context, host, cluster_name, size, count):
+    """Add to the running totals of the cache entries of a host."""
+    model = models.ImageVolumeCacheUsage
+    usage = (
+        context.session.query(model.id)
+        .filter_by(host=host, cluster_name=cluster_name)
+        .first()
+    )
+    if usage is None:
+        # Concurrent creations may add a second row for the same host and
+        # cluster, which is fine since the totals of all rows are summed.
+        context.session.add(
+            model(host=host, cluster_name=cluster_name, size=size,
+                  count=count)
+        )
+        return
+
+    context.session.query(model).filter_by(id=usage.id).update(
+        {'size': model.size + size, 'count': model.count + count},
+        synchronize_session=False,
+    )
+
+
 @require_context
 @main_context_manager.writer
 def image_volume_cache_delete(context, volume_id):
-    context.session.query(
+    query = context.session.query(
         models.ImageVolumeCacheEntry,
-    ).filter_by(volume_id=volume_id).delete()
+    ).filter_by(volume_id=volume_id)
+    for entry in query.all():
+        _image_volume_cache_usage_add(context, entry.host,
+                                      entry.cluster_name, -entry.size, -1)
+    query.delete()
 
 
 @require_context
@@ -8517,6 +8545,45 @@ def image_volume_cache_get_all(context, **filters):
     )
 
 
+@require_context
+@main_context_manager.reader
+def image_volume_cache_get_lru(context, limit, **filters):
+    """Get the least recently used cache entries, least recent first."""
+    filters = _clean_filters(filters)
+    return (
+        context.session.query(models.ImageVolumeCacheEntry)
+        .filter_by(**filters)
+        .order_by(models.ImageVolumeCacheEntry.last_used)
+        .limit(limit)
+        .all()
+    )
+
+
+@require_context
+@main_context_manager.reader
+def image_volume_cache_get_usage(context, **filters):
+    """Get the size and count of the cache entries by pool.
+
+    Pools are named by their cluster when filtering by cluster_name, and by
+    their host otherwise. Like for include in cluster, host and cluster_name
+    filters without a pool match all the pools of the backend.
+
+    :returns: list of (pool, size, count) tuples
+    """
+    filters = _clean_filters(filters)
+    model = models.ImageVolumeCacheUsage
+    pool = model.cluster_name if 'cluster_name' in filters else model.host
+
+    query = context.session.query(
+        pool, func.sum(model.size), func.sum(model.count),
+    )
+    for field in {'cluster_name', 'host'}.intersection(filters):
+        query = query.filter(
+            _filter_host(getattr(model, field), filters.pop(field)))
+    query = query.filter_by(**filters).group_by(pool)
+    return [(name, int(size), int(count)) for name, size, count in query]
+
+
 @require_admin_context
 @main_context_manager.writer
 def image_volume_cache_include_in_cluster(
@@ -8527,6 +8594,14 @@ def image_volume_cache_include_in_cluster(
 ):
     """Include all volumes matching the filters into a cluster."""
     filters = _clean_filters(filters)
+    # The running totals of the entries follow them into the cluster
+    _include_in_cluster(
+        context,
+        cluster,
+        models.ImageVolumeCacheUsage,
+        partial_rename,
+        dict(filters),
+    )
     return _include_in_cluster(
         context,
         cluster,
@@ -8539,6 +8614,147 @@ def image_volume_cache_include_in_cluster(
 ###################
 
 
+@require_context
+@main_context_manager.reader
+def capacity_claim_get(context, backend):
+    """Get the capacity claimed on a pool, or None if there is no claim."""
+    return (
+        context.session.query(models.CapacityClaim)
+        .filter_by(backend=backend)
+        .first()
+    )
+
+
+@require_context
+@main_context_manager.writer
+def capacity_claim_create(context, backend, claimed_gb, stats_timestamp):
+    """Create the capacity claim of a pool."""
+    claim = models.CapacityClaim(
+        backend=backend,
+        claimed_gb=claimed_gb,
+        stats_timestamp=stats_timestamp,
+        race_preventer=0,
+    )
+    try:
+        claim.save(context.session)
+    except db_exc.DBDuplicateEntry:
+        raise exception.CapacityClaimExists(backend=backend)
+    return claim
+
+
+@require_context
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@main_context_manager.writer
+def capacity_claim_update(context, backend, race_preventer, **values):
+    """Update the capacity claim of a pool if no one else updated it.
+
+    Returns whether the claim still had the given race_preventer value and
+    was updated.
+    """
+    values['race_preventer'] = race_preventer + 1
+    values['updated_at'] = timeutils.utcnow()
+    result = (
+        context.session.query(models.CapacityClaim)
+        .filter_by(backend=backend, race_preventer=race_preventer)
+        .update(values, synchronize_session=False)
+    )
+    return bool(result)
+
+
+###################
+
+
+@require_context
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@main_context_manager.writer
+def backup_dedup_chunk_reference(context, container, dedup_key, backup_id):
+    """Add a reference of a backup to a stored deduplicated chunk.
+
+    Returns the chunk, or None if it isn't stored in the container.
+    """
+    chunk = (
+        context.session.query(models.BackupDedupChunk)
+        .filter_by(container=container, dedup_key=dedup_key)
+        .first()
+    )
+    if chunk is None:
+        return None
+    # The update locks the row, so a concurrent release either sees our
+    # reference or deleted the chunk before, in which case we update nothing
+    result = (
+        context.session.query(models.BackupDedupChunk)
+        .filter_by(id=chunk.id)
+        .filter(models.BackupDedupChunk.refcount > 0)
+        .update({'refcount': models.BackupDedupChunk.refcount + 1,
+                 'updated_at': timeutils.utcnow()},
+                synchronize_session=False)
+    )
+    if not result:
+        return None
+    models.BackupDedupReference(chunk_id=chunk.id,
+                                backup_id=backup_id).save(context.session)
+    return chunk
+
+
+@require_context
+@main_context_manager.writer
+def backup_dedup_chunk_create(context, container, dedup_key, backup_id,
+                              object_name, compression):
+    """Create a deduplicated chunk referenced by a backup."""
+    chunk = models.BackupDedupChunk(
+        container=container,
+        dedup_key=dedup_key,
+        object_name=object_name,
+        compression=compression,
+        refcount=1,
+    )
+    try:
+        chunk.save(context.session)
+    except db_exc.DBDuplicateEntry:
+        raise exception.BackupDedupChunkExists(container=container,
+                                               dedup_key=dedup_key)
+    models.BackupDedupReference(chunk_id=chunk.id,
+                                backup_id=backup_id).save(context.session)
+    return chunk
+
+
+@require_context
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@main_context_manager.writer
+def backup_dedup_chunks_release(context, backup_id):
+    """Drop the references of a backup to deduplicated chunks.
+
+    The chunks no backup references anymore are deleted.
+
+    :returns: the names of the objects of the deleted chunks
+    """
+    refs = (
+        context.session.query(models.BackupDedupReference)
+        .filter_by(backup_id=backup_id)
+    )
+    counts = collections.Counter(ref.chunk_id for ref in refs)
+    refs.delete(synchronize_session=False)
+
+    released = []
+    # Sorted to lock the chunks in the same order as other releases
+    for chunk_id, count in sorted(counts.items()):
+        chunks = (
+            context.session.query(models.BackupDedupChunk)
+            .filter_by(id=chunk_id)
+        )
+        chunks.update({'refcount': models.BackupDedupChunk.refcount - count,
+                       'updated_at': timeutils.utcnow()},
+                      synchronize_session=False)
+        chunk = chunks.filter_by(refcount=0).first()
+        if chunk is not None:
+            released.append(chunk.object_name)
+            context.session.delete(chunk)
+    return released
+
+
+###################
+
+
 def _worker_query(
     context,
     until=None,
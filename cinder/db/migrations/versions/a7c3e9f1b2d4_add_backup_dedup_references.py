@@ -0,0 +1,55 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add backup dedup references
+
+Revision ID: a7c3e9f1b2d4
+Revises: f4b2c8d1e6a3
+Create Date: 2026-10-19 10:12:37.804215
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f1b2d4'
+down_revision = 'f4b2c8d1e6a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'backup_dedup_chunks',
+        sa.Column('created_at', sa.DateTime(timezone=False)),
+        sa.Column('updated_at', sa.DateTime(timezone=False)),
+        sa.Column('id', sa.Integer, primary_key=True, nullable=False),
+        sa.Column('container', sa.String(255), nullable=False),
+        sa.Column('dedup_key', sa.String(64), nullable=False),
+        sa.Column('object_name', sa.String(255), nullable=False),
+        sa.Column('compression', sa.String(255), nullable=False),
+        sa.Column('refcount', sa.Integer, nullable=False),
+        sa.UniqueConstraint('container', 'dedup_key'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+
+    op.create_table(
+        'backup_dedup_references',
+        sa.Column('id', sa.Integer, primary_key=True, nullable=False),
+        sa.Column('chunk_id', sa.Integer,
+                  sa.ForeignKey('backup_dedup_chunks.id'),
+                  nullable=False, index=True),
+        sa.Column('backup_id', sa.String(36), nullable=False, index=True),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
@@ -0,0 +1,50 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add capacity claims
+
+Revision ID: e3f1a9c27b4d
+Revises: 9c74c1c6971f
+Create Date: 2026-10-18 09:42:13.512960
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e3f1a9c27b4d'
+down_revision = '9c74c1c6971f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'capacity_claims',
+        sa.Column('created_at', sa.DateTime(timezone=False)),
+        sa.Column('updated_at', sa.DateTime(timezone=False)),
+        sa.Column('id', sa.Integer, primary_key=True, nullable=False),
+        sa.Column('backend', sa.String(255), nullable=False),
+        sa.Column('stats_timestamp', sa.DateTime(timezone=False),
+                  nullable=False),
+        sa.Column('claimed_gb', sa.Integer, nullable=False),
+        sa.Column(
+            'race_preventer',
+            sa.Integer,
+            nullable=False,
+            default=0,
+            server_default=sa.text('0'),
+        ),
+        sa.UniqueConstraint('backend'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
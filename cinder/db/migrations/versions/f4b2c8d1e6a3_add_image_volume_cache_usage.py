@@ -0,0 +1,57 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add image volume cache usage
+
+Revision ID: f4b2c8d1e6a3
+Revises: e3f1a9c27b4d
+Create Date: 2026-10-18 23:05:41.207316
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f4b2c8d1e6a3'
+down_revision = 'e3f1a9c27b4d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    usage = op.create_table(
+        'image_volume_cache_usage',
+        sa.Column('id', sa.Integer, primary_key=True, nullable=False),
+        sa.Column('host', sa.String(255), nullable=False, index=True),
+        sa.Column('cluster_name', sa.String(255), nullable=True, index=True),
+        sa.Column('size', sa.Integer, nullable=False),
+        sa.Column('count', sa.Integer, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+
+    op.create_index('image_volume_cache_entries_host_last_used_idx',
+                    'image_volume_cache_entries', ['host', 'last_used'])
+    op.create_index('image_volume_cache_entries_cluster_name_last_used_idx',
+                    'image_volume_cache_entries',
+                    ['cluster_name', 'last_used'])
+
+    # Start the running totals from the existing entries
+    entries = sa.table('image_volume_cache_entries',
+                       sa.column('host', sa.String),
+                       sa.column('cluster_name', sa.String),
+                       sa.column('size', sa.Integer))
+    op.execute(usage.insert().from_select(
+        ['host', 'cluster_name', 'size', 'count'],
+        sa.select(entries.c.host, entries.c.cluster_name,
+                  sa.func.sum(entries.c.size), sa.func.count())
+        .group_by(entries.c.host, entries.c.cluster_name)))
@@ -1072,6 +1072,40 @@ class BackupMetadata(BASE, CinderBase):
     )
 
 
+class BackupDedupChunk(BASE, models.TimestampMixin, models.ModelBase):
+    """Represents a deduplicated backup chunk shared by backups"""
+
+    __tablename__ = 'backup_dedup_chunks'
+    __table_args__ = (
+        schema.UniqueConstraint('container', 'dedup_key'),
+        CinderBase.__table_args__,
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True, nullable=False)
+    container = sa.Column(sa.String(255), nullable=False)
+    # sha256 of the sha256 list of the blocks of the chunk
+    dedup_key = sa.Column(sa.String(64), nullable=False)
+    object_name = sa.Column(sa.String(255), nullable=False)
+    compression = sa.Column(sa.String(255), nullable=False)
+    # Number of rows in backup_dedup_references for the chunk
+    refcount = sa.Column(sa.Integer, nullable=False, default=0)
+
+
+class BackupDedupReference(BASE, models.ModelBase):
+    """Represents a reference of a backup to a deduplicated chunk"""
+
+    __tablename__ = 'backup_dedup_references'
+
+    id = sa.Column(sa.Integer, primary_key=True, nullable=False)
+    chunk_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey('backup_dedup_chunks.id'),
+        nullable=False,
+        index=True,
+    )
+    backup_id = sa.Column(sa.String(36), nullable=False, index=True)
+
+
 class Encryption(BASE, CinderBase):
     """Represents encryption requirement for a volume type.
 
@@ -1185,6 +1219,19 @@ class ImageVolumeCacheEntry(BASE, models.ModelBase):
     """Represents an image volume cache entry"""
 
     __tablename__ = 'image_volume_cache_entries'
+    __table_args__ = (
+        # To find the least recently used entries of a pool
+        sa.Index(
+            'image_volume_cache_entries_host_last_used_idx',
+            'host',
+            'last_used',
+        ),
+        sa.Index(
+            'image_volume_cache_entries_cluster_name_last_used_idx',
+            'cluster_name',
+            'last_used',
+        ),
+    )
 
     id = sa.Column(sa.Integer, primary_key=True, nullable=False)
     host = sa.Column(sa.String(255), index=True, nullable=False)
@@ -1199,6 +1246,43 @@ class ImageVolumeCacheEntry(BASE, models.ModelBase):
     )
 
 
+class ImageVolumeCacheUsage(BASE, models.ModelBase):
+    """Represents the running totals of the image volume cache entries"""
+
+    __tablename__ = 'image_volume_cache_usage'
+
+    id = sa.Column(sa.Integer, primary_key=True, nullable=False)
+    # Host and cluster of the entries the totals are for
+    host = sa.Column(sa.String(255), index=True, nullable=False)
+    cluster_name = sa.Column(sa.String(255), index=True, nullable=True)
+    size = sa.Column(sa.Integer, nullable=False, default=0)
+    count = sa.Column(sa.Integer, nullable=False, default=0)
+
+
+class CapacityClaim(BASE, models.TimestampMixin, models.ModelBase):
+    """Represents the capacity the schedulers claimed on a pool"""
+
+    __tablename__ = 'capacity_claims'
+    __table_args__ = (
+        schema.UniqueConstraint('backend'),
+        CinderBase.__table_args__,
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True, nullable=False)
+    # Pool the capacity was claimed on, by cluster or host
+    backend = sa.Column(sa.String(255), nullable=False)
+    # Time of the pool stats the capacity was claimed on top of
+    stats_timestamp = sa.Column(sa.DateTime, nullable=False)
+    claimed_gb = sa.Column(sa.Integer, nullable=False, default=0)
+    # To claim with compare-and-swap semantics
+    race_preventer = sa.Column(
+        sa.Integer,
+        nullable=False,
+        default=0,
+        server_default=sa.text('0'),
+    )
+
+
 class Worker(BASE, CinderBase):
     """Represents all resources that are being worked on by a node."""
 
@@ -498,6 +498,15 @@ class WorkerExists(Duplicate):
     message = _("Worker for %(type)s %(id)s already exists.")
 
 
+class CapacityClaimExists(Duplicate):
+    message = _("Capacity claim for %(backend)s already exists.")
+
+
+class BackupDedupChunkExists(Duplicate):
+    message = _("Deduplicated chunk %(dedup_key)s already exists in "
+                "container %(container)s.")
+
+
 class CleanableInUse(Invalid):
     message = _('%(type)s with id %(id)s is already being cleaned up or '
                 'another host has taken over it.')
@@ -12,7 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from typing import Optional
+import time
+from typing import Iterable, Optional
 from zoneinfo import ZoneInfo
 
 from oslo_config import cfg
@@ -20,6 +21,7 @@ from oslo_log import log as logging
 from oslo_utils import timeutils
 
 from cinder import context
+from cinder import exception
 from cinder import objects
 from cinder import rpc
 from cinder import utils
@@ -28,17 +30,70 @@ CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
 
+ADMISSION_ALWAYS = 'always'
+ADMISSION_POPULARITY = 'popularity'
+
+
+class ImagePopularity(object):
+    """Decaying request counts of the images of an image volume cache.
+
+    Counts halve every half_life seconds, so images requested often lately
+    are more popular than images that were popular a while ago. Only the
+    most popular max_images images are tracked.
+    """
+
+    def __init__(self,
+                 half_life: float = 24 * 3600,
+                 max_images: int = 10000):
+        self.half_life = half_life
+        self.max_images = max_images
+        self._counts: dict[str, tuple[float, float]] = {}
+
+    def _decayed(self, image_id: str, now: float) -> float:
+        count, updated = self._counts.get(image_id, (0.0, now))
+        return count * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, image_id: str) -> None:
+        """Record a request for an image."""
+        now = time.monotonic()
+        self._counts[image_id] = (self._decayed(image_id, now) + 1, now)
+        if len(self._counts) > self.max_images:
+            # Forget the least popular half of the other images at once
+            ranked = sorted((i for i in self._counts if i != image_id),
+                            key=lambda i: self._decayed(i, now))
+            for forgotten in ranked[:len(ranked) // 2]:
+                del self._counts[forgotten]
+
+    def get(self, image_id: str) -> float:
+        """Get the decayed request count of an image."""
+        return self._decayed(image_id, time.monotonic())
+
 
 class ImageVolumeCache(object):
+    # Number of least recently used entries read at once to evict them
+    EVICTION_BATCH_SIZE = 10
+
     def __init__(self,
                  db,
                  volume_api,
                  max_cache_size_gb: int = 0,
-                 max_cache_size_count: int = 0):
+                 max_cache_size_count: int = 0,
+                 background_eviction: bool = False,
+                 high_watermark: int = 100,
+                 low_watermark: int = 100,
+                 admission_policy: str = ADMISSION_ALWAYS,
+                 prewarm_images: Optional[Iterable[str]] = None):
         self.db = db
         self.volume_api = volume_api
         self.max_cache_size_gb = int(max_cache_size_gb)
         self.max_cache_size_count = int(max_cache_size_count)
+        self.background_eviction = background_eviction
+        self.high_watermark = int(high_watermark)
+        self.low_watermark = int(low_watermark)
+        self.admission_policy = admission_policy
+        # Images pre-warmed by the administrator are always admitted
+        self.prewarm_images = set(prewarm_images or [])
+        self.popularity = ImagePopularity()
         self.notifier = rpc.get_notifier('volume', CONF.host)
 
     def get_by_image_volume(self,
@@ -98,6 +153,23 @@ class ImageVolumeCache(object):
                                     volume_ref['host'])
         return cache_entry
 
+    def find_entry(self,
+                   context: context.RequestContext,
+                   volume_ref: objects.Volume,
+                   image_id: str,
+                   image_meta: dict) -> Optional[dict]:
+        """Find an up to date entry without using it.
+
+        Unlike get_entry, the entry is not made more recently used and the
+        request is not counted for the image popularity.
+        """
+        entries = self.db.image_volume_cache_get_all(
+            context, image_id=image_id, **self._get_query_filters(volume_ref))
+        for entry in entries:
+            if not self._should_update_entry(entry, image_meta):
+                return entry
+        return None
+
     def create_cache_entry(self,
                            context: context.RequestContext,
                            volume_ref: objects.Volume,
@@ -141,19 +213,39 @@ class ImageVolumeCache(object):
                              context: context.RequestContext,
                              cache_entry: dict,
                              msg: str) -> None:
-        """Delete a volume and remove cache entry."""
+        """Delete a volume and remove cache entry.
+
+        Volumes that are already being deleted, for example by another
+        service of the cluster evicting the same entry, count as deleted.
+        """
         LOG.debug('%(msg)s: entry %(entry)s.',
                   {'msg': msg, 'entry': self._entry_to_str(cache_entry)})
-        volume = objects.Volume.get_by_id(context, cache_entry['volume_id'])
-
-        # Delete will evict the cache entry.
-        self.volume_api.delete(context, volume)
+        try:
+            volume = objects.Volume.get_by_id(context,
+                                              cache_entry['volume_id'])
+            try:
+                # Delete will evict the cache entry.
+                self.volume_api.delete(context, volume)
+            except exception.InvalidVolume:
+                volume.refresh()
+                if volume.status != 'deleting':
+                    raise
+                LOG.debug('Image-volume cache entry %(entry)s is already '
+                          'being deleted.',
+                          {'entry': self._entry_to_str(cache_entry)})
+        except exception.VolumeNotFound:
+            LOG.debug('Image-volume cache entry %(entry)s was already '
+                      'deleted.', {'entry': self._entry_to_str(cache_entry)})
 
     def ensure_space(self,
                      context: context.RequestContext,
-                     volume: objects.Volume) -> bool:
+                     volume: objects.Volume,
+                     image_id: Optional[str] = None) -> bool:
         """Makes room for a volume cache entry.
 
+        With the popularity admission policy, the entries of images more
+        popular than image_id are not evicted to make room for it.
+
         Returns True if successful, false otherwise.
         """
 
@@ -168,16 +260,11 @@ class ImageVolumeCache(object):
                 volume.size > self.max_cache_size_gb):
             return False
 
-        # Assume the entries are ordered by most recently used to least used.
-        entries = self.db.image_volume_cache_get_all(
-            context,
-            **self._get_query_filters(volume))
-
-        current_count = len(entries)
-
-        current_size = 0
-        for entry in entries:
-            current_size += entry['size']
+        # The running totals of the pool spare reading its entries
+        filters = self._get_query_filters(volume)
+        usage = self.db.image_volume_cache_get_usage(context, **filters)
+        current_size = sum(size for _pool, size, _count in usage)
+        current_count = sum(count for _pool, _size, count in usage)
 
         # Add values for the entry we intend to create.
         current_size += volume.size
@@ -192,21 +279,10 @@ class ImageVolumeCache(object):
                    'count': current_count,
                    'max_count': self.max_cache_size_count})
 
-        while (((current_size > self.max_cache_size_gb and
-                 self.max_cache_size_gb > 0)
-                or (current_count > self.max_cache_size_count and
-                    self.max_cache_size_count > 0))
-               and len(entries)):
-            entry = entries.pop()
-            msg = 'Deleting image-volume cache entry to reclaim space'
-            self.delete_cached_volume(context, entry, msg)
-            current_size -= entry['size']
-            current_count -= 1
-            LOG.debug('Image-volume cache for %(service)s new size (GB) = '
-                      '%(size_gb)s, new count = %(count)s.',
-                      {'service': volume.service_topic_queue,
-                       'size_gb': current_size,
-                       'count': current_count})
+        max_size, max_count = self._get_limits(100)
+        victims, current_size, current_count = self._select_lru(
+            context, filters, current_size, current_count, max_size,
+            max_count)
 
         # It is only possible to not free up enough gb, we will always be able
         # to free enough count. This is because 0 means unlimited which means
@@ -219,20 +295,138 @@ class ImageVolumeCache(object):
                             {'service': volume.service_topic_queue})
                 return False
 
-        return True
+        if image_id and not self._admit(image_id, victims):
+            LOG.debug('Image-volume cache for %(service)s will not evict '
+                      'entries of more popular images for image '
+                      '%(image_id)s.',
+                      {'service': volume.service_topic_queue,
+                       'image_id': image_id})
+            return False
+
+        return self._evict_entries(context, volume.service_topic_queue,
+                                   victims, current_size, current_count)
+
+    def _admit(self, image_id: str, victims: list) -> bool:
+        """Check if an image may evict the entries of other images."""
+        if (self.admission_policy != ADMISSION_POPULARITY or
+                image_id in self.prewarm_images or not victims):
+            return True
+        popularity = self.popularity.get(image_id)
+        return all(self.popularity.get(victim['image_id']) <= popularity
+                   for victim in victims)
+
+    def evict_over_watermark(self,
+                             context: context.RequestContext,
+                             **filters) -> None:
+        """Evict entries of the pools over the high watermark.
+
+        The least recently used entries of those pools are evicted until
+        they are under the low watermark.
+
+        :param filters: host or cluster_name of the backend
+        """
+        high_size, high_count = self._get_limits(self.high_watermark)
+        low_size, low_count = self._get_limits(self.low_watermark)
+        for pool, size, count in self.db.image_volume_cache_get_usage(
+                context, **filters):
+            if not self._is_over(size, count, high_size, high_count):
+                continue
+            LOG.debug('Image-volume cache for %(pool)s is over its high '
+                      'watermark, size (GB) = %(size_gb)s, count = '
+                      '%(count)s.',
+                      {'pool': pool, 'size_gb': size, 'count': count})
+            pool_filters = {field: pool for field in filters}
+            victims, size, count = self._select_lru(
+                context, pool_filters, size, count, low_size, low_count)
+            self._evict_entries(context, pool, victims, size, count)
+
+    def _get_limits(self,
+                    percentage: int) -> tuple[Optional[float],
+                                              Optional[float]]:
+        """Get a percentage of the size and count limits, None if unlimited."""
+        size = count = None
+        if self.max_cache_size_gb > 0:
+            size = self.max_cache_size_gb * percentage / 100.0
+        if self.max_cache_size_count > 0:
+            count = self.max_cache_size_count * percentage / 100.0
+        return size, count
+
+    @staticmethod
+    def _is_over(size: int,
+                 count: int,
+                 max_size: Optional[float],
+                 max_count: Optional[float]) -> bool:
+        return ((max_size is not None and size > max_size) or
+                (max_count is not None and count > max_count))
+
+    def _select_lru(self,
+                    context: context.RequestContext,
+                    filters: dict,
+                    current_size: int,
+                    current_count: int,
+                    max_size: Optional[float],
+                    max_count: Optional[float]) -> tuple[list, int, int]:
+        """Select the least recently used entries to get under the limits.
+
+        :returns: the entries, and the size and count of the entries left
+                  once they are evicted
+        """
+        victims: list = []
+        while self._is_over(current_size, current_count, max_size, max_count):
+            entries = self.db.image_volume_cache_get_lru(
+                context, len(victims) + self.EVICTION_BATCH_SIZE,
+                **filters)[len(victims):]
+            if not entries:
+                break
+
+            for entry in entries:
+                victims.append(entry)
+                current_size -= entry['size']
+                current_count -= 1
+                if not self._is_over(current_size, current_count, max_size,
+                                     max_count):
+                    break
+        return victims, current_size, current_count
+
+    def _evict_entries(self,
+                       context: context.RequestContext,
+                       service: str,
+                       entries: list,
+                       new_size: int,
+                       new_count: int) -> bool:
+        """Evict entries, returns whether they all could be evicted."""
+        evicted = True
+        for entry in entries:
+            msg = 'Deleting image-volume cache entry to reclaim space'
+            try:
+                self.delete_cached_volume(context, entry, msg)
+            except exception.InvalidVolume as e:
+                # Keep reclaiming space with the other entries
+                LOG.warning('Could not evict image-volume cache entry '
+                            '%(entry)s: %(exception)s',
+                            {'entry': self._entry_to_str(entry),
+                             'exception': e})
+                evicted = False
+        if entries and evicted:
+            LOG.debug('Image-volume cache for %(service)s new size (GB) = '
+                      '%(size_gb)s, new count = %(count)s.',
+                      {'service': service,
+                       'size_gb': new_size,
+                       'count': new_count})
+        return evicted
 
-    @utils.if_notifications_enabled
     def _notify_cache_hit(self,
                           context: context.RequestContext,
                           image_id: str,
                           host: str) -> None:
+        self.popularity.record(image_id)
         self._notify_cache_action(context, image_id, host, 'hit')
 
-    @utils.if_notifications_enabled
     def _notify_cache_miss(self,
                            context: context.RequestContext,
                            image_id: str,
                            host: str) -> None:
+        self.popularity.record(image_id)
         self._notify_cache_action(context, image_id, host, 'miss')
 
     @utils.if_notifications_enabled
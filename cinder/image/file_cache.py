@@ -0,0 +1,229 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Node-local cache of image files.
+
+Drivers that copy images onto their volumes, like the remote-fs and LVM
+drivers, download and convert an image for every volume created from it.
+The image file cache keeps the images converted to the format of the
+volumes in a local directory, so the next volumes created from them are
+copied from the cache instead.
+
+Entries are named after the image id, the image checksum and the format of
+the image file, so an image whose data changed is never read from a stale
+entry. They are published with atomic renames and read through hardlinks
+of their own, which makes the cache safe to share among the cinder-volume
+services of a node without any lock, and the least recently used entries
+are evicted when the cache grows over its size limit.
+"""
+
+import contextlib
+import errno
+import fcntl
+import os
+import shutil
+from typing import Generator, Optional
+
+from eventlet import tpool
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import fileutils
+from oslo_utils import units
+from oslo_utils import uuidutils
+
+image_file_cache_opts = [
+    cfg.StrOpt('image_file_cache_dir',
+               help='Directory of a node-local cache of the image files '
+                    'written onto volumes, converted to the format of the '
+                    'volumes. Volumes created from cached images are copied '
+                    'from the cache, without downloading or converting the '
+                    'image again. The cache is used by the drivers that '
+                    'copy images onto volumes through the host, like the '
+                    'remote-fs and LVM drivers, and it is disabled when '
+                    'this option is not set. Placing it on the filesystem '
+                    'of image_conversion_dir lets downloaded images be '
+                    'cached without being copied.'),
+    cfg.IntOpt('image_file_cache_size_gb',
+               default=10,
+               min=1,
+               help='Maximum size in GB of the image file cache. The least '
+                    'recently used images are evicted when it grows over '
+                    'this size.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_file_cache_opts)
+
+LOG = logging.getLogger(__name__)
+
+# From linux/fs.h, shares the extents of a file with another file of the
+# same filesystem on filesystems supporting it, like XFS and Btrfs.
+FICLONE = 0x40049409
+
+# Files of the cache directory starting with this prefix are not entries.
+_STAGING_PREFIX = '.staging-'
+
+
+def clone_file(source: str, dest: str) -> bool:
+    """Make dest a copy-on-write clone of source.
+
+    Returns False when the filesystem can't clone files, or the files are
+    on different filesystems.
+    """
+    try:
+        with open(source, 'rb') as source_file:
+            with open(dest, 'wb') as dest_file:
+                fcntl.ioctl(dest_file.fileno(), FICLONE, source_file.fileno())
+    except OSError as e:
+        LOG.debug('Could not clone %(source)s into %(dest)s: %(error)s',
+                  {'source': source, 'dest': dest, 'error': e})
+        return False
+    return True
+
+
+class ImageFileCache(object):
+    def __init__(self, cache_dir: str, max_size_gb: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_gb * units.Gi
+
+    @classmethod
+    def get_default(cls) -> Optional['ImageFileCache']:
+        """Get the configured image file cache, or None if it's disabled."""
+        if not CONF.image_file_cache_dir:
+            return None
+        return cls(CONF.image_file_cache_dir, CONF.image_file_cache_size_gb)
+
+    @staticmethod
+    def get_key(image_id: str,
+                image_meta: dict,
+                file_format: str,
+                file_subformat: Optional[str] = None) -> Optional[str]:
+        """Get the cache key of an image file in the given format.
+
+        Returns None for images without a checksum, which are not cached.
+        """
+        checksum = (image_meta.get('os_hash_value') or
+                    image_meta.get('checksum'))
+        if not checksum:
+            return None
+        if file_subformat:
+            file_format = '%s-%s' % (file_format, file_subformat)
+        return '%s.%s.%s' % (image_id, checksum, file_format)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    @contextlib.contextmanager
+    def pin(self, key: str) -> Generator[Optional[str], None, None]:
+        """Yield the path of a cached image file, or None on misses.
+
+        The entry is hardlinked to a staging path, which is yielded, so it
+        can still be read when another service evicts it in the meantime.
+        """
+        with self.staging_path() as staged:
+            try:
+                os.link(self._path(key), staged)
+                # The modification time of the entries orders them for
+                # eviction, and the link shares it with the entry
+                os.utime(staged)
+            except FileNotFoundError:
+                LOG.debug('Image file cache miss for %s.', key)
+                staged = None
+            except OSError as e:
+                LOG.warning('Could not use image file cache entry %(key)s: '
+                            '%(error)s', {'key': key, 'error': e})
+                staged = None
+            else:
+                LOG.debug('Image file cache hit for %s.', key)
+            yield staged
+
+    def find(self, image_id: str, image_meta: dict) -> Optional[str]:
+        """Get the path of a cached file of an image in any format."""
+        key = self.get_key(image_id, image_meta, '')
+        if key is None:
+            return None
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.startswith(key):
+                        return entry.path
+        except FileNotFoundError:
+            pass
+        return None
+
+    @contextlib.contextmanager
+    def staging_path(self) -> Generator[str, None, None]:
+        """Yield a path of the cache directory to write a new entry into."""
+        fileutils.ensure_tree(self.cache_dir)
+        path = self._path(_STAGING_PREFIX + uuidutils.generate_uuid())
+        try:
+            yield path
+        finally:
+            fileutils.delete_if_exists(path)
+
+    def add(self, key: str, source: str, move: bool = False) -> str:
+        """Add an image file to the cache.
+
+        Unless it is moved into the cache, the file is hardlinked into the
+        cache when possible, and cloned or copied otherwise, so the source
+        path is left untouched.
+
+        :param move: whether to move the file, for files of staging_path()
+        :returns: the path of the cache entry
+        """
+        path = self._path(key)
+        if move:
+            os.rename(source, path)
+        else:
+            with self.staging_path() as staged:
+                try:
+                    os.link(source, staged)
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM):
+                        raise
+                    if not clone_file(source, staged):
+                        tpool.execute(shutil.copyfile, source, staged)
+                os.rename(staged, path)
+        LOG.debug('Added %s to the image file cache.', key)
+        self.evict(keep=key)
+        return path
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Evict the least recently used entries over the cache size.
+
+        :param keep: key of an entry that is never evicted
+        """
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(_STAGING_PREFIX):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                # Sparse files only use the space of their allocated blocks
+                size = stat.st_blocks * 512
+                total_size += size
+                entries.append((stat.st_mtime, entry.name, size))
+
+        entries.sort()
+        for _mtime, name, size in entries:
+            if total_size <= self.max_size:
+                break
+            if name == keep:
+                continue
+            LOG.debug('Evicting %s from the image file cache.', name)
+            fileutils.delete_if_exists(self._path(name))
+            total_size -= size
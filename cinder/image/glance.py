@@ -17,9 +17,12 @@
 """Implementation of an image service that uses Glance as the backend"""
 
 import copy
+import hashlib
 import itertools
+import os
 import random
 import shutil
+import stat
 import sys
 import textwrap
 import time
@@ -27,14 +30,22 @@ from typing import (Any, Callable, Iterable, NoReturn, Optional)
 import urllib
 import urllib.parse
 
+from eventlet import greenthread
+from eventlet import tpool
 import glanceclient
+import glanceclient.common.http
 import glanceclient.exc
+from keystoneauth1 import adapter as ks_adapter
+from keystoneauth1 import exceptions as ks_exceptions
 from keystoneauth1 import loading as ks_loading
 from keystoneauth1.loading import session as ks_session
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import excutils
 from oslo_utils import timeutils
+from oslo_utils import units
+import requests
 
 from cinder import context
 from cinder import exception
@@ -107,6 +118,37 @@ _SESSION = None
 
 LOG = logging.getLogger(__name__)
 
+# Images downloaded in byte ranges get at most one range per
+# MIN_RANGE_SIZE bytes, and the data of every range is read and written in
+# blocks of RANGE_WRITE_SIZE bytes.
+MIN_RANGE_SIZE = 64 * units.Mi
+RANGE_WRITE_SIZE = 4 * units.Mi
+
+
+class _RangesNotSupported(Exception):
+    """The image store ignored a Range request."""
+    pass
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _hash_file(path: str, size: int, hasher) -> None:
+    # Called from a native thread, like image_utils._verify_image, since
+    # hashing is CPU bound.
+    with open(path, 'rb') as image_file:
+        while size > 0:
+            block = image_file.read(min(RANGE_WRITE_SIZE, size))
+            if not block:
+                break
+            hasher.update(block)
+            size -= len(block)
+
 
 def _parse_image_ref(image_href: str) -> tuple[str, str, bool]:
     """Parse an image href into composite parts.
@@ -307,6 +349,39 @@ class GlanceClientWrapper(object):
             except glanceclient.exc.HTTPOverLimit as e:
                 raise exception.ImageLimitExceeded(e)
 
+    def get_range(self,
+                  context: context.RequestContext,
+                  url: str,
+                  start: int,
+                  end: int) -> requests.Response:
+        """Request the bytes start to end of a glance URL.
+
+        The glance client percent-encodes the value of the Range header, so
+        the request is sent through the HTTP session of the client. The
+        response body is streamed.
+        """
+        client = self.client or self._create_onetime_client(context)
+        http_client = client.http_client
+        headers = {'Range': 'bytes=%d-%d' % (start, end)}
+        try:
+            if isinstance(http_client, glanceclient.common.http.SessionClient):
+                resp = ks_adapter.Adapter.request(http_client, url, 'GET',
+                                                  headers=headers,
+                                                  stream=True,
+                                                  raise_exc=False)
+            else:
+                headers['X-Auth-Token'] = http_client.auth_token
+                resp = http_client.session.get(http_client.endpoint + url,
+                                               headers=headers,
+                                               stream=True,
+                                               timeout=http_client.timeout)
+        except (requests.exceptions.RequestException,
+                ks_exceptions.ConnectionError) as e:
+            raise exception.GlanceConnectionFailed(reason=e)
+        if not resp.ok:
+            raise glanceclient.exc.from_response(resp, resp.content)
+        return resp
+
 
 class GlanceImageService(object):
     """Provides storage and retrieval of disk image objects within Glance."""
@@ -505,6 +580,10 @@ class GlanceImageService(object):
                         shutil.copyfileobj(f, data)
                     return
 
+        if (data and CONF.glance_download_ranges > 1 and
+                self._download_ranges(context, image_id, data)):
+            return
+
         try:
             image_chunks = self._client.call(context, 'data', image_id)
         except Exception:
@@ -520,6 +599,163 @@ class GlanceImageService(object):
             for chunk in image_chunks:
                 data.write(chunk)
 
+    def _download_ranges(self,
+                         context: context.RequestContext,
+                         image_id: str,
+                         data) -> bool:
+        """Download an image in byte ranges fetched concurrently.
+
+        Every range is written at its offset of the data file, and the
+        checksum of the image is verified once all of them were written.
+
+        Returns False, before writing anything, when the image can't be
+        downloaded that way: it is too small, the data is not a file that
+        can be written at offsets and read back, or the image store doesn't
+        honour Range requests.
+        """
+        try:
+            fd = data.fileno()
+            path = data.name
+            mode = os.fstat(fd).st_mode
+        except (AttributeError, OSError, TypeError):
+            return False
+        if (not isinstance(path, str) or
+                not (stat.S_ISREG(mode) or stat.S_ISBLK(mode))):
+            return False
+
+        try:
+            _resp, image = self._client.call(context, 'get',
+                                             '/v2/images/%s' % image_id,
+                                             controller='http_client')
+        except Exception:
+            _reraise_translated_image_exception(image_id)
+        size = image.get('size')
+        if not size:
+            return False
+        count = min(CONF.glance_download_ranges, -(-size // MIN_RANGE_SIZE))
+        if count < 2:
+            return False
+        range_size = -(-size // count)
+        ranges = [(start, min(start + range_size, size) - 1)
+                  for start in range(0, size, range_size)]
+
+        try:
+            first_chunks = self._open_range(context, image_id, *ranges[0])
+        except _RangesNotSupported:
+            LOG.info('The store of image %s does not honour Range requests, '
+                     'downloading it over a single connection.', image_id)
+            return False
+
+        LOG.debug('Downloading image %(image_id)s in %(count)d ranges.',
+                  {'image_id': image_id, 'count': len(ranges)})
+        threads = [greenthread.spawn(self._download_range, context,
+                                     image_id, fd, start, end,
+                                     first_chunks if start == 0 else None)
+                   for start, end in ranges]
+        try:
+            for thread in threads:
+                thread.wait()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for thread in threads:
+                    thread.kill()
+
+        self._verify_ranges(image_id, image, path, size)
+        return True
+
+    def _open_range(self,
+                    context: context.RequestContext,
+                    image_id: str,
+                    start: int,
+                    end: int) -> Iterable[bytes]:
+        try:
+            resp = self._client.get_range(context,
+                                          '/v2/images/%s/file' % image_id,
+                                          start, end)
+        except glanceclient.exc.HTTPException:
+            _reraise_translated_image_exception(image_id)
+        content_range = resp.headers.get('Content-Range', '')
+        if (resp.status_code != 206 or
+                not content_range.startswith('bytes %d-' % start)):
+            resp.close()
+            raise _RangesNotSupported()
+        return resp.iter_content(chunk_size=RANGE_WRITE_SIZE)
+
+    def _download_range(self,
+                        context: context.RequestContext,
+                        image_id: str,
+                        fd: int,
+                        start: int,
+                        end: int,
+                        chunks: Optional[Iterable[bytes]] = None) -> None:
+        """Download the bytes start to end of an image at their offset.
+
+        Failed downloads are resumed from the last byte written, up to
+        CONF.glance_download_range_retries times.
+        """
+        offset = start
+        num_attempts = 1 + CONF.glance_download_range_retries
+        for attempt in range(1, num_attempts + 1):
+            try:
+                if chunks is None:
+                    chunks = self._open_range(context, image_id, offset,
+                                              end)
+                for chunk in chunks:
+                    chunk = chunk[:end + 1 - offset]
+                    tpool.execute(_pwrite_all, fd, chunk, offset)
+                    offset += len(chunk)
+                if offset > end:
+                    return
+                reason = _('the connection was closed early')
+            except (requests.exceptions.RequestException,
+                    exception.GlanceConnectionFailed,
+                    _RangesNotSupported) as e:
+                reason = str(e) or e.__class__.__name__
+            chunks = None
+            LOG.warning('Error downloading bytes %(offset)d-%(end)d of '
+                        'image %(image_id)s, attempt %(attempt)d of '
+                        '%(num_attempts)d: %(reason)s',
+                        {'offset': offset, 'end': end, 'image_id': image_id,
+                         'attempt': attempt, 'num_attempts': num_attempts,
+                         'reason': reason})
+            if attempt < num_attempts:
+                time.sleep(1)
+
+        raise exception.ImageDownloadFailed(
+            image_href=image_id,
+            reason=_('could not download bytes %(offset)d-%(end)d') %
+            {'offset': offset, 'end': end})
+
+    @staticmethod
+    def _verify_ranges(image_id: str, image: dict, path: str,
+                       size: int) -> None:
+        """Verify the checksum of an image downloaded in ranges.
+
+        Like the glance client, the os_hash_value of the image is used, or
+        its MD5 checksum for images that don't have one.
+        """
+        hash_value = image.get('os_hash_value')
+        try:
+            if hash_value:
+                hasher = hashlib.new(str(image.get('os_hash_algo')))
+            elif image.get('checksum'):
+                hash_value = image['checksum']
+                hasher = hashlib.md5(usedforsecurity=False)
+            else:
+                LOG.debug('Image %s has no checksum, its data is not '
+                          'verified.', image_id)
+                return
+        except ValueError as e:
+            raise exception.ImageDownloadFailed(image_href=image_id,
+                                                reason=e)
+
+        tpool.execute(_hash_file, path, size, hasher)
+        if hasher.hexdigest() != hash_value:
+            raise exception.ImageDownloadFailed(
+                image_href=image_id,
+                reason=_('the checksum of the downloaded data does not '
+                         'match the image checksum.'))
+
     def create(self,
                context: context.RequestContext,
                image_meta: dict[str, Any],
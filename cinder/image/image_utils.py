@@ -26,6 +26,7 @@ we should look at maybe pushing this up to Oslo
 import contextlib
 import errno
 import io
+import itertools
 import math
 import os
 import re
@@ -37,10 +38,13 @@ from typing import ContextManager, Generator, Optional
 import cryptography
 from cursive import exception as cursive_exception
 from cursive import signature_utils
+from eventlet import greenthread
+from eventlet import queue as greenqueue
 from eventlet import tpool
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import excutils
 from oslo_utils import fileutils
 from oslo_utils import imageutils
 from oslo_utils import timeutils
@@ -50,6 +54,8 @@ from cinder import context
 from cinder import exception
 from cinder.i18n import _
 from cinder.image import accelerator
+from cinder.image import file_cache
+from cinder.image import format_inspector
 from cinder.image import glance
 import cinder.privsep.format_inspector
 import cinder.privsep.path
@@ -108,6 +114,19 @@ image_opts = [
                      'this configuration option allows operators to specify '
                      '*additional* namespaces to be excluded.',
                 default=[]),
+    cfg.BoolOpt('image_stream_to_volume',
+                default=False,
+                help='Write raw images straight onto raw volumes while they '
+                'are downloaded, instead of staging them in '
+                'image_conversion_dir first. The first chunks of the image '
+                'are inspected to make sure it is really a raw image, and '
+                'the image is staged as usual when that cannot be '
+                'determined. Images that need to be converted, decompressed '
+                'or whose signature has to be verified are always staged. '
+                'Streamed images are written in full, zeros included. '
+                'Images are not streamed when volume_copy_bps_limit is set, '
+                'since the streamed data is not written by a copy command '
+                'that can be throttled.'),
 ]
 
 CONF = cfg.CONF
@@ -133,6 +152,14 @@ COMPRESSIBLE_IMAGE_FORMATS = ('qcow2',)
 GLANCE_RESERVED_NAMESPACES = ["os_glance", "img_signature",
                               "signature_verified"]
 
+# Bytes of a streamed image that are held back until the format inspectors
+# rule out every format other than raw.
+STREAM_INSPECT_LIMIT = 1 * units.Mi
+# Streamed chunks are coalesced into writes of this size, and up to
+# STREAM_QUEUE_DEPTH of those writes are queued while the download goes on.
+STREAM_WRITE_SIZE = 4 * units.Mi
+STREAM_QUEUE_DEPTH = 4
+
 
 def validate_stores_id(context: context.RequestContext,
                        image_service_store_id: str) -> None:
@@ -702,25 +729,9 @@ def fetch(context: context.RequestContext,
     start_time = timeutils.utcnow()
     with fileutils.remove_path_on_error(path):
         with open(path, "wb") as image_file:
-            try:
+            with _translate_download_errors(image_id, path):
                 image_service.download(context, image_id,
                                        tpool.Proxy(image_file))
-            except IOError as e:
-                if e.errno == errno.ENOSPC:
-                    params = {'path': os.path.dirname(path),
-                              'image': image_id}
-                    reason = _("No space left in image_conversion_dir "
-                               "path (%(path)s) while fetching "
-                               "image %(image)s.") % params
-                    LOG.exception(reason)
-                    raise exception.ImageTooBig(image_id=image_id,
-                                                reason=reason)
-
-                reason = ("IOError: %(errno)s %(strerror)s" %
-                          {'errno': e.errno, 'strerror': e.strerror})
-                LOG.error(reason)
-                raise exception.ImageDownloadFailed(image_href=image_id,
-                                                    reason=reason)
 
     duration = timeutils.delta_seconds(start_time, timeutils.utcnow())
 
@@ -739,6 +750,263 @@ def fetch(context: context.RequestContext,
     LOG.info(msg, {"sz": fsz_mb, "mbps": mbps})
 
 
+@contextlib.contextmanager
+def _translate_download_errors(image_id: str,
+                               path: str) -> Generator[None, None, None]:
+    try:
+        yield
+    except IOError as e:
+        if e.errno == errno.ENOSPC:
+            params = {'path': os.path.dirname(path),
+                      'image': image_id}
+            reason = _("No space left in image_conversion_dir "
+                       "path (%(path)s) while fetching "
+                       "image %(image)s.") % params
+            LOG.exception(reason)
+            raise exception.ImageTooBig(image_id=image_id,
+                                        reason=reason)
+
+        reason = ("IOError: %(errno)s %(strerror)s" %
+                  {'errno': e.errno, 'strerror': e.strerror})
+        LOG.error(reason)
+        raise exception.ImageDownloadFailed(image_href=image_id,
+                                            reason=reason)
+
+
+def is_streamable(image_meta: dict, volume_format: str = 'raw') -> bool:
+    """Check if an image can be written onto a volume as it is downloaded.
+
+    Only raw images written onto raw volumes are plain copies; any other
+    image is converted by qemu-img, which seeks in the image file, and
+    decompression and signature verification need the whole image first.
+    Streamed images are written by the volume service itself, outside of
+    the blkio cgroup volume_copy_bps_limit puts the copy commands in, so
+    images are not streamed when copies are throttled.
+    """
+    if not CONF.image_stream_to_volume or volume_format != 'raw':
+        return False
+    if throttling.Throttle.DEFAULT is not None:
+        return False
+    if image_meta.get('size') is None:
+        return False
+    if fixup_disk_format(image_meta.get('disk_format')) != 'raw':
+        return False
+    if image_meta.get('container_format') == 'compressed':
+        return False
+    properties = image_meta.get('properties') or {}
+    return properties.get('img_signature') is None
+
+
+def _inspect_stream_head(image_id: str,
+                         chunks: typing.Iterator[bytes]) -> tuple[bool, list]:
+    """Inspect the first chunks of an image claimed to be raw.
+
+    Returns whether every other format was ruled out, and the chunks that
+    were read to find it out.
+
+    :raises ImageUnacceptable: when the image is in another format
+    """
+    inspectors = {fmt: inspector_class()
+                  for fmt, inspector_class in
+                  format_inspector.ALL_FORMATS.items() if fmt != 'raw'}
+    head = []
+    read = 0
+    for chunk in chunks:
+        head.append(chunk)
+        read += len(chunk)
+        for fmt, inspector in list(inspectors.items()):
+            try:
+                inspector.eat_chunk(chunk)
+            except format_inspector.ImageFormatError:
+                # No match, so stop considering this format
+                inspectors.pop(fmt)
+                continue
+            if inspector.complete:
+                if inspector.format_match:
+                    LOG.debug("Rejecting image %(image_id)s due to format "
+                              "mismatch. disk_format: 'raw', but the image "
+                              "data is '%(fmt)s'",
+                              {'image_id': image_id, 'fmt': fmt})
+                    msg = _("The image format was claimed to be 'raw' but "
+                            "the image data appears to be in a different "
+                            "format.")
+                    raise exception.ImageUnacceptable(image_id=image_id,
+                                                      reason=msg)
+                inspectors.pop(fmt)
+        if not inspectors:
+            return True, head
+        if read >= STREAM_INSPECT_LIMIT:
+            return False, head
+    # The whole image was read and none of the formats matched
+    return True, head
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class _VolumeStreamWriter(object):
+    """Write image data onto a volume while the next data is downloaded.
+
+    Writes are queued to a greenthread that runs them in native threads, so
+    the download goes on while they complete, until STREAM_QUEUE_DEPTH
+    writes are pending.
+    """
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._queue: greenqueue.LightQueue = greenqueue.LightQueue(
+            STREAM_QUEUE_DEPTH)
+        self._error: Optional[Exception] = None
+        self.written = 0
+        self._thread = greenthread.spawn(self._run)
+
+    def _run(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if self._error is not None:
+                # Drain the queue so the writer never blocks
+                continue
+            try:
+                tpool.execute(_write_all, self._fd, data)
+                self.written += len(data)
+            except Exception as e:
+                self._error = e
+        if self._error is None:
+            try:
+                tpool.execute(os.fsync, self._fd)
+            except Exception as e:
+                self._error = e
+
+    def _check_error(self) -> None:
+        if self._error is not None:
+            raise exception.ImageCopyFailure(reason=self._error)
+
+    def write(self, data: bytes) -> None:
+        self._check_error()
+        self._queue.put(data)
+
+    def wait(self) -> None:
+        """Wait for the queued writes to complete."""
+        self._queue.put(None)
+        self._thread.wait()
+
+    def close(self) -> None:
+        """Wait for the queued writes, and raise their errors if any."""
+        self.wait()
+        self._check_error()
+
+
+def _stream_chunks(image_id: str,
+                   chunks: typing.Iterable[bytes],
+                   dest: str,
+                   image_size: int) -> None:
+    fd = os.open(dest, os.O_WRONLY)
+    try:
+        writer = _VolumeStreamWriter(fd)
+        try:
+            pending = []
+            pending_size = 0
+            read = 0
+            with _translate_download_errors(image_id, dest):
+                for chunk in chunks:
+                    read += len(chunk)
+                    if read > image_size:
+                        reason = _("Image data exceeds the image size of "
+                                   "%d bytes.") % image_size
+                        raise exception.ImageDownloadFailed(
+                            image_href=image_id, reason=reason)
+                    pending.append(chunk)
+                    pending_size += len(chunk)
+                    if pending_size >= STREAM_WRITE_SIZE:
+                        writer.write(b''.join(pending))
+                        pending = []
+                        pending_size = 0
+            if read != image_size:
+                reason = _("Image data ended after %(read)d bytes of the "
+                           "image size of %(size)d bytes.") % {
+                    'read': read, 'size': image_size}
+                raise exception.ImageDownloadFailed(image_href=image_id,
+                                                    reason=reason)
+            if pending:
+                writer.write(b''.join(pending))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                writer.wait()
+        writer.close()
+    finally:
+        os.close(fd)
+
+
+def _stage_chunks(image_id: str,
+                  chunks: typing.Iterable[bytes],
+                  path: str) -> None:
+    with fileutils.remove_path_on_error(path):
+        with open(path, "wb") as image_file:
+            with _translate_download_errors(image_id, path):
+                image_file = tpool.Proxy(image_file)
+                for chunk in chunks:
+                    image_file.write(chunk)
+
+
+def stream_to_volume(context: context.RequestContext,
+                     image_service: glance.GlanceImageService,
+                     image_id: str,
+                     image_meta: dict,
+                     dest: str,
+                     staging_path: str,
+                     size: Optional[int] = None,
+                     run_as_root: bool = True) -> bool:
+    """Write a raw image onto a volume while it is downloaded.
+
+    The image is held back until the format inspectors make sure it is a
+    raw image. When they can't tell from the first STREAM_INSPECT_LIMIT
+    bytes, the image is downloaded into the staging path instead, to be
+    checked and converted like any other image.
+
+    :param image_meta: the image metadata, which is_streamable() accepted
+    :param size: the size of the volume in GB, or None to not check it
+    :returns: True if the image was written onto the volume, False if it
+              was downloaded into the staging path
+    :raises ImageUnacceptable: when the image data is not raw, or doesn't
+                               fit in the volume
+    """
+    image_size = image_meta['size']
+    if size is not None:
+        check_virtual_size(image_size, size, image_id)
+
+    start_time = timeutils.utcnow()
+    with _translate_download_errors(image_id, staging_path):
+        chunks = iter(image_service.download(context, image_id))
+        is_raw, head = _inspect_stream_head(image_id, chunks)
+    if not is_raw:
+        LOG.info('Could not tell the format of image %s from its first '
+                 'chunks, staging it instead of streaming it.', image_id)
+        _stage_chunks(image_id, itertools.chain(head, chunks), staging_path)
+        return False
+
+    LOG.debug('Streaming image %(image_id)s to volume %(dest)s',
+              {'image_id': image_id, 'dest': dest})
+    if run_as_root:
+        ownership = chown_if_needed(dest, os.W_OK)
+    else:
+        ownership = contextlib.nullcontext()
+    with ownership:
+        _stream_chunks(image_id, itertools.chain(head, chunks), dest,
+                       image_size)
+
+    duration = max(timeutils.delta_seconds(start_time, timeutils.utcnow()), 1)
+    size_mb = image_size / units.Mi
+    LOG.info("Image stream %(sz).2f MB at %(mbps).2f MB/s",
+             {"sz": size_mb, "mbps": size_mb / duration})
+    return True
+
+
 def get_qemu_data(image_id: str,
                   has_meta: bool,
                   disk_format_raw: bool,
@@ -1030,6 +1298,20 @@ def fetch_to_volume_format(context: context.RequestContext,
                          "but container_format is "
                          "%(container_format)s.") % compression_param)
 
+    image_file_cache = file_cache.ImageFileCache.get_default()
+    cache_key = None
+    if image_file_cache:
+        cache_key = image_file_cache.get_key(image_id, image_meta,
+                                             volume_format, volume_subformat)
+    if cache_key:
+        with image_file_cache.pin(cache_key) as cached_path:
+            if cached_path:
+                _write_cached_image(cached_path, dest, volume_format,
+                                    volume_subformat, image_id, size=size,
+                                    run_as_root=run_as_root,
+                                    disable_sparse=disable_sparse)
+                return
+
     # NOTE(avishay): I'm not crazy about creating temp files which may be
     # large and cause disk full errors which would confuse users.
     # Unfortunately it seems that you can't pipe to 'qemu-img convert' because
@@ -1053,6 +1335,11 @@ def fetch_to_volume_format(context: context.RequestContext,
         tmp_image = tmp_images.get(context, image_id)
         if tmp_image:
             tmp = tmp_image
+        elif cache_key is None and is_streamable(image_meta, volume_format):
+            if stream_to_volume(context, image_service, image_id,
+                                image_meta, dest, tmp, size=size,
+                                run_as_root=run_as_root):
+                return
         else:
             fetch(context, image_service, image_id, tmp, user_id, project_id)
 
@@ -1122,6 +1409,22 @@ def fetch_to_volume_format(context: context.RequestContext,
         disk_format = fixup_disk_format(image_meta['disk_format'])
         LOG.debug("%s was %s, converting to %s", image_id, fmt, volume_format)
 
+        if cache_key:
+            _add_to_file_cache(
+                image_file_cache, cache_key, tmp, disk_format, volume_format,
+                volume_subformat, image_id, data, run_as_root=run_as_root)
+            with image_file_cache.pin(cache_key) as cached_path:
+                if cached_path:
+                    _write_cached_image(cached_path, dest, volume_format,
+                                        volume_subformat, image_id,
+                                        run_as_root=run_as_root,
+                                        disable_sparse=disable_sparse)
+                    return
+            # Another service evicted the image already, convert the
+            # downloaded image like without the cache
+            LOG.debug('Image %s was evicted from the image file cache '
+                      'before it was used.', image_id)
+
         convert_image(tmp, dest, volume_format,
                       out_subformat=volume_subformat,
                       src_format=disk_format,
@@ -1131,9 +1434,101 @@ def fetch_to_volume_format(context: context.RequestContext,
                       disable_sparse=disable_sparse)
 
 
+def _add_to_file_cache(image_file_cache: file_cache.ImageFileCache,
+                       cache_key: str,
+                       source: str,
+                       src_format: str,
+                       volume_format: str,
+                       volume_subformat: Optional[str],
+                       image_id: str,
+                       data: imageutils.QemuImgInfo,
+                       run_as_root: bool = True) -> None:
+    """Add a downloaded image to the image file cache.
+
+    Images already in the format of the volume are cached as they were
+    downloaded, the others are converted into the cache.
+    """
+    if src_format == volume_format and not volume_subformat:
+        check_image_format(source, src_format=src_format, image_id=image_id,
+                           data=data, run_as_root=run_as_root)
+        image_file_cache.add(cache_key, source)
+        return
+
+    with image_file_cache.staging_path() as staged:
+        convert_image(source, staged, volume_format,
+                      out_subformat=volume_subformat,
+                      src_format=src_format,
+                      run_as_root=run_as_root,
+                      image_id=image_id,
+                      data=data)
+        image_file_cache.add(cache_key, staged, move=True)
+
+
+def _write_cached_image(path: str,
+                        dest: str,
+                        volume_format: str,
+                        volume_subformat: Optional[str],
+                        image_id: str,
+                        size: Optional[int] = None,
+                        run_as_root: bool = True,
+                        disable_sparse: bool = False) -> None:
+    """Write an image of the image file cache onto a volume.
+
+    Volume files are cloned from the cache when the filesystem allows it,
+    the cached image is copied by qemu-img otherwise.
+    """
+    data = qemu_img_info(path, run_as_root=run_as_root)
+    if size is not None:
+        check_virtual_size(data.virtual_size, size, image_id)
+
+    if os.path.isfile(dest):
+        if run_as_root:
+            ownership = chown_if_needed(dest, os.W_OK)
+        else:
+            ownership = contextlib.nullcontext()
+        with ownership:
+            if file_cache.clone_file(path, dest):
+                return
+
+    convert_image(path, dest, volume_format,
+                  out_subformat=volume_subformat,
+                  src_format=volume_format,
+                  run_as_root=run_as_root,
+                  image_id=image_id,
+                  data=data,
+                  disable_sparse=disable_sparse)
+
+
+def get_virtual_size_without_download(image_id: str,
+                                      image_meta: dict) -> Optional[int]:
+    """Get the virtual size of an image, if it is known without a download.
+
+    Images streamed onto volumes are raw images of the size of the image,
+    and images of the image file cache are inspected there. Signed images
+    always have to be downloaded to verify their signature.
+    """
+    if is_streamable(image_meta):
+        return image_meta['size']
+    properties = image_meta.get('properties') or {}
+    if properties.get('img_signature') is not None:
+        return None
+    image_file_cache = file_cache.ImageFileCache.get_default()
+    if image_file_cache is None:
+        return None
+    path = image_file_cache.find(image_id, image_meta)
+    if path is None:
+        return None
+    try:
+        return qemu_img_info(path).virtual_size
+    except processutils.ProcessExecutionError:
+        # The image was evicted from the cache in the meantime
+        return None
+
+
 @contextlib.contextmanager
-def chown_if_needed(volume_path: str) -> Generator[None, None, None]:
-    if os.access(volume_path, os.R_OK):
+def chown_if_needed(volume_path: str,
+                    mode: int = os.R_OK) -> Generator[None, None, None]:
+    if os.access(volume_path, mode):
         yield
     else:
         with utils.temporary_chown(volume_path):
@@ -205,6 +205,8 @@ class SchedulerDependentManager(ThreadPoolManager):
         **kwargs,
     ):
         self.last_capabilities = None
+        # Set to a CapabilitiesReporter to send the capabilities as deltas
+        self.capabilities_reporter = None
         self.service_name = service_name
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         super().__init__(host, cluster=cluster, *args, **kwargs)
@@ -213,16 +215,26 @@ class SchedulerDependentManager(ThreadPoolManager):
         """Remember these capabilities to send on next periodic update."""
         self.last_capabilities = capabilities
 
-    def _publish_service_capabilities(self, context):
-        """Pass data back to the scheduler at a periodic interval."""
+    def _publish_service_capabilities(self, context, full=False):
+        """Pass data back to the scheduler at a periodic interval.
+
+        With a capabilities reporter, only the changes since the previous
+        report are sent to the schedulers, unless full is True.
+        """
         if self.last_capabilities:
             LOG.debug('Notifying Schedulers of capabilities ...')
+            version = delta = None
+            if self.capabilities_reporter:
+                version, delta = self.capabilities_reporter.report(
+                    self.last_capabilities, full=full)
             self.scheduler_rpcapi.update_service_capabilities(
                 context,
                 self.service_name,
                 self.host,
                 self.last_capabilities,
-                self.cluster)
+                self.cluster,
+                capabilities_version=version,
+                capabilities_delta=delta)
             try:
                 self.scheduler_rpcapi.notify_service_capabilities(
                     context,
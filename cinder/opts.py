@@ -43,6 +43,7 @@ from cinder.backup.drivers import s3 as cinder_backup_drivers_s3
 from cinder.backup.drivers import swift as cinder_backup_drivers_swift
 from cinder.backup import manager as cinder_backup_manager
 from cinder.cmd import backup as cinder_cmd_backup
+from cinder.cmd import scheduler as cinder_cmd_scheduler
 from cinder.cmd import volume as cinder_cmd_volume
 from cinder.common import config as cinder_common_config
 import cinder.compute
@@ -50,6 +51,7 @@ from cinder.compute import nova as cinder_compute_nova
 from cinder import context as cinder_context
 from cinder import coordination as cinder_coordination
 from cinder.db import api as cinder_db_api
+from cinder.image import file_cache as cinder_image_filecache
 from cinder.image import glance as cinder_image_glance
 from cinder.image import image_utils as cinder_image_imageutils
 from cinder.keymgr import conf_key_mgr as cinder_keymgr_confkeymgr
@@ -249,6 +251,7 @@ def list_opts():
                 cinder_backup_drivers_swift.swiftbackup_service_opts,
                 cinder_backup_manager.backup_manager_opts,
                 cinder_cmd_backup.backup_cmd_opts,
+                cinder_cmd_scheduler.scheduler_cmd_opts,
                 [cinder_cmd_volume.cluster_opt],
                 cinder_common_config.api_opts,
                 cinder_common_config.core_opts,
@@ -261,6 +264,7 @@ def list_opts():
                 cinder_context.context_opts,
                 cinder_db_api.db_opts,
                 cinder_db_api.backup_opts,
+                cinder_image_filecache.image_file_cache_opts,
                 cinder_image_glance.image_opts,
                 cinder_image_glance.glance_core_properties_opts,
                 cinder_image_imageutils.image_opts,
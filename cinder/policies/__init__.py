@@ -28,6 +28,7 @@ from cinder.policies import group_snapshots
 from cinder.policies import group_types
 from cinder.policies import groups
 from cinder.policies import hosts
+from cinder.policies import image_volume_cache
 from cinder.policies import limits
 from cinder.policies import manageable_snapshots
 from cinder.policies import manageable_volumes
@@ -57,6 +58,7 @@ def list_rules():
         messages.list_rules(),
         clusters.list_rules(),
         workers.list_rules(),
+        image_volume_cache.list_rules(),
         snapshot_metadata.list_rules(),
         snapshots.list_rules(),
         snapshot_actions.list_rules(),
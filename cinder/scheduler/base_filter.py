@@ -16,11 +16,13 @@
 """
 Filter support
 """
-from typing import Iterable
+import time
+from typing import Iterable, Optional
 
 from oslo_log import log as logging
 
 from cinder.scheduler import base_handler
+from cinder.scheduler import trace as sched_trace
 
 LOG = logging.getLogger(__name__)
 
@@ -82,7 +84,9 @@ class BaseFilterHandler(base_handler.BaseHandler):
                  msg_dict)
 
     def get_filtered_objects(self, filter_classes, objs: Iterable,
-                             filter_properties: dict, index: int = 0) -> list:
+                             filter_properties: dict, index: int = 0,
+                             trace: Optional[sched_trace.SchedulerTrace] = None
+                             ) -> list:
         """Get objects after filter
 
         :param filter_classes: filters that will be used to filter the
@@ -92,6 +96,8 @@ class BaseFilterHandler(base_handler.BaseHandler):
         :param index: This value needs to be increased in the caller
                       function of get_filtered_objects when handling
                       each resource.
+        :param trace: SchedulerTrace recording the time each filter took
+                      and the objects it removed, if any
         """
         list_objs = list(objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
@@ -108,14 +114,26 @@ class BaseFilterHandler(base_handler.BaseHandler):
             filter_class = filter_cls()
 
             if filter_class.run_filter_for_index(index):
+                if trace is not None:
+                    start_time = time.monotonic()
                 objs = filter_class.filter_all(list_objs, filter_properties)
                 if objs is None:
                     LOG.info("Filter %s returned 0 hosts", cls_name)
+                    if trace is not None:
+                        trace.add_filter(cls_name,
+                                         time.monotonic() - start_time,
+                                         list_objs, [])
                     full_filter_results.append((cls_name, None))
                     list_objs = None
                     break
 
+                objs_before = list_objs
                 list_objs = list(objs)
+                if trace is not None:
+                    # filter_all usually is a generator, so the time is
+                    # only known once the list has been built.
+                    trace.add_filter(cls_name, time.monotonic() - start_time,
+                                     objs_before, list_objs)
                 end_count = len(list_objs)
                 part_filter_results.append((cls_name, start_count, end_count))
                 remaining = [getattr(obj, "host", obj)
@@ -18,11 +18,16 @@ Pluggable Weighing support
 """
 
 import abc
+import bisect
+import heapq
+import math
+import time
 from typing import Iterable, Optional
 
 from oslo_log import log as logging
 
 from cinder.scheduler import base_handler
+from cinder.scheduler import trace as sched_trace
 
 
 LOG = logging.getLogger(__name__)
@@ -125,36 +130,236 @@ class BaseWeigher(object, metaclass=abc.ABCMeta):
         return weights
 
 
+class WeighedObjectList(object):
+    """Objects weighed once, whose weights can then be updated one by one.
+
+    The objects are weighed and sorted like BaseWeightHandler does. When
+    an object changes, for example because a resource consumed from it,
+    reweigh() only asks the weighers for the values of that object. The
+    values the weighers returned for the other objects are kept, along
+    with heaps of them giving the range of every weigher, so the list
+    stays the one weighing all the objects again would return.
+
+    When a change moves the range of a weigher, the other objects are only
+    normalized again when their weights are needed: first() finds the best
+    object without sorting them, and objects sorts them again.
+    """
+
+    # Whether the weights of the objects don't match the ranges anymore
+    _stale = False
+    # Whether the objects are not sorted by their weights anymore
+    _unsorted = False
+
+    def __init__(self,
+                 object_class: type,
+                 weigher_classes: list,
+                 obj_list: list,
+                 weighing_properties: dict,
+                 trace: Optional[sched_trace.SchedulerTrace] = None) -> None:
+        self.weighers = [weigher_cls() for weigher_cls in weigher_classes]
+        self.weighing_properties = weighing_properties
+        self.objects = [object_class(obj, 0.0) for obj in obj_list]
+        self._positions = {id(obj): index
+                           for index, obj in enumerate(self.objects)}
+        # Values returned by every weigher for every object
+        self._values: dict[int, list[float]] = {
+            id(obj): [] for obj in self.objects}
+        # Bounds set by the weighers themselves, which the values only
+        # widen
+        self._bounds = []
+        # Values infinite weights were replaced with
+        self._inf_values = []
+        self._ranges = []
+        # Heaps of the values of every weigher, and of their opposites, to
+        # find their range. Values replaced since are dropped lazily.
+        self._min_heaps: list[list] = []
+        self._max_heaps: list[list] = []
+
+        for weigher in self.weighers:
+            if trace is not None:
+                start_time = time.monotonic()
+            self._bounds.append((weigher.minval, weigher.maxval))
+            weights = weigher.weigh_objects(self.objects, weighing_properties)
+            min_heap = []
+            max_heap = []
+            for obj, weight in zip(self.objects, weights):
+                self._values[id(obj)].append(weight)
+                min_heap.append((weight, id(obj)))
+                max_heap.append((-weight, id(obj)))
+            heapq.heapify(min_heap)
+            heapq.heapify(max_heap)
+            self._min_heaps.append(min_heap)
+            self._max_heaps.append(max_heap)
+            self._inf_values.append(weigher.maxval)
+            self._ranges.append((weigher.minval, weigher.maxval))
+
+            if trace is not None:
+                trace.add_weigher(weigher.__class__.__name__,
+                                  time.monotonic() - start_time,
+                                  len(self.objects), weigher.minval,
+                                  weigher.maxval)
+
+            LOG.debug("Weigher %(cls_name)s returned, "
+                      "weigher value is {max: %(maxval)s, min: %(minval)s}",
+                      {'cls_name': weigher.__class__.__name__,
+                       'maxval': weigher.maxval,
+                       'minval': weigher.minval})
+
+        self._normalize()
+        self.objects.sort(key=self._sort_key)
+
+    @property
+    def objects(self) -> list:
+        """The objects, from the highest weight to the lowest."""
+        if self._stale:
+            self._normalize()
+        if self._unsorted:
+            self._objects.sort(key=self._sort_key)
+            self._unsorted = False
+        return self._objects
+
+    @objects.setter
+    def objects(self, objects: list) -> None:
+        self._objects = objects
+
+    def first(self) -> Optional[WeighedObject]:
+        """Return the object with the highest weight, None if empty."""
+        if not self._objects:
+            return None
+        if self._stale:
+            self._normalize()
+        if self._unsorted:
+            return min(self._objects, key=self._sort_key)
+        return self._objects[0]
+
+    def _normalize(self) -> None:
+        """Normalize the weights of the objects with the current ranges."""
+        scales = self._get_scales()
+        for obj in self._objects:
+            obj.weight = self._get_weight(obj, scales)
+        self._stale = False
+
+    def _get_scales(self) -> list[tuple[int, float, float, float]]:
+        """Return the index, multiplier, minimum and range of the weighers.
+
+        Weighers whose values are all equal are left out, like normalize()
+        makes them 0.
+        """
+        scales = []
+        for index, (weigher, (minval, maxval)) in enumerate(
+                zip(self.weighers, self._ranges)):
+            if minval is None or maxval is None:
+                # No objects left
+                continue
+            minval = float(minval)
+            maxval = float(maxval)
+            if minval != maxval:
+                scales.append((index, weigher.weight_multiplier(), minval,
+                               maxval - minval))
+        return scales
+
+    def _get_weight(self, weighed_obj: WeighedObject,
+                    scales: Optional[list] = None) -> float:
+        """Add up the normalized values of an object."""
+        if scales is None:
+            scales = self._get_scales()
+        values = self._values[id(weighed_obj)]
+        weight = 0.0
+        for index, multiplier, minval, range_ in scales:
+            weight += multiplier * ((values[index] - minval) / range_)
+        return weight
+
+    def _sort_key(self, weighed_obj: WeighedObject) -> tuple[float, int]:
+        # Descending weights, in the original order when they are equal like
+        # the stable sort of the first weighing
+        return -weighed_obj.weight, self._positions[id(weighed_obj)]
+
+    def _heap_top(self, heap: list, index: int,
+                  sign: int) -> Optional[float]:
+        """Return the top value of a heap, dropping the replaced ones."""
+        while heap:
+            value, key = heap[0]
+            values = self._values.get(key)
+            if values is not None and values[index] == sign * value:
+                return sign * value
+            heapq.heappop(heap)
+        return None
+
+    def _update_ranges(self) -> None:
+        """Mark the weights stale if a change moved the range of a weigher."""
+        for index, (minval, maxval) in enumerate(self._bounds):
+            lowest = self._heap_top(self._min_heaps[index], index, 1)
+            highest = self._heap_top(self._max_heaps[index], index, -1)
+            if lowest is not None:
+                minval = lowest if minval is None else min(minval, lowest)
+                maxval = highest if maxval is None else max(maxval, highest)
+            if (minval, maxval) != self._ranges[index]:
+                self._ranges[index] = (minval, maxval)
+                self._stale = self._unsorted = True
+
+    def reweigh(self, weighed_obj: WeighedObject) -> None:
+        """Recompute the weight of an object and move it to its new rank."""
+        values = []
+        for index, weigher in enumerate(self.weighers):
+            value = weigher._weigh_object(weighed_obj.obj,
+                                          self.weighing_properties)
+            if math.isinf(value):
+                value = self._inf_values[index]
+            values.append(value)
+            heapq.heappush(self._min_heaps[index], (value, id(weighed_obj)))
+            heapq.heappush(self._max_heaps[index],
+                           (-value, id(weighed_obj)))
+        self._values[id(weighed_obj)] = values
+
+        self._update_ranges()
+        if self._stale:
+            # The weights of the other objects changed too
+            return
+
+        weighed_obj.weight = self._get_weight(weighed_obj)
+        if not self._unsorted:
+            self._objects.remove(weighed_obj)
+            bisect.insort(self._objects, weighed_obj, key=self._sort_key)
+
+    def remove(self, weighed_obj: WeighedObject) -> None:
+        """Remove an object that can't be chosen anymore."""
+        self._objects.remove(weighed_obj)
+        del self._values[id(weighed_obj)]
+        self._update_ranges()
+
+
 class BaseWeightHandler(base_handler.BaseHandler):
     object_class = WeighedObject
 
+    # Whether get_weighed_object_list() can be used with this handler
+    incremental = True
+
     def get_weighed_objects(self,
                             weigher_classes: list,
                             obj_list: list[WeighedObject],
-                            weighing_properties: dict) -> list[WeighedObject]:
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+                            weighing_properties: dict,
+                            trace: Optional[sched_trace.SchedulerTrace] = None
+                            ) -> list[WeighedObject]:
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        If a SchedulerTrace is given, the time each weigher took and the
+        weights it found are recorded in it.
+        """
 
         if not obj_list:
             return []
 
-        weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
-        for weigher_cls in weigher_classes:
-            weigher = weigher_cls()
-            weights = weigher.weigh_objects(weighed_objs, weighing_properties)
-
-            # Normalize the weights
-            weights = normalize(weights,
-                                minval=weigher.minval,
-                                maxval=weigher.maxval)
-
-            for i, weight in enumerate(weights):
-                obj = weighed_objs[i]
-                obj.weight += weigher.weight_multiplier() * weight
-
-            LOG.debug("Weigher %(cls_name)s returned, "
-                      "weigher value is {max: %(maxval)s, min: %(minval)s}",
-                      {'cls_name': weigher_cls.__name__,
-                       'maxval': weigher.maxval,
-                       'minval': weigher.minval})
-
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+        return self.get_weighed_object_list(weigher_classes, obj_list,
+                                            weighing_properties,
+                                            trace=trace).objects
+
+    def get_weighed_object_list(self,
+                                weigher_classes: list,
+                                obj_list: list,
+                                weighing_properties: dict,
+                                trace: Optional[
+                                    sched_trace.SchedulerTrace] = None) \
+            -> WeighedObjectList:
+        """Return the weighed objects in a list that can be re-weighed."""
+        return WeighedObjectList(self.object_class, weigher_classes,
+                                 obj_list, weighing_properties, trace=trace)
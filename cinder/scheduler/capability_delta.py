@@ -0,0 +1,135 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Capability reports sent as changes since the previous report.
+
+A delta between two capability dicts has the following keys:
+
+- ``changed``: backend level capabilities that were added or changed.
+- ``removed``: backend level capabilities that were removed.
+- ``pool_names``: names of all the reported pools, in order. Only present
+  when both reports have a list of pools.
+- ``pools``: for every pool that was added or changed, a dict with the
+  ``changed`` and ``removed`` capabilities of the pool.
+"""
+
+import copy
+from typing import Any, Optional
+
+from oslo_utils import uuidutils
+
+
+def _diff(old: dict, new: dict, skip: tuple = ()) -> tuple[dict, list]:
+    changed = {key: value for key, value in new.items()
+               if key not in skip and (key not in old or old[key] != value)}
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+
+def _pools_by_name(capabilities: dict) -> Optional[dict]:
+    pools = capabilities.get('pools')
+    if not isinstance(pools, list):
+        return None
+    by_name = {pool.get('pool_name'): pool for pool in pools}
+    # Pools can only be matched if their names are unique
+    return by_name if len(by_name) == len(pools) else None
+
+
+def make_delta(old: dict, new: dict) -> dict:
+    """Return the delta that turns the old capabilities into the new ones."""
+    old_pools = _pools_by_name(old)
+    new_pools = _pools_by_name(new)
+    if old_pools is None or new_pools is None:
+        changed, removed = _diff(old, new)
+        return {'changed': changed, 'removed': removed}
+
+    changed, removed = _diff(old, new, skip=('pools',))
+    pools = {}
+    for name, pool in new_pools.items():
+        pool_changed, pool_removed = _diff(old_pools.get(name, {}), pool)
+        if pool_changed or pool_removed:
+            pools[name] = {'changed': pool_changed, 'removed': pool_removed}
+    return {'changed': changed,
+            'removed': removed,
+            'pool_names': list(new_pools),
+            'pools': pools}
+
+
+def apply_delta(old: dict, delta: dict) -> dict:
+    """Return the capabilities resulting from applying a delta to old ones.
+
+    The old capabilities are not modified, but the pools that didn't change
+    are shared with the returned capabilities.
+    """
+    removed = set(delta['removed'])
+    new = {key: value for key, value in old.items() if key not in removed}
+    new.update(delta['changed'])
+
+    if 'pool_names' in delta:
+        old_pools = _pools_by_name(old) or {}
+        pools = []
+        for name in delta['pool_names']:
+            pool = old_pools.get(name, {})
+            pool_delta = delta['pools'].get(name)
+            if pool_delta:
+                pool = {key: value for key, value in pool.items()
+                        if key not in pool_delta['removed']}
+                pool.update(pool_delta['changed'])
+            pools.append(pool)
+        new['pools'] = pools
+    return new
+
+
+def copy_capabilities(capabilities: dict) -> dict:
+    """Copy capabilities deep enough for their pools to be modified."""
+    result = dict(capabilities)
+    if isinstance(result.get('pools'), list):
+        result['pools'] = [dict(pool) for pool in result['pools']]
+    return result
+
+
+class CapabilitiesReporter(object):
+    """Decides whether each capability report is sent in full or as a delta.
+
+    Reports are numbered, so receivers can detect missed deltas, and the
+    numbering restarts with a new generation when the service restarts.
+    All the capabilities are sent every full_report_interval reports, or
+    always if it is 0.
+    """
+
+    def __init__(self, full_report_interval: int) -> None:
+        self.full_report_interval = full_report_interval
+        self.generation = uuidutils.generate_uuid()
+        self.version = 0
+        self._last: Optional[dict] = None
+        self._deltas_sent = 0
+
+    def report(self,
+               capabilities: dict[str, Any],
+               full: bool = False) -> tuple[dict, Optional[dict]]:
+        """Register a report of the capabilities.
+
+        Returns the version of the report and the delta to send, which is
+        None when all the capabilities must be sent.
+        """
+        self.version += 1
+        delta = None
+        if (not full and self._last is not None and
+                self._deltas_sent < self.full_report_interval):
+            delta = make_delta(self._last, capabilities)
+            self._deltas_sent += 1
+        else:
+            self._deltas_sent = 0
+        # Drivers may update their stats in place
+        self._last = copy.deepcopy(capabilities)
+        return {'generation': self.generation, 'version': self.version}, delta
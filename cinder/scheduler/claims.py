@@ -0,0 +1,99 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Capacity claims shared by all the schedulers.
+
+A scheduler virtually consumes the capacity of the pools it places volumes
+on, but only in its own memory, so several schedulers can place volumes on
+the same pool until the pool reports its stats again, over-committing it.
+
+Capacity claims are stored in the database instead, and updated with
+compare-and-swap semantics so concurrent claims on the same pool are
+serialized. The claims of a pool are on top of the stats it reported at a
+given time, and they are discarded once the pool reports stats collected
+after the last claim, like the capacity a scheduler consumed in memory is.
+"""
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from cinder.db import api as db
+from cinder import exception
+from cinder.scheduler.host_manager import BackendState
+
+CONF = cfg.CONF
+CONF.import_opt('scheduler_capacity_claim_retries', 'cinder.scheduler.driver')
+LOG = logging.getLogger(__name__)
+
+
+def _is_thin(request_spec: dict) -> bool:
+    vol_type = request_spec.get('volume_type') or {}
+    extra_specs = vol_type.get('extra_specs') or {}
+    return extra_specs.get('provisioning:type') != 'thick'
+
+
+def _is_superseded(claim, stats_updated) -> bool:
+    """Check if the pool stats were collected after the claims were made."""
+    last_claim = claim.updated_at or claim.created_at
+    return (claim.stats_timestamp < stats_updated and
+            (last_claim is None or last_claim < stats_updated))
+
+
+def claim_capacity(context, backend_state: BackendState,
+                   request_spec: dict) -> bool:
+    """Claim the capacity of a volume on a pool.
+
+    Returns whether the pool has room for the volume once the capacity
+    claimed by all the schedulers is taken into account.
+    """
+    size = request_spec['volume_properties']['size']
+    free = backend_state.reported_virtual_free_capacity.get(
+        _is_thin(request_spec))
+    if free is None or backend_state.stats_updated is None:
+        # Infinite or unknown capacity can't be over-committed
+        return True
+
+    backend = backend_state.backend_id
+    for _attempt in range(CONF.scheduler_capacity_claim_retries + 1):
+        claim = db.capacity_claim_get(context, backend)
+        if claim and not _is_superseded(claim, backend_state.stats_updated):
+            claimed = claim.claimed_gb
+            stats_timestamp = claim.stats_timestamp
+        else:
+            claimed = 0
+            stats_timestamp = backend_state.stats_updated
+
+        if free - claimed < size:
+            LOG.debug('Pool %(backend)s has no room for %(size)s GB, '
+                      '%(claimed)s GB were already claimed.',
+                      {'backend': backend, 'size': size,
+                       'claimed': claimed})
+            return False
+
+        values = {'claimed_gb': claimed + size,
+                  'stats_timestamp': stats_timestamp}
+        if claim is None:
+            try:
+                db.capacity_claim_create(context, backend, **values)
+                return True
+            except exception.CapacityClaimExists:
+                pass
+        elif db.capacity_claim_update(context, backend,
+                                      claim.race_preventer, **values):
+            return True
+        LOG.debug('Capacity on %s was claimed concurrently, retrying.',
+                  backend)
+
+    LOG.info('Could not claim capacity on %s, too many concurrent claims.',
+             backend)
+    return False
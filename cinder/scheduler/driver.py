@@ -35,6 +35,26 @@ scheduler_driver_opts = [
     cfg.IntOpt('scheduler_max_attempts',
                default=3,
                help='Maximum number of attempts to schedule a volume'),
+    cfg.BoolOpt('scheduler_trace_decisions',
+                default=False,
+                help='Send a scheduler.decision notification for every '
+                     'volume scheduled by the filter scheduler, with the '
+                     'time each filter and weigher took, the number of '
+                     'candidate backends before and after each filter and '
+                     'the backends each filter rejected.'),
+    cfg.BoolOpt('scheduler_capacity_claims',
+                default=False,
+                help='Claim the capacity of the pools volumes are placed on '
+                     'in the database, with compare-and-swap semantics, so '
+                     'that several schedulers or scheduler workers do not '
+                     'over-commit a pool before it reports its stats '
+                     'again.'),
+    cfg.IntOpt('scheduler_capacity_claim_retries',
+               default=3,
+               min=0,
+               help='Number of times a capacity claim is retried when '
+                    'another scheduler claimed capacity on the same pool '
+                    'concurrently, before trying the next best pool.'),
 ]
 
 CONF = cfg.CONF
@@ -102,13 +122,17 @@ class Scheduler(object):
         return self.host_manager.first_receive_capabilities()
 
     def update_service_capabilities(self, service_name, host, capabilities,
-                                    cluster_name, timestamp):
-        """Process a capability update from a service node."""
-        self.host_manager.update_service_capabilities(service_name,
-                                                      host,
-                                                      capabilities,
-                                                      cluster_name,
-                                                      timestamp)
+                                    cluster_name, timestamp, **kwargs):
+        """Process a capability update from a service node.
+
+        Returns False if the service must send all its capabilities again.
+        """
+        return self.host_manager.update_service_capabilities(service_name,
+                                                             host,
+                                                             capabilities,
+                                                             cluster_name,
+                                                             timestamp,
+                                                             **kwargs)
 
     def notify_service_capabilities(self, service_name, backend,
                                     capabilities, timestamp):
@@ -142,6 +166,17 @@ class Scheduler(object):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement schedule_create_volume"))
 
+    def schedule_create_volumes(self, context, request_spec_list,
+                                filter_properties_list):
+        """Schedule the creation of several volumes at once.
+
+        Returns the indexes of the volumes that were not scheduled, which
+        the scheduler manager then schedules one by one with
+        schedule_create_volume. Override this method if the scheduler can
+        place several volumes more efficiently than one at a time.
+        """
+        return list(range(len(request_spec_list)))
+
     def schedule_create_group(self, context, group,
                               group_spec,
                               request_spec_list,
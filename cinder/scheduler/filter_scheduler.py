@@ -20,6 +20,8 @@ You can customize this scheduler by specifying your own volume Filters and
 Weighing Functions.
 """
 
+import collections
+import copy
 from typing import (Optional, Union)
 
 from oslo_config import cfg
@@ -30,9 +32,12 @@ from cinder import context
 from cinder import exception
 from cinder.i18n import _
 from cinder import objects
+from cinder import rpc
+from cinder.scheduler import claims
 from cinder.scheduler import driver
 from cinder.scheduler.host_manager import BackendState
 from cinder.scheduler import scheduler_options
+from cinder.scheduler import trace as sched_trace
 from cinder.scheduler.weights import WeighedHost
 from cinder.volume import volume_utils
 
@@ -101,7 +106,157 @@ class FilterScheduler(driver.Scheduler):
             raise exception.NoValidBackend(reason=_("No weighed backends "
                                                     "available"))
 
-        backend = backend.obj
+        self._create_volume_on_backend(context, request_spec,
+                                       filter_properties, backend.obj)
+
+    def schedule_create_volumes(self,
+                                context: context.RequestContext,
+                                request_spec_list: list,
+                                filter_properties_list: list) -> list[int]:
+        """Schedule the creation of several volumes at once.
+
+        Volumes with the same scheduling requirements are placed together:
+        the backends are filtered and weighed once for all of them, and after
+        each placement only the pool the volume consumed from is filtered and
+        weighed again.
+
+        Returns the indexes of the volumes that could not be placed.
+        """
+        if not filter_properties_list:
+            filter_properties_list = [None] * len(request_spec_list)
+
+        batches: dict[str, list[int]] = collections.defaultdict(list)
+        for index, request_spec in enumerate(request_spec_list):
+            key = self._get_batch_key(request_spec,
+                                      filter_properties_list[index])
+            batches[key].append(index)
+
+        unplaced = []
+        for indexes in batches.values():
+            batch_unplaced = self._schedule_volume_batch(
+                context,
+                [request_spec_list[index] for index in indexes],
+                [filter_properties_list[index] for index in indexes])
+            unplaced.extend(indexes[position] for position in batch_unplaced)
+        return sorted(unplaced)
+
+    @staticmethod
+    def _get_batch_key(request_spec: dict,
+                       filter_properties: Optional[dict]) -> str:
+        """Return what the scheduling of a volume depends on."""
+        spec = jsonutils.to_primitive(request_spec)
+        volume_properties = spec.get('volume_properties') or {}
+        volume_type = spec.get('volume_type') or {}
+        return jsonutils.dumps({
+            'volume_type_id': volume_properties.get('volume_type_id',
+                                                    volume_type.get('id')),
+            'size': volume_properties.get('size'),
+            'availability_zone': volume_properties.get('availability_zone'),
+            'availability_zones': spec.get('availability_zones'),
+            'resource_backend': spec.get('resource_backend'),
+            'scheduler_hints': (filter_properties or {}).get(
+                'scheduler_hints'),
+        }, sort_keys=True)
+
+    def _schedule_volume_batch(self,
+                               context: context.RequestContext,
+                               request_spec_list: list,
+                               filter_properties_list: list) -> list[int]:
+        """Place volumes with the same scheduling requirements.
+
+        Returns the indexes of the volumes that could not be placed.
+        """
+        weighed_backends = None
+        unplaced = []
+        for index, request_spec in enumerate(request_spec_list):
+            # Volumes we can't place go through the regular scheduling, so
+            # leave their filter properties untouched.
+            filter_properties = copy.deepcopy(filter_properties_list[index]
+                                              or {})
+            try:
+                filter_properties = self._populate_request_filter_properties(
+                    context, request_spec, filter_properties)
+                if weighed_backends is None:
+                    weighed_backends = self._get_batch_candidates(
+                        context, request_spec, filter_properties)
+                    if weighed_backends is None:
+                        # The weight handler can't place a batch in one pass
+                        return list(range(len(request_spec_list)))
+                backend = self._choose_batch_backend(weighed_backends,
+                                                     request_spec,
+                                                     filter_properties)
+            except exception.NoValidBackend:
+                backend = None
+
+            if not backend:
+                LOG.warning('No weighed backend found for %(count)d volumes '
+                            'with properties: %(type)s',
+                            {'count': len(request_spec_list) - index,
+                             'type': request_spec.get('volume_type')})
+                unplaced.extend(range(index, len(request_spec_list)))
+                break
+
+            try:
+                self._create_volume_on_backend(context, request_spec,
+                                               filter_properties, backend)
+            except Exception:
+                LOG.exception('Failed to schedule volume %s.',
+                              request_spec.get('volume_id'))
+                unplaced.append(index)
+        return unplaced
+
+    def _get_batch_candidates(self,
+                              context: context.RequestContext,
+                              request_spec: dict,
+                              filter_properties: dict):
+        """Filter and weigh the backends for a batch of volumes."""
+        backends = self._get_filtered_candidates(context, filter_properties)
+
+        resource_backend = request_spec.get('resource_backend')
+        if resource_backend:
+            backends = [backend for backend in backends
+                        if self._matches_resource_backend(backend,
+                                                          resource_backend)]
+
+        return self.host_manager.get_weighed_backend_list(backends,
+                                                          filter_properties)
+
+    def _choose_batch_backend(self, weighed_backends, request_spec: dict,
+                              filter_properties: dict) -> Optional[
+                                  BackendState]:
+        """Consume from the best backend of a batch and re-weigh it."""
+        top_backend = weighed_backends.first()
+        if top_backend is None:
+            return None
+
+        if CONF.scheduler_capacity_claims:
+            context = filter_properties['context']
+            while not claims.claim_capacity(context, top_backend.obj,
+                                            request_spec):
+                # Other schedulers used up the capacity of the pool
+                weighed_backends.remove(top_backend)
+                top_backend = weighed_backends.first()
+                if top_backend is None:
+                    return None
+
+        backend_state = top_backend.obj
+        LOG.debug("Choosing %s", backend_state.backend_id)
+        backend_state.consume_from_volume(request_spec['volume_properties'])
+
+        # Only the backend we consumed from changed, the next volumes of
+        # the batch can still use the others as they were weighed.
+        if self.host_manager.get_filtered_backends([backend_state],
+                                                   filter_properties):
+            weighed_backends.reweigh(top_backend)
+        else:
+            weighed_backends.remove(top_backend)
+        return backend_state
+
+    def _create_volume_on_backend(self,
+                                  context: context.RequestContext,
+                                  request_spec: dict,
+                                  filter_properties: dict,
+                                  backend: BackendState) -> None:
         volume_id = request_spec['volume_id']
 
         updated_volume = driver.volume_update_db(
@@ -199,7 +354,12 @@ class FilterScheduler(driver.Scheduler):
                 {'id': request_spec['volume_id'],
                  'type': request_spec['volume_type']})
 
-        top_backend = self._choose_top_backend(weighed_backends, request_spec)
+        top_backend = self._choose_top_backend(weighed_backends, request_spec,
+                                               context)
+        if not top_backend:
+            raise exception.NoValidBackend(
+                reason=_('No backend with enough capacity for volume %s')
+                % request_spec['volume_id'])
         return top_backend.obj
 
     def get_pools(self, context: context.RequestContext, filters: dict):
@@ -294,17 +454,12 @@ class FilterScheduler(driver.Scheduler):
                 {'max_attempts': max_attempts,
                  'resource_id': resource_id})
 
-    def _get_weighted_candidates(
+    def _populate_request_filter_properties(
             self,
             context: context.RequestContext,
             request_spec: dict,
-            filter_properties: Optional[dict] = None) -> list:
-        """Return a list of backends that meet required specs.
-
-        Returned list is ordered by their fitness.
-        """
-        elevated = context.elevated()
-
+            filter_properties: Optional[dict] = None) -> dict:
+        """Populate the filter properties used to schedule a request."""
         # Since Cinder is using mixed filters from Oslo and it's own, which
         # takes 'resource_XX' and 'volume_XX' as input respectively, copying
         # 'volume_XX' to 'resource_XX' will make both filters happy.
@@ -340,6 +495,16 @@ class FilterScheduler(driver.Scheduler):
             self.host_manager.revert_volume_consumed_capacity(
                 retry['backends'][-1],
                 request_spec['volume_properties']['size'])
+        return filter_properties
+
+    def _get_filtered_candidates(
+            self,
+            context: context.RequestContext,
+            filter_properties: dict,
+            trace: Optional[sched_trace.SchedulerTrace] = None) -> list:
+        """Return the backends that pass the filters for a request."""
+        elevated = context.elevated()
+
         # Find our local list of acceptable backends by filtering and
         # weighing our options. we virtually consume resources on
         # it so subsequent selections can adjust accordingly.
@@ -350,15 +515,34 @@ class FilterScheduler(driver.Scheduler):
 
         # Filter local hosts based on requirements ...
         backends = self.host_manager.get_filtered_backends(backends,
-                                                           filter_properties)
+                                                           filter_properties,
+                                                           trace=trace)
+        if backends:
+            LOG.debug("Filtered %s", backends)
+        return backends
+
+    def _get_weighted_candidates(
+            self,
+            context: context.RequestContext,
+            request_spec: dict,
+            filter_properties: Optional[dict] = None,
+            trace: Optional[sched_trace.SchedulerTrace] = None) -> list:
+        """Return a list of backends that meet required specs.
+
+        Returned list is ordered by their fitness.
+        """
+        filter_properties = self._populate_request_filter_properties(
+            context, request_spec, filter_properties)
+
+        backends = self._get_filtered_candidates(context, filter_properties,
+                                                 trace=trace)
         if not backends:
             return []
 
-        LOG.debug("Filtered %s", backends)
         # weighted_backends = WeightedHost() ... the best
         # backend for the job.
         weighed_backends = self.host_manager.get_weighed_backends(
-            backends, filter_properties)
+            backends, filter_properties, trace=trace)
         return weighed_backends
 
     def _get_weighted_candidates_generic_group(
@@ -540,31 +724,61 @@ class FilterScheduler(driver.Scheduler):
                   context: context.RequestContext,
                   request_spec: dict,
                   filter_properties: Optional[dict] = None):
+        trace = None
+        if CONF.scheduler_trace_decisions:
+            trace = sched_trace.SchedulerTrace()
         weighed_backends = self._get_weighted_candidates(context, request_spec,
-                                                         filter_properties)
+                                                         filter_properties,
+                                                         trace=trace)
         # When we get the weighed_backends, we clear those backends that don't
         # match the resource's backend (it could be assigned from group,
         # snapshot or volume).
         resource_backend = request_spec.get('resource_backend')
         if weighed_backends and resource_backend:
-            resource_backend_has_pool = bool(volume_utils.extract_host(
-                resource_backend, 'pool'))
             # Get host name including host@backend#pool info from
             # weighed_backends.
             for backend in weighed_backends[::-1]:
-                backend_id = (
-                    backend.obj.backend_id if resource_backend_has_pool
-                    else volume_utils.extract_host(backend.obj.backend_id)
-                )
-                if backend_id != resource_backend:
+                if not self._matches_resource_backend(backend.obj,
+                                                      resource_backend):
                     weighed_backends.remove(backend)
+        top_backend = None
         if not weighed_backends:
             assert filter_properties is not None
             LOG.warning('No weighed backend found for volume '
                         'with properties: %s',
                         filter_properties['request_spec'].get('volume_type'))
-            return None
-        return self._choose_top_backend(weighed_backends, request_spec)
+        else:
+            top_backend = self._choose_top_backend(weighed_backends,
+                                                   request_spec, context)
+        if trace is not None:
+            self._notify_decision(context, request_spec, trace, top_backend)
+        return top_backend
+
+    @staticmethod
+    def _notify_decision(context: context.RequestContext,
+                         request_spec: dict,
+                         trace: sched_trace.SchedulerTrace,
+                         top_backend: Optional[WeighedHost]) -> None:
+        """Send the trace of a scheduling decision as a notification."""
+        payload = trace.to_dict(
+            request_id=context.request_id,
+            volume_id=request_spec.get('volume_id'),
+            volume_type_id=(request_spec.get('volume_type') or {}).get('id'),
+            backend=top_backend.obj.backend_id if top_backend else None)
+        LOG.debug("Scheduling decision: %s", payload)
+        rpc.get_notifier('scheduler').info(context, 'scheduler.decision',
+                                           payload)
+
+    @staticmethod
+    def _matches_resource_backend(backend_state: BackendState,
+                                  resource_backend: str) -> bool:
+        resource_backend_has_pool = bool(volume_utils.extract_host(
+            resource_backend, 'pool'))
+        backend_id = (
+            backend_state.backend_id if resource_backend_has_pool
+            else volume_utils.extract_host(backend_state.backend_id)
+        )
+        return backend_id == resource_backend
 
     def _schedule_generic_group(
             self,
@@ -585,10 +799,27 @@ class FilterScheduler(driver.Scheduler):
             return None
         return self._choose_top_backend_generic_group(weighed_backends)
 
-    def _choose_top_backend(self,
-                            weighed_backends: list[WeighedHost],
-                            request_spec: dict):
-        top_backend = weighed_backends[0]
+    def _choose_top_backend(
+            self,
+            weighed_backends: list[WeighedHost],
+            request_spec: dict,
+            context: Optional[context.RequestContext] = None) -> Optional[
+                WeighedHost]:
+        """Choose the best backend and consume the volume from it.
+
+        When capacity claims are enabled, the best backend with room for the
+        volume once the claims of all the schedulers are taken into account
+        is chosen, and None is returned if there isn't any.
+        """
+        if context is not None and CONF.scheduler_capacity_claims:
+            for top_backend in weighed_backends:
+                if claims.claim_capacity(context, top_backend.obj,
+                                         request_spec):
+                    break
+            else:
+                return None
+        else:
+            top_backend = weighed_backends[0]
         backend_state = top_backend.obj
         LOG.debug("Choosing %s", backend_state.backend_id)
         volume_properties = request_spec['volume_properties']
@@ -22,18 +22,26 @@ class AvailabilityZoneFilter(filters.BaseBackendFilter):
     # Availability zones do not change within a request
     run_filter_once_per_request = True
 
-    def backend_passes(self, backend_state, filter_properties):
+    @staticmethod
+    def get_requested_zones(filter_properties):
+        """Return the availability zones allowed by a request, if any."""
         spec = filter_properties.get('request_spec', {})
         availability_zones = spec.get('availability_zones')
 
         if availability_zones:
-            return (backend_state.service['availability_zone']
-                    in availability_zones)
+            return availability_zones
 
         props = spec.get('resource_properties', {})
         availability_zone = props.get('availability_zone')
 
         if availability_zone:
-            return (availability_zone ==
-                    backend_state.service['availability_zone'])
+            return [availability_zone]
+        return None
+
+    def backend_passes(self, backend_state, filter_properties):
+        availability_zones = self.get_requested_zones(filter_properties)
+
+        if availability_zones:
+            return (backend_state.service['availability_zone']
+                    in availability_zones)
         return True
@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
+
 from oslo_log import log as logging
 
 from cinder.objects.fields import VolumeAttachStatus
@@ -21,6 +24,47 @@ from cinder.scheduler.filters import extra_specs_ops
 
 LOG = logging.getLogger(__name__)
 
+CompiledSpec = collections.namedtuple('CompiledSpec',
+                                      ['key', 'req', 'scope', 'predicate'])
+
+
+def _compile_spec_items(spec_items):
+    compiled = []
+    for key, req in spec_items:
+        # Either not scoped format, or in capabilities scope
+        scope = key.split(':')
+
+        # Ignore scoped (such as vendor-specific) capabilities
+        if len(scope) > 1 and scope[0] != "capabilities":
+            continue
+        # Strip off prefix if spec started with 'capabilities:'
+        elif scope[0] == "capabilities":
+            del scope[0]
+
+        compiled.append(CompiledSpec(key, req, tuple(scope),
+                                     extra_specs_ops.compile_req(req)))
+    return tuple(compiled)
+
+
+# Compiled specs are keyed by the content of the extra specs, so updating a
+# resource type yields a new entry and the stale one ages out of the cache.
+_cached_compile_spec_items = functools.lru_cache(maxsize=256)(
+    _compile_spec_items)
+
+
+def compile_extra_specs(extra_specs):
+    """Return the checks for the capabilities scoped extra specs.
+
+    The result is cached, so the specs of a resource type are parsed once
+    and not for every backend and request.
+    """
+    spec_items = tuple(extra_specs.items())
+    try:
+        return _cached_compile_spec_items(spec_items)
+    except TypeError:
+        # Unhashable requirement, it can't be cached
+        return _compile_spec_items(spec_items)
+
 
 class CapabilitiesFilter(filters.BaseBackendFilter):
     """BackendFilter to work with resource (instance & volume) type records."""
@@ -45,33 +89,14 @@ class CapabilitiesFilter(filters.BaseBackendFilter):
                     LOG.debug("Backend doesn't support attached volume extend")
                     return False
 
-        resource_type = filter_properties.get('resource_type')
-        if not resource_type:
-            return True
-
-        extra_specs = resource_type.get('extra_specs', [])
-        if not extra_specs:
-            return True
-
-        for key, req in extra_specs.items():
-
-            # Either not scoped format, or in capabilities scope
-            scope = key.split(':')
-
-            # Ignore scoped (such as vendor-specific) capabilities
-            if len(scope) > 1 and scope[0] != "capabilities":
-                continue
-            # Strip off prefix if spec started with 'capabilities:'
-            elif scope[0] == "capabilities":
-                del scope[0]
-
+        for spec in self._get_compiled_specs(filter_properties):
             cap = capabilities
-            for index in range(len(scope)):
+            for name in spec.scope:
                 try:
-                    cap = cap[scope[index]]
+                    cap = cap[name]
                 except (TypeError, KeyError):
                     LOG.debug("Backend doesn't provide capability '%(cap)s' ",
-                              {'cap': scope[index]})
+                              {'cap': name})
                     return False
 
             # Make all capability values a list so we can handle lists
@@ -79,17 +104,39 @@ class CapabilitiesFilter(filters.BaseBackendFilter):
 
             # Loop through capability values looking for any match
             for cap_value in cap_list:
-                if extra_specs_ops.match(cap_value, req):
+                if spec.predicate(cap_value):
                     break
             else:
                 # Nothing matched, so bail out
                 LOG.debug('Volume type extra spec requirement '
                           '"%(key)s=%(req)s" does not match reported '
                           'capability "%(cap)s"',
-                          {'key': key, 'req': req, 'cap': cap})
+                          {'key': spec.key, 'req': spec.req, 'cap': cap})
                 return False
         return True
 
+    def _get_compiled_specs(self, filter_properties):
+        compiled = getattr(self, '_compiled_specs', None)
+        if compiled and compiled[0] is filter_properties:
+            return compiled[1]
+
+        resource_type = filter_properties.get('resource_type')
+        if not resource_type:
+            return ()
+
+        extra_specs = resource_type.get('extra_specs', [])
+        if not extra_specs:
+            return ()
+
+        return compile_extra_specs(extra_specs)
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        # Resolve the extra specs once for all the backends of the request
+        self._compiled_specs = (filter_properties,
+                                self._get_compiled_specs(filter_properties))
+        return super(CapabilitiesFilter, self).filter_all(filter_obj_list,
+                                                          filter_properties)
+
     def backend_passes(self, backend_state, filter_properties):
         """Return a list of backends that can create resource_type."""
         # Note(zhiteng) Currently only Cinder and Nova are using
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import operator
 
 from oslo_utils import strutils
@@ -38,40 +39,82 @@ _op_methods = {'=': lambda x, y: float(x) >= float(y),
                's>=': operator.ge}
 
 
-def match(value, req):
-    if req is None:
+# Operators comparing the values as floats, the requirement is converted only
+# once when it is compiled.
+_float_ops = {'=': operator.ge,
+              '==': operator.eq,
+              '!=': operator.ne,
+              '>=': operator.ge,
+              '<=': operator.le}
+
+
+def _never(value):
+    return False
+
+
+def _compile_method(method, arg):
+    def predicate(value):
         if value is None:
-            return True
-        else:
             return False
-    words = req.split()
+        try:
+            return bool(method(value, arg))
+        except ValueError:
+            return False
+    return predicate
 
-    op = method = None
-    if words:
-        op = words.pop(0)
-        method = _op_methods.get(op)
 
-    if op != '<or>' and not method:
-        return value == req
+@functools.lru_cache(maxsize=1024)
+def compile_req(req):
+    """Return a predicate checking a capability value against a requirement.
 
-    if value is None:
-        return False
+    The returned callable accepts a capability value and behaves like
+    ``match(value, req)``, but the requirement is parsed only once, so the
+    predicate can be reused for every backend considered by a request.
+    Predicates are cached by requirement string.
+    """
+    if req is None:
+        return lambda value: value is None
+
+    words = req.split()
+    op = words.pop(0) if words else None
 
     if op == '<or>':  # Ex: <or> v1 <or> v2 <or> v3
-        while True:
-            if words.pop(0) == value:
-                return True
-            if not words:
-                break
-            op = words.pop(0)  # remove a keyword <or>
-            if not words:
-                break
+        # Every other word is an <or> keyword
+        choices = tuple(words[::2])
+        return lambda value: value is not None and value in choices
+
+    if op in _float_ops:
+        if not words:
+            return _never
+        try:
+            arg = float(words[0])
+        except ValueError:
+            return _never
+        compare = _float_ops[op]
+        return _compile_method(lambda x, y: compare(float(x), y), arg)
+
+    if op == '<is>':
+        if not words:
+            return _never
+        return _compile_method(
+            lambda x, y: strutils.bool_from_string(x) is y,
+            strutils.bool_from_string(words[0]))
+
+    method = _op_methods.get(op)
+    if not method:
+        return lambda value: value == req
+    if not words:
+        return _never
+    return _compile_method(method, words[0])
+
+
+def is_equality(req):
+    """Return True if a requirement is met only by a value equal to it."""
+    if not isinstance(req, str):
         return False
+    words = req.split()
+    return not words or (words[0] != '<or>' and words[0] not in _op_methods)
 
-    try:
-        if words and method(value, words[0]):
-            return True
-    except ValueError:
-        pass
 
-    return False
+def match(value, req):
+    return compile_req(req)(value)
@@ -15,8 +15,10 @@
 
 """Manage backends in the current zone."""
 
+import collections
 from collections import abc
 import random
+import time
 import typing
 from typing import (Any, Iterable, Optional, Type, Union)
 
@@ -30,7 +32,11 @@ from cinder.common import constants
 from cinder import context as cinder_context
 from cinder import exception
 from cinder import objects
+from cinder.scheduler import base_weight
+from cinder.scheduler import capability_delta
 from cinder.scheduler import filters
+from cinder.scheduler.filters import availability_zone_filter
+from cinder.scheduler.filters import extra_specs_ops
 from cinder.scheduler import sched_utils
 from cinder.volume import volume_types
 from cinder.volume import volume_utils
@@ -59,6 +65,19 @@ host_manager_opts = [
                default='cinder.scheduler.weights.OrderedHostWeightHandler',
                help='Which handler to use for selecting the host/pool '
                     'after weighing'),
+    cfg.IntOpt('scheduler_backend_state_cache_ttl',
+               default=10,
+               min=0,
+               help='Seconds during which the scheduler reuses its view of '
+                    'the up and enabled volume services instead of reading '
+                    'it from the database for every request. Capabilities '
+                    'reported by known backends are applied as soon as they '
+                    'are received, so this only bounds how long the '
+                    'scheduler takes to notice added, removed, disabled or '
+                    'down services. The default matches the default '
+                    'report_interval of the services, well under the '
+                    'service_down_time it takes to consider a service '
+                    'down. 0 reads the services for every request.'),
 ]
 
 CONF = cfg.CONF
@@ -144,10 +163,47 @@ class BackendState(object):
 
         self.updated = None
 
+        # Virtual free capacity for thin and thick provisioning, computed
+        # once for every change of the capacity stats.
+        self._virtual_free_capacity: dict[bool, Optional[float]] = {}
+        # Time and virtual free capacity of the stats reported by the
+        # backend, before any volume was virtually consumed.
+        self.stats_updated = None
+        self.reported_virtual_free_capacity: dict[bool,
+                                                  Optional[float]] = {}
+
     @property
     def backend_id(self) -> str:
         return self.cluster_name or self.host
 
+    def get_virtual_free_capacity(self, thin: bool = True) -> Optional[float]:
+        """Return the virtual free capacity weighed by the CapacityWeigher.
+
+        Returns None when the free or total capacity is 'infinite' or
+        'unknown'. The value is kept until the capacity stats change.
+        """
+        try:
+            return self._virtual_free_capacity[thin]
+        except KeyError:
+            pass
+
+        free_space = self.free_capacity_gb
+        total_space = self.total_capacity_gb
+        if (free_space in ('infinite', 'unknown') or
+                total_space in ('infinite', 'unknown')):
+            free = None
+        else:
+            free = sched_utils.calculate_virtual_free_capacity(
+                total_space,
+                free_space,
+                self.provisioned_capacity_gb,
+                self.thin_provisioning_support,
+                self.max_over_subscription_ratio,
+                self.reserved_percentage,
+                thin)
+        self._virtual_free_capacity[thin] = free
+        return free
+
     def update_capabilities(
             self,
             capabilities: Optional[Union[dict, ReadOnlyDict]] = None,
@@ -333,6 +389,7 @@ class BackendState(object):
         if 'storage_protocol' in capability:
             capability['storage_protocol'] = self.storage_protocol
         self.updated = capability['timestamp']
+        self._virtual_free_capacity = {}
 
     def consume_from_volume(self,
                             volume: objects.Volume,
@@ -349,6 +406,7 @@ class BackendState(object):
             pass
         else:
             self.free_capacity_gb -= volume_gb
+        self._virtual_free_capacity = {}
         if update_time:
             self.updated = timeutils.utcnow()
         LOG.debug("Consumed %s GB from backend: %s", volume['size'], self)
@@ -447,6 +505,12 @@ class PoolState(BackendState):
             self.filter_function = capability.get('filter_function', None)
             self.goodness_function = capability.get('goodness_function', 0)
 
+            # Compute the weigher inputs now rather than on every request
+            self.stats_updated = capability['timestamp']
+            self.reported_virtual_free_capacity = {
+                thin: self.get_virtual_free_capacity(thin)
+                for thin in (True, False)}
+
     @typing.no_type_check
     def update_pools(self, capability):
         # Do nothing, since we don't have pools within pool, yet
@@ -471,6 +535,10 @@ class HostManager(object):
         'max_over_subscription_ratio',
         'reserved_percentage'])
 
+    # Pool capabilities indexed to narrow the pools checked by the
+    # CapabilitiesFilter when a volume type requires an exact value.
+    INDEXED_CAPABILITIES = ('volume_backend_name', 'storage_protocol')
+
     def __init__(self):
         self.service_states = {}  # { <host|cluster>: {<service>: {cap k : v}}}
         self.backend_state_map: dict[str, BackendState] = {}
@@ -486,6 +554,16 @@ class HostManager(object):
         self.weight_classes = self.weight_handler.get_all_classes()
 
         self._no_capabilities_backends = set()  # Services without capabilities
+        # Incremented whenever backends or pools are added, removed or
+        # updated, to let users of backend_state_map cache derived data.
+        self.backend_state_map_version = 0
+        self._backend_state_map_refreshed: Optional[float] = None
+        self._pool_states: Optional[tuple] = None
+        self._pool_positions: dict[str, int] = {}
+        self._init_pool_indexes()
+        # Version and contents of the last capabilities reported by each
+        # service host, that capability deltas are applied to.
+        self._reported_capabilities: dict[str, tuple[dict, dict]] = {}
         self._update_backend_state_map(cinder_context.get_admin_context())
         self.service_states_last_update = {}
 
@@ -545,39 +623,191 @@ class HostManager(object):
         return good_weighers
 
     def get_filtered_backends(self, backends, filter_properties,
-                              filter_class_names=None):
-        """Filter backends and return only ones passing all filters."""
+                              filter_class_names=None, trace=None):
+        """Filter backends and return only ones passing all filters.
+
+        If a SchedulerTrace is given, the backends removed by the pool
+        indexes and by each filter are recorded in it.
+        """
         if filter_class_names is not None:
             filter_classes = self._choose_backend_filters(filter_class_names)
         else:
             filter_classes = self.enabled_filters
+        start_time = time.monotonic()
+        all_backends = backends
+        backends = self._prefilter_backends(backends, filter_properties,
+                                            filter_classes)
+        if trace is not None and backends is not all_backends:
+            trace.add_filter('PoolIndexes', time.monotonic() - start_time,
+                             all_backends, backends)
         return self.filter_handler.get_filtered_objects(filter_classes,
                                                         backends,
-                                                        filter_properties)
+                                                        filter_properties,
+                                                        trace=trace)
+
+    def _init_pool_indexes(self) -> None:
+        # Each index maps a value to the keys of the pools having it
+        self._pool_indexes: dict[str, dict] = {
+            key: collections.defaultdict(set)
+            for key in ('availability_zone',) + self.INDEXED_CAPABILITIES}
+        # Index entries of the pools of each backend, and what they were
+        # computed from
+        self._indexed_pools: dict[str, dict[str, tuple]] = {}
+        self._indexed_sources: dict[str, tuple] = {}
+
+    def _get_index_entries(self, pool: 'PoolState') -> tuple:
+        """Return the (index, value) pairs of a pool in the pool indexes."""
+        values = {'availability_zone':
+                  [pool.service.get('availability_zone')]}
+        for key in self.INDEXED_CAPABILITIES:
+            value = pool.capabilities.get(key)
+            values[key] = value if isinstance(value, list) else [value]
+
+        entries = []
+        for key, key_values in values.items():
+            for value in key_values:
+                try:
+                    hash(value)
+                except TypeError:
+                    # Unhashable values never equal the requested strings,
+                    # so the pool can't match them anyway.
+                    continue
+                entries.append((key, value))
+        return tuple(entries)
+
+    def _index_backend(self, backend_key: str) -> None:
+        """Update the pool indexes with the current pools of a backend.
+
+        Only the entries of the pools whose indexed values changed are
+        updated, and removed backends have their entries removed.
+        """
+        old = self._indexed_pools.pop(backend_key, {})
+        new = {}
+        backend_state = self.backend_state_map.get(backend_key)
+        if backend_state is not None:
+            for pool in backend_state.pools.values():
+                pool_key = '.'.join([backend_key, pool.pool_name])
+                new[pool_key] = self._get_index_entries(pool)
+            self._indexed_pools[backend_key] = new
+        else:
+            self._indexed_sources.pop(backend_key, None)
+
+        for pool_key, entries in old.items():
+            if new.get(pool_key) != entries:
+                for key, value in entries:
+                    pool_keys = self._pool_indexes[key][value]
+                    pool_keys.discard(pool_key)
+                    if not pool_keys:
+                        del self._pool_indexes[key][value]
+        for pool_key, entries in new.items():
+            if old.get(pool_key) != entries:
+                for key, value in entries:
+                    self._pool_indexes[key][value].add(pool_key)
+
+        if new.keys() != old.keys():
+            # Pools were added or removed
+            self._pool_states = None
+
+    def _prefilter_backends(self, backends, filter_properties: dict,
+                            filter_classes: list):
+        """Narrow the cached pool states down to the ones worth filtering.
+
+        Uses the pool indexes to drop the pools that the availability zone
+        and the exact volume backend name and storage protocol requirements
+        of the request would reject, so the filters only run on pools that
+        can match. Other lists of backends are returned unchanged.
+        """
+        if not backends or backends is not self._pool_states:
+            return backends
+
+        filter_names = {cls.__name__ for cls in filter_classes}
+        indexes = self._pool_indexes
+        candidates = []
+
+        if 'AvailabilityZoneFilter' in filter_names:
+            az_filter = availability_zone_filter.AvailabilityZoneFilter
+            zones = az_filter.get_requested_zones(filter_properties)
+            if zones:
+                candidates.append(set().union(
+                    *(indexes['availability_zone'].get(zone, ())
+                      for zone in zones)))
+
+        resource_type = filter_properties.get('resource_type')
+        if 'CapabilitiesFilter' in filter_names and resource_type:
+            extra_specs = resource_type.get('extra_specs', []) or {}
+            for key in self.INDEXED_CAPABILITIES:
+                for spec_key in (key, 'capabilities:' + key):
+                    req = extra_specs.get(spec_key)
+                    if extra_specs_ops.is_equality(req):
+                        candidates.append(indexes[key].get(req, set()))
+
+        if not candidates:
+            return backends
+
+        pool_keys = set.intersection(*candidates)
+        LOG.debug("Indexes narrowed %(total)d pools down to %(count)d",
+                  {'total': len(backends), 'count': len(pool_keys)})
+        positions = sorted(self._pool_positions[pool_key]
+                           for pool_key in pool_keys)
+        return [backends[position] for position in positions]
 
     def get_weighed_backends(self, backends, weight_properties,
-                             weigher_class_names=None) -> list:
+                             weigher_class_names=None, trace=None) -> list:
         """Weigh the backends."""
         weigher_classes = self._choose_backend_weighers(weigher_class_names)
 
+        # Weight handlers can be out of tree, only the ones tracing their
+        # weighers take a trace
+        kwargs = {} if trace is None else {'trace': trace}
         weighed_backends = self.weight_handler.get_weighed_objects(
-            weigher_classes, backends, weight_properties)
+            weigher_classes, backends, weight_properties, **kwargs)
 
         LOG.debug("Weighed %s", weighed_backends)
         return weighed_backends
 
+    def get_weighed_backend_list(
+            self, backends, weight_properties, weigher_class_names=None) \
+            -> Optional[base_weight.WeighedObjectList]:
+        """Weigh the backends into a list that can be re-weighed one by one.
+
+        Returns None if the weight handler can't update weights
+        incrementally.
+        """
+        if not getattr(self.weight_handler, 'incremental', False):
+            return None
+        weigher_classes = self._choose_backend_weighers(weigher_class_names)
+        return self.weight_handler.get_weighed_object_list(
+            weigher_classes, backends, weight_properties)
+
     def update_service_capabilities(self,
                                     service_name: str,
                                     host: str,
-                                    capabilities: dict,
+                                    capabilities: Optional[dict],
                                     cluster_name: Optional[str],
-                                    timestamp) -> None:
-        """Update the per-service capabilities based on this notification."""
+                                    timestamp,
+                                    capabilities_version: Optional[
+                                        dict] = None,
+                                    capabilities_delta: Optional[
+                                        dict] = None) -> bool:
+        """Update the per-service capabilities based on this notification.
+
+        Versioned reports may only contain the changes since the previous
+        report of the host. Returns False when such a delta doesn't follow
+        the last report received from the host, in which case the host
+        must be asked to send all its capabilities again.
+        """
         if service_name not in HostManager.ALLOWED_SERVICE_NAMES:
             LOG.debug('Ignoring %(service_name)s service update '
                       'from %(host)s',
                       {'service_name': service_name, 'host': host})
-            return
+            return True
+
+        if capabilities_version is not None:
+            capabilities = self._get_reported_capabilities(
+                host, capabilities, capabilities_version, capabilities_delta)
+            if capabilities is None:
+                return False
+        capabilities = typing.cast(dict, capabilities)
 
         # Determine whether HostManager has just completed initialization, and
         # has not received the rpc message returned by volume.
@@ -599,7 +829,7 @@ class HostManager(object):
                       "%(host)s: %(cap)s",
                       {'service_name': service_name, 'host': host,
                        'cap': capabilities})
-            return
+            return True
 
         capab_old = self.service_states.get(backend, {"timestamp": 0})
         capab_last_update = self.service_states_last_update.get(
@@ -608,7 +838,7 @@ class HostManager(object):
         # Ignore older updates
         if capab_old['timestamp'] and timestamp < capab_old['timestamp']:
             LOG.info('Ignoring old capability report from %s.', backend)
-            return
+            return True
 
         # If the capabilities are not changed and the timestamp is older,
         # record the capabilities.
@@ -635,6 +865,85 @@ class HostManager(object):
         self._no_capabilities_backends.discard(backend)
         if just_init:
             self._update_backend_state_map(cinder_context.get_admin_context())
+        elif CONF.scheduler_backend_state_cache_ttl:
+            self._apply_capabilities(backend, capab_copy)
+        return True
+
+    def _get_reported_capabilities(
+            self,
+            host: str,
+            capabilities: Optional[dict],
+            capabilities_version: dict,
+            capabilities_delta: Optional[dict]) -> Optional[dict]:
+        """Return the capabilities of a versioned report of a host.
+
+        Applies the delta, if any, to the last capabilities reported by the
+        host. Returns None if the delta can't be applied because reports
+        were missed.
+        """
+        if capabilities_delta is None:
+            reported = typing.cast(dict, capabilities)
+        else:
+            last_version, last_reported = self._reported_capabilities.get(
+                host, ({}, {}))
+            if (last_version.get('generation') !=
+                    capabilities_version['generation'] or
+                    last_version.get('version') !=
+                    capabilities_version['version'] - 1):
+                LOG.info('Missed capability reports from %(host)s, last '
+                         'received: %(last)s, current: %(current)s.',
+                         {'host': host, 'last': last_version,
+                          'current': capabilities_version})
+                self._reported_capabilities.pop(host, None)
+                return None
+            reported = capability_delta.apply_delta(last_reported,
+                                                    capabilities_delta)
+        self._reported_capabilities[host] = (capabilities_version, reported)
+        # The reported capabilities are modified once processed, but deltas
+        # apply to them as they were reported.
+        return capability_delta.copy_capabilities(reported)
+
+    def _apply_capabilities(self, backend: str, capabilities: dict) -> None:
+        """Apply the capabilities just reported by a backend to its state.
+
+        A backend that isn't in the cached backend state map yet is added on
+        the next refresh of the map, which is done as soon as possible.
+        """
+        backend_state = self.backend_state_map.get(backend)
+        if backend_state is None:
+            self._backend_state_map_refreshed = None
+            return
+        backend_state.update_from_volume_capability(
+            capabilities, service=dict(backend_state.service))
+        self._backend_changed(backend, capabilities, backend_state.service)
+
+    def _backend_changed(self, backend_key: str, capabilities: dict,
+                         service) -> None:
+        """Update the data derived from the state of a backend."""
+        self._indexed_sources[backend_key] = (
+            capabilities, service.get('availability_zone'))
+        self._index_backend(backend_key)
+        self.backend_state_map_version += 1
+
+    def _is_backend_changed(self, backend_key: str, capabilities: dict,
+                            service) -> bool:
+        """Check if a backend state is to be updated from a service.
+
+        Backends get new capabilities with every report, so unchanged
+        capabilities are the ones the backend state was last updated with.
+        """
+        sources = self._indexed_sources.get(backend_key)
+        return (sources is None or sources[0] is not capabilities or
+                sources[1] != service.get('availability_zone'))
+
+    def _refresh_backend_state_map(
+            self,
+            context: cinder_context.RequestContext) -> None:
+        """Update the backend state map unless the cached one is recent."""
+        ttl = CONF.scheduler_backend_state_cache_ttl
+        if (not ttl or self._backend_state_map_refreshed is None or
+                time.monotonic() - self._backend_state_map_refreshed >= ttl):
+            self._update_backend_state_map(context)
 
     def notify_service_capabilities(self, service_name, backend, capabilities,
                                     timestamp):
@@ -724,9 +1033,12 @@ class HostManager(object):
             # update capabilities and attributes in backend_state
             backend_state.update_from_volume_capability(capabilities,
                                                         service=dict(service))
+            if self._is_backend_changed(backend_key, capabilities, service):
+                self._backend_changed(backend_key, capabilities, service)
             active_backends.add(backend_key)
 
         self._no_capabilities_backends = no_capabilities_backends
+        self._backend_state_map_refreshed = time.monotonic()
 
         # remove non-active keys from backend_state_map
         inactive_backend_keys = set(self.backend_state_map) - active_backends
@@ -738,6 +1050,8 @@ class HostManager(object):
                 LOG.info("Removing non-active backend: %(backend)s from "
                          "scheduler cache.", {'backend': backend_key})
             del self.backend_state_map[backend_key]
+            self._index_backend(backend_key)
+            self.backend_state_map_version += 1
 
     def revert_volume_consumed_capacity(self,
                                         pool_name: str,
@@ -761,19 +1075,23 @@ class HostManager(object):
           {'192.168.1.100': BackendState(), ...}
         """
 
-        self._update_backend_state_map(context)
-
-        # build a pool_state map and return that map instead of
-        # backend_state_map
-        all_pools = {}
-        for backend_key, state in self.backend_state_map.items():
-            for key in state.pools:
-                pool = state.pools[key]
-                # use backend_key.pool_name to make sure key is unique
-                pool_key = '.'.join([backend_key, pool.pool_name])
-                all_pools[pool_key] = pool
+        self._refresh_backend_state_map(context)
+
+        if self._pool_states is None:
+            # build a pool_state map and return that map instead of
+            # backend_state_map
+            all_pools = {}
+            for backend_key, state in self.backend_state_map.items():
+                for key in state.pools:
+                    pool = state.pools[key]
+                    # use backend_key.pool_name to make sure key is unique
+                    pool_key = '.'.join([backend_key, pool.pool_name])
+                    all_pools[pool_key] = pool
+            self._pool_states = tuple(all_pools.values())
+            self._pool_positions = {pool_key: position for position, pool_key
+                                    in enumerate(all_pools)}
 
-        return all_pools.values()
+        return self._pool_states
 
     def _filter_pools_by_volume_type(
             self,
@@ -801,7 +1119,7 @@ class HostManager(object):
                   filters: Optional[dict] = None) -> list[dict]:
         """Returns a dict of all pools on all hosts HostManager knows about."""
 
-        self._update_backend_state_map(context)
+        self._refresh_backend_state_map(context)
 
         all_pools = {}
         name = volume_type = None
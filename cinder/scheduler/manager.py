@@ -139,20 +139,33 @@ class SchedulerManager(manager.CleanableManager, manager.Manager):
     def update_service_capabilities(self, context, service_name=None,
                                     host=None, capabilities=None,
                                     cluster_name=None, timestamp=None,
-                                    **kwargs):
-        """Process a capability update from a service node."""
-        if capabilities is None:
+                                    capabilities_version=None,
+                                    capabilities_delta=None, **kwargs):
+        """Process a capability update from a service node.
+
+        Since 3.14 reports are versioned and may only contain the changes
+        since the previous report of the service. When reports were missed
+        the service is asked to send all its capabilities again.
+        """
+        if capabilities is None and capabilities_delta is None:
             capabilities = {}
         # If we received the timestamp we have to deserialize it
         elif timestamp:
             timestamp = datetime.strptime(timestamp,
                                           timeutils.PERFECT_TIME_FORMAT)
 
-        self.driver.update_service_capabilities(service_name,
-                                                host,
-                                                capabilities,
-                                                cluster_name,
-                                                timestamp)
+        version_args = {}
+        if capabilities_version is not None:
+            version_args = {'capabilities_version': capabilities_version,
+                            'capabilities_delta': capabilities_delta}
+        updated = self.driver.update_service_capabilities(service_name,
+                                                          host,
+                                                          capabilities,
+                                                          cluster_name,
+                                                          timestamp,
+                                                          **version_args)
+        if updated is False and service_name == 'volume':
+            self.volume_api.publish_service_capabilities(context, host=host)
 
     def notify_service_capabilities(self, context, service_name,
                                     capabilities, host=None, backend=None,
@@ -228,6 +241,42 @@ class SchedulerManager(manager.CleanableManager, manager.Manager):
         with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
             flow_engine.run()
 
+    @append_operation_type()
+    def create_volumes(self, context, volumes, request_spec_list=None,
+                       filter_properties_list=None):
+        """Schedule the creation of several volumes together.
+
+        The scheduler driver places as many volumes as it can in one pass,
+        the others go through the regular create_volume flow, which also
+        takes care of erroring out the volumes that can't be placed.
+        """
+        self._wait_for_scheduler()
+
+        filter_properties_list = (filter_properties_list or
+                                  [None] * len(volumes))
+        # Like Volume.set_workers does for create_volume, so this service
+        # cleans up the volumes if it stops while scheduling them.
+        for volume in volumes:
+            if volume.is_cleanable(pinned=False):
+                volume.set_worker()
+
+        try:
+            unplaced = self.driver.schedule_create_volumes(
+                context, request_spec_list, filter_properties_list)
+        except Exception:
+            LOG.exception("Failed to schedule %d volumes together, "
+                          "scheduling them one by one.", len(volumes))
+            unplaced = range(len(volumes))
+
+        for index in unplaced:
+            request_spec = request_spec_list[index]
+            self.create_volume(context, volumes[index],
+                               snapshot_id=request_spec.get('snapshot_id'),
+                               image_id=request_spec.get('image_id'),
+                               request_spec=request_spec,
+                               filter_properties=filter_properties_list[index],
+                               backup_id=request_spec.get('backup_id'))
+
     @append_operation_type()
     def create_snapshot(self, ctxt, volume, snapshot, backend,
                         request_spec=None, filter_properties=None):
@@ -73,9 +73,12 @@ class SchedulerAPI(rpc.RPCAPI):
         3.10 - Adds backup_id to create_volume method.
         3.11 - Adds manage_existing_snapshot method.
         3.12 - Adds create_backup method.
+        3.13 - Adds create_volumes method.
+        3.14 - Adds capabilities_version and capabilities_delta to
+               update_service_capabilities.
     """
 
-    RPC_API_VERSION = '3.12'
+    RPC_API_VERSION = '3.14'
     RPC_DEFAULT_VERSION = '3.0'
     TOPIC = constants.SCHEDULER_TOPIC
     BINARY = 'cinder-scheduler'
@@ -109,6 +112,33 @@ class SchedulerAPI(rpc.RPCAPI):
             msg_args.pop('backup_id')
         cctxt.cast(ctxt, 'create_volume', **msg_args)
 
+    def create_volumes(self, ctxt, volumes, request_spec_list,
+                       filter_properties_list=None):
+        """Schedule the creation of several volumes in one request.
+
+        Falls back to a create_volume cast per volume if the schedulers
+        are too old to schedule them together.
+        """
+        filter_properties_list = (filter_properties_list or
+                                  [None] * len(volumes))
+        if not self.client.can_send_version('3.13'):
+            for volume, request_spec, filter_properties in zip(
+                    volumes, request_spec_list, filter_properties_list):
+                self.create_volume(ctxt, volume,
+                                   snapshot_id=request_spec.get('snapshot_id'),
+                                   image_id=request_spec.get('image_id'),
+                                   request_spec=request_spec,
+                                   filter_properties=filter_properties,
+                                   backup_id=request_spec.get('backup_id'))
+            return
+
+        for volume in volumes:
+            volume.create_worker()
+        cctxt = self._get_cctxt(version='3.13')
+        cctxt.cast(ctxt, 'create_volumes', volumes=volumes,
+                   request_spec_list=request_spec_list,
+                   filter_properties_list=filter_properties_list)
+
     @rpc.assert_min_rpc_version('3.8')
     def validate_host_capacity(self, ctxt, backend, request_spec,
                                filter_properties=None):
@@ -205,13 +235,28 @@ class SchedulerAPI(rpc.RPCAPI):
 
     def update_service_capabilities(self, ctxt, service_name, host,
                                     capabilities, cluster_name,
-                                    timestamp=None):
+                                    timestamp=None, capabilities_version=None,
+                                    capabilities_delta=None):
+        """Send the capabilities of a service to all the schedulers.
+
+        capabilities always are all the capabilities. If the schedulers
+        support versioned reports and a delta is given, only the delta is
+        sent.
+        """
         msg_args = dict(service_name=service_name, host=host,
                         capabilities=capabilities)
 
         version = '3.3'
+        if (capabilities_version is not None and
+                self.client.can_send_version('3.14')):
+            version = '3.14'
+            msg_args.update(capabilities_version=capabilities_version)
+            if capabilities_delta is not None:
+                msg_args.update(capabilities=None,
+                                capabilities_delta=capabilities_delta)
+
         # If server accepts timestamping the capabilities and the cluster name
-        if self.client.can_send_version(version):
+        if version == '3.14' or self.client.can_send_version(version):
             # Serialize the timestamp
             msg_args.update(cluster_name=cluster_name,
                             timestamp=self.prepare_timestamp(timestamp))
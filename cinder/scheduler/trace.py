@@ -0,0 +1,80 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Scheduler decision tracing
+"""
+
+import time
+from typing import Iterable, Optional
+
+
+def _obj_name(obj) -> str:
+    return str(getattr(obj, "host", obj))
+
+
+class SchedulerTrace(object):
+    """Records how a request went through the filters and the weighers.
+
+    The filter and weight handlers add one entry per filter and per weigher
+    they run, with the time it took and how the candidates changed. The
+    result is a plain dict, see to_dict(), suitable for a notification
+    payload.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.candidates: Optional[int] = None
+        self.filters: list[dict] = []
+        self.weighers: list[dict] = []
+
+    def add_filter(self,
+                   name: str,
+                   elapsed: float,
+                   objs_before: list,
+                   objs_after: Iterable) -> None:
+        """Record a filter run and the objects it rejected."""
+        kept = {id(obj) for obj in objs_after}
+        if self.candidates is None:
+            self.candidates = len(objs_before)
+        self.filters.append({
+            'name': name,
+            'elapsed': elapsed,
+            'start': len(objs_before),
+            'end': len(kept),
+            'rejected': [_obj_name(obj) for obj in objs_before
+                         if id(obj) not in kept],
+        })
+
+    def add_weigher(self,
+                    name: str,
+                    elapsed: float,
+                    count: int,
+                    minval: Optional[float],
+                    maxval: Optional[float]) -> None:
+        """Record a weigher run and the range of weights it found."""
+        self.weighers.append({
+            'name': name,
+            'elapsed': elapsed,
+            'count': count,
+            'minval': minval,
+            'maxval': maxval,
+        })
+
+    def to_dict(self, **kwargs) -> dict:
+        """Return the trace, with the additional given fields."""
+        result = {'elapsed': time.monotonic() - self.start,
+                  'candidates': self.candidates,
+                  'filters': self.filters,
+                  'weighers': self.weighers}
+        result.update(kwargs)
+        return result
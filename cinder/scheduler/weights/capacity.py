@@ -20,7 +20,6 @@ import math
 
 from oslo_config import cfg
 
-from cinder.scheduler import sched_utils
 from cinder.scheduler import weights
 
 
@@ -62,27 +61,35 @@ class CapacityWeigher(weights.BaseHostWeigher):
     def weigh_objects(self, weighed_obj_list, weight_properties):
         """Override the weigh objects.
 
-
-        This override calls the parent to do the weigh objects and then
-        replaces any infinite weights with a value that is a multiple of the
-        delta between the min and max values.
+        The virtual free capacity of the backends is computed when their
+        stats are updated, so weighing only reads it and finds the minimum
+        and maximum of the filtered backends. Any infinite weights are then
+        replaced with a value that is a multiple of the delta between the
+        min and max values.
 
         NOTE(jecarey): the infinite weight value is only used when the
         smallest value is being favored (negative multiplier).  When the
         largest weight value is being used a weight of -1 is used instead.
         See _weigh_object method.
         """
-        tmp_weights = super(CapacityWeigher, self).weigh_objects(
-            weighed_obj_list, weight_properties)
-
-        assert self.maxval is not None
+        thin = self._is_thin(weight_properties)
+        unknown = self._unknown_weight()
+        tmp_weights = []
+        for obj in weighed_obj_list:
+            free = obj.obj.get_virtual_free_capacity(thin)
+            tmp_weights.append(unknown if free is None else free)
+        if not tmp_weights:
+            return tmp_weights
+
+        self.minval = min(tmp_weights)
+        self.maxval = max(tmp_weights)
         if math.isinf(self.maxval):
-            # NOTE(jecarey): if all weights were infinite then parent
-            # method returns 0 for all of the weights.  Thus self.minval
-            # cannot be infinite at this point
             copy_weights = [w for w in tmp_weights if not math.isinf(w)]
+            if not copy_weights:
+                # NOTE(jecarey): if all weights are infinite they are all
+                # normalized to 0.
+                return tmp_weights
             self.maxval = max(copy_weights)
-            assert self.minval is not None
             offset = (self.maxval - self.minval) * OFFSET_MULT
             self.maxval += OFFSET_MIN if offset == 0.0 else offset
             tmp_weights = [self.maxval if math.isinf(w) else w
@@ -90,41 +97,32 @@ class CapacityWeigher(weights.BaseHostWeigher):
 
         return tmp_weights
 
+    @staticmethod
+    def _is_thin(weight_properties) -> bool:
+        # NOTE(xyang): If 'provisioning:type' is 'thick' in extra_specs,
+        # we will not use max_over_subscription_ratio and
+        # provisioned_capacity_gb to determine whether a volume can be
+        # provisioned. Instead free capacity will be used to evaluate.
+        vol_type = weight_properties.get('volume_type', {}) or {}
+        provision_type = vol_type.get('extra_specs', {}).get(
+            'provisioning:type')
+        return provision_type != 'thick'
+
+    @staticmethod
+    def _unknown_weight() -> float:
+        # (zhiteng) 'infinite' and 'unknown' are treated the same
+        # here, for sorting purpose.
+
+        # As a partial fix for bug #1350638, 'infinite' and 'unknown' are
+        # given the lowest weight to discourage driver from report such
+        # capacity anymore.
+        return -1 if CONF.capacity_weight_multiplier > 0 else float('inf')
+
     def _weigh_object(self, host_state, weight_properties) -> float:
         """Higher weights win.  We want spreading to be the default."""
-        free_space = host_state.free_capacity_gb
-        total_space = host_state.total_capacity_gb
-        if (free_space == 'infinite' or free_space == 'unknown' or
-                total_space == 'infinite' or total_space == 'unknown'):
-            # (zhiteng) 'infinite' and 'unknown' are treated the same
-            # here, for sorting purpose.
-
-            # As a partial fix for bug #1350638, 'infinite' and 'unknown' are
-            # given the lowest weight to discourage driver from report such
-            # capacity anymore.
-            free = -1 if CONF.capacity_weight_multiplier > 0 else float('inf')
-        else:
-            # NOTE(xyang): If 'provisioning:type' is 'thick' in extra_specs,
-            # we will not use max_over_subscription_ratio and
-            # provisioned_capacity_gb to determine whether a volume can be
-            # provisioned. Instead free capacity will be used to evaluate.
-            thin = True
-            vol_type = weight_properties.get('volume_type', {}) or {}
-            provision_type = vol_type.get('extra_specs', {}).get(
-                'provisioning:type')
-            if provision_type == 'thick':
-                thin = False
-
-            free = sched_utils.calculate_virtual_free_capacity(
-                total_space,
-                free_space,
-                host_state.provisioned_capacity_gb,
-                host_state.thin_provisioning_support,
-                host_state.max_over_subscription_ratio,
-                host_state.reserved_percentage,
-                thin)
-
-        return free
+        free = host_state.get_virtual_free_capacity(
+            self._is_thin(weight_properties))
+        return self._unknown_weight() if free is None else free
 
 
 class AllocatedCapacityWeigher(weights.BaseHostWeigher):
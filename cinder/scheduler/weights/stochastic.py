@@ -20,19 +20,148 @@ where the probability is proportional to each pools'
 weight.
 """
 
+import bisect
+import itertools
+import math
 import random
+import time
+from typing import Optional
 
 from cinder.scheduler import base_weight
+from cinder.scheduler import trace as sched_trace
 from cinder.scheduler import weights as wts
 
 
+class CumulativeWeights(object):
+    """Cumulative sums of weights that can be searched and updated.
+
+    This is a Fenwick tree: finding the object a random value falls on and
+    changing the weight of an object both take O(log n) time. Weights must
+    not be negative.
+    """
+
+    def __init__(self, weights: list[float]) -> None:
+        self.weights = list(weights)
+        self._size = len(self.weights)
+        self._tree = [0.0] + self.weights
+        for index in range(1, self._size + 1):
+            parent = index + (index & -index)
+            if parent <= self._size:
+                self._tree[parent] += self._tree[index]
+        self.total = math.fsum(self.weights)
+        # Number of objects that can still be drawn
+        self.positive = sum(1 for weight in self.weights if weight > 0)
+
+    def set(self, index: int, weight: float) -> None:
+        """Change the weight of the object at index."""
+        old = self.weights[index]
+        delta = weight - old
+        self.weights[index] = weight
+        self.total += delta
+        self.positive += (weight > 0) - (old > 0)
+        index += 1
+        while index <= self._size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def find(self, value: float) -> int:
+        """Return the index of the object a value in [0, total) falls on.
+
+        That is the first object whose cumulative weight is higher than the
+        value. At least one object must have a weight.
+        """
+        index = 0
+        step = 1 << self._size.bit_length()
+        while step:
+            next_index = index + step
+            if next_index <= self._size and self._tree[next_index] <= value:
+                index = next_index
+                value -= self._tree[next_index]
+            step >>= 1
+        if index < self._size and self.weights[index] > 0:
+            return index
+
+        # Floating point rounding made the value reach the total, or fall on
+        # an object without weight, so the winner is the closest object
+        # with a weight, looking backwards first.
+        index = min(index, self._size - 1)
+        for candidate in itertools.chain(range(index, -1, -1),
+                                         range(index + 1, self._size)):
+            if self.weights[candidate] > 0:
+                return candidate
+        raise ValueError('No object has a weight')
+
+
+class StochasticWeighedObjectList(base_weight.WeighedObjectList):
+    """Objects drawn with a probability proportional to their weight.
+
+    The object drawn for the next request is objects[0]. When reweigh() or
+    remove() change the candidates the next object is drawn again, which
+    only takes O(log n) time since the other objects keep their weights.
+    """
+
+    def __init__(self,
+                 weighers: list,
+                 weighed_objs: list,
+                 weighing_properties: dict) -> None:
+        self.weighers = weighers
+        self.weighing_properties = weighing_properties
+        self.objects = list(weighed_objs)
+        self._entries = weighed_objs
+        self._positions = {id(obj): index
+                           for index, obj in enumerate(weighed_objs)}
+        self._weights = CumulativeWeights(
+            [max(obj.weight, 0.0) for obj in weighed_objs])
+        self._draw()
+
+    def _draw(self) -> None:
+        if not self._weights.positive:
+            # Nothing has a weight, objects[0] is the first one left like
+            # StochasticHostWeightHandler.get_weighed_objects would return
+            self.objects.sort(key=lambda obj: self._positions[id(obj)])
+            return
+        index = self._weights.find(random.random() * self._weights.total)
+        winner = self._entries[index]
+        if self.objects[0] is not winner:
+            self.objects.remove(winner)
+            self.objects.insert(0, winner)
+
+    def _set_weight(self, weighed_obj, weight: float) -> None:
+        weighed_obj.weight = weight
+        self._weights.set(self._positions[id(weighed_obj)],
+                          max(weight, 0.0))
+
+    def reweigh(self, weighed_obj) -> None:
+        """Recompute the weight of an object and draw the next one."""
+        weight = 0.0
+        for weigher in self.weighers:
+            value = weigher._weigh_object(weighed_obj.obj,
+                                          self.weighing_properties)
+            if math.isinf(value):
+                value = weigher.maxval
+            weight += weigher.weight_multiplier() * value
+        self._set_weight(weighed_obj, weight)
+        self._draw()
+
+    def remove(self, weighed_obj) -> None:
+        """Remove an object that can't be chosen anymore."""
+        self._set_weight(weighed_obj, 0.0)
+        self.objects.remove(weighed_obj)
+        self._draw()
+
+
 class StochasticHostWeightHandler(base_weight.BaseWeightHandler):
     def __init__(self, namespace):
         super(StochasticHostWeightHandler, self).__init__(wts.BaseHostWeigher,
                                                           namespace)
 
-    def get_weighed_objects(self, weigher_classes, obj_list,
-                            weighing_properties):
+    @staticmethod
+    def _weigh(weigher_classes: list,
+               obj_list: list,
+               weighing_properties: dict,
+               trace: Optional[sched_trace.SchedulerTrace] = None) -> tuple[
+                   list, list]:
+        """Return the weighers and the objects with their added weights."""
         # The normalization performed in the superclass is nonlinear, which
         # messes up the probabilities, so override it. The probabilistic
         # approach we use here is self-normalizing.
@@ -41,42 +170,63 @@ class StochasticHostWeightHandler(base_weight.BaseWeightHandler):
 
         # Compute the object weights as the parent would but without sorting
         # or normalization.
+        weighers = []
         weighed_objs = [wts.WeighedHost(obj, 0.0) for obj in obj_list]
         for weigher_cls in weigher_classes:
             weigher = weigher_cls()
+            weighers.append(weigher)
+            if trace is not None:
+                start_time = time.monotonic()
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
-            for i, weight in enumerate(weights):
-                obj = weighed_objs[i]
-                obj.weight += weigher.weight_multiplier() * weight
+            multiplier = weigher.weight_multiplier()
+            for obj, weight in zip(weighed_objs, weights):
+                obj.weight += multiplier * weight
+            if trace is not None:
+                trace.add_weigher(weigher_cls.__name__,
+                                  time.monotonic() - start_time,
+                                  len(weighed_objs), weigher.minval,
+                                  weigher.maxval)
+        return weighers, weighed_objs
+
+    def get_weighed_objects(self, weigher_classes, obj_list,
+                            weighing_properties, trace=None):
+        """Return the objects with the randomly drawn winner first."""
+        _weighers, weighed_objs = self._weigh(weigher_classes, obj_list,
+                                              weighing_properties, trace)
 
         # Avoid processing empty lists
         if not weighed_objs:
             return []
 
-        # First compute the total weight of all the objects and the upper
-        # bound for each object to "win" the lottery.
-        total_weight = 0.0
-        table = []
-        for weighed_obj in weighed_objs:
-            total_weight += weighed_obj.weight
-            max_value = total_weight
-            table.append((max_value, weighed_obj))
+        # Every object "wins" the lottery when the random value is lower
+        # than its cumulative weight and not lower than the previous one.
+        cumulative = list(itertools.accumulate(
+            weighed_obj.weight for weighed_obj in weighed_objs))
+        total_weight = cumulative[-1]
 
         # Now draw a random value with the computed range
         winning_value = random.random() * total_weight
 
-        # Scan the table to find the first object with a maximum higher than
-        # the random number. Save the index of the winner.
-        winning_index = 0
-        for (i, (max_value, weighed_obj)) in enumerate(table):
-            if max_value > winning_value:
-                # Return a single element array with the winner.
-                winning_index = i
-                break
-
-        # It's theoretically possible for the above loop to terminate with no
-        # winner. This happens when winning_value >= total_weight, which
-        # could only occur with very large numbers and floating point
-        # rounding. In those cases the actual winner should have been the
-        # last element, so return it.
+        # The winner is the first object with a cumulative weight higher
+        # than the random number. Negative weights can make the cumulative
+        # weights decrease, so search their running maximum, which is first
+        # higher than the random number on the same object.
+        bounds = list(itertools.accumulate(cumulative, max))
+        winning_index = bisect.bisect_right(bounds, winning_value)
+
+        # It's theoretically possible for there to be no winner. This
+        # happens when winning_value >= total_weight, which could only occur
+        # with very large numbers and floating point rounding. In those
+        # cases the actual winner should have been the last element, so
+        # return it.
+        if winning_index == len(weighed_objs):
+            winning_index = 0
         return weighed_objs[winning_index:] + weighed_objs[0:winning_index]
+
+    def get_weighed_object_list(self, weigher_classes, obj_list,
+                                weighing_properties, trace=None):
+        """Return the weighed objects drawn one after the other."""
+        weighers, weighed_objs = self._weigh(weigher_classes, obj_list,
+                                             weighing_properties, trace)
+        return StochasticWeighedObjectList(weighers, weighed_objs,
+                                           weighing_properties)
@@ -0,0 +1,150 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from http import HTTPStatus
+from unittest import mock
+
+import ddt
+from oslo_serialization import jsonutils
+import webob
+
+from cinder.api import microversions as mv
+from cinder.api import urlmap
+from cinder.api.v3 import router
+from cinder.common import constants
+from cinder import context
+from cinder import exception
+from cinder.tests.unit import fake_constants as fake
+from cinder.tests.unit import test
+from cinder.volume import api as volume_api
+
+
+def app():
+    # no auth, just let environ['cinder.context'] pass through
+    api = router.APIRouter()
+    mapper = urlmap.URLMap()
+    mapper['/v3'] = api
+    return mapper
+
+
+@ddt.ddt
+class ImageVolumeCacheTestCase(test.TestCase):
+    """Test Case for the image volume cache API."""
+    def setUp(self):
+        super(ImageVolumeCacheTestCase, self).setUp()
+        self.context = context.RequestContext(user_id=None,
+                                              project_id=fake.PROJECT_ID,
+                                              is_admin=True,
+                                              read_deleted='no',
+                                              overwrite=False)
+
+    def _get_resp_post(self, body, version=mv.IMAGE_VOLUME_CACHE_PREWARM,
+                       ctxt=None):
+        """Helper to execute a POST image_volume_cache/prewarm API call."""
+        req = webob.Request.blank('/v3/%s/image_volume_cache/prewarm' %
+                                  fake.PROJECT_ID)
+        req.method = 'POST'
+        req.headers['Content-Type'] = 'application/json'
+        req.headers['OpenStack-API-Version'] = 'volume ' + version
+        req.environ['cinder.context'] = ctxt or self.context
+        req.body = jsonutils.dump_as_bytes(body)
+        res = req.get_response(app())
+        return res
+
+    @mock.patch('cinder.volume.api.API.prewarm_image_volume_cache')
+    def test_prewarm_old_api_version(self, prewarm_mock):
+        res = self._get_resp_post(
+            {'image_id': fake.IMAGE_ID, 'host': 'host@backend'},
+            mv.get_prior_version(mv.IMAGE_VOLUME_CACHE_PREWARM))
+        self.assertEqual(HTTPStatus.NOT_FOUND, res.status_code)
+        prewarm_mock.assert_not_called()
+
+    @mock.patch('cinder.volume.api.API.prewarm_image_volume_cache')
+    def test_prewarm_not_authorized(self, prewarm_mock):
+        ctxt = context.RequestContext(user_id=None,
+                                      project_id=fake.PROJECT_ID,
+                                      is_admin=False,
+                                      read_deleted='no',
+                                      overwrite=False)
+        res = self._get_resp_post(
+            {'image_id': fake.IMAGE_ID, 'host': 'host@backend'}, ctxt=ctxt)
+        self.assertEqual(HTTPStatus.FORBIDDEN, res.status_code)
+        prewarm_mock.assert_not_called()
+
+    @ddt.data({'host': 'host@backend'},
+              {'image_id': 'non UUID', 'host': 'host@backend'},
+              {'image_id': fake.IMAGE_ID},
+              {'image_id': fake.IMAGE_ID, 'host': None},
+              {'image_id': fake.IMAGE_ID, 'host': 'host@backend',
+               'cluster_name': 'cluster@backend'},
+              {'image_id': fake.IMAGE_ID, 'host': 'host@backend',
+               'fake_key': 'value'})
+    @mock.patch('cinder.volume.api.API.prewarm_image_volume_cache')
+    def test_prewarm_wrong_param(self, body, prewarm_mock):
+        res = self._get_resp_post(body)
+        self.assertEqual(HTTPStatus.BAD_REQUEST, res.status_code)
+        prewarm_mock.assert_not_called()
+
+    @ddt.data({'host': 'host@backend'},
+              {'cluster_name': 'cluster@backend#pool'})
+    @mock.patch('cinder.volume.api.API.prewarm_image_volume_cache')
+    def test_prewarm(self, backend, prewarm_mock):
+        res = self._get_resp_post(dict(backend, image_id=fake.IMAGE_ID))
+        self.assertEqual(HTTPStatus.ACCEPTED, res.status_code)
+        prewarm_mock.assert_called_once_with(
+            mock.ANY, fake.IMAGE_ID, host=backend.get('host'),
+            cluster_name=backend.get('cluster_name'))
+
+    @mock.patch('cinder.volume.api.API.prewarm_image_volume_cache',
+                side_effect=exception.ServiceNotFound(service_id='host'))
+    def test_prewarm_service_not_found(self, prewarm_mock):
+        res = self._get_resp_post({'image_id': fake.IMAGE_ID,
+                                   'host': 'host@backend'})
+        self.assertEqual(HTTPStatus.NOT_FOUND, res.status_code)
+
+
+@ddt.ddt
+class ImageVolumeCacheVolumeAPITestCase(test.TestCase):
+    def setUp(self):
+        super(ImageVolumeCacheVolumeAPITestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.volume_api = volume_api.API()
+        self.volume_api.image_service = mock.Mock()
+        self.mock_rpcapi = self.mock_object(self.volume_api, 'volume_rpcapi')
+
+    @ddt.data(({'host': 'host@backend#pool'},
+               {'host': 'host@backend', 'cluster_name': None}),
+              ({'cluster_name': 'cluster@backend'},
+               {'host': None, 'cluster_name': 'cluster@backend'}))
+    @ddt.unpack
+    @mock.patch('cinder.objects.Service.get_by_id')
+    def test_prewarm_image_volume_cache(self, backend, filters,
+                                        mock_get_service):
+        mock_get_service.return_value = mock.Mock(is_up=True)
+
+        self.volume_api.prewarm_image_volume_cache(self.context,
+                                                   fake.IMAGE_ID, **backend)
+
+        mock_get_service.assert_called_once_with(
+            mock.ANY, None, binary=constants.VOLUME_BINARY, **filters)
+        self.volume_api.image_service.show.assert_called_once_with(
+            self.context, fake.IMAGE_ID)
+        self.mock_rpcapi.prewarm_image_volume_cache.assert_called_once_with(
+            self.context, list(backend.values())[0], fake.IMAGE_ID)
+
+    @mock.patch('cinder.objects.Service.get_by_id',
+                return_value=mock.Mock(is_up=False))
+    def test_prewarm_image_volume_cache_service_down(self, mock_get_service):
+        self.assertRaises(exception.ServiceUnavailable,
+                          self.volume_api.prewarm_image_volume_cache,
+                          self.context, fake.IMAGE_ID, host='host@backend')
+        self.mock_rpcapi.prewarm_image_volume_cache.assert_not_called()
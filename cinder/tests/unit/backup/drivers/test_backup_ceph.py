@@ -426,6 +426,20 @@ class BackupCephTestCase(test.TestCase):
             # Ensure the files are equal
             self.assertEqual(checksum.digest(), self.checksum.digest())
 
+    @common_mocks
+    def test_transfer_data_throttle(self):
+        throttle = mock.Mock()
+        self.service.chunk_size = self.chunk_size
+        with tempfile.NamedTemporaryFile() as test_file:
+            self.volume_file.seek(0)
+            self.service._transfer_data(self.volume_file, 'src_foo', test_file,
+                                        'dest_foo', self.data_length + 10,
+                                        throttle=throttle)
+
+        self.assertEqual(
+            [mock.call(self.chunk_size)] * self.num_chunks + [mock.call(10)],
+            throttle.call_args_list)
+
     @common_mocks
     def test_transfer_data_discard_zeros_advances_offset(self):
         # bug #2155612: a discarded zero chunk must still advance the
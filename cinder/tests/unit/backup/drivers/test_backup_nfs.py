@@ -17,6 +17,7 @@
 import bz2
 import filecmp
 import hashlib
+import json
 import os
 import shutil
 import stat
@@ -31,9 +32,11 @@ from os_brick.remotefs import remotefs as remotefs_brick
 from oslo_config import cfg
 import zstd
 
+from cinder.backup import chunkeddriver
 from cinder.backup.drivers import nfs
 from cinder import context
 from cinder.db import api as db
+from cinder.db import models
 from cinder import exception
 from cinder.i18n import _
 from cinder import objects
@@ -702,6 +705,449 @@ class BackupNFSTestCase(test.TestCase):
             self.assertTrue(filecmp.cmp(self.volume_file.name,
                             restored_file.name))
 
+    def test_restore_concurrent_transfers(self):
+        volume_id = fake.VOLUME_ID
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_compression_algorithm='zlib')
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_upload_workers=4)
+        self.flags(backup_restore_workers=4)
+        self.flags(backup_max_inflight_chunks=3)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+
+        service.backup(backup, self.volume_file)
+
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        self.assertEqual(8, backup.object_count)
+        with tempfile.NamedTemporaryFile() as restored_file:
+            backup.status = objects.fields.BackupStatus.RESTORING
+            backup.save()
+            service.restore(backup, volume_id, restored_file, False)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_backup_buffer_pool(self):
+        self.mock_object(chunkeddriver, '_BUFFER_POOLS', {})
+        self.flags(backup_buffer_pool_size=4)
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_upload_workers=2)
+        self.flags(backup_restore_workers=2)
+        self.flags(backup_max_inflight_chunks=3)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        service.backup(backup, self.volume_file)
+
+        # Change a block and back up the changes from the same buffers
+        self.volume_file.seek(1024 * 9)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.flush()
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID,
+                                     backup_id=fake.BACKUP2_ID,
+                                     parent_id=fake.BACKUP_ID)
+        self.volume_file.seek(0)
+        deltabackup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP2_ID)
+        service.backup(deltabackup, self.volume_file)
+        self._restore_and_compare(service, fake.BACKUP2_ID, self.volume_file)
+
+        # All the buffers have been returned to the pool
+        pool = chunkeddriver._BUFFER_POOLS[1024 * 4]
+        self.assertLessEqual(len(pool._free), 4)
+        for _i in range(4):
+            self.assertTrue(pool._semaphore.acquire(blocking=False))
+        self.assertFalse(pool._semaphore.acquire(blocking=False))
+
+    def _restore_and_compare(self, service, backup_id, volume_file):
+        backup = objects.Backup.get_by_id(self.ctxt, backup_id)
+        backup.status = objects.fields.BackupStatus.RESTORING
+        backup.save()
+        volume_file.seek(0, os.SEEK_END)
+        size = volume_file.tell()
+        with tempfile.NamedTemporaryFile() as restored_file:
+            restored_file.truncate(size)
+            service.restore(backup, fake.VOLUME_ID, restored_file, True)
+            self.assertTrue(filecmp.cmp(volume_file.name, restored_file.name,
+                                        shallow=False))
+        with tempfile.NamedTemporaryFile() as restored_file:
+            restored_file.write(os.urandom(size))
+            restored_file.flush()
+            service.restore(backup, fake.VOLUME_ID, restored_file, False)
+            self.assertTrue(filecmp.cmp(volume_file.name, restored_file.name,
+                                        shallow=False))
+
+    def test_backup_sparse(self):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_compression_algorithm='none')
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        service = nfs.NFSBackupDriver(self.ctxt)
+
+        with tempfile.NamedTemporaryFile() as volume_file:
+            # A hole, a chunk of data, a chunk of written zeros and a hole
+            volume_file.truncate(1024 * 16)
+            volume_file.seek(1024 * 4)
+            volume_file.write(os.urandom(1024 * 4))
+            volume_file.write(bytes(1024 * 4))
+            volume_file.flush()
+            volume_file.seek(0)
+            backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+            service.backup(backup, volume_file)
+
+            backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+            self.assertEqual(1, backup.object_count)
+            metadata = service._read_metadata(backup)
+            self.assertEqual(service.SPARSE_DRIVER_VERSION,
+                             metadata['version'])
+            self.assertEqual([[0, 1024 * 4], [1024 * 8, 1024 * 8]],
+                             metadata['holes'])
+            sha256s = service._read_sha256file(backup)['sha256s']
+            volume_file.seek(0)
+            self.assertEqual(service._calculate_sha(volume_file.read()),
+                             sha256s)
+
+            self._restore_and_compare(service, fake.BACKUP_ID, volume_file)
+
+    def test_backup_sparse_delta(self):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        service.backup(backup, self.volume_file)
+
+        # Zero one block and one whole chunk
+        self.volume_file.seek(1024 * 5)
+        self.volume_file.write(bytes(1024))
+        self.volume_file.seek(1024 * 12)
+        self.volume_file.write(bytes(1024 * 4))
+        self.volume_file.flush()
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID,
+                                     backup_id=fake.BACKUP2_ID,
+                                     parent_id=fake.BACKUP_ID)
+        self.volume_file.seek(0)
+        deltabackup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP2_ID)
+        service.backup(deltabackup, self.volume_file)
+
+        deltabackup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP2_ID)
+        self.assertEqual(0, deltabackup.object_count)
+        self.assertEqual([[1024 * 5, 1024], [1024 * 12, 1024 * 4]],
+                         service._read_metadata(deltabackup)['holes'])
+        self._restore_and_compare(service, fake.BACKUP2_ID, self.volume_file)
+
+    def test_backup_changed_extents(self):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        service.backup(backup, self.volume_file)
+
+        self.volume_file.seek(1024 * 3)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.seek(1024 * 9 + 100)
+        self.volume_file.write(os.urandom(1500))
+        self.volume_file.flush()
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID,
+                                     backup_id=fake.BACKUP2_ID,
+                                     parent_id=fake.BACKUP_ID)
+        self.volume_file.seek(0)
+        deltabackup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP2_ID)
+        # The last extent hasn't actually changed
+        changed_extents = [[1024 * 9 + 100, 1500], [1024 * 3, 1024],
+                           [1024 * 14, 512]]
+        with mock.patch.object(self.volume_file, 'read',
+                               wraps=self.volume_file.read) as mock_read:
+            service.backup(deltabackup, self.volume_file,
+                           changed_extents=changed_extents)
+
+        self.assertEqual([mock.call(1024), mock.call(1024 * 2),
+                          mock.call(1024)], mock_read.call_args_list)
+        deltabackup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP2_ID)
+        self.assertEqual(2, deltabackup.object_count)
+        parent_shas = service._read_sha256file(backup)['sha256s']
+        delta_shas = service._read_sha256file(deltabackup)['sha256s']
+        self.assertEqual(len(parent_shas), len(delta_shas))
+        self.assertEqual(
+            [3, 9, 10],
+            [i for i, sha in enumerate(delta_shas) if sha != parent_shas[i]])
+        self._restore_and_compare(service, fake.BACKUP2_ID, self.volume_file)
+
+    def test_changed_regions(self):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.assertEqual(
+            [(0, 1024), (1024 * 2, 1024 * 4), (1024 * 6, 1024),
+             (1024 * 9, 1024)],
+            list(service._changed_regions(
+                [[1024 * 3, 4000], [10, 20], [1024 * 2, 10],
+                 [1024 * 9, 5000]], 1024 * 10)))
+
+    @mock.patch('cinder.backup.driver.get_throttle')
+    def test_backup_throttle(self, mock_get_throttle):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        db.volume_update(self.ctxt, fake.VOLUME_ID,
+                         {'host': 'host1@backend1#pool1'})
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        service.backup(backup, self.volume_file)
+
+        consume = mock_get_throttle.return_value.consume
+        self.assertEqual([mock.call('host1@backend1', 1024 * 4)] * 8,
+                         consume.call_args_list)
+        consume.reset_mock()
+        self._restore_and_compare(service, fake.BACKUP_ID, self.volume_file)
+        self.assertEqual([mock.call('host1@backend1', 1024 * 4)] * 16,
+                         consume.call_args_list)
+
+    def test_backup_resume(self):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_checkpoint_interval=1)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        self.assertFalse(service.can_resume_backup(backup))
+
+        backup_chunk = service._backup_chunk
+
+        def _interrupt(*args, **kwargs):
+            if interrupted.call_count == 3:
+                raise exception.BackupOperationError('interrupted')
+            return backup_chunk(*args, **kwargs)
+
+        self.volume_file.seek(0)
+        with mock.patch.object(service, '_backup_chunk',
+                               side_effect=_interrupt) as interrupted:
+            self.assertRaises(exception.BackupOperationError,
+                              service.backup, backup, self.volume_file)
+
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        object_prefix = backup.service_metadata
+        self.assertTrue(service.can_resume_backup(backup))
+        checkpoint_name = service._checkpoint_filename(backup)
+        self.assertEqual(
+            [checkpoint_name, checkpoint_name + '-00000',
+             checkpoint_name + '-00001'],
+            sorted(service.get_container_entries(backup.container,
+                                                 checkpoint_name)))
+        # Every checkpoint only writes the chunk stored after the last one
+        with service._get_object_reader(
+                backup.container, checkpoint_name + '-00001') as reader:
+            segment = json.loads(reader.read().decode('utf-8'))
+        self.assertEqual(1, segment['objects'][0])
+        self.assertEqual(1, len(segment['objects'][1]))
+        self.assertEqual(4, segment['sha256s'][0])
+        self.assertEqual(4, len(segment['sha256s'][1]))
+        checkpoint = service._read_checkpoint(backup)
+        self.assertEqual(1024 * 8, checkpoint['offset'])
+        self.assertEqual(2, len(checkpoint['objects']))
+        self.assertEqual(8, len(checkpoint['sha256s']))
+        # A new service and volume file, as after a restart
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        with mock.patch.object(self.volume_file, 'read',
+                               wraps=self.volume_file.read) as mock_read:
+            service.backup(backup, self.volume_file)
+
+        # The two checkpointed chunks aren't read again
+        self.assertEqual(7, mock_read.call_count)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        self.assertEqual(object_prefix, backup.service_metadata)
+        self.assertEqual(8, backup.object_count)
+        self.assertFalse(service.can_resume_backup(backup))
+        self.assertEqual([], service.get_container_entries(backup.container,
+                                                           checkpoint_name))
+        self._restore_and_compare(service, fake.BACKUP_ID, self.volume_file)
+
+    def test_checkpoint_segments(self):
+        self.flags(backup_checkpoint_interval=1)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        backup.service_metadata = 'test-prefix'
+        backup.save()
+        service.put_container(backup.container)
+        block = service.sha_block_size_bytes
+        object_meta = {'id': 2, 'list': [{'test-prefix-00001': {}}],
+                       'holes': [[0, block]]}
+        sha256_list = ['sha1', 'sha2']
+        marks = service._checkpoint_marks()
+        service._write_checkpoint(backup, backup.container, object_meta,
+                                  sha256_list, 2 * block, marks)
+
+        # The hole grows before the next chunk
+        object_meta['holes'][0][1] += block
+        object_meta['list'].append({'test-prefix-00002': {}})
+        object_meta['id'] = 3
+        sha256_list.extend(['sha3', 'sha4'])
+        service._write_checkpoint(backup, backup.container, object_meta,
+                                  sha256_list, 4 * block, marks)
+        self.assertEqual({'segments': 2, 'objects': 2, 'holes': 1,
+                          'sha256s': 4}, marks)
+
+        checkpoint = service._read_checkpoint(backup)
+        self.assertEqual(4 * block, checkpoint['offset'])
+        self.assertEqual(3, checkpoint['object_id'])
+        self.assertEqual(object_meta['list'], checkpoint['objects'])
+        self.assertEqual([[0, 2 * block]], checkpoint['holes'])
+        self.assertEqual(sha256_list, checkpoint['sha256s'])
+        self.assertEqual(marks, service._checkpoint_marks(checkpoint))
+
+    def test_backup_resume_config_changed(self):
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_checkpoint_interval=1)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+        self.mock_object(service, '_finalize_backup',
+                         side_effect=exception.BackupOperationError('fail'))
+        self.volume_file.seek(0)
+        self.assertRaises(exception.BackupOperationError,
+                          service.backup, backup, self.volume_file)
+        self.assertTrue(service.can_resume_backup(backup))
+
+        self.flags(backup_sha_block_size_bytes=2048)
+        self.assertFalse(
+            nfs.NFSBackupDriver(self.ctxt).can_resume_backup(backup))
+
+    def _dedup_entries(self, container):
+        return [name for name in os.listdir(os.path.join(self.temp_dir,
+                                                         container))
+                if name.startswith('dedup_')]
+
+    def _dedup_references(self, backup_id=None):
+        with db.main_context_manager.reader.using(self.ctxt):
+            query = self.ctxt.session.query(models.BackupDedupReference)
+            if backup_id:
+                query = query.filter_by(backup_id=backup_id)
+            return query.count()
+
+    def _setup_dedup(self):
+        self.flags(backup_dedup=True)
+        self.flags(backup_file_size=1024 * 4)
+        self.flags(backup_sha_block_size_bytes=1024)
+        return nfs.NFSBackupDriver(self.ctxt)
+
+    def _dedup_backup(self, service, backup_id):
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID,
+                                     backup_id=backup_id)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, backup_id)
+        service.backup(backup, self.volume_file)
+        return objects.Backup.get_by_id(self.ctxt, backup_id)
+
+    def _restore_and_compare_backup(self, service, backup):
+        with tempfile.NamedTemporaryFile() as restored_file:
+            backup.status = objects.fields.BackupStatus.RESTORING
+            backup.save()
+            service.restore(backup, fake.VOLUME_ID, restored_file, False)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_backup_dedup(self):
+        service = self._setup_dedup()
+        # Make the second half of the volume a copy of the first half
+        self.volume_file.seek(0)
+        half = self.volume_file.read(self.size_volume_file // 2)
+        self.volume_file.write(half)
+
+        backups = [self._dedup_backup(service, backup_id)
+                   for backup_id in (fake.BACKUP_ID, fake.BACKUP2_ID)]
+
+        # Each backup references 8 chunks, only 4 of them are distinct.
+        self.assertEqual(8, backups[1].object_count)
+        self.assertEqual(4, len(self._dedup_entries('test-container')))
+        self.assertEqual(8, self._dedup_references(fake.BACKUP2_ID))
+
+        service.delete_backup(backups[0])
+        self.assertEqual(4, len(self._dedup_entries('test-container')))
+        self.assertEqual(0, self._dedup_references(fake.BACKUP_ID))
+        self._restore_and_compare_backup(service, backups[1])
+
+        service.delete_backup(backups[1])
+        self.assertEqual([], self._dedup_entries('test-container'))
+        self.assertEqual(0, self._dedup_references())
+
+    def test_backup_dedup_cancel(self):
+        """Test references of an incomplete backup are released."""
+        service = self._setup_dedup()
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, fake.BACKUP_ID)
+
+        with mock.patch.object(service, '_finalize_backup'):
+            service.backup(backup, self.volume_file)
+        self.assertEqual(8, len(self._dedup_entries('test-container')))
+
+        service.delete_backup(backup)
+        self.assertEqual([], self._dedup_entries('test-container'))
+        self.assertEqual(0, self._dedup_references())
+
+    def test_backup_dedup_release_concurrent_write(self):
+        """Test a backup writing chunks while the last reference is dropped.
+
+        The chunks of the first backup are stored again by the second
+        backup right after the first backup released them, and before the
+        released objects are deleted.
+        """
+        service = self._setup_dedup()
+        first = self._dedup_backup(service, fake.BACKUP_ID)
+        self._create_backup_db_entry(volume_id=fake.VOLUME_ID,
+                                     backup_id=fake.BACKUP2_ID)
+        second = objects.Backup.get_by_id(self.ctxt, fake.BACKUP2_ID)
+        delete_object = service.delete_object
+
+        def concurrent_write(container, object_name):
+            if not second.object_count:
+                self.volume_file.seek(0)
+                service.backup(second, self.volume_file)
+                second.refresh()
+            delete_object(container, object_name)
+
+        with mock.patch.object(service, 'delete_object',
+                               side_effect=concurrent_write):
+            service.delete_backup(first)
+
+        # The second backup stored its own copy of the released chunks
+        self.assertEqual(8, len(self._dedup_entries('test-container')))
+        self.assertEqual(8, self._dedup_references(fake.BACKUP2_ID))
+        self._restore_and_compare_backup(service, second)
+
+    def test_backup_dedup_write_stored_concurrently(self):
+        service = self._setup_dedup()
+        service.put_container('test-container')
+        create = db.backup_dedup_chunk_create
+
+        def concurrent_create(context, container, dedup_key, *args):
+            # Another backup stores the same chunk first
+            create(context, container, dedup_key, fake.BACKUP2_ID,
+                   'dedup_%s_data_other' % dedup_key, 'none')
+            raise exception.BackupDedupChunkExists(container=container,
+                                                   dedup_key=dedup_key)
+
+        with mock.patch.object(db, 'backup_dedup_chunk_create',
+                               side_effect=concurrent_create):
+            service._write_dedup_chunk({'id': fake.BACKUP_ID},
+                                       'test-container', 'key', b'data',
+                                       None)
+
+        # Our copy was deleted and the stored chunk is referenced instead
+        self.assertEqual([], self._dedup_entries('test-container'))
+        self.assertEqual(1, self._dedup_references(fake.BACKUP_ID))
+
     def test_restore_bz2(self):
         self.thread_original_method = bz2.decompress
         volume_id = fake.VOLUME_ID
@@ -573,6 +573,56 @@ class BackupTestCase(BaseBackupTest):
         volume = objects.Volume.get_by_id(self.ctxt, vol1_id)
         self.assertEqual('available', volume.status)
 
+    @mock.patch.object(manager.BackupManager, '_start_backup')
+    def test_cleanup_one_creating_backup_resume(self, mock_start_backup):
+        """Test cleanup_one_backup resumes a checkpointed backup."""
+        vol1_id = self._create_volume_db_entry()
+        temp_vol_id = self._create_volume_db_entry()
+        backup = self._create_backup_db_entry(
+            status=fields.BackupStatus.CREATING,
+            volume_id=vol1_id,
+            temp_volume_id=temp_vol_id)
+        mock_service = self.mock_object(self.backup_mgr, 'service')
+        mock_service.return_value.can_resume_backup.return_value = True
+        mock_delete_volume = self.mock_object(self.backup_mgr.volume_rpcapi,
+                                              'delete_volume')
+
+        self.backup_mgr._cleanup_one_backup(self.ctxt, backup)
+
+        self.assertEqual(fields.BackupStatus.CREATING, backup.status)
+        self.assertIsNone(backup.temp_volume_id)
+        mock_service.return_value.can_resume_backup.assert_called_once_with(
+            backup)
+        mock_delete_volume.assert_called_once_with(self.ctxt, mock.ANY)
+        mock_start_backup.assert_called_once_with(self.ctxt, backup,
+                                                  mock.ANY)
+        volume = objects.Volume.get_by_id(self.ctxt, vol1_id)
+        self.assertEqual('backing-up', volume.status)
+
+    @ddt.data((True, 'available'), (False, 'in-use'))
+    @ddt.unpack
+    @mock.patch.object(manager.BackupManager, '_start_backup')
+    def test_cleanup_one_creating_backup_no_resume(self, can_resume,
+                                                   previous_status,
+                                                   mock_start_backup):
+        """Test cleanup_one_backup resets backups that can't be resumed."""
+        vol1_id = self._create_volume_db_entry(
+            previous_status=previous_status)
+        backup = self._create_backup_db_entry(
+            status=fields.BackupStatus.CREATING,
+            volume_id=vol1_id)
+        mock_service = self.mock_object(self.backup_mgr, 'service')
+        mock_service.return_value.can_resume_backup.return_value = can_resume
+        if can_resume:
+            mock_start_backup.side_effect = exception.ServiceNotFound(
+                service_id='cinder-volume')
+
+        self.backup_mgr._cleanup_one_backup(self.ctxt, backup)
+
+        self.assertEqual(fields.BackupStatus.ERROR, backup.status)
+        volume = objects.Volume.get_by_id(self.ctxt, vol1_id)
+        self.assertEqual(previous_status, volume.status)
+
     def test_cleanup_one_restoring_backup(self):
         """Test cleanup_one_backup for volume status 'restoring'."""
 
@@ -863,6 +913,104 @@ class BackupTestCase(BaseBackupTest):
         self.assertEqual(vol_size, backup['size'])
         self.assertIsNone(backup.encryption_key_id)
 
+    def _create_incremental_backup(self, parent_snapshot=True,
+                                   snapshot=False):
+        vol_id = self._create_volume_db_entry(size=1)
+        base = self._create_snapshot_db_entry(volume_id=vol_id)
+        parent = self._create_backup_db_entry(
+            volume_id=vol_id, status=fields.BackupStatus.AVAILABLE,
+            snapshot_id=base.id if parent_snapshot else None)
+        snap_id = None
+        if snapshot:
+            snap_id = self._create_snapshot_db_entry(volume_id=vol_id).id
+        backup = self._create_backup_db_entry(volume_id=vol_id,
+                                              parent_id=parent.id,
+                                              snapshot_id=snap_id)
+        vol = objects.Volume.get_by_id(self.ctxt, vol_id)
+        return vol, base, backup
+
+    @ddt.data(False, True)
+    @mock.patch('cinder.volume.rpcapi.VolumeAPI.get_changed_extents',
+                return_value=[[0, 4096]])
+    def test_get_changed_extents(self, snapshot, mock_get_extents):
+        vol, base, backup = self._create_incremental_backup(snapshot=snapshot)
+        device = objects.BackupDeviceInfo(volume=vol)
+
+        res = self.backup_mgr._get_changed_extents(self.ctxt, backup, vol,
+                                                   device)
+
+        self.assertEqual([[0, 4096]], res)
+        mock_get_extents.assert_called_once_with(
+            self.ctxt, vol, mock.ANY, snapshot=mock.ANY)
+        self.assertEqual(base.id, mock_get_extents.call_args[0][2].id)
+        to_snapshot = mock_get_extents.call_args[1]['snapshot']
+        if snapshot:
+            self.assertEqual(backup.snapshot_id, to_snapshot.id)
+        else:
+            self.assertIsNone(to_snapshot)
+
+    @mock.patch('cinder.volume.rpcapi.VolumeAPI.get_changed_extents')
+    def test_get_changed_extents_unavailable(self, mock_get_extents):
+        # Parent backup not taken from a snapshot
+        vol, base, backup = self._create_incremental_backup(
+            parent_snapshot=False)
+        device = objects.BackupDeviceInfo(volume=vol)
+        self.assertIsNone(self.backup_mgr._get_changed_extents(
+            self.ctxt, backup, vol, device))
+
+        # Backing up a temporary clone of the volume
+        vol, base, backup = self._create_incremental_backup()
+        clone = objects.Volume.get_by_id(
+            self.ctxt, self._create_volume_db_entry(size=1))
+        device = objects.BackupDeviceInfo(volume=clone)
+        self.assertIsNone(self.backup_mgr._get_changed_extents(
+            self.ctxt, backup, vol, device))
+
+        # Base snapshot deleted
+        base.destroy()
+        device = objects.BackupDeviceInfo(volume=vol)
+        self.assertIsNone(self.backup_mgr._get_changed_extents(
+            self.ctxt, backup, vol, device))
+        mock_get_extents.assert_not_called()
+
+    @mock.patch('cinder.volume.rpcapi.VolumeAPI.get_changed_extents',
+                side_effect=exception.ServiceTooOld('too old'))
+    def test_get_changed_extents_error(self, mock_get_extents):
+        vol, base, backup = self._create_incremental_backup()
+        device = objects.BackupDeviceInfo(volume=vol)
+        self.assertIsNone(self.backup_mgr._get_changed_extents(
+            self.ctxt, backup, vol, device))
+        mock_get_extents.assert_called_once()
+
+    @mock.patch('cinder.volume.volume_utils.brick_get_connector_properties')
+    @mock.patch('cinder.utils.temporary_chown')
+    @mock.patch('builtins.open', wraps=open)
+    @mock.patch.object(os.path, 'isdir', return_value=False)
+    def test_continue_backup_changed_extents(self, mock_isdir, mock_open,
+                                             mock_temporary_chown,
+                                             mock_get_conn):
+        vol, base, backup = self._create_incremental_backup()
+        device = objects.BackupDeviceInfo(volume=vol, secure_enabled=False)
+        self.mock_object(self.backup_mgr, '_attach_device',
+                         return_value={'device': {'path': '/dev/null'}})
+        self.mock_object(self.backup_mgr, '_detach_device')
+        mock_get_extents = self.mock_object(self.backup_mgr,
+                                            '_get_changed_extents',
+                                            return_value=[[0, 4096]])
+        service = self.backup_mgr.service(self.ctxt)
+        service.support_changed_extents = True
+        self.mock_object(self.backup_mgr, 'service', return_value=service)
+        mock_backup = self.mock_object(service, 'backup', return_value={})
+
+        self.backup_mgr.continue_backup(self.ctxt, backup, device)
+
+        mock_get_extents.assert_called_once_with(self.ctxt, backup, mock.ANY,
+                                                 device)
+        mock_backup.assert_called_once_with(backup, mock.ANY,
+                                            changed_extents=[[0, 4096]])
+        backup.refresh()
+        self.assertEqual(fields.BackupStatus.AVAILABLE, backup.status)
+
     @mock.patch('cinder.volume.volume_utils.brick_get_connector_properties')
     @mock.patch('cinder.volume.rpcapi.VolumeAPI.get_backup_device')
     @mock.patch('cinder.utils.temporary_chown')
@@ -2009,6 +2157,15 @@ class BackupTestCase(BaseBackupTest):
         result = self.backup_mgr.check_support_to_force_delete(self.ctxt)
         self.assertTrue(result)
 
+    def test_throttle_limits(self):
+        self.override_config('backup_bps_limit', 1024)
+        self.mock_object(manager.backup_driver, '_THROTTLE', None)
+        self.backup_mgr.set_throttle_limits(self.ctxt,
+                                            {'backend_iops_limit': 10})
+        self.assertEqual({'bps_limit': 1024, 'iops_limit': 0,
+                          'backend_bps_limit': 0, 'backend_iops_limit': 10},
+                         self.backup_mgr.get_throttle_limits(self.ctxt))
+
     def test_backup_has_dependent_backups(self):
         """Test backup has dependent backups.
 
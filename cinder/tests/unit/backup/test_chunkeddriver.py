@@ -13,8 +13,13 @@
 #    under the License.
 """Tests for the base chunkedbackupdriver class."""
 
+import hashlib
+import io
 import json
+import os
+import threading
 from unittest import mock
+import zlib
 
 from oslo_config import cfg
 from oslo_utils import units
@@ -214,6 +219,60 @@ class ChunkedDriverTestCase(test.TestCase):
     def test_get_compressor_invalid(self):
         self.assertRaises(ValueError, self.driver._get_compressor, 'winzip')
 
+    def test_get_compression_args(self):
+        self.assertEqual((), self.driver._get_compression_args('zlib'))
+        self.assertEqual((), self.driver._get_compression_args('zstd'))
+        self.flags(backup_compression_threads=4)
+        self.assertEqual((3, 4), self.driver._get_compression_args('zstd'))
+        self.flags(backup_compression_level=1)
+        self.assertEqual((1,), self.driver._get_compression_args('gzip'))
+        self.assertEqual((1,), self.driver._get_compression_args('bz2'))
+        self.assertEqual((1, 4), self.driver._get_compression_args('zstd'))
+        self.assertEqual((), self.driver._get_compression_args('none'))
+
+    def test_get_compression_args_invalid_level(self):
+        self.flags(backup_compression_level=0)
+        self.assertRaises(ValueError, self.driver._get_compression_args,
+                          'bz2')
+        self.flags(backup_compression_level=10)
+        self.assertRaises(ValueError, self.driver._get_compression_args,
+                          'zlib')
+
+    def test_prepare_output_data_level(self):
+        self.flags(backup_compression_level=1)
+        driver = ConcreteChunkedDriver(self.ctxt)
+        with mock.patch('zlib.compress', return_value=b'x') as mock_compress:
+            result = driver._prepare_output_data(TEST_DATA)
+        self.assertEqual(('zlib', b'x'), result)
+        mock_compress.assert_called_once_with(TEST_DATA, 1)
+
+    def test_prepare_output_data_min_ratio(self):
+        data = TEST_DATA + os.urandom(len(TEST_DATA))
+        driver = ConcreteChunkedDriver(self.ctxt)
+        self.assertEqual('zlib', driver._prepare_output_data(data)[0])
+        self.flags(backup_compression_min_ratio=2)
+        driver = ConcreteChunkedDriver(self.ctxt)
+        self.assertEqual(('none', data), driver._prepare_output_data(data))
+
+    def test_prepare_output_data_adaptive(self):
+        self.flags(backup_compression_adaptive=True)
+        driver = ConcreteChunkedDriver(self.ctxt)
+        sample_size = (driver.COMPRESSION_SAMPLE_SIZE *
+                       driver.COMPRESSION_SAMPLES)
+        data = os.urandom(sample_size * 2)
+        with mock.patch('zlib.compress', wraps=zlib.compress) as mock_compress:
+            self.assertEqual(('none', data),
+                             driver._prepare_output_data(data))
+            # Only the sample was compressed
+            mock_compress.assert_called_once()
+            self.assertEqual(sample_size,
+                             len(mock_compress.call_args[0][0]))
+
+            mock_compress.reset_mock()
+            data = bytes(sample_size * 2)
+            self.assertEqual('zlib', driver._prepare_output_data(data)[0])
+            self.assertEqual(2, mock_compress.call_count)
+
     def test_create_container(self):
         self.assertEqual(self.backup.container,
                          self.driver._create_container(self.backup))
@@ -381,6 +440,27 @@ class ChunkedDriverTestCase(test.TestCase):
         self.assertEqual(0, chunk['offset'])
         self.assertEqual(len(TEST_DATA), chunk['length'])
 
+    def test_backup_hole(self):
+        object_meta = {}
+        self.driver._backup_hole(object_meta, 0, 10)
+        self.driver._backup_hole(object_meta, 10, 5)
+        self.driver._backup_hole(object_meta, 20, 5)
+        self.assertEqual([[0, 15], [20, 5]], object_meta['holes'])
+
+    def test_changed_extents(self):
+        self.driver.sha_block_size_bytes = 4
+        self.assertEqual(
+            [(0, 4), (8, 16), (20, 22)],
+            self.driver._changed_extents(['a', 'b', 'c', 'd', 'e', 'f'],
+                                         ['x', 'b', 'x', 'x', 'e', 'x'],
+                                         22))
+        self.assertEqual([], self.driver._changed_extents(['a'], ['a'], 4))
+
+    def test_zero_block_shas(self):
+        self.driver.sha_block_size_bytes = 4
+        self.assertEqual(self.driver._calculate_sha(bytes(10)),
+                         self.driver._zero_block_shas(10))
+
     def test_finalize_backup(self):
         (object_meta, object_sha256, extra_metadata, container,
          volume_size_bytes) = self.driver._prepare_backup(self.backup)
@@ -447,6 +527,42 @@ class ChunkedDriverTestCase(test.TestCase):
         self.assert_notify_called(mock_notify,
                                   (['INFO', 'backup.createprogress'],))
 
+    def test_backup_concurrent_uploads(self):
+        self.flags(backup_upload_workers=4)
+        self.driver.chunk_size_bytes = 16
+        self.driver.sha_block_size_bytes = 8
+        stored = {}
+
+        class DictWriter(TestObjectWriter):
+            def write(self, data):
+                stored[self.filename] = data
+
+        volume_file = mock.Mock()
+        volume_file.tell.side_effect = range(0, len(TEST_DATA) + 16, 16)
+        volume_file.read.side_effect = (
+            [TEST_DATA[i:i + 16] for i in range(0, len(TEST_DATA), 16)] +
+            [b''])
+        with mock.patch.object(self.driver, 'get_object_writer',
+                               side_effect=DictWriter), \
+                mock.patch.object(self.driver,
+                                  '_finalize_backup') as mock_finalize:
+            self.driver.backup(self.backup, volume_file, False)
+
+        object_meta = mock_finalize.call_args[0][2]
+        object_list = object_meta['list']
+        self.assertEqual(len(range(0, len(TEST_DATA), 16)), len(object_list))
+        for index, obj in enumerate(object_list, start=1):
+            name, entry = list(obj.items())[0]
+            self.assertEqual('test--%05d' % index, name)
+            self.assertEqual((index - 1) * 16, entry['offset'])
+            self.assertEqual(stored[name],
+                             TEST_DATA[entry['offset']:
+                                       entry['offset'] + entry['length']])
+            self.assertEqual('none', entry['compression'])
+            self.assertIn('md5', entry)
+        sha256s = mock_finalize.call_args[0][3]['sha256s']
+        self.assertEqual(self.driver._calculate_sha(TEST_DATA), sha256s)
+
     def test_backup_invalid_size(self):
         self.driver.chunk_size_bytes = 999
         self.driver.sha_block_size_bytes = 1024
@@ -455,6 +571,17 @@ class ChunkedDriverTestCase(test.TestCase):
                           self.backup,
                           mock.Mock())
 
+    @mock.patch('cinder.volume.volume_utils.notify_about_backup_usage')
+    def test_send_restore_progress_notification(self, mock_notify):
+        self.driver._send_restore_progress_notification(
+            self.ctxt, self.backup, 50, 200, 2)
+
+        mock_notify.assert_called_once_with(
+            self.ctxt, self.backup, 'restoreprogress',
+            extra_usage_info={'restore_percent': 25,
+                              'restored_bytes': 50,
+                              'restore_rate': 25})
+
     def test_restore(self):
         volume_file = mock.Mock()
         restore_test = mock.Mock()
@@ -479,3 +606,221 @@ class ChunkedDriverTestCase(test.TestCase):
         mock_delete.assert_called_once_with(
             self.backup.container,
             self.backup.container + self.backup.service_metadata)
+
+
+class ChunkUploaderTestCase(test.TestCase):
+
+    def test_single_worker_runs_inline(self):
+        uploader = cbd._ChunkUploader(1)
+        func = mock.Mock()
+        uploader.submit(10, func, 'arg', kwarg='kwarg')
+        func.assert_called_once_with('arg', kwarg='kwarg')
+        self.assertEqual(0, uploader.inflight_bytes)
+        uploader.wait()
+        uploader.shutdown()
+
+    def test_inflight_chunks_bounded(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def upload(index):
+            with lock:
+                running.append(index)
+                peak.append(len(running))
+            cbd.utils.cooperative_yield()
+            with lock:
+                running.remove(index)
+
+        with cbd._ChunkUploader(4, max_chunks=2) as uploader:
+            for index in range(10):
+                uploader.submit(1, upload, index)
+                self.assertLessEqual(uploader.inflight_bytes, 2)
+            uploader.wait()
+        self.assertEqual(10, len(peak))
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual(0, uploader.inflight_bytes)
+
+    def test_inflight_bytes_bounded(self):
+        with cbd._ChunkUploader(4, max_chunks=8,
+                                max_bytes=10) as uploader:
+            for _index in range(10):
+                uploader.submit(4, cbd.utils.cooperative_yield)
+                self.assertLessEqual(uploader.inflight_bytes, 10)
+            uploader.wait()
+
+    def test_upload_error_raised(self):
+        def upload(index):
+            if index == 3:
+                raise exception.BackupOperationError()
+
+        def run():
+            with cbd._ChunkUploader(2) as uploader:
+                for index in range(10):
+                    uploader.submit(1, upload, index)
+                uploader.wait()
+
+        self.assertRaises(exception.BackupOperationError, run)
+
+    def test_release(self):
+        release = mock.Mock()
+        cbd._ChunkUploader(1).submit(1, mock.Mock(), release=release)
+        release.assert_called_once_with()
+
+        release.reset_mock()
+        with cbd._ChunkUploader(2) as uploader:
+            uploader.submit(1, mock.Mock(), release=release)
+            uploader.submit(1, mock.Mock(side_effect=ValueError),
+                            release=release)
+            self.assertRaises(ValueError, uploader.wait)
+        self.assertEqual(2, release.call_count)
+
+    def test_release_cancelled(self):
+        release = mock.Mock()
+        with cbd._ChunkUploader(2, max_chunks=8) as uploader:
+            for _index in range(8):
+                uploader.submit(1, cbd.utils.cooperative_yield,
+                                release=release)
+            uploader.abort()
+        self.assertEqual(8, release.call_count)
+
+
+class BufferPoolTestCase(test.TestCase):
+
+    def test_read_into(self):
+        volume_file = io.BytesIO(TEST_DATA)
+        buf = bytearray(100)
+        data = cbd._read_into(volume_file, buf, 100)
+        self.assertEqual(TEST_DATA[:100], data)
+        self.assertTrue(data.readonly)
+        self.assertEqual(TEST_DATA[:100], buf)
+        self.assertEqual(TEST_DATA[100:150],
+                         cbd._read_into(volume_file, buf, 50))
+        self.assertEqual(TEST_DATA[150:], cbd._read_into(volume_file, buf,
+                                                         100))
+        self.assertEqual(b'', cbd._read_into(volume_file, buf, 100))
+
+    def test_read_into_short_reads(self):
+        volume_file = mock.Mock(spec=['readinto'])
+        volume_file.readinto.side_effect = [10, 10, 0]
+        self.assertEqual(20, len(cbd._read_into(volume_file,
+                                                bytearray(100), 100)))
+        self.assertEqual(3, volume_file.readinto.call_count)
+
+    def test_read_into_not_supported(self):
+        volume_file = mock.Mock(spec=['read'])
+        volume_file.read.return_value = TEST_DATA
+        self.assertEqual(TEST_DATA,
+                         cbd._read_into(volume_file, bytearray(300), 300))
+        volume_file.read.assert_called_once_with(300)
+
+    def test_pool(self):
+        pool = cbd._BufferPool(16, 2)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertEqual(16, len(first.buffer))
+        self.assertIsNot(first.buffer, second.buffer)
+        # The pool is exhausted
+        self.assertFalse(pool._semaphore.acquire(blocking=False))
+
+        first.hold()
+        first.release()
+        self.assertEqual([], pool._free)
+        first.release()
+        self.assertEqual([first.buffer], pool._free)
+        self.assertIs(first.buffer, pool.acquire().buffer)
+
+    def test_get_buffer_pool(self):
+        self.mock_object(cbd, '_BUFFER_POOLS', {})
+        self.assertIsNone(cbd._get_buffer_pool(16))
+        self.flags(backup_buffer_pool_size=2)
+        pool = cbd._get_buffer_pool(16)
+        self.assertEqual((16, 2), (pool.buffer_size, pool.max_buffers))
+        self.assertIs(pool, cbd._get_buffer_pool(16))
+        self.assertIsNot(pool, cbd._get_buffer_pool(32))
+
+
+class ChunkReadAheadTestCase(test.TestCase):
+
+    def test_single_worker_fetches_inline(self):
+        fetched = []
+
+        def fetch(item):
+            fetched.append(item)
+            return item * 2
+
+        read_ahead = cbd._ChunkReadAhead(fetch, [(1, 1), (2, 1)], 1)
+        results = iter(read_ahead)
+        self.assertEqual((1, 2), next(results))
+        self.assertEqual([1], fetched)
+        self.assertEqual((2, 4), next(results))
+        self.assertRaises(StopIteration, next, results)
+
+    def test_results_in_order(self):
+        def fetch(item):
+            # Make later items finish first
+            for _i in range(10 - item):
+                cbd.utils.cooperative_yield()
+            return str(item)
+
+        items = [(index, 1) for index in range(10)]
+        with cbd._ChunkReadAhead(fetch, items, 4) as read_ahead:
+            results = list(read_ahead)
+        self.assertEqual([(index, str(index)) for index in range(10)],
+                         results)
+        self.assertEqual(0, read_ahead.inflight_bytes)
+
+    def test_inflight_bounded(self):
+        with cbd._ChunkReadAhead(lambda item: item,
+                                 [(index, 4) for index in range(10)],
+                                 4, max_chunks=3,
+                                 max_bytes=8) as read_ahead:
+            for _result in read_ahead:
+                self.assertLessEqual(read_ahead.inflight_bytes, 8)
+
+    def test_fetch_error_raised(self):
+        def fetch(item):
+            if item == 3:
+                raise exception.BackupOperationError()
+            return item
+
+        def run():
+            with cbd._ChunkReadAhead(fetch, [(index, 1) for index in
+                                             range(10)], 2) as read_ahead:
+                return list(read_ahead)
+
+        self.assertRaises(exception.BackupOperationError, run)
+
+
+class BlockHasherTestCase(test.TestCase):
+
+    def _expected(self, data, block_size):
+        return [hashlib.sha256(data[off:off + block_size]).hexdigest()
+                for off in range(0, len(data), block_size)]
+
+    def test_single_worker(self):
+        hasher = cbd._BlockHasher(16, 1)
+        self.assertIsNone(hasher._executor)
+        self.assertEqual(self._expected(TEST_DATA, 16),
+                         hasher.calculate(TEST_DATA))
+
+    def test_workers(self):
+        for workers in (2, 3, 4, 32):
+            with cbd._BlockHasher(16, workers) as hasher:
+                self.assertEqual(self._expected(TEST_DATA, 16),
+                                 hasher.calculate(TEST_DATA))
+                self.assertEqual([], hasher.calculate(b''))
+                self.assertEqual(self._expected(b'abc', 16),
+                                 hasher.calculate(b'abc'))
+            self.assertIsNone(hasher._executor)
+
+    def test_batches(self):
+        with cbd._BlockHasher(16, 4) as hasher:
+            with mock.patch.object(hasher, '_calculate',
+                                   side_effect=cbd._calculate_block_shas) as \
+                    mock_calculate:
+                hasher.calculate(TEST_DATA)
+        # 250 bytes are 16 blocks of 16 bytes, hashed in 4 batches of 4
+        self.assertEqual([64, 64, 64, 58],
+                         [len(call[0][0])
+                          for call in mock_calculate.call_args_list])
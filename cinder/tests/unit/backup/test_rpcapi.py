@@ -116,3 +116,22 @@ class BackupRPCAPITestCase(test.RPCAPITestCase):
                            service=service,
                            log_request='log_request',
                            version='2.1')
+
+    @mock.patch('oslo_messaging.RPCClient.can_send_version', mock.Mock())
+    def test_set_throttle_limits(self):
+        service = objects.Service(self.context, host='host1')
+        self._test_rpc_api('set_throttle_limits',
+                           rpc_method='cast',
+                           server=service.host,
+                           service=service,
+                           limits={'bps_limit': 1024},
+                           version='2.5')
+
+    @mock.patch('oslo_messaging.RPCClient.can_send_version', mock.Mock())
+    def test_get_throttle_limits(self):
+        service = objects.Service(self.context, host='host1')
+        self._test_rpc_api('get_throttle_limits',
+                           rpc_method='call',
+                           server=service.host,
+                           service=service,
+                           version='2.5')
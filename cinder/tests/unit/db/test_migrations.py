@@ -27,6 +27,7 @@ from oslo_db.sqlalchemy import test_fixtures
 from oslo_db.sqlalchemy import test_migrations
 from oslo_db.sqlalchemy import utils as db_utils
 from oslo_log.fixture import logging_error as log_fixture
+from oslo_utils import timeutils
 from oslotest import base as test_base
 import sqlalchemy
 
@@ -396,6 +397,51 @@ class MigrationsWalk(
         self.assertEqual({'backups', 'backup_gigabytes'},
                          {r[0] for r in res})
 
+    def _check_e3f1a9c27b4d(self, connection):
+        """Test capacity_claims table was added."""
+        capacity_claims = db_utils.get_table(connection, 'capacity_claims')
+        for column in ('backend', 'stats_timestamp', 'claimed_gb',
+                       'race_preventer'):
+            self.assertIn(column, capacity_claims.c)
+        self.assertFalse(capacity_claims.c.claimed_gb.nullable)
+
+    def _pre_upgrade_f4b2c8d1e6a3(self, connection):
+        """Add cache entries to start the running totals from."""
+        entries = db_utils.get_table(connection, 'image_volume_cache_entries')
+        now = timeutils.utcnow()
+        for host, volume_id, size in (('host@lvm#pool', 'vol-1', 5),
+                                      ('host@lvm#pool', 'vol-2', 7),
+                                      ('other@lvm#pool', 'vol-3', 1)):
+            connection.execute(entries.insert().values(
+                host=host, image_id='image', volume_id=volume_id,
+                size=size, last_used=now))
+
+    def _check_f4b2c8d1e6a3(self, connection):
+        """Test image_volume_cache_usage table was added and filled."""
+        usage = db_utils.get_table(connection, 'image_volume_cache_usage')
+        for column in ('host', 'cluster_name', 'size', 'count'):
+            self.assertIn(column, usage.c)
+        res = connection.execute(
+            sqlalchemy.select(usage.c.host, usage.c.size, usage.c.count)
+        ).all()
+        self.assertEqual({('host@lvm#pool', 12, 2), ('other@lvm#pool', 1, 1)},
+                         {tuple(r) for r in res})
+
+        for idx in ('image_volume_cache_entries_host_last_used_idx',
+                    'image_volume_cache_entries_cluster_name_last_used_idx'):
+            self.assertTrue(db_utils.index_exists(
+                connection, 'image_volume_cache_entries', idx))
+
+    def _check_a7c3e9f1b2d4(self, connection):
+        """Test backup dedup chunks and references tables were added."""
+        chunks = db_utils.get_table(connection, 'backup_dedup_chunks')
+        for column in ('container', 'dedup_key', 'object_name',
+                       'compression', 'refcount'):
+            self.assertIn(column, chunks.c)
+        references = db_utils.get_table(connection, 'backup_dedup_references')
+        for column in ('chunk_id', 'backup_id'):
+            self.assertIn(column, references.c)
+
     # TODO: (D Release) Uncomment method _check_afd7494d43b7 and create a
     # migration with hash afd7494d43b7 using the following command:
     #   $ tox -e venv -- alembic -c cinder/db/alembic.ini revision \
@@ -12,7 +12,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+import http.server
+import re
+import threading
+
+import fixtures
 import glanceclient.exc
+from oslo_serialization import jsonutils
 
 
 NOW_GLANCE_FORMAT = "2010-10-11T10:30:22"
@@ -158,3 +165,81 @@ class FakeSchema(object):
             return True
         else:
             return False
+
+
+class RangedImageServer(fixtures.Fixture):
+    """A local HTTP stand-in for glance serving the data of an image.
+
+    :param honour_ranges: whether Range requests get partial content
+    :param broken_responses: number of responses closed halfway through
+    """
+
+    def __init__(self, image_id, data, honour_ranges=True,
+                 broken_responses=0):
+        super(RangedImageServer, self).__init__()
+        self.image_id = image_id
+        self.data = data
+        self.honour_ranges = honour_ranges
+        self.broken_responses = broken_responses
+        self.ranges = []
+        self.image = {'id': image_id,
+                      'size': len(data),
+                      'os_hash_algo': 'sha512',
+                      'os_hash_value': hashlib.sha512(data).hexdigest()}
+
+    def _setUp(self):
+        server = self
+        # Don't send the requests through a proxy of the environment
+        for name in ('no_proxy', 'NO_PROXY'):
+            self.useFixture(fixtures.EnvironmentVariable(name, '127.0.0.1'))
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if server.broken_responses and status == 206:
+                    server.broken_responses -= 1
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = '/v2/images/%s' % server.image_id
+                if self.path == path:
+                    self._send(200, jsonutils.dump_as_bytes(server.image),
+                               'application/json')
+                elif self.path == path + '/file':
+                    self._send_data()
+                else:
+                    self._send(404, b'', 'text/plain')
+
+            def _send_data(self):
+                data = server.data
+                match = re.match(r'bytes=(\d+)-(\d+)$',
+                                 self.headers.get('Range', ''))
+                if not match or not server.honour_ranges:
+                    self._send(200, data, 'application/octet-stream')
+                    return
+                start, end = int(match.group(1)), int(match.group(2))
+                server.ranges.append((start, end))
+                content_range = 'bytes %d-%d/%d' % (start, end, len(data))
+                self._send(206, data[start:end + 1],
+                           'application/octet-stream',
+                           {'Content-Range': content_range})
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.endpoint = 'http://127.0.0.1:%d' % self.server.server_port
@@ -20,11 +20,14 @@ from oslo_utils import timeutils
 
 from cinder import context as ctxt
 from cinder.db import models
+from cinder import exception
 from cinder.image import cache as image_cache
 from cinder import objects
 from cinder.tests.unit import fake_constants as fake
 from cinder.tests.unit import test
 
+OTHER_IMAGE_ID = '3d2a7c6b-1f4e-4b8a-9c5d-6e7f8a9b0c1d'
+
 
 @ddt.ddt
 class ImageVolumeCacheTestCase(test.TestCase):
@@ -50,14 +53,15 @@ class ImageVolumeCacheTestCase(test.TestCase):
         cache.notifier = self.notifier
         return cache
 
-    def _build_entry(self, size=10):
+    def _build_entry(self, size=10,
+                     volume_id='70a599e0-31e7-49b7-b260-868f441e862b'):
         entry = {
             'id': 1,
             'host': 'test@foo#bar',
             'cluster_name': 'cluster@foo#bar',
             'image_id': 'c7a8b8d4-e519-46c7-a0df-ddf1b9b9fff2',
             'image_updated_at': timeutils.utcnow(with_timezone=True),
-            'volume_id': '70a599e0-31e7-49b7-b260-868f441e862b',
+            'volume_id': volume_id,
             'size': size,
             'last_used': timeutils.utcnow(with_timezone=True)
         }
@@ -225,9 +229,18 @@ class ImageVolumeCacheTestCase(test.TestCase):
         has_space = cache.ensure_space(self.context, self.volume)
         self.assertTrue(has_space)
 
+    def _build_lru_entries(self, *sizes):
+        """Build cache entries from the least to the most recently used."""
+        entries = [self._build_entry(size=size, volume_id='vol-%d' % i)
+                   for i, size in enumerate(sizes)]
+        self.mock_db.image_volume_cache_get_usage.return_value = [
+            ('cluster@foo#bar', sum(sizes), len(sizes))]
+        self.mock_db.image_volume_cache_get_lru.return_value = entries
+        return entries
+
     def test_ensure_space_no_entries(self):
         cache = self._build_cache(max_gb=100, max_count=10)
-        self.mock_db.image_volume_cache_get_all.return_value = []
+        self.mock_db.image_volume_cache_get_usage.return_value = []
 
         self.volume_ovo.size = 5
         has_space = cache.ensure_space(self.context, self.volume_ovo)
@@ -237,18 +250,24 @@ class ImageVolumeCacheTestCase(test.TestCase):
         has_space = cache.ensure_space(self.context, self.volume_ovo)
         self.assertFalse(has_space)
 
+    def test_ensure_space_enough_space(self):
+        cache = self._build_cache(max_gb=30, max_count=3)
+        mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
+        self._build_lru_entries(10, 5)
+
+        self.volume_ovo.size = 15
+        has_space = cache.ensure_space(self.context, self.volume_ovo)
+        self.assertTrue(has_space)
+        # Cache misses don't read the entries when there is enough space
+        self.mock_db.image_volume_cache_get_lru.assert_not_called()
+        mock_delete.assert_not_called()
+        self.mock_db.image_volume_cache_get_usage.assert_called_once_with(
+            self.context, cluster_name=self.volume_ovo.cluster_name)
+
     def test_ensure_space_need_gb(self):
         cache = self._build_cache(max_gb=30, max_count=0)
         mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
-
-        entries = []
-        entry1 = self._build_entry(size=12)
-        entries.append(entry1)
-        entry2 = self._build_entry(size=5)
-        entries.append(entry2)
-        entry3 = self._build_entry(size=10)
-        entries.append(entry3)
-        self.mock_db.image_volume_cache_get_all.return_value = entries
+        entry3, entry2, entry1 = self._build_lru_entries(10, 5, 12)
 
         self.volume_ovo.size = 15
         has_space = cache.ensure_space(self.context, self.volume_ovo)
@@ -256,19 +275,14 @@ class ImageVolumeCacheTestCase(test.TestCase):
         self.assertEqual(2, mock_delete.call_count)
         mock_delete.assert_any_call(self.context, entry2, mock.ANY)
         mock_delete.assert_any_call(self.context, entry3, mock.ANY)
-        self.mock_db.image_volume_cache_get_all.assert_called_with(
-            self.context, cluster_name=self.volume_ovo.cluster_name)
+        self.mock_db.image_volume_cache_get_lru.assert_called_with(
+            self.context, cache.EVICTION_BATCH_SIZE,
+            cluster_name=self.volume_ovo.cluster_name)
 
     def test_ensure_space_need_count(self):
         cache = self._build_cache(max_gb=0, max_count=2)
         mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
-
-        entries = []
-        entry1 = self._build_entry(size=10)
-        entries.append(entry1)
-        entry2 = self._build_entry(size=5)
-        entries.append(entry2)
-        self.mock_db.image_volume_cache_get_all.return_value = entries
+        entry2, entry1 = self._build_lru_entries(5, 10)
 
         self.volume_ovo.size = 12
         has_space = cache.ensure_space(self.context, self.volume_ovo)
@@ -279,15 +293,7 @@ class ImageVolumeCacheTestCase(test.TestCase):
     def test_ensure_space_need_gb_and_count(self):
         cache = self._build_cache(max_gb=30, max_count=3)
         mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
-
-        entries = []
-        entry1 = self._build_entry(size=10)
-        entries.append(entry1)
-        entry2 = self._build_entry(size=5)
-        entries.append(entry2)
-        entry3 = self._build_entry(size=12)
-        entries.append(entry3)
-        self.mock_db.image_volume_cache_get_all.return_value = entries
+        entry3, entry2, entry1 = self._build_lru_entries(12, 5, 10)
 
         self.volume_ovo.size = 16
         has_space = cache.ensure_space(self.context, self.volume_ovo)
@@ -296,14 +302,217 @@ class ImageVolumeCacheTestCase(test.TestCase):
         mock_delete.assert_any_call(self.context, entry2, mock.ANY)
         mock_delete.assert_any_call(self.context, entry3, mock.ANY)
 
+    def test_ensure_space_in_batches(self):
+        cache = self._build_cache(max_gb=0, max_count=2)
+        cache.EVICTION_BATCH_SIZE = 2
+        mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
+        entries = self._build_lru_entries(*([1] * 5))
+        # The deleted entries stay in the cache until deleted by the API
+        self.mock_db.image_volume_cache_get_lru.side_effect = (
+            lambda context, limit, **filters: entries[:limit])
+
+        has_space = cache.ensure_space(self.context, self.volume_ovo)
+        self.assertTrue(has_space)
+        self.assertEqual(entries[:4],
+                         [c[0][1] for c in mock_delete.call_args_list])
+        self.assertEqual(
+            [2, 4], [c[0][1] for c in
+                     self.mock_db.image_volume_cache_get_lru.call_args_list])
+
     def test_ensure_space_cant_free_enough_gb(self):
         cache = self._build_cache(max_gb=30, max_count=10)
         mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
-
-        entries = list(self._build_entry(size=25))
-        self.mock_db.image_volume_cache_get_all.return_value = entries
+        self._build_lru_entries(25)
 
         self.volume_ovo.size = 50
         has_space = cache.ensure_space(self.context, self.volume_ovo)
         self.assertFalse(has_space)
         mock_delete.assert_not_called()
+
+    def test_ensure_space_cant_evict_enough_gb(self):
+        cache = self._build_cache(max_gb=30, max_count=10)
+        mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
+        self._build_lru_entries(10)
+        # Another service evicted the entries in the meantime
+        self.mock_db.image_volume_cache_get_usage.return_value = [
+            ('cluster@foo#bar', 50, 3)]
+
+        self.volume_ovo.size = 25
+        has_space = cache.ensure_space(self.context, self.volume_ovo)
+        self.assertFalse(has_space)
+        # Entries aren't evicted when that doesn't make enough room
+        mock_delete.assert_not_called()
+
+    def test_ensure_space_eviction_failed(self):
+        cache = self._build_cache(max_gb=30, max_count=0)
+        mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
+        mock_delete.side_effect = [exception.InvalidVolume(reason='in-use'),
+                                   None]
+        entry3, entry2, entry1 = self._build_lru_entries(10, 5, 12)
+
+        self.volume_ovo.size = 15
+        has_space = cache.ensure_space(self.context, self.volume_ovo)
+        self.assertFalse(has_space)
+        # The other entries are still evicted
+        self.assertEqual([entry3, entry2],
+                         [c[0][1] for c in mock_delete.call_args_list])
+
+    @mock.patch('cinder.objects.Volume.get_by_id')
+    def test_delete_cached_volume(self, mock_get):
+        cache = self._build_cache()
+        entry = self._build_entry()
+
+        cache.delete_cached_volume(self.context, entry, 'msg')
+
+        mock_get.assert_called_once_with(self.context, entry['volume_id'])
+        self.mock_volume_api.delete.assert_called_once_with(
+            self.context, mock_get.return_value)
+
+    @mock.patch('cinder.objects.Volume.get_by_id')
+    def test_delete_cached_volume_already_deleting(self, mock_get):
+        cache = self._build_cache()
+        volume = mock_get.return_value
+        volume.status = 'deleting'
+        self.mock_volume_api.delete.side_effect = exception.InvalidVolume(
+            reason='deleting')
+
+        # Another service is evicting the same entry
+        cache.delete_cached_volume(self.context, self._build_entry(), 'msg')
+        volume.refresh.assert_called_once_with()
+
+    @mock.patch('cinder.objects.Volume.get_by_id')
+    def test_delete_cached_volume_invalid(self, mock_get):
+        cache = self._build_cache()
+        mock_get.return_value.status = 'in-use'
+        self.mock_volume_api.delete.side_effect = exception.InvalidVolume(
+            reason='in-use')
+
+        self.assertRaises(exception.InvalidVolume,
+                          cache.delete_cached_volume, self.context,
+                          self._build_entry(), 'msg')
+
+    @mock.patch('cinder.objects.Volume.get_by_id',
+                side_effect=exception.VolumeNotFound(volume_id='vol'))
+    def test_delete_cached_volume_already_deleted(self, mock_get):
+        cache = self._build_cache()
+
+        cache.delete_cached_volume(self.context, self._build_entry(), 'msg')
+        self.mock_volume_api.delete.assert_not_called()
+
+    def _build_popularity_cache(self):
+        cache = self._build_cache(max_gb=0, max_count=2)
+        cache.admission_policy = image_cache.ADMISSION_POPULARITY
+        mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
+        entry = self._build_lru_entries(5, 5)[0]
+        entry['image_id'] = fake.IMAGE_ID
+        for _i in range(3):
+            cache.popularity.record(fake.IMAGE_ID)
+        return cache, mock_delete, entry
+
+    def test_ensure_space_popularity_rejected(self):
+        cache, mock_delete, _entry = self._build_popularity_cache()
+        cache.popularity.record(OTHER_IMAGE_ID)
+
+        has_space = cache.ensure_space(self.context, self.volume_ovo,
+                                       OTHER_IMAGE_ID)
+        self.assertFalse(has_space)
+        mock_delete.assert_not_called()
+
+    def test_ensure_space_popularity_admitted(self):
+        cache, mock_delete, entry = self._build_popularity_cache()
+        for _i in range(4):
+            cache.popularity.record(OTHER_IMAGE_ID)
+
+        has_space = cache.ensure_space(self.context, self.volume_ovo,
+                                       OTHER_IMAGE_ID)
+        self.assertTrue(has_space)
+        mock_delete.assert_called_once_with(self.context, entry, mock.ANY)
+
+    def test_ensure_space_popularity_prewarmed(self):
+        cache, mock_delete, entry = self._build_popularity_cache()
+        cache.prewarm_images.add(OTHER_IMAGE_ID)
+
+        has_space = cache.ensure_space(self.context, self.volume_ovo,
+                                       OTHER_IMAGE_ID)
+        self.assertTrue(has_space)
+        mock_delete.assert_called_once_with(self.context, entry, mock.ANY)
+
+    def test_ensure_space_always_admitted(self):
+        cache, mock_delete, entry = self._build_popularity_cache()
+        cache.admission_policy = image_cache.ADMISSION_ALWAYS
+
+        has_space = cache.ensure_space(self.context, self.volume_ovo,
+                                       OTHER_IMAGE_ID)
+        self.assertTrue(has_space)
+        mock_delete.assert_called_once_with(self.context, entry, mock.ANY)
+
+    def test_find_entry(self):
+        cache = self._build_cache()
+        image_meta = {'updated_at': timeutils.utcnow(with_timezone=True)}
+        outdated = self._build_entry()
+        outdated['image_updated_at'] = image_meta['updated_at'] - timedelta(
+            hours=1)
+        entry = self._build_entry()
+        entry['image_updated_at'] = image_meta['updated_at']
+        self.mock_db.image_volume_cache_get_all.return_value = [outdated,
+                                                                entry]
+
+        self.assertEqual(entry, cache.find_entry(self.context,
+                                                 self.volume_ovo,
+                                                 fake.IMAGE_ID, image_meta))
+        self.mock_db.image_volume_cache_get_all.assert_called_once_with(
+            self.context, image_id=fake.IMAGE_ID,
+            cluster_name=self.volume_ovo.cluster_name)
+        # Looking entries up doesn't use them
+        self.mock_db.image_volume_cache_entry_update.assert_not_called()
+        self.assertEqual(0, cache.popularity.get(fake.IMAGE_ID))
+
+    def test_evict_over_watermark(self):
+        cache = self._build_cache(max_gb=100, max_count=10)
+        cache.high_watermark = 90
+        cache.low_watermark = 50
+        mock_delete = mock.patch.object(cache, 'delete_cached_volume').start()
+        entries = [self._build_entry(size=20, volume_id='vol-%d' % i)
+                   for i in range(5)]
+        self.mock_db.image_volume_cache_get_usage.return_value = [
+            ('host@foo#over', 95, 5), ('host@foo#under', 90, 9)]
+        self.mock_db.image_volume_cache_get_lru.return_value = entries
+
+        cache.evict_over_watermark(self.context, host='host@foo')
+
+        self.mock_db.image_volume_cache_get_usage.assert_called_once_with(
+            self.context, host='host@foo')
+        self.mock_db.image_volume_cache_get_lru.assert_called_once_with(
+            self.context, cache.EVICTION_BATCH_SIZE, host='host@foo#over')
+        # Evicted down to 50 GB
+        self.assertEqual(entries[:3],
+                         [c[0][1] for c in mock_delete.call_args_list])
+
+
+class ImagePopularityTestCase(test.TestCase):
+
+    @mock.patch('time.monotonic')
+    def test_record_decays(self, mock_time):
+        popularity = image_cache.ImagePopularity(half_life=10)
+        mock_time.return_value = 0
+        popularity.record(fake.IMAGE_ID)
+        popularity.record(fake.IMAGE_ID)
+        self.assertEqual(2, popularity.get(fake.IMAGE_ID))
+
+        mock_time.return_value = 10
+        self.assertEqual(1, popularity.get(fake.IMAGE_ID))
+        popularity.record(fake.IMAGE_ID)
+        self.assertEqual(2, popularity.get(fake.IMAGE_ID))
+        self.assertEqual(0, popularity.get(OTHER_IMAGE_ID))
+
+    def test_record_forgets_least_popular(self):
+        popularity = image_cache.ImagePopularity(max_images=3)
+        for image_id, count in (('a', 3), ('b', 1), ('c', 2), ('d', 4)):
+            for _i in range(count):
+                popularity.record(image_id)
+
+        # The image just requested is never forgotten
+        self.assertEqual(0, popularity.get('b'))
+        self.assertAlmostEqual(2, popularity.get('c'), places=3)
+        self.assertAlmostEqual(3, popularity.get('a'), places=3)
+        self.assertAlmostEqual(4, popularity.get('d'), places=3)
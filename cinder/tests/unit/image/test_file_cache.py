@@ -0,0 +1,140 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the node-local image file cache."""
+
+import os
+from unittest import mock
+
+import ddt
+import fixtures
+
+from cinder.image import file_cache
+from cinder.tests.unit import test
+
+
+@ddt.ddt
+class ImageFileCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageFileCacheTestCase, self).setUp()
+        self.tmp_dir = self.useFixture(fixtures.TempDir()).path
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.cache = file_cache.ImageFileCache(self.cache_dir, 1)
+
+    def _make_file(self, name, size=4096):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_get_default(self):
+        self.assertIsNone(file_cache.ImageFileCache.get_default())
+
+        self.flags(image_file_cache_dir=self.cache_dir,
+                   image_file_cache_size_gb=5)
+        cache = file_cache.ImageFileCache.get_default()
+        self.assertEqual(self.cache_dir, cache.cache_dir)
+        self.assertEqual(5 * 1024 ** 3, cache.max_size)
+
+    @ddt.data(({'os_hash_value': 'sha', 'checksum': 'md5'}, None,
+               'image.sha.raw'),
+              ({'checksum': 'md5'}, None, 'image.md5.raw'),
+              ({'checksum': 'md5'}, 'fixed', 'image.md5.raw-fixed'),
+              ({}, None, None))
+    @ddt.unpack
+    def test_get_key(self, image_meta, subformat, expected):
+        self.assertEqual(expected,
+                         file_cache.ImageFileCache.get_key(
+                             'image', image_meta, 'raw', subformat))
+
+    def test_add(self):
+        source = self._make_file('image')
+
+        path = self.cache.add('image.sha.raw', source)
+
+        self.assertEqual(os.path.join(self.cache_dir, 'image.sha.raw'), path)
+        # The source is left in place, and linked into the cache
+        self.assertTrue(os.path.exists(source))
+        self.assertTrue(os.path.samefile(source, path))
+        self.assertEqual(['image.sha.raw'], os.listdir(self.cache_dir))
+        self.assertEqual(path,
+                         self.cache.find('image', {'os_hash_value': 'sha'}))
+        self.assertIsNone(self.cache.find('image', {'os_hash_value': 'new'}))
+
+    def test_pin(self):
+        with self.cache.pin('image.sha.raw') as path:
+            self.assertIsNone(path)
+
+        self.cache.add('image.sha.raw', self._make_file('image'))
+        entry = os.path.join(self.cache_dir, 'image.sha.raw')
+        os.utime(entry, (0, 0))
+        with self.cache.pin('image.sha.raw') as path:
+            self.assertTrue(os.path.samefile(entry, path))
+            # Using an entry makes it the most recently used one
+            self.assertNotEqual(0, os.stat(entry).st_mtime)
+
+            # Another service evicts the entry while it is being read
+            self.cache.max_size = 0
+            self.cache.evict()
+            self.assertFalse(os.path.exists(entry))
+            with open(path, 'rb') as f:
+                self.assertEqual(b'x' * 4096, f.read())
+
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    @mock.patch('cinder.image.file_cache.clone_file', return_value=False)
+    @mock.patch('os.link', side_effect=PermissionError(1, 'EPERM'))
+    def test_add_copied(self, mock_link, mock_clone):
+        source = self._make_file('image')
+
+        path = self.cache.add('image.sha.raw', source)
+
+        mock_clone.assert_called_once()
+        self.assertFalse(os.path.samefile(source, path))
+        with open(path, 'rb') as f:
+            self.assertEqual(b'x' * 4096, f.read())
+
+    def test_add_moved(self):
+        with self.cache.staging_path() as staged:
+            with open(staged, 'wb') as f:
+                f.write(b'x')
+            path = self.cache.add('image.sha.raw', staged, move=True)
+
+        self.assertFalse(os.path.exists(staged))
+        self.assertEqual(['image.sha.raw'], os.listdir(self.cache_dir))
+        self.assertEqual(os.path.join(self.cache_dir, 'image.sha.raw'), path)
+
+    def test_evict(self):
+        self.cache.max_size = 3 * 4096
+        for i in range(3):
+            self.cache.add('image%d.sha.raw' % i,
+                           self._make_file('image%d' % i))
+            path = os.path.join(self.cache_dir, 'image%d.sha.raw' % i)
+            os.utime(path, (i, i))
+        # Using an entry makes it the most recently used one
+        with self.cache.pin('image0.sha.raw'):
+            pass
+
+        self.cache.add('image3.sha.raw', self._make_file('image3'))
+
+        self.assertEqual(['image0.sha.raw', 'image2.sha.raw',
+                          'image3.sha.raw'],
+                         sorted(os.listdir(self.cache_dir)))
+
+    def test_evict_keep(self):
+        self.cache.max_size = 4096
+        self.cache.add('image0.sha.raw', self._make_file('image0'))
+
+        # Entries larger than the cache are still used once
+        self.cache.add('image1.sha.raw', self._make_file('image1', 8192))
+
+        self.assertEqual(['image1.sha.raw'], os.listdir(self.cache_dir))
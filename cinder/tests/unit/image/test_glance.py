@@ -15,11 +15,15 @@
 
 
 import datetime
+import hashlib
 import itertools
+import os
 import traceback
 from unittest import mock
 
 import ddt
+import fixtures
+import glanceclient
 import glanceclient.exc
 from keystoneauth1 import loading as ksloading
 from keystoneauth1.loading import session as ks_session
@@ -1341,6 +1345,89 @@ def _create_failing_glance_client(info):
     return MyGlanceStubClient()
 
 
+@ddt.ddt
+class TestGlanceRangedDownload(test.TestCase):
+
+    def setUp(self):
+        super(TestGlanceRangedDownload, self).setUp()
+        self.context = context.RequestContext('fake', 'fake', auth_token=True)
+        self.mock_object(glance.time, 'sleep', return_value=None)
+        self.mock_object(glance, 'MIN_RANGE_SIZE', 1024)
+        self.mock_object(glance, 'RANGE_WRITE_SIZE', 512)
+        self.flags(glance_download_ranges=4)
+        self.image_id = 'fake-image-uuid'
+        self.data = os.urandom(10000)
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'image')
+
+    def _server(self, data=None, **kwargs):
+        return self.useFixture(glance_stubs.RangedImageServer(
+            self.image_id, self.data if data is None else data, **kwargs))
+
+    def _download(self, server, use_session=False):
+        if use_session:
+            client = glanceclient.Client('2', server.endpoint,
+                                         session=session.Session())
+        else:
+            client = glanceclient.Client('2', server.endpoint, token='fake')
+        self.mock_object(glance, '_create_glance_client',
+                         return_value=client)
+        service = glance.GlanceImageService(
+            client=glance.GlanceClientWrapper(self.context, 'fake_host'))
+        with open(self.path, 'wb') as image_file:
+            service.download(self.context, self.image_id, image_file)
+        with open(self.path, 'rb') as image_file:
+            return image_file.read()
+
+    @ddt.data(False, True)
+    def test_download_ranges(self, use_session):
+        server = self._server()
+
+        self.assertEqual(self.data, self._download(server, use_session))
+        self.assertEqual([(0, 2499), (2500, 4999), (5000, 7499),
+                          (7500, 9999)], sorted(server.ranges))
+
+    def test_download_ranges_resumed(self):
+        server = self._server(broken_responses=2)
+
+        self.assertEqual(self.data, self._download(server))
+        # The ranges were resumed from the last block written
+        self.assertEqual(6, len(server.ranges))
+
+    def test_download_ranges_failed(self):
+        self.flags(glance_download_range_retries=1)
+        server = self._server(broken_responses=100)
+
+        self.assertRaises(exception.ImageDownloadFailed, self._download,
+                          server)
+
+    def test_download_ranges_checksum_mismatch(self):
+        server = self._server()
+        server.image['os_hash_value'] = hashlib.sha512(b'other').hexdigest()
+
+        self.assertRaises(exception.ImageDownloadFailed, self._download,
+                          server)
+
+    def test_download_ranges_not_honoured(self):
+        server = self._server(honour_ranges=False)
+
+        self.assertEqual(self.data, self._download(server))
+        self.assertEqual([], server.ranges)
+
+    def test_download_ranges_small_image(self):
+        server = self._server(data=self.data[:1000])
+
+        self.assertEqual(self.data[:1000], self._download(server))
+        self.assertEqual([], server.ranges)
+
+    def test_download_ranges_disabled(self):
+        self.flags(glance_download_ranges=1)
+        server = self._server()
+
+        self.assertEqual(self.data, self._download(server))
+        self.assertEqual([], server.ranges)
+
+
 class TestGlanceImageServiceClient(test.TestCase):
 
     def setUp(self):
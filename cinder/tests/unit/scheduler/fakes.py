@@ -253,6 +253,12 @@ class FakeHostManager(host_manager.HostManager):
         self.weight_classes = helpers.ALL_WEIGHER_CLASSES[:]
 
         self._no_capabilities_backends = set()  # Services without capabilities
+        self.backend_state_map_version = 0
+        self._backend_state_map_refreshed = None
+        self._pool_states = None
+        self._pool_positions = {}
+        self._init_pool_indexes()
+        self._reported_capabilities = {}
         self._update_backend_state_map(cinder_context.get_admin_context())
         self.service_states_last_update = {}
 
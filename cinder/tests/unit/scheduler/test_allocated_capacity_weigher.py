@@ -30,6 +30,8 @@ from cinder.volume import volume_utils
 class AllocatedCapacityWeigherTestCase(test.TestCase):
     def setUp(self):
         super(AllocatedCapacityWeigherTestCase, self).setUp()
+        # The services change between requests
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
         self.host_manager = fakes.FakeHostManager()
         self.weight_handler = weights.OrderedHostWeightHandler(
             'cinder.scheduler.weights')
@@ -16,6 +16,7 @@
 from unittest import mock
 
 from cinder.scheduler import base_filter
+from cinder.scheduler import trace as sched_trace
 from cinder.tests.unit import test
 
 
@@ -172,3 +173,30 @@ class TestBaseFilterHandler(test.TestCase):
             result = self._get_filtered_objects(filter_classes, index=2)
             self.assertEqual(filter_objs_expected, result)
             self.assertEqual(1, fake5_filter_all.call_count)
+
+    def test_get_filtered_objects_trace(self):
+        trace = sched_trace.SchedulerTrace()
+        result = self.handler.get_filtered_objects([FilterA, FilterA],
+                                                   [1, 2, 3, 4], {},
+                                                   trace=trace)
+
+        self.assertEqual([3, 4], result)
+        self.assertEqual(4, trace.candidates)
+        self.assertEqual(
+            [('FilterA', 4, 3, ['1']), ('FilterA', 3, 2, ['2'])],
+            [(f['name'], f['start'], f['end'], f['rejected'])
+             for f in trace.filters])
+        for filter_trace in trace.filters:
+            self.assertGreaterEqual(filter_trace['elapsed'], 0)
+
+    def test_get_filtered_objects_trace_return_none(self):
+        trace = sched_trace.SchedulerTrace()
+        result = self.handler.get_filtered_objects([FilterA, FilterB],
+                                                   [1, 2, 3], {},
+                                                   trace=trace)
+
+        self.assertIsNone(result)
+        self.assertEqual(
+            [('FilterA', 3, 2, ['1']), ('FilterB', 2, 0, ['2', '3'])],
+            [(f['name'], f['start'], f['end'], f['rejected'])
+             for f in trace.filters])
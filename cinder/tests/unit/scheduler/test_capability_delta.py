@@ -0,0 +1,118 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for capability deltas."""
+
+import copy
+
+import ddt
+
+from cinder.scheduler import capability_delta
+from cinder.tests.unit import test
+
+
+def _capabilities(**pools):
+    return {'volume_backend_name': 'lvm',
+            'driver_version': '1.0',
+            'pools': [dict(pool_name=name, **pool)
+                      for name, pool in pools.items()]}
+
+
+@ddt.ddt
+class CapabilityDeltaTestCase(test.TestCase):
+
+    @ddt.data(
+        # Nothing changed
+        (_capabilities(pool1={'free_capacity_gb': 10}),
+         _capabilities(pool1={'free_capacity_gb': 10})),
+        # Pool stats changed, added and removed
+        (_capabilities(pool1={'free_capacity_gb': 10, 'old': 1},
+                       pool2={'free_capacity_gb': 20}),
+         _capabilities(pool1={'free_capacity_gb': 5},
+                       pool3={'free_capacity_gb': 30})),
+        # Pools reordered
+        (_capabilities(pool1={}, pool2={}),
+         _capabilities(pool2={}, pool1={})),
+        # Backend level capabilities changed and removed
+        (dict(_capabilities(), timestamp=1, removed=True),
+         dict(_capabilities(), timestamp=2)),
+        # Legacy backends without pools
+        ({'free_capacity_gb': 10}, {'free_capacity_gb': 5}),
+        ({'free_capacity_gb': 10}, _capabilities(pool1={})),
+        (_capabilities(pool1={}), {'free_capacity_gb': 5}),
+    )
+    @ddt.unpack
+    def test_apply_delta(self, old, new):
+        old_copy = copy.deepcopy(old)
+        delta = capability_delta.make_delta(old, new)
+
+        self.assertEqual(new, capability_delta.apply_delta(old, delta))
+        self.assertEqual(old_copy, old)
+
+    def test_make_delta_only_changes(self):
+        old = _capabilities(pool1={'free_capacity_gb': 10},
+                            pool2={'free_capacity_gb': 20})
+        new = _capabilities(pool1={'free_capacity_gb': 10},
+                            pool2={'free_capacity_gb': 15})
+
+        delta = capability_delta.make_delta(old, new)
+        self.assertEqual({'changed': {},
+                          'removed': [],
+                          'pool_names': ['pool1', 'pool2'],
+                          'pools': {'pool2': {
+                              'changed': {'free_capacity_gb': 15},
+                              'removed': []}}},
+                         delta)
+
+    def test_apply_delta_duplicated_pool_names(self):
+        old = {'pools': [{'pool_name': 'pool1', 'free_capacity_gb': 1},
+                         {'pool_name': 'pool1', 'free_capacity_gb': 2}]}
+        new = {'pools': [{'pool_name': 'pool1', 'free_capacity_gb': 3},
+                         {'pool_name': 'pool1', 'free_capacity_gb': 2}]}
+
+        delta = capability_delta.make_delta(old, new)
+        self.assertNotIn('pool_names', delta)
+        self.assertEqual(new, capability_delta.apply_delta(old, delta))
+
+    def test_copy_capabilities(self):
+        capabilities = _capabilities(pool1={'free_capacity_gb': 10})
+        result = capability_delta.copy_capabilities(capabilities)
+
+        result['pools'][0]['free_capacity_gb'] = 5
+        self.assertEqual(10, capabilities['pools'][0]['free_capacity_gb'])
+
+    def test_reporter(self):
+        reporter = capability_delta.CapabilitiesReporter(2)
+        capabilities = _capabilities(pool1={'free_capacity_gb': 10})
+
+        reports = []
+        for free in range(5):
+            capabilities['pools'][0]['free_capacity_gb'] = free
+            reports.append(reporter.report(capabilities))
+        reports.append(reporter.report(capabilities, full=True))
+
+        self.assertEqual([1, 2, 3, 4, 5, 6],
+                         [version['version'] for version, _d in reports])
+        self.assertEqual({reporter.generation},
+                         {version['generation'] for version, _d in reports})
+        # All capabilities are sent first and after every 2 deltas, or when
+        # requested.
+        self.assertEqual([True, False, False, True, False, True],
+                         [delta is None for _v, delta in reports])
+        self.assertEqual({'free_capacity_gb': 1},
+                         reports[1][1]['pools']['pool1']['changed'])
+
+    def test_reporter_no_deltas(self):
+        reporter = capability_delta.CapabilitiesReporter(0)
+        capabilities = _capabilities(pool1={'free_capacity_gb': 10})
+
+        for _i in range(3):
+            self.assertIsNone(reporter.report(capabilities)[1])
@@ -30,6 +30,8 @@ from cinder.volume import volume_utils
 class CapacityWeigherTestCase(test.TestCase):
     def setUp(self):
         super(CapacityWeigherTestCase, self).setUp()
+        # The services change between requests
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
         self.host_manager = fakes.FakeHostManager()
         self.weight_handler = weights.OrderedHostWeightHandler(
             'cinder.scheduler.weights')
@@ -416,3 +418,14 @@ class CapacityWeigherTestCase(test.TestCase):
         self.assertEqual(-1.0, worst_host.weight)
         self.assertEqual('host5',
                          volume_utils.extract_host(worst_host.obj.host))
+
+    def test_capacity_weight_all_unknown(self):
+        self.flags(capacity_weight_multiplier=-1.0)
+        backends = [fakes.FakeBackendState(host, {
+            'total_capacity_gb': 'unknown', 'free_capacity_gb': 'unknown'})
+            for host in ('host1', 'host2')]
+
+        weighed_hosts = self._get_weighed_hosts(backends)
+        self.assertEqual([0.0, 0.0], [w.weight for w in weighed_hosts])
+        self.assertEqual(['host1', 'host2'],
+                         [w.obj.host for w in weighed_hosts])
@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the capacity claims shared by the schedulers."""
+
+import datetime
+from unittest import mock
+
+from cinder import context
+from cinder.db import api as db
+from cinder.scheduler import claims
+from cinder.scheduler import host_manager
+from cinder.tests.unit import test
+
+
+class CapacityClaimsTestCase(test.TestCase):
+
+    def setUp(self):
+        super(CapacityClaimsTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.timestamp = datetime.datetime(2020, 1, 1)
+        self.pool = self._pool_state(self.timestamp)
+
+    def _pool_state(self, timestamp, free=100):
+        pool = host_manager.PoolState('host@lvm', None, None, 'pool')
+        pool.update_from_volume_capability({
+            'total_capacity_gb': 100,
+            'free_capacity_gb': free,
+            'provisioned_capacity_gb': 100 - free,
+            'reserved_percentage': 0,
+            'thin_provisioning_support': False,
+            'thick_provisioning_support': True,
+            'max_over_subscription_ratio': 1.0,
+            'timestamp': timestamp})
+        return pool
+
+    @staticmethod
+    def _request_spec(size):
+        return {'volume_properties': {'size': size},
+                'volume_type': {'extra_specs': {}}}
+
+    def test_claim_capacity(self):
+        self.assertTrue(claims.claim_capacity(self.context, self.pool,
+                                              self._request_spec(60)))
+        self.assertTrue(claims.claim_capacity(self.context, self.pool,
+                                              self._request_spec(40)))
+        # The pool is full, even if this scheduler didn't consume from it
+        self.assertFalse(claims.claim_capacity(self.context, self.pool,
+                                               self._request_spec(1)))
+
+        claim = db.capacity_claim_get(self.context, 'host@lvm#pool')
+        self.assertEqual(100, claim.claimed_gb)
+        self.assertEqual(self.timestamp, claim.stats_timestamp)
+
+    def test_claim_capacity_newer_stats(self):
+        self.assertTrue(claims.claim_capacity(self.context, self.pool,
+                                              self._request_spec(60)))
+
+        # Stats collected after the claim include the claimed volume
+        pool = self._pool_state(datetime.datetime.utcnow() +
+                                datetime.timedelta(seconds=1), free=40)
+        self.assertTrue(claims.claim_capacity(self.context, pool,
+                                              self._request_spec(40)))
+        claim = db.capacity_claim_get(self.context, 'host@lvm#pool')
+        self.assertEqual(40, claim.claimed_gb)
+        self.assertEqual(pool.stats_updated, claim.stats_timestamp)
+
+    def test_claim_capacity_stale_stats(self):
+        newer = self._pool_state(datetime.datetime.utcnow() +
+                                 datetime.timedelta(seconds=1))
+        self.assertTrue(claims.claim_capacity(self.context, newer,
+                                              self._request_spec(60)))
+
+        # Claims on top of newer stats are kept for other schedulers
+        self.assertFalse(claims.claim_capacity(self.context, self.pool,
+                                               self._request_spec(60)))
+
+    def test_claim_capacity_infinite(self):
+        self.pool.free_capacity_gb = 'infinite'
+        self.pool.reported_virtual_free_capacity = {True: None, False: None}
+
+        self.assertTrue(claims.claim_capacity(self.context, self.pool,
+                                              self._request_spec(1000)))
+        self.assertIsNone(db.capacity_claim_get(self.context,
+                                                'host@lvm#pool'))
+
+    @mock.patch('cinder.db.api.capacity_claim_update', return_value=False)
+    def test_claim_capacity_concurrent(self, mock_update):
+        self.flags(scheduler_capacity_claim_retries=2)
+        claims.claim_capacity(self.context, self.pool,
+                              self._request_spec(10))
+
+        # Another scheduler keeps claiming capacity between our read and
+        # our update.
+        self.assertFalse(claims.claim_capacity(self.context, self.pool,
+                                               self._request_spec(10)))
+        self.assertEqual(3, mock_update.call_count)
@@ -17,12 +17,14 @@
 from unittest import mock
 
 import ddt
+from oslo_utils import uuidutils
 
 from cinder import context
 from cinder import exception
 from cinder import objects
 from cinder.scheduler import filter_scheduler
 from cinder.scheduler import host_manager
+from cinder.scheduler.weights import stochastic
 from cinder.tests.unit import fake_constants as fake
 from cinder.tests.unit.scheduler import fakes
 from cinder.tests.unit.scheduler import test_scheduler
@@ -35,6 +37,11 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     driver_cls = filter_scheduler.FilterScheduler
 
+    def setUp(self):
+        super(FilterSchedulerTestCase, self).setUp()
+        # The services change between requests
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
+
     def test_create_group_no_hosts(self):
         # Ensure empty hosts result in NoValidBackend exception.
         sched = fakes.FakeFilterScheduler()
@@ -180,6 +187,204 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         weighed_host = sched._schedule(fake_context, request_spec, {})
         self.assertIsNotNone(weighed_host.obj)
         self.assertTrue(_mock_service_get_all.called)
+        self.assertEqual(0, len(self.notifier.notifications))
+
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_trace_decisions(self, _mock_service_get_all):
+        self.flags(scheduler_trace_decisions=True)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+
+        request_spec = {'volume_id': fake.VOLUME_ID,
+                        'volume_type': {'name': 'LVM_iSCSI',
+                                        'extra_specs': {
+                                            'volume_backend_name': 'lvm1'}},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 1}}
+        request_spec = objects.RequestSpec.from_primitives(request_spec)
+        weighed_host = sched._schedule(fake_context, request_spec, {})
+
+        self.assertEqual(1, len(self.notifier.notifications))
+        msg = self.notifier.notifications[0]
+        self.assertEqual('scheduler.decision', msg['event_type'])
+        payload = msg['payload']
+        self.assertEqual(fake.VOLUME_ID, payload['volume_id'])
+        self.assertEqual(fake_context.request_id, payload['request_id'])
+        self.assertEqual(weighed_host.obj.backend_id, payload['backend'])
+        # The pool indexes already removed the pools of other backends
+        self.assertEqual(['PoolIndexes', 'AvailabilityZoneFilter',
+                          'CapabilitiesFilter', 'CapacityFilter'],
+                         [f['name'] for f in payload['filters']])
+        index_trace = payload['filters'][0]
+        self.assertEqual(payload['candidates'], index_trace['start'])
+        self.assertEqual(1, index_trace['end'])
+        self.assertEqual(index_trace['start'] - 1,
+                         len(index_trace['rejected']))
+        self.assertNotIn('host1#lvm1', index_trace['rejected'])
+        self.assertEqual(['CapacityWeigher'],
+                         [w['name'] for w in payload['weighers']])
+
+    @mock.patch('cinder.scheduler.claims.claim_capacity')
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_capacity_claims(self, _mock_service_get_all,
+                                      mock_claim):
+        self.flags(scheduler_capacity_claims=True)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+        # Other schedulers already claimed the capacity of the best pool
+        mock_claim.side_effect = [False, True]
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 1}}
+        request_spec = objects.RequestSpec.from_primitives(request_spec)
+        weighed_host = sched._schedule(fake_context, request_spec, {})
+
+        self.assertEqual(2, mock_claim.call_count)
+        first, second = [call[0][1] for call in mock_claim.call_args_list]
+        self.assertIs(second, weighed_host.obj)
+        self.assertIsNot(first, second)
+
+    @mock.patch('cinder.scheduler.claims.claim_capacity', return_value=False)
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_capacity_claims_no_room(self, _mock_service_get_all,
+                                              mock_claim):
+        self.flags(scheduler_capacity_claims=True)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 1}}
+        request_spec = objects.RequestSpec.from_primitives(request_spec)
+        self.assertIsNone(sched._schedule(fake_context, request_spec, {}))
+        self.assertGreater(mock_claim.call_count, 1)
+
+    def _get_batch_request_specs(self, count, size, extra_specs=None):
+        return [objects.RequestSpec.from_primitives(
+            {'volume_id': uuidutils.generate_uuid(),
+             'volume_properties': {'project_id': 1, 'size': size},
+             'volume_type': {'name': 'LVM_iSCSI',
+                             'extra_specs': extra_specs or {}}})
+            for _i in range(count)]
+
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_create_volumes(self, _mock_service_get_all,
+                                     mock_update_db):
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+
+        # Place the volumes one by one to know where they should go
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        expected = [
+            sched._schedule(fake_context, request_spec, {}).obj.host
+            for request_spec in self._get_batch_request_specs(8, 100)]
+        self.assertGreater(len(set(expected)), 1)
+
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        request_specs = self._get_batch_request_specs(8, 100)
+
+        with mock.patch.object(
+                sched.host_manager, 'get_all_backend_states',
+                wraps=sched.host_manager.get_all_backend_states) as get_all:
+            unplaced = sched.schedule_create_volumes(fake_context,
+                                                     request_specs, None)
+
+        self.assertEqual([], unplaced)
+        get_all.assert_called_once()
+        self.assertEqual(expected, [call[0][2] for call in
+                                    mock_update_db.call_args_list])
+        self.assertEqual(8, sched.volume_rpcapi.create_volume.call_count)
+
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_create_volumes_stochastic(self, _mock_service_get_all,
+                                                mock_update_db):
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.host_manager.weight_handler = (
+            stochastic.StochasticHostWeightHandler('cinder.scheduler.weights'))
+        sched.volume_rpcapi = mock.Mock()
+        request_specs = self._get_batch_request_specs(8, 100)
+
+        with mock.patch.object(
+                sched.host_manager, 'get_all_backend_states',
+                wraps=sched.host_manager.get_all_backend_states) as get_all:
+            unplaced = sched.schedule_create_volumes(fake_context,
+                                                     request_specs, None)
+
+        # The winners are drawn in a single pass too
+        self.assertEqual([], unplaced)
+        get_all.assert_called_once()
+        self.assertEqual(8, sched.volume_rpcapi.create_volume.call_count)
+
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_create_volumes_unplaced(self, _mock_service_get_all,
+                                              mock_update_db):
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        # host1 only has room for one of these volumes
+        request_specs = self._get_batch_request_specs(
+            3, 800, {'volume_backend_name': 'lvm1'})
+        filter_properties_list = [{}, {}, {}]
+
+        unplaced = sched.schedule_create_volumes(fake_context, request_specs,
+                                                 filter_properties_list)
+
+        self.assertEqual([1, 2], unplaced)
+        mock_update_db.assert_called_once_with(
+            fake_context, request_specs[0].volume_id, 'host1#lvm1', None,
+            availability_zone='zone1', volume=None)
+        # Unplaced volumes are left untouched for the regular scheduling
+        self.assertEqual([{}, {}, {}], filter_properties_list)
+
+    @mock.patch('cinder.scheduler.claims.claim_capacity')
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_schedule_create_volumes_capacity_claims(self,
+                                                     _mock_service_get_all,
+                                                     mock_update_db,
+                                                     mock_claim):
+        self.flags(scheduler_capacity_claims=True)
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+        fakes.mock_host_manager_db_calls(_mock_service_get_all)
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        # The first pool is full for the other schedulers
+        mock_claim.side_effect = lambda ctxt, backend, spec: (
+            backend is not mock_claim.call_args_list[0][0][1])
+        request_specs = self._get_batch_request_specs(3, 1)
+
+        unplaced = sched.schedule_create_volumes(fake_context,
+                                                 request_specs, None)
+
+        self.assertEqual([], unplaced)
+        full = mock_claim.call_args_list[0][0][1]
+        self.assertNotIn(full.host, [call[0][2] for call in
+                                     mock_update_db.call_args_list])
+        # The full pool was dropped from the batch after the first attempt
+        self.assertEqual(4, mock_claim.call_count)
 
     @ddt.data(('host10@BackendA', True),
               ('host10@BackendB#openstack_nfs_1', True),
@@ -1215,6 +1215,24 @@ class ExtraSpecsOpsTestCase(test.TestCase):
             req=req,
             matches=matches)
 
+    @ddt.data({'value': '13', 'req': '<or>', 'matches': False},
+              {'value': '13', 'req': '>=', 'matches': False},
+              {'value': '13', 'req': '>= foo', 'matches': False},
+              {'value': 'foo', 'req': '>= 12', 'matches': False},
+              {'value': None, 'req': '<or> 11 <or> 12', 'matches': False})
+    @ddt.unpack
+    def test_extra_specs_matches_invalid(self, value, req, matches):
+        self._do_extra_specs_ops_test(
+            value=value,
+            req=req,
+            matches=matches)
+
+    def test_compile_req_cached(self):
+        predicate = extra_specs_ops.compile_req('>= 2')
+        self.assertIs(predicate, extra_specs_ops.compile_req('>= 2'))
+        self.assertTrue(predicate('3'))
+        self.assertFalse(predicate('1'))
+
 
 @ddt.ddt
 class BasicFiltersTestCase(BackendFiltersTestCase):
@@ -1392,6 +1410,29 @@ class BasicFiltersTestCase(BackendFiltersTestCase):
             especs={'capabilities:scope_lv1:opt1': '<is> True'},
             passes=False)
 
+    @mock.patch.object(extra_specs_ops, 'compile_req',
+                       wraps=extra_specs_ops.compile_req)
+    def test_capability_filter_compiles_extra_specs_once(self, mock_compile):
+        filt_cls = self.class_map['CapabilitiesFilter']()
+        especs = {'opt1': '>= 7', 'scope:opt2': 'ignored'}
+        filter_properties = {'resource_type': {'name': 'fake_type',
+                                               'extra_specs': especs},
+                             'request_spec': {'volume_id': fake.VOLUME_ID}}
+        hosts = [fakes.FakeBackendState('host%s' % i,
+                                        {'capabilities': {'opt1': i}})
+                 for i in range(10)]
+
+        result = list(filt_cls.filter_all(hosts, filter_properties))
+
+        self.assertEqual(hosts[7:], result)
+        mock_compile.assert_called_once_with('>= 7')
+
+        # Updating the type extra specs changes the checks
+        especs['opt1'] = '<= 1'
+        filt_cls = self.class_map['CapabilitiesFilter']()
+        result = list(filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(hosts[:2], result)
+
     def test_json_filter_passes(self):
         filt_cls = self.class_map['JsonFilter']()
         filter_properties = {'resource_type': {'memory_mb': 1024,
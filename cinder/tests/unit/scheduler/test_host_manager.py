@@ -14,6 +14,7 @@
 #    under the License.
 """Tests For HostManager."""
 
+import copy
 from datetime import datetime
 from datetime import timedelta
 from unittest import mock
@@ -28,10 +29,13 @@ from cinder import context
 from cinder.db import api as db
 from cinder import exception
 from cinder import objects
+from cinder.scheduler import capability_delta
 from cinder.scheduler import filters
+from cinder.scheduler.filters import capabilities_filter
 from cinder.scheduler import host_manager
 from cinder.tests.unit import fake_constants as fake
 from cinder.tests.unit.objects import test_service
+from cinder.tests.unit.scheduler import fakes
 from cinder.tests.unit.scheduler import helpers
 from cinder.tests.unit import test
 
@@ -119,6 +123,26 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(expected, mock_func.call_args_list)
         self.assertEqual(set(self.fake_backends), set(result))
 
+    def test_get_weighed_backends_out_of_tree_handler(self):
+        class OldWeightHandler(object):
+            """Weight handler of the interface before scheduler traces."""
+
+            def get_all_classes(self):
+                return []
+
+            def get_weighed_objects(self, weigher_classes, obj_list,
+                                    weighing_properties):
+                return list(reversed(obj_list))
+
+        self.host_manager.weight_handler = OldWeightHandler()
+
+        self.assertEqual(list(reversed(self.fake_backends)),
+                         self.host_manager.get_weighed_backends(
+                             self.fake_backends, {}, []))
+        # Batches are placed one volume at a time with these handlers
+        self.assertIsNone(self.host_manager.get_weighed_backend_list(
+            self.fake_backends, {}, []))
+
     @mock.patch(
         'cinder.scheduler.host_manager.HostManager._is_just_initialized')
     @mock.patch('cinder.scheduler.host_manager.HostManager._get_updated_pools')
@@ -168,6 +192,61 @@ class HostManagerTestCase(test.TestCase):
                     'host3': host3_volume_capabs}
         self.assertDictEqual(expected, service_states)
 
+    @mock.patch(
+        'cinder.scheduler.host_manager.HostManager._is_just_initialized',
+        return_value=False)
+    def test_update_service_capabilities_delta(self, _mock_is_just_init):
+        reporter = capability_delta.CapabilitiesReporter(10)
+        capabilities = {'volume_backend_name': 'lvm',
+                        'pools': [{'pool_name': 'pool1',
+                                   'free_capacity_gb': 10},
+                                  {'pool_name': 'pool2',
+                                   'free_capacity_gb': 20}]}
+
+        def _report(timestamp, send=True):
+            version, delta = reporter.report(capabilities)
+            if not send:
+                return None
+            return self.host_manager.update_service_capabilities(
+                'volume', 'host1',
+                None if delta else copy.deepcopy(capabilities), None,
+                datetime(2024, 1, 1, 0, timestamp),
+                capabilities_version=version, capabilities_delta=delta)
+
+        self.assertTrue(_report(0))
+        capabilities['pools'][1]['free_capacity_gb'] = 15
+        self.assertTrue(_report(1))
+
+        service_capabilities = self.host_manager.service_states['host1']
+        self.assertEqual(datetime(2024, 1, 1, 0, 1),
+                         service_capabilities['timestamp'])
+        self.assertEqual(capabilities['pools'],
+                         service_capabilities['pools'])
+        # The pools are processed on a copy of the reported ones
+        self.assertIsNot(service_capabilities['pools'][0],
+                         self.host_manager._reported_capabilities[
+                             'host1'][1]['pools'][0])
+
+        # A missed delta can't be applied
+        capabilities['pools'][0]['free_capacity_gb'] = 5
+        _report(2, send=False)
+        capabilities['pools'][0]['free_capacity_gb'] = 4
+        self.assertFalse(_report(3))
+        self.assertEqual(15, self.host_manager.service_states['host1'][
+            'pools'][1]['free_capacity_gb'])
+        self.assertFalse(_report(4))
+
+        # Until all the capabilities are received again
+        version, delta = reporter.report(capabilities, full=True)
+        self.assertIsNone(delta)
+        self.assertTrue(self.host_manager.update_service_capabilities(
+            'volume', 'host1', copy.deepcopy(capabilities), None,
+            datetime(2024, 1, 1, 0, 5), capabilities_version=version))
+        capabilities['pools'][0]['free_capacity_gb'] = 3
+        self.assertTrue(_report(6))
+        self.assertEqual(3, self.host_manager.service_states['host1'][
+            'pools'][0]['free_capacity_gb'])
+
     @mock.patch(
         'cinder.scheduler.host_manager.HostManager._is_just_initialized')
     @mock.patch(
@@ -752,12 +831,170 @@ class HostManagerTestCase(test.TestCase):
                     ('non_clustered_host#_pool0', 4000)}
         self.assertSetEqual(expected, result)
 
+    @mock.patch.object(host_manager.time, 'monotonic', return_value=100)
+    def test_get_all_backend_states_cached(self, mock_monotonic):
+        # Uses the default scheduler_backend_state_cache_ttl of 10 seconds
+        ctxt = context.RequestContext(fake.USER_ID, fake.PROJECT_ID, True)
+        for host in ('host1', 'host2'):
+            db.service_create(ctxt, {'host': host,
+                                     'topic': constants.VOLUME_TOPIC,
+                                     'binary': constants.VOLUME_BINARY,
+                                     'created_at': timeutils.utcnow()})
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', {'free_capacity_gb': 1000}, None, 1)
+        self.host_manager.service_states_last_update = {
+            'host1': self.host_manager.service_states['host1']}
+
+        with mock.patch.object(objects.ServiceList, 'get_all',
+                               wraps=objects.ServiceList.get_all) as get_all:
+            res = self.host_manager.get_all_backend_states(ctxt)
+            self.assertEqual(['host1#_pool0'], [s.host for s in res])
+            version = self.host_manager.backend_state_map_version
+            self.assertIs(res, self.host_manager.get_all_backend_states(ctxt))
+            # The map was refreshed when receiving the first capabilities
+            self.assertEqual(0, get_all.call_count)
+
+            # A known backend's capabilities are applied right away
+            self.host_manager.update_service_capabilities(
+                'volume', 'host1', {'free_capacity_gb': 500}, None, 2)
+            res = self.host_manager.get_all_backend_states(ctxt)
+            self.assertEqual([500], [s.free_capacity_gb for s in res])
+            self.assertGreater(self.host_manager.backend_state_map_version,
+                               version)
+            self.assertEqual(0, get_all.call_count)
+
+            # A new backend is added on the next request
+            self.host_manager.update_service_capabilities(
+                'volume', 'host2', {'free_capacity_gb': 2000}, None, 2)
+            res = self.host_manager.get_all_backend_states(ctxt)
+            self.assertEqual({'host1#_pool0', 'host2#_pool0'},
+                             {s.host for s in res})
+            self.assertEqual(1, get_all.call_count)
+
+            # Services are read again once the cache expires
+            db.service_update(ctxt, 2, {'disabled': True})
+            mock_monotonic.return_value = 109
+            res = self.host_manager.get_all_backend_states(ctxt)
+            self.assertEqual({'host1#_pool0', 'host2#_pool0'},
+                             {s.host for s in res})
+            self.assertEqual(1, get_all.call_count)
+            mock_monotonic.return_value = 110
+            res = self.host_manager.get_all_backend_states(ctxt)
+            self.assertEqual(['host1#_pool0'], [s.host for s in res])
+            self.assertEqual(2, get_all.call_count)
+
+    def test_pool_indexes_updated_per_backend(self):
+        self.override_config('scheduler_backend_state_cache_ttl', 60)
+        ctxt = context.RequestContext(fake.USER_ID, fake.PROJECT_ID, True)
+        for host in ('host1', 'host2'):
+            db.service_create(ctxt, {'host': host,
+                                     'topic': constants.VOLUME_TOPIC,
+                                     'binary': constants.VOLUME_BINARY,
+                                     'availability_zone': 'zone1',
+                                     'created_at': timeutils.utcnow()})
+            self.host_manager.update_service_capabilities(
+                'volume', host, {'free_capacity_gb': 1000,
+                                 'storage_protocol': 'iSCSI'}, None, 1)
+        self.host_manager.service_states_last_update = {
+            'host1': self.host_manager.service_states['host1']}
+        pools = self.host_manager.get_all_backend_states(ctxt)
+        indexes = self.host_manager._pool_indexes
+        self.assertEqual({'host1._pool0', 'host2._pool0'},
+                         indexes['storage_protocol']['iSCSI'])
+
+        with mock.patch.object(self.host_manager, '_index_backend',
+                               wraps=self.host_manager._index_backend
+                               ) as mock_index:
+            # Refreshing the map without changes keeps the indexes
+            self.host_manager._update_backend_state_map(ctxt)
+            mock_index.assert_not_called()
+            self.assertIs(pools,
+                          self.host_manager.get_all_backend_states(ctxt))
+
+            # A capability report only updates the entries of its backend
+            self.host_manager.update_service_capabilities(
+                'volume', 'host2', {'free_capacity_gb': 1000,
+                                    'storage_protocol': 'FC'}, None, 2)
+            mock_index.assert_called_once_with('host2')
+
+        self.assertIs(pools, self.host_manager.get_all_backend_states(ctxt))
+        self.assertEqual({'host1._pool0'},
+                         indexes['storage_protocol']['iSCSI'])
+        self.assertEqual({'host2._pool0'}, indexes['storage_protocol']['FC'])
+        filter_properties = {'resource_type': {
+            'extra_specs': {'storage_protocol': 'FC'}}}
+        self.assertEqual(
+            ['host2#_pool0'],
+            [pool.host for pool in self.host_manager._prefilter_backends(
+                pools, filter_properties,
+                [capabilities_filter.CapabilitiesFilter])])
+
+        # Removed backends are removed from the indexes
+        db.service_update(ctxt, 2, {'disabled': True})
+        self.host_manager._update_backend_state_map(ctxt)
+        self.assertNotIn('FC', indexes['storage_protocol'])
+        self.assertEqual(['host1#_pool0'],
+                         [pool.host for pool in
+                          self.host_manager.get_all_backend_states(ctxt)])
+
+    @ddt.data(({'availability_zone': 'zone1'}, {'storage_protocol': 'iSCSI'},
+               ['host1@BackendA#openstack_iscsi_1',
+                'host1@BackendA#openstack_iscsi_2',
+                'host2@BackendX#BackendX']),
+              ({'availability_zones': ['zone1', 'zone2']},
+               {'capabilities:volume_backend_name': 'BackendY'},
+               ['host3@BackendY#openstack_fcp_1',
+                'host3@BackendY#openstack_fcp_2']),
+              ({'availability_zone': 'zone2'},
+               {'volume_backend_name': 'BackendA'}, []),
+              ({}, {'volume_backend_name': '<or> BackendA <or> BackendX'},
+               None))
+    @ddt.unpack
+    @mock.patch('cinder.db.api.service_get_all')
+    def test_get_filtered_backends_prefiltered(self, az_spec, extra_specs,
+                                               expected,
+                                               _mock_service_get_all):
+        fakes.mock_host_manager_db_calls(_mock_service_get_all,
+                                         backends_with_pools=True)
+        hm = fakes.FakeHostManager(multibackend_with_pools=True)
+        ctxt = context.get_admin_context()
+        pools = hm.get_all_backend_states(ctxt)
+        az_spec['resource_properties'] = az_spec.get('resource_properties',
+                                                     {})
+        if 'availability_zone' in az_spec:
+            az_spec['resource_properties']['availability_zone'] = (
+                az_spec.pop('availability_zone'))
+        filter_properties = {'request_spec': az_spec,
+                             'resource_type': {'name': 'fake_type',
+                                               'extra_specs': extra_specs}}
+        filter_names = ['AvailabilityZoneFilter', 'CapabilitiesFilter']
+
+        # Any other list of backends is filtered without the indexes
+        unindexed = hm.get_filtered_backends(list(pools), filter_properties,
+                                             filter_names)
+
+        with mock.patch.object(hm.filter_handler, 'get_filtered_objects',
+                               wraps=hm.filter_handler.get_filtered_objects
+                               ) as mock_filter:
+            res = hm.get_filtered_backends(pools, filter_properties,
+                                           filter_names)
+
+        self.assertEqual(unindexed, res)
+        candidates = [pool.host for pool in mock_filter.call_args[0][1]]
+        if expected is None:
+            # Requirements with operators can't use the indexes
+            self.assertEqual(len(pools), len(candidates))
+        else:
+            self.assertEqual(expected, candidates)
+            self.assertEqual(expected, [pool.host for pool in res])
+
     @mock.patch('cinder.db.api.service_get_all')
     @mock.patch('cinder.objects.service.Service.is_up',
                 new_callable=mock.PropertyMock)
     def test_get_all_backend_states(self, _mock_service_is_up,
                                     _mock_service_get_all):
         context = 'fake_context'
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
         timestamp = datetime.utcnow()
         topic = constants.VOLUME_TOPIC
 
@@ -865,6 +1102,7 @@ class HostManagerTestCase(test.TestCase):
     def test_get_pools(self, _mock_service_is_up,
                        _mock_service_get_all):
         context = 'fake_context'
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
         timestamp = datetime.utcnow()
 
         services = [
@@ -1092,6 +1330,7 @@ class HostManagerTestCase(test.TestCase):
     def test_get_pools_filter_name(self, _mock_service_is_up,
                                    _mock_service_get_all_by_topic):
         context = 'fake_context'
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
 
         services = [
             dict(id=1, host='host1', topic='volume', disabled=False,
@@ -1186,6 +1425,7 @@ class HostManagerTestCase(test.TestCase):
     def test_get_pools_filter_multiattach(self, _mock_service_is_up,
                                           _mock_service_get_all_by_topic):
         context = 'fake_context'
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
 
         services = [
             dict(id=1, host='host1', topic='volume', disabled=False,
@@ -1541,3 +1781,30 @@ class PoolStateTestCase(test.TestCase):
                          fake_pool.provisioned_capacity_gb)
 
         self.assertDictEqual(volume_capability, dict(fake_pool.capabilities))
+
+    def test_get_virtual_free_capacity(self):
+        fake_pool = host_manager.PoolState('host1', None, None, 'pool0')
+        volume_capability = {'total_capacity_gb': 1024,
+                             'free_capacity_gb': 512,
+                             'reserved_percentage': 0,
+                             'provisioned_capacity_gb': 512,
+                             'thin_provisioning_support': True,
+                             'max_over_subscription_ratio': 2.0,
+                             'timestamp': None}
+        fake_pool.update_from_volume_capability(volume_capability)
+
+        # Computed when the stats were updated, not when weighing
+        with mock.patch.object(host_manager.sched_utils,
+                               'calculate_virtual_free_capacity') as calc:
+            self.assertEqual(1536, fake_pool.get_virtual_free_capacity())
+            self.assertEqual(512, fake_pool.get_virtual_free_capacity(
+                thin=False))
+        calc.assert_not_called()
+
+        fake_pool.consume_from_volume({'size': 10}, update_time=False)
+        self.assertEqual(1526, fake_pool.get_virtual_free_capacity())
+        self.assertEqual(502, fake_pool.get_virtual_free_capacity(thin=False))
+
+        volume_capability['free_capacity_gb'] = 'unknown'
+        fake_pool.update_from_volume_capability(volume_capability)
+        self.assertIsNone(fake_pool.get_virtual_free_capacity())
@@ -62,6 +62,27 @@ class SchedulerRPCAPITestCase(test.RPCAPITestCase):
                            timestamp='123')
         can_send_version.assert_called_once_with('3.3')
 
+    @ddt.data(None, {'changed': {'free_capacity_gb': 10}, 'removed': []})
+    @mock.patch('oslo_messaging.RPCClient.can_send_version',
+                return_value=True)
+    def test_update_service_capabilities_versioned(self, delta,
+                                                   can_send_version):
+        version = {'generation': fake_constants.UUID1, 'version': 2}
+        self._test_rpc_api('update_service_capabilities',
+                           rpc_method='cast',
+                           service_name='fake_name',
+                           host='fake_host',
+                           cluster_name='cluster_name',
+                           capabilities={'free_capacity_gb': 10},
+                           capabilities_version=version,
+                           capabilities_delta=delta,
+                           expected_kwargs_diff=(
+                               {'capabilities': None} if delta else None),
+                           fanout=True,
+                           version='3.14',
+                           timestamp='123')
+        can_send_version.assert_called_once_with('3.14')
+
     @ddt.data('3.0', '3.10')
     @mock.patch('oslo_messaging.RPCClient.can_send_version')
     def test_create_volume(self, version, can_send_version):
@@ -79,6 +100,41 @@ class SchedulerRPCAPITestCase(test.RPCAPITestCase):
         create_worker_mock.assert_called_once()
         can_send_version.assert_called_once_with('3.10')
 
+    @mock.patch('oslo_messaging.RPCClient.can_send_version',
+                return_value=True)
+    def test_create_volumes(self, can_send_version):
+        create_worker_mock = self.mock_object(self.fake_volume,
+                                              'create_worker')
+        self._test_rpc_api('create_volumes',
+                           rpc_method='cast',
+                           version='3.13',
+                           volumes=[self.fake_volume],
+                           request_spec_list=[self.fake_rs_obj],
+                           filter_properties_list=[self.fake_fp_dict])
+        create_worker_mock.assert_called_once()
+        can_send_version.assert_called_once_with('3.13')
+
+    @mock.patch('oslo_messaging.RPCClient.can_send_version',
+                return_value=False)
+    def test_create_volumes_old_scheduler(self, can_send_version):
+        rpcapi = scheduler_rpcapi.SchedulerAPI()
+        volumes = [mock.sentinel.volume1, mock.sentinel.volume2]
+        request_specs = [{'image_id': fake_constants.IMAGE_ID},
+                         {'snapshot_id': fake_constants.SNAPSHOT_ID}]
+
+        with mock.patch.object(rpcapi, 'create_volume') as create_volume:
+            rpcapi.create_volumes(self.context, volumes, request_specs)
+
+        create_volume.assert_has_calls([
+            mock.call(self.context, mock.sentinel.volume1, snapshot_id=None,
+                      image_id=fake_constants.IMAGE_ID,
+                      request_spec=request_specs[0], filter_properties=None,
+                      backup_id=None),
+            mock.call(self.context, mock.sentinel.volume2,
+                      snapshot_id=fake_constants.SNAPSHOT_ID, image_id=None,
+                      request_spec=request_specs[1], filter_properties=None,
+                      backup_id=None)])
+
     @mock.patch('oslo_messaging.RPCClient.can_send_version',
                 return_value=True)
     def test_create_snapshot(self, can_send_version_mock):
@@ -275,6 +275,34 @@ class SchedulerManagerTestCase(test.TestCase):
         _mock_update_cap.assert_called_once_with(service, host, capabilities,
                                                  None, None)
 
+    @ddt.data(True, False)
+    @mock.patch('cinder.volume.rpcapi.VolumeAPI.'
+                'publish_service_capabilities')
+    @mock.patch('cinder.scheduler.driver.Scheduler.'
+                'update_service_capabilities')
+    def test_update_service_capabilities_delta(self, updated,
+                                               _mock_update_cap,
+                                               _mock_publish):
+        _mock_update_cap.return_value = updated
+        host = 'fake_host'
+        version = {'generation': fake.UUID1, 'version': 2}
+        delta = {'changed': {'fake_capability': 'fake_value'}, 'removed': []}
+
+        self.manager.update_service_capabilities(self.context,
+                                                 service_name='volume',
+                                                 host=host,
+                                                 capabilities=None,
+                                                 capabilities_version=version,
+                                                 capabilities_delta=delta)
+        _mock_update_cap.assert_called_once_with(
+            'volume', host, None, None, None,
+            capabilities_version=version, capabilities_delta=delta)
+        # Missed reports make the scheduler ask for all the capabilities
+        if updated:
+            _mock_publish.assert_not_called()
+        else:
+            _mock_publish.assert_called_once_with(self.context, host=host)
+
     @mock.patch('cinder.scheduler.driver.Scheduler.'
                 'notify_service_capabilities')
     def test_notify_service_capabilities_no_timestamp(self, _mock_notify_cap):
@@ -339,6 +367,42 @@ class SchedulerManagerTestCase(test.TestCase):
             resource_uuid=volume.id,
             exception=mock.ANY)
 
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volumes')
+    @mock.patch.object(manager.SchedulerManager, 'create_volume')
+    def test_create_volumes(self, mock_create_volume, mock_sched_create):
+        mock_sched_create.return_value = [1]
+        volumes = [fake_volume.fake_volume_obj(self.context, id=volume_id)
+                   for volume_id in (fake.VOLUME_ID, fake.VOLUME2_ID)]
+        request_specs = [
+            objects.RequestSpec.from_primitives({'volume_id': volume.id})
+            for volume in volumes]
+
+        self.manager.create_volumes(self.context, volumes, request_specs)
+
+        mock_sched_create.assert_called_once_with(self.context, request_specs,
+                                                  [None, None])
+        # Volumes the driver couldn't place go through the regular flow
+        mock_create_volume.assert_called_once_with(
+            self.context, volumes[1], snapshot_id=None, image_id=None,
+            request_spec=request_specs[1], filter_properties=None,
+            backup_id=None)
+
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volumes')
+    @mock.patch.object(manager.SchedulerManager, 'create_volume')
+    def test_create_volumes_driver_error(self, mock_create_volume,
+                                         mock_sched_create):
+        mock_sched_create.side_effect = Exception()
+        volumes = [fake_volume.fake_volume_obj(self.context, id=volume_id)
+                   for volume_id in (fake.VOLUME_ID, fake.VOLUME2_ID)]
+        request_specs = [
+            objects.RequestSpec.from_primitives({'volume_id': volume.id})
+            for volume in volumes]
+
+        self.manager.create_volumes(self.context, volumes, request_specs,
+                                    [{}, {}])
+
+        self.assertEqual(2, mock_create_volume.call_count)
+
     @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volume')
     @mock.patch('eventlet.sleep')
     def test_create_volume_no_delay(self, _mock_sleep, _mock_sched_create):
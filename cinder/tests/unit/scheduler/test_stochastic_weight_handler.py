@@ -12,15 +12,37 @@
 #    under the License.
 """Tests for stochastic weight handler."""
 
+import collections
+import itertools
 import random
 
 import ddt
 
 from cinder.scheduler import base_weight
+from cinder.scheduler.weights import stochastic
 from cinder.scheduler.weights.stochastic import StochasticHostWeightHandler
 from cinder.tests.unit import test
 
 
+class MapWeigher(base_weight.BaseWeigher):
+    minval = 0
+    maxval = 100
+
+    def _weigh_object(self, obj, weight_map):
+        return weight_map[obj]
+
+
+# Chi-squared values with a 0.001 probability of being exceeded by chance,
+# by degrees of freedom.
+CHI_SQUARED_CRITICAL = {3: 16.266, 11: 31.264}
+
+
+def _chi_squared(observed, expected_probabilities, trials):
+    return sum((observed.get(key, 0) - trials * probability) ** 2 /
+               (trials * probability)
+               for key, probability in expected_probabilities.items())
+
+
 @ddt.ddt
 class StochasticWeightHandlerTestCase(test.TestCase):
     """Test case for StochasticHostWeightHandler."""
@@ -43,13 +65,6 @@ class StochasticWeightHandlerTestCase(test.TestCase):
                          'random',
                          return_value=rand_value)
 
-        class MapWeigher(base_weight.BaseWeigher):
-            minval = 0
-            maxval = 100
-
-            def _weigh_object(self, obj, weight_map):
-                return weight_map[obj]
-
         weight_map = {'A': 1, 'B': 3, 'C': 2}
         objs = sorted(weight_map.keys())
 
@@ -60,3 +75,103 @@ class StochasticWeightHandlerTestCase(test.TestCase):
                                                     weight_map)
         winner = weighted_objs[0].obj
         self.assertEqual(expected_obj, winner)
+
+    def test_get_weighed_objects_same_as_linear_scan(self):
+        # Negative weights make the cumulative weights decrease
+        weight_map = {'A': 2, 'B': -1, 'C': 0, 'D': 3, 'E': -2, 'F': 1}
+        objs = sorted(weight_map.keys())
+        handler = StochasticHostWeightHandler('fake_namespace')
+        cumulative = list(itertools.accumulate(weight_map[obj]
+                                               for obj in objs))
+
+        for step in range(0, 101):
+            rand_value = step / 100.0
+            self.mock_object(random, 'random', return_value=rand_value)
+            winning_value = rand_value * cumulative[-1]
+            expected = next((obj for obj, max_value in zip(objs, cumulative)
+                             if max_value > winning_value), objs[0])
+
+            weighed_objs = handler.get_weighed_objects([MapWeigher], objs,
+                                                       weight_map)
+            self.assertEqual(expected, weighed_objs[0].obj)
+
+    def test_get_weighed_objects_distribution(self):
+        self.mock_object(random, 'random', random.Random(42).random)
+        weight_map = {'A': 1, 'B': 3, 'C': 2, 'D': 0, 'E': 4}
+        objs = sorted(weight_map.keys())
+        handler = StochasticHostWeightHandler('fake_namespace')
+        trials = 10000
+
+        winners = collections.Counter(
+            handler.get_weighed_objects([MapWeigher], objs,
+                                        weight_map)[0].obj
+            for _i in range(trials))
+
+        self.assertNotIn('D', winners)
+        expected = {obj: weight / 10.0 for obj, weight in weight_map.items()
+                    if weight}
+        self.assertLess(_chi_squared(winners, expected, trials),
+                        CHI_SQUARED_CRITICAL[3])
+
+    def test_weighed_object_list_distribution(self):
+        self.mock_object(random, 'random', random.Random(42).random)
+        weight_map = {'A': 1, 'B': 3, 'C': 2, 'D': 0, 'E': 4}
+        objs = sorted(weight_map.keys())
+        handler = StochasticHostWeightHandler('fake_namespace')
+        trials = 10000
+
+        pairs = collections.Counter()
+        for _i in range(trials):
+            weighed_list = handler.get_weighed_object_list(
+                [MapWeigher], objs, weight_map)
+            first = weighed_list.objects[0]
+            weighed_list.remove(first)
+            pairs[(first.obj, weighed_list.objects[0].obj)] += 1
+
+        # Removing the winner draws the next one as if the lottery was
+        # repeated without it.
+        positive = [obj for obj in objs if weight_map[obj]]
+        expected = {
+            (first, second): (weight_map[first] / 10.0 *
+                              weight_map[second] / (10.0 - weight_map[first]))
+            for first, second in itertools.permutations(positive, 2)}
+        self.assertEqual(set(expected), set(pairs))
+        self.assertLess(_chi_squared(pairs, expected, trials),
+                        CHI_SQUARED_CRITICAL[11])
+
+    def test_cumulative_weights(self):
+        weights = stochastic.CumulativeWeights([1.0, 0.0, 3.0, 2.0])
+        self.assertEqual(6.0, weights.total)
+        self.assertEqual([0, 2, 2, 2, 3, 3],
+                         [weights.find(value) for value in
+                          (0.0, 1.0, 2.5, 3.9, 4.0, 5.9)])
+        # Rounding errors that reach the total fall on the last object
+        self.assertEqual(3, weights.find(6.0))
+
+        weights.set(2, 0.0)
+        self.assertEqual(3.0, weights.total)
+        self.assertEqual(2, weights.positive)
+        self.assertEqual([0, 3, 3], [weights.find(value)
+                                     for value in (0.5, 1.0, 2.9)])
+
+    def test_weighed_object_list(self):
+        self.mock_object(random, 'random', return_value=0.25)
+        weight_map = {'A': 1, 'B': 3, 'C': 0}
+        objs = sorted(weight_map.keys())
+        handler = StochasticHostWeightHandler('fake_namespace')
+
+        weighed_list = handler.get_weighed_object_list([MapWeigher], objs,
+                                                       weight_map)
+        winner = weighed_list.objects[0]
+        self.assertEqual('B', winner.obj)
+
+        # The winner got a lower weight after consuming from it
+        weight_map['B'] = 1
+        weighed_list.reweigh(winner)
+        self.assertEqual('A', weighed_list.objects[0].obj)
+
+        weighed_list.remove(weighed_list.objects[0])
+        self.assertEqual('B', weighed_list.objects[0].obj)
+        weighed_list.remove(weighed_list.objects[0])
+        # Only objects without weight are left
+        self.assertEqual(['C'], [obj.obj for obj in weighed_list.objects])
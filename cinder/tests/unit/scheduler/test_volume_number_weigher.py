@@ -48,6 +48,8 @@ class VolumeNumberWeigherTestCase(test.TestCase):
 
     def setUp(self):
         super(VolumeNumberWeigherTestCase, self).setUp()
+        # The services change between requests
+        self.override_config('scheduler_backend_state_cache_ttl', 0)
         uid = fake_constants.USER_ID
         pid = fake_constants.PROJECT_ID
         self.context = context.RequestContext(user_id=uid,
@@ -18,6 +18,7 @@ Tests For Scheduler weights.
 """
 
 from cinder.scheduler import base_weight
+from cinder.scheduler import trace as sched_trace
 from cinder.tests.unit import test
 
 
@@ -52,3 +53,125 @@ class TestWeightHandler(test.TestCase):
         for seq, result, minval, maxval in map_:
             ret = base_weight.normalize(seq, minval=minval, maxval=maxval)
             self.assertEqual(result, tuple(ret))
+
+    def test_weighed_object_list_reweigh(self):
+        class FakeWeigher(base_weight.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj['free']
+
+        objs = [{'name': name, 'free': free}
+                for name, free in (('a', 100), ('b', 300), ('c', 200))]
+        weighed = base_weight.WeighedObjectList(
+            base_weight.WeighedObject, [FakeWeigher], objs, {})
+        self.assertEqual(['b', 'c', 'a'],
+                         [w.obj['name'] for w in weighed.objects])
+        self.assertEqual([1.0, 0.5, 0.0],
+                         [w.weight for w in weighed.objects])
+
+        # Only the changed object is weighed again, the others are
+        # normalized again with the range that changed
+        top = weighed.objects[0]
+        top.obj['free'] = 150
+        weighed.reweigh(top)
+        self.assertEqual(['c', 'b', 'a'],
+                         [w.obj['name'] for w in weighed.objects])
+        self.assertEqual([1.0, 0.5, 0.0],
+                         [w.weight for w in weighed.objects])
+
+        # The range doesn't change, the other weights stay the same
+        top.obj['free'] = 125
+        weighed.reweigh(top)
+        self.assertEqual([1.0, 0.25, 0.0],
+                         [w.weight for w in weighed.objects])
+
+        weighed.remove(top)
+        self.assertEqual(['c', 'a'],
+                         [w.obj['name'] for w in weighed.objects])
+        self.assertEqual([1.0, 0.0],
+                         [w.weight for w in weighed.objects])
+
+        weighed.remove(weighed.first())
+        weighed.remove(weighed.first())
+        self.assertIsNone(weighed.first())
+        self.assertEqual([], weighed.objects)
+
+    def test_weighed_object_list_reweigh_equal(self):
+        class FakeWeigher(base_weight.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj['free']
+
+        objs = [{'name': name, 'free': 100} for name in ('a', 'b')]
+        weighed = base_weight.WeighedObjectList(
+            base_weight.WeighedObject, [FakeWeigher], objs, {})
+
+        top = weighed.objects[0]
+        top.obj['free'] = 90
+        weighed.reweigh(top)
+        self.assertEqual(['b', 'a'],
+                         [w.obj['name'] for w in weighed.objects])
+
+    def test_weighed_object_list_reweigh_matches_weighing(self):
+        class FreeWeigher(base_weight.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj['free']
+
+        class AllocatedWeigher(base_weight.BaseWeigher):
+            def weight_multiplier(self):
+                return -1.0
+
+            def _weigh_object(self, obj, weight_properties):
+                return obj['allocated']
+
+        weigher_classes = [FreeWeigher, AllocatedWeigher]
+        objs = [{'name': name, 'free': free, 'allocated': allocated}
+                for name, free, allocated in (('a', 100, 0), ('b', 100, 0),
+                                              ('c', 40, 0))]
+        weighed = base_weight.WeighedObjectList(
+            base_weight.WeighedObject, weigher_classes, objs, {})
+
+        # All the objects have the same allocated capacity at first. Placing
+        # the volumes of a batch one after the other in the same list
+        # chooses like weighing all the objects for every volume
+        for i in range(8):
+            top = weighed.first()
+            top.obj['free'] -= 10
+            top.obj['allocated'] += 10
+            weighed.reweigh(top)
+
+            expected = base_weight.WeighedObjectList(
+                base_weight.WeighedObject, weigher_classes, objs, {})
+            top = weighed.first()
+            self.assertEqual(
+                (expected.objects[0].obj['name'], expected.objects[0].weight),
+                (top.obj['name'], top.weight))
+
+        self.assertEqual(
+            [(w.obj['name'], w.weight) for w in expected.objects],
+            [(w.obj['name'], w.weight) for w in weighed.objects])
+
+        weighed.remove(weighed.first())
+        expected = base_weight.WeighedObjectList(
+            base_weight.WeighedObject, weigher_classes,
+            [w.obj for w in weighed.objects], {})
+        self.assertEqual(
+            [(w.obj['name'], w.weight) for w in expected.objects],
+            [(w.obj['name'], w.weight) for w in weighed.objects])
+
+    def test_weighed_objects_trace(self):
+        class FakeWeigher(base_weight.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj['free']
+
+        handler = base_weight.BaseWeightHandler(base_weight.BaseWeigher,
+                                                'fake_weighers')
+        objs = [{'name': name, 'free': free}
+                for name, free in (('a', 100), ('b', 300))]
+        trace = sched_trace.SchedulerTrace()
+        handler.get_weighed_objects([FakeWeigher], objs, {}, trace=trace)
+
+        self.assertEqual(1, len(trace.weighers))
+        weigher_trace = trace.weighers[0]
+        self.assertEqual(('FakeWeigher', 2, 100, 300),
+                         (weigher_trace['name'], weigher_trace['count'],
+                          weigher_trace['minval'], weigher_trace['maxval']))
+        self.assertGreaterEqual(weigher_trace['elapsed'], 0)
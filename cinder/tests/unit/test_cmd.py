@@ -182,6 +182,26 @@ class TestCinderSchedulerCmd(test.TestCase):
         service_serve.assert_called_once_with(server)
         service_wait.assert_called_once_with()
 
+    @mock.patch('cinder.db.api.dispose_engine')
+    @mock.patch('cinder.service.process_launcher')
+    @mock.patch('cinder.service.Service.create')
+    @mock.patch('oslo_log.log.setup')
+    def test_main_multiprocess(self, log_setup, service_create,
+                               process_launcher, dispose_engine):
+        if processutils.get_worker_count() < 2:
+            raise test.testtools.TestCase.skipException(
+                'requires more than 1 cpu (to set scheduler_workers >1)')
+
+        CONF.set_override('scheduler_workers', 2)
+        cinder_scheduler.main()
+
+        service_create.assert_called_once_with(binary='cinder-scheduler')
+        dispose_engine.assert_called_once_with()
+        launcher = process_launcher.return_value
+        launcher.launch_service.assert_called_once_with(
+            service_create.return_value, workers=2)
+        launcher.wait.assert_called_once_with()
+
 
 class TestCinderVolumeCmd(test.TestCase):
 
@@ -728,6 +748,46 @@ class TestCinderManageCmd(test.TestCase):
         backup_update.assert_called_once_with(ctxt, fake.BACKUP_ID,
                                               {'host': 'fake_host2'})
 
+    @mock.patch('cinder.backup.rpcapi.BackupAPI')
+    @mock.patch('cinder.rpc.init')
+    @mock.patch('cinder.objects.Service.get_by_args')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_backup_throttle(self, get_admin_context, service_get_by_args,
+                             rpc_init, backup_rpcapi):
+        ctxt = context.RequestContext(fake.USER_ID, fake.PROJECT_ID)
+        get_admin_context.return_value = ctxt
+        service = service_get_by_args.return_value
+        set_throttle_limits = backup_rpcapi.return_value.set_throttle_limits
+        get_throttle_limits = backup_rpcapi.return_value.get_throttle_limits
+        get_throttle_limits.return_value = {'bps_limit': 1024,
+                                            'iops_limit': 0}
+
+        backup_cmds = cinder_manage.BackupCommands()
+        with mock.patch('sys.stdout', new=io.StringIO()) as fake_out:
+            backup_cmds.throttle('fake_host', bps_limit=1024,
+                                 backend_iops_limit=0)
+
+        service_get_by_args.assert_called_once_with(ctxt, 'fake_host',
+                                                    'cinder-backup')
+        set_throttle_limits.assert_called_once_with(
+            ctxt, service, {'bps_limit': 1024, 'backend_iops_limit': 0})
+        get_throttle_limits.assert_called_once_with(ctxt, service)
+        self.assertEqual('bps_limit           \t1024\n'
+                         'iops_limit          \t0\n', fake_out.getvalue())
+
+    @mock.patch('cinder.rpc.init')
+    @mock.patch('cinder.objects.Service.get_by_args')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_backup_throttle_service_not_found(self, get_admin_context,
+                                               service_get_by_args, rpc_init):
+        service_get_by_args.side_effect = exception.ServiceNotFound(
+            service_id='fake_host')
+
+        backup_cmds = cinder_manage.BackupCommands()
+        with mock.patch('sys.stdout', new=io.StringIO()):
+            self.assertEqual(2, backup_cmds.throttle('fake_host'))
+        rpc_init.assert_not_called()
+
     @mock.patch('cinder.db.api.consistencygroup_update')
     @mock.patch('cinder.db.api.consistencygroup_get_all')
     @mock.patch('cinder.context.get_admin_context')
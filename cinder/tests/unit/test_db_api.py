@@ -3482,6 +3482,91 @@ class DBAPIDriverInitiatorDataTestCase(BaseTest):
         )
 
 
+class DBAPICapacityClaimTestCase(BaseTest):
+    backend = 'host@lvm#pool'
+
+    def test_capacity_claim_create_and_get(self):
+        timestamp = datetime.datetime(2020, 1, 1)
+        self.assertIsNone(db.capacity_claim_get(self.ctxt, self.backend))
+
+        db.capacity_claim_create(self.ctxt, self.backend, 10, timestamp)
+        claim = db.capacity_claim_get(self.ctxt, self.backend)
+
+        self.assertEqual(10, claim.claimed_gb)
+        self.assertEqual(timestamp, claim.stats_timestamp)
+        self.assertEqual(0, claim.race_preventer)
+
+    def test_capacity_claim_create_already_exists(self):
+        timestamp = datetime.datetime(2020, 1, 1)
+        db.capacity_claim_create(self.ctxt, self.backend, 10, timestamp)
+        self.assertRaises(exception.CapacityClaimExists,
+                          db.capacity_claim_create,
+                          self.ctxt, self.backend, 20, timestamp)
+
+    def test_capacity_claim_update(self):
+        timestamp = datetime.datetime(2020, 1, 1)
+        db.capacity_claim_create(self.ctxt, self.backend, 10, timestamp)
+
+        self.assertTrue(db.capacity_claim_update(self.ctxt, self.backend, 0,
+                                                 claimed_gb=20))
+        # The claim changed since it was read with race_preventer 0
+        self.assertFalse(db.capacity_claim_update(self.ctxt, self.backend, 0,
+                                                  claimed_gb=30))
+
+        claim = db.capacity_claim_get(self.ctxt, self.backend)
+        self.assertEqual(20, claim.claimed_gb)
+        self.assertEqual(1, claim.race_preventer)
+        self.assertIsNotNone(claim.updated_at)
+
+
+class DBAPIBackupDedupChunkTestCase(BaseTest):
+    container = 'container'
+
+    def _create_chunk(self, dedup_key='key', backup_id=fake.BACKUP_ID):
+        return db.backup_dedup_chunk_create(
+            self.ctxt, self.container, dedup_key, backup_id,
+            'dedup_%s_data_1' % dedup_key, 'zlib')
+
+    def test_backup_dedup_chunk_reference(self):
+        self.assertIsNone(db.backup_dedup_chunk_reference(
+            self.ctxt, self.container, 'key', fake.BACKUP_ID))
+        self._create_chunk()
+
+        chunk = db.backup_dedup_chunk_reference(
+            self.ctxt, self.container, 'key', fake.BACKUP2_ID)
+
+        self.assertEqual('dedup_key_data_1', chunk.object_name)
+        self.assertEqual('zlib', chunk.compression)
+        # Chunks are per container
+        self.assertIsNone(db.backup_dedup_chunk_reference(
+            self.ctxt, 'other', 'key', fake.BACKUP_ID))
+
+    def test_backup_dedup_chunk_create_already_exists(self):
+        self._create_chunk()
+        self.assertRaises(exception.BackupDedupChunkExists,
+                          self._create_chunk, backup_id=fake.BACKUP2_ID)
+
+    def test_backup_dedup_chunks_release(self):
+        self._create_chunk('key1')
+        self._create_chunk('key2', backup_id=fake.BACKUP2_ID)
+        # A backup may reference the same chunk more than once
+        for backup_id in (fake.BACKUP_ID, fake.BACKUP2_ID, fake.BACKUP2_ID):
+            db.backup_dedup_chunk_reference(self.ctxt, self.container,
+                                            'key1', backup_id)
+
+        self.assertEqual(['dedup_key2_data_1'],
+                         db.backup_dedup_chunks_release(self.ctxt,
+                                                        fake.BACKUP2_ID))
+        self.assertIsNone(db.backup_dedup_chunk_reference(
+            self.ctxt, self.container, 'key2', fake.BACKUP_ID))
+
+        self.assertEqual(['dedup_key1_data_1'],
+                         db.backup_dedup_chunks_release(self.ctxt,
+                                                        fake.BACKUP_ID))
+        self.assertEqual([], db.backup_dedup_chunks_release(self.ctxt,
+                                                            fake.BACKUP_ID))
+
+
 @ddt.ddt
 class DBAPIImageVolumeCacheEntryTestCase(BaseTest):
 
@@ -3653,6 +3738,57 @@ class DBAPIImageVolumeCacheEntryTestCase(BaseTest):
         db_image_cache = db.image_volume_cache_get_by_volume_id(
             self.ctxt, image_cache[0].volume_id)
         self.assertEqual(cluster_name, db_image_cache.cluster_name)
+        self.assertEqual(
+            [(cluster_name, 6, 1)],
+            db.image_volume_cache_get_usage(self.ctxt,
+                                            cluster_name=cluster_name))
+
+    def test_cache_entry_get_usage(self):
+        image_updated_at = datetime.datetime.utcnow()
+        for host, volume_id, size in (('host1@backend#pool1', 'vol-1', 5),
+                                      ('host1@backend#pool1', 'vol-2', 7),
+                                      ('host1@backend#pool2', 'vol-3', 1),
+                                      ('host2@backend#pool1', 'vol-4', 2)):
+            db.image_volume_cache_create(self.ctxt, host, None, 'image',
+                                         image_updated_at, volume_id, size)
+
+        self.assertEqual(
+            [('host1@backend#pool1', 12, 2)],
+            db.image_volume_cache_get_usage(self.ctxt,
+                                            host='host1@backend#pool1'))
+        self.assertEqual(
+            [('host1@backend#pool1', 12, 2), ('host1@backend#pool2', 1, 1)],
+            sorted(db.image_volume_cache_get_usage(self.ctxt,
+                                                   host='host1@backend')))
+
+        db.image_volume_cache_delete(self.ctxt, 'vol-1')
+        self.assertEqual(
+            [('host1@backend#pool1', 7, 1)],
+            db.image_volume_cache_get_usage(self.ctxt,
+                                            host='host1@backend#pool1'))
+        self.assertEqual(
+            [], db.image_volume_cache_get_usage(self.ctxt, host='host3'))
+
+    @mock.patch('oslo_utils.timeutils.utcnow')
+    def test_cache_entry_get_lru(self, mock_utcnow):
+        image_updated_at = datetime.datetime.utcnow()
+        mock_utcnow.side_effect = [image_updated_at +
+                                   datetime.timedelta(seconds=i)
+                                   for i in range(5)]
+        host = 'host1@backend#pool1'
+        for i in range(3):
+            db.image_volume_cache_create(self.ctxt, host, None,
+                                         'image-%d' % i, image_updated_at,
+                                         'vol-%d' % i, 1)
+        db.image_volume_cache_create(self.ctxt, 'host2', None, 'image',
+                                     image_updated_at, 'vol-other', 1)
+        # Using an entry makes it the most recently used one
+        db.image_volume_cache_get_and_update_last_used(self.ctxt, 'image-0',
+                                                       host=host)
+
+        entries = db.image_volume_cache_get_lru(self.ctxt, 2, host=host)
+        self.assertEqual(['vol-1', 'vol-2'],
+                         [entry.volume_id for entry in entries])
 
 
 class DBAPIGenericTestCase(BaseTest):
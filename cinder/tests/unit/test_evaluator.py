@@ -144,3 +144,22 @@ class EvaluatorTestCase(test.TestCase):
         self.assertGreater(evaluator.evaluate(
             '(((1 + max(1 + (10 / 20), 2, 3)) / 100) + 1)'),
             1)
+
+    def test_cached_expression(self):
+        expression = "stats.total_capacity_gb > 100 ? 100 : 50"
+        self.assertEqual(100, evaluator.evaluate(
+            expression, stats={'total_capacity_gb': 500}))
+        parsed = evaluator._parse_expression(expression)
+
+        self.assertEqual(50, evaluator.evaluate(
+            expression, stats={'total_capacity_gb': 10}))
+        self.assertIs(parsed, evaluator._parse_expression(expression))
+
+    def test_cached_expression_missing_var(self):
+        expression = "stats.free_capacity_gb > 10"
+        self.assertTrue(evaluator.evaluate(
+            expression, stats={'free_capacity_gb': 20}))
+        self.assertRaises(exception.EvaluatorParseException,
+                          evaluator.evaluate,
+                          expression,
+                          stats={})
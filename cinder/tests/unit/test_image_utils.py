@@ -12,17 +12,21 @@
 #    under the License.
 """Unit tests for image utils."""
 
+import contextlib
 import errno
 import math
+import os
 from unittest import mock
 
 import cryptography
 import ddt
+import fixtures
 from oslo_concurrency import processutils
 from oslo_utils import imageutils
 from oslo_utils import units
 
 from cinder import exception
+from cinder.image import file_cache
 from cinder.image import image_utils
 from cinder.tests.unit import fake_constants as fake
 from cinder.tests.unit import test
@@ -2046,6 +2050,372 @@ class TestFetchToVolumeFormat(test.TestCase):
                                              disable_sparse=False)
         mock_engine.decompress_img.assert_called()
 
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.stream_to_volume',
+                return_value=True)
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    def test_streamed(self, mock_temp, mock_info, mock_stream, mock_fetch,
+                      mock_convert):
+        self.flags(image_stream_to_volume=True)
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = FakeImageService()
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, image_id,
+                                           dest, 'raw', mock.sentinel.bs,
+                                           size=3, run_as_root=False)
+
+        mock_stream.assert_called_once_with(
+            ctxt, image_service, image_id, image_service.show(ctxt, image_id),
+            dest, tmp, size=3, run_as_root=False)
+        mock_fetch.assert_not_called()
+        mock_convert.assert_not_called()
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.stream_to_volume',
+                return_value=False)
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    def test_streamed_staged(self, mock_temp, mock_info, mock_stream,
+                             mock_fetch, mock_convert):
+        self.flags(image_stream_to_volume=True)
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = FakeImageService()
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+        data = mock_info.return_value
+        data.file_format = 'raw'
+        data.backing_file = None
+        data.virtual_size = 1234
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, image_id,
+                                           dest, 'raw', mock.sentinel.bs)
+
+        # The image was staged in the temporary file instead
+        mock_stream.assert_called_once()
+        mock_fetch.assert_not_called()
+        mock_convert.assert_called_once_with(tmp, dest, 'raw',
+                                             out_subformat=None,
+                                             run_as_root=True,
+                                             src_format='raw',
+                                             image_id=image_id,
+                                             data=data,
+                                             disable_sparse=False)
+
+    def _mock_file_cache(self, *cached_paths):
+        cache = mock.Mock(spec=file_cache.ImageFileCache)
+        cache.get_key = file_cache.ImageFileCache.get_key
+        cache.pin = mock.Mock(side_effect=[contextlib.nullcontext(path)
+                                           for path in cached_paths])
+        cache.staging_path = mock.MagicMock()
+        self.mock_object(file_cache.ImageFileCache, 'get_default',
+                         return_value=cache)
+        return cache
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    def test_file_cache_hit(self, mock_temp, mock_info, mock_fetch,
+                            mock_convert):
+        cache = self._mock_file_cache(mock.sentinel.cached_path)
+        ctxt = mock.sentinel.context
+        image_service = mock.Mock()
+        image_service.show.return_value = {'size': 2 * units.Gi,
+                                           'disk_format': 'qcow2',
+                                           'container_format': 'bare',
+                                           'checksum': 'abc',
+                                           'status': 'active'}
+        data = mock_info.return_value
+        data.virtual_size = 1234
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, 'image-id',
+                                           '/dev/fake', 'raw',
+                                           mock.sentinel.bs, size=3)
+
+        cache.pin.assert_called_once_with('image-id.abc.raw')
+        mock_temp.assert_not_called()
+        mock_fetch.assert_not_called()
+        mock_info.assert_called_once_with(mock.sentinel.cached_path,
+                                          run_as_root=True)
+        mock_convert.assert_called_once_with(mock.sentinel.cached_path,
+                                             '/dev/fake', 'raw',
+                                             out_subformat=None,
+                                             src_format='raw',
+                                             run_as_root=True,
+                                             image_id='image-id',
+                                             data=data,
+                                             disable_sparse=False)
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.check_image_format')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    def test_file_cache_miss(self, mock_temp, mock_info, mock_fetch,
+                             mock_check_format, mock_convert):
+        cache = self._mock_file_cache(None, mock.sentinel.cached_path)
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'size': 2 * units.Gi,
+                                           'disk_format': 'raw',
+                                           'container_format': 'bare',
+                                           'os_hash_value': 'abc',
+                                           'status': 'active'}
+        data = mock_info.return_value
+        data.file_format = 'raw'
+        data.backing_file = None
+        data.virtual_size = 1234
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, 'image-id',
+                                           '/dev/fake', 'raw',
+                                           mock.sentinel.bs)
+
+        mock_fetch.assert_called_once()
+        # The downloaded image is already raw, it is cached as it is
+        mock_check_format.assert_called_once_with(
+            tmp, src_format='raw', image_id='image-id', data=data,
+            run_as_root=True)
+        cache.add.assert_called_once_with('image-id.abc.raw', tmp)
+        mock_convert.assert_called_once_with(mock.sentinel.cached_path,
+                                             '/dev/fake', 'raw',
+                                             out_subformat=None,
+                                             src_format='raw',
+                                             run_as_root=True,
+                                             image_id='image-id',
+                                             data=data,
+                                             disable_sparse=False)
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    def test_file_cache_miss_converted(self, mock_temp, mock_info,
+                                       mock_fetch, mock_convert):
+        cache = self._mock_file_cache(None, mock.sentinel.cached_path)
+        staged = cache.staging_path.return_value.__enter__.return_value
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'size': 2 * units.Gi,
+                                           'disk_format': 'qcow2',
+                                           'container_format': 'bare',
+                                           'os_hash_value': 'abc',
+                                           'status': 'active'}
+        data = mock_info.return_value
+        data.file_format = 'qcow2'
+        data.backing_file = None
+        data.virtual_size = 1234
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, 'image-id',
+                                           '/dev/fake', 'raw',
+                                           mock.sentinel.bs)
+
+        cache.add.assert_called_once_with('image-id.abc.raw', staged,
+                                          move=True)
+        mock_convert.assert_has_calls([
+            mock.call(tmp, staged, 'raw', out_subformat=None,
+                      src_format='qcow2', run_as_root=True,
+                      image_id='image-id', data=data),
+            mock.call(mock.sentinel.cached_path, '/dev/fake', 'raw',
+                      out_subformat=None, src_format='raw',
+                      run_as_root=True, image_id='image-id', data=data,
+                      disable_sparse=False)])
+
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    def test_file_cache_miss_evicted(self, mock_temp, mock_info, mock_fetch,
+                                     mock_convert):
+        # Another service evicts the new entry before it is used
+        cache = self._mock_file_cache(None, None)
+        staged = cache.staging_path.return_value.__enter__.return_value
+        ctxt = mock.sentinel.context
+        ctxt.user_id = mock.sentinel.user_id
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'size': 2 * units.Gi,
+                                           'disk_format': 'qcow2',
+                                           'container_format': 'bare',
+                                           'os_hash_value': 'abc',
+                                           'status': 'active'}
+        data = mock_info.return_value
+        data.file_format = 'qcow2'
+        data.backing_file = None
+        data.virtual_size = 1234
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        image_utils.fetch_to_volume_format(ctxt, image_service, 'image-id',
+                                           '/dev/fake', 'raw',
+                                           mock.sentinel.bs)
+
+        self.assertEqual(2, cache.pin.call_count)
+        # The downloaded image is converted onto the volume instead
+        mock_convert.assert_has_calls([
+            mock.call(tmp, staged, 'raw', out_subformat=None,
+                      src_format='qcow2', run_as_root=True,
+                      image_id='image-id', data=data),
+            mock.call(tmp, '/dev/fake', 'raw', out_subformat=None,
+                      src_format='qcow2', run_as_root=True,
+                      image_id='image-id', data=data,
+                      disable_sparse=False)])
+
+
+class TestGetVirtualSizeWithoutDownload(test.TestCase):
+    def setUp(self):
+        super(TestGetVirtualSizeWithoutDownload, self).setUp()
+        self.image_meta = {'size': 1024, 'disk_format': 'qcow2',
+                           'container_format': 'bare', 'checksum': 'abc',
+                           'properties': {}}
+
+    def test_streamable(self):
+        self.flags(image_stream_to_volume=True)
+        self.image_meta['disk_format'] = 'raw'
+        self.assertEqual(1024, image_utils.get_virtual_size_without_download(
+            'image-id', self.image_meta))
+
+    def test_no_file_cache(self):
+        self.assertIsNone(image_utils.get_virtual_size_without_download(
+            'image-id', self.image_meta))
+
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    def test_file_cache(self, mock_info):
+        cache = mock.Mock(spec=file_cache.ImageFileCache)
+        self.mock_object(file_cache.ImageFileCache, 'get_default',
+                         return_value=cache)
+        mock_info.return_value.virtual_size = 4096
+
+        self.assertEqual(4096, image_utils.get_virtual_size_without_download(
+            'image-id', self.image_meta))
+        cache.find.assert_called_once_with('image-id', self.image_meta)
+        mock_info.assert_called_once_with(cache.find.return_value)
+
+        # Signed images are downloaded to verify their signature
+        self.image_meta['properties']['img_signature'] = 'signature'
+        self.assertIsNone(image_utils.get_virtual_size_without_download(
+            'image-id', self.image_meta))
+
+
+@ddt.ddt
+class TestStreamToVolume(test.TestCase):
+    def setUp(self):
+        super(TestStreamToVolume, self).setUp()
+        self.flags(image_stream_to_volume=True)
+        self.context = mock.sentinel.context
+        self.image_id = fake.IMAGE_ID
+        tmp_dir = self.useFixture(fixtures.TempDir()).path
+        self.dest = os.path.join(tmp_dir, 'volume')
+        with open(self.dest, 'wb') as volume_file:
+            volume_file.truncate(units.Mi)
+        self.staging_path = os.path.join(tmp_dir, 'staging')
+
+    def _stream(self, chunks, image_size=None, size=None):
+        image_service = mock.Mock()
+        image_service.download.return_value = chunks
+        if image_size is None:
+            image_size = sum(len(chunk) for chunk in chunks)
+        image_meta = {'size': image_size, 'disk_format': 'raw',
+                      'container_format': 'bare'}
+        return image_utils.stream_to_volume(
+            self.context, image_service, self.image_id, image_meta,
+            self.dest, self.staging_path, size=size, run_as_root=False)
+
+    def _read(self, path):
+        with open(path, 'rb') as image_file:
+            return image_file.read()
+
+    @ddt.data(({}, 'raw', True),
+              ({}, 'qcow2', False),
+              ({'disk_format': 'iso'}, 'raw', True),
+              ({'disk_format': 'qcow2'}, 'raw', False),
+              ({'container_format': 'compressed'}, 'raw', False),
+              ({'size': None}, 'raw', False),
+              ({'properties': {'img_signature': 'signature'}}, 'raw', False))
+    @ddt.unpack
+    def test_is_streamable(self, meta, volume_format, expected):
+        image_meta = {'size': units.Gi, 'disk_format': 'raw',
+                      'container_format': 'bare'}
+        image_meta.update(meta)
+        self.assertEqual(expected,
+                         image_utils.is_streamable(image_meta, volume_format))
+
+    def test_is_streamable_disabled(self):
+        self.flags(image_stream_to_volume=False)
+        self.assertFalse(image_utils.is_streamable(
+            {'size': units.Gi, 'disk_format': 'raw',
+             'container_format': 'bare'}))
+
+    def test_is_streamable_throttled(self):
+        self.mock_object(throttling.Throttle, 'DEFAULT',
+                         mock.Mock(spec=throttling.BlkioCgroup))
+        self.assertFalse(image_utils.is_streamable(
+            {'size': units.Gi, 'disk_format': 'raw',
+             'container_format': 'bare'}))
+
+    @mock.patch.object(image_utils, 'STREAM_WRITE_SIZE', 1000)
+    def test_stream_to_volume(self):
+        chunks = [bytes([i]) * 300 for i in range(10)]
+
+        self.assertTrue(self._stream(chunks))
+
+        volume_data = self._read(self.dest)
+        self.assertEqual(units.Mi, len(volume_data))
+        self.assertEqual(b''.join(chunks), volume_data[:3000])
+        self.assertFalse(os.path.exists(self.staging_path))
+
+    def test_stream_to_volume_not_raw(self):
+        chunks = [b'QFI\xfb' + b'\0' * 508, b'\0' * 512]
+
+        self.assertRaises(exception.ImageUnacceptable, self._stream, chunks)
+        self.assertEqual(b'\0' * units.Mi, self._read(self.dest))
+
+    @mock.patch.object(image_utils, 'STREAM_INSPECT_LIMIT', 16)
+    def test_stream_to_volume_staged(self):
+        # The inspectors can't rule out the other formats from 16 bytes
+        chunks = [b'a' * 16, b'b' * 600]
+
+        self.assertFalse(self._stream(chunks))
+
+        self.assertEqual(b''.join(chunks), self._read(self.staging_path))
+        self.assertEqual(b'\0' * units.Mi, self._read(self.dest))
+
+    def test_stream_to_volume_too_big(self):
+        self.assertRaises(exception.ImageUnacceptable, self._stream,
+                          [b'a' * 512], image_size=2 * units.Gi, size=1)
+
+    def test_stream_to_volume_more_data(self):
+        self.assertRaises(exception.ImageDownloadFailed, self._stream,
+                          [b'a' * 512, b'b' * 512], image_size=600)
+
+    def test_stream_to_volume_less_data(self):
+        self.assertRaises(exception.ImageDownloadFailed, self._stream,
+                          [b'a' * 512, b'b' * 512], image_size=2048)
+
+    def test_stream_to_volume_download_error(self):
+        def chunks():
+            yield b'a' * 512
+            raise IOError(errno.ECONNRESET, 'Connection reset')
+
+        self.assertRaises(exception.ImageDownloadFailed, self._stream,
+                          chunks(), image_size=1024)
+
+    @mock.patch('cinder.image.image_utils._write_all',
+                side_effect=OSError(errno.EIO, 'I/O error'))
+    def test_stream_to_volume_write_error(self, mock_write):
+        self.assertRaises(exception.ImageCopyFailure, self._stream,
+                          [b'a' * 512])
+
 
 class TestXenserverUtils(test.TestCase):
     def test_is_xenserver_format(self):
@@ -17,6 +17,7 @@ from unittest import mock
 
 from cinder import manager
 from cinder import objects
+from cinder.scheduler import capability_delta
 from cinder.tests.unit import test
 
 
@@ -54,3 +55,42 @@ class TestManager(test.TestCase):
 
         self.assertEqual(set(str(r) for r in result.objects),
                          set(str(e) for e in expected))
+
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.'
+                'notify_service_capabilities')
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.'
+                'update_service_capabilities')
+    def test_publish_service_capabilities_delta(self, update_mock,
+                                                notify_mock):
+        service = manager.SchedulerDependentManager(service_name='volume')
+        service.capabilities_reporter = (
+            capability_delta.CapabilitiesReporter(10))
+        service.update_service_capabilities({'free_capacity_gb': 10})
+        service._publish_service_capabilities(mock.sentinel.context)
+        service.update_service_capabilities({'free_capacity_gb': 5})
+        service._publish_service_capabilities(mock.sentinel.context)
+        service._publish_service_capabilities(mock.sentinel.context,
+                                              full=True)
+
+        generation = service.capabilities_reporter.generation
+        self.assertEqual(
+            [mock.call(mock.sentinel.context, 'volume', service.host,
+                       {'free_capacity_gb': 10}, service.cluster,
+                       capabilities_version={'generation': generation,
+                                             'version': 1},
+                       capabilities_delta=None),
+             mock.call(mock.sentinel.context, 'volume', service.host,
+                       {'free_capacity_gb': 5}, service.cluster,
+                       capabilities_version={'generation': generation,
+                                             'version': 2},
+                       capabilities_delta={
+                           'changed': {'free_capacity_gb': 5},
+                           'removed': []}),
+             mock.call(mock.sentinel.context, 'volume', service.host,
+                       {'free_capacity_gb': 5}, service.cluster,
+                       capabilities_version={'generation': generation,
+                                             'version': 3},
+                       capabilities_delta=None)],
+            update_mock.call_args_list)
+        # Capabilities are always sent in full for usage notifications
+        self.assertEqual(3, notify_mock.call_count)
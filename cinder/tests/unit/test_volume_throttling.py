@@ -17,6 +17,7 @@
 
 from unittest import mock
 
+from cinder import exception
 from cinder.tests.unit import test
 from cinder import utils
 from cinder.volume import throttling
@@ -61,3 +62,85 @@ class ThrottleTestCase(test.TestCase):
             # a nested job ends; bps limit is resumed
             mock.call('fake_group', 'read', '253:0', 1024),
             mock.call('fake_group', 'write', '253:1', 1024)])
+
+
+@mock.patch.object(throttling.time, 'monotonic', return_value=100.0)
+class TokenBucketTestCase(test.TestCase):
+
+    def test_unlimited(self, mock_monotonic):
+        bucket = throttling.TokenBucket()
+        self.assertEqual(0, bucket.reserve(10 ** 12))
+
+    def test_reserve(self, mock_monotonic):
+        bucket = throttling.TokenBucket(100)
+        # The bucket starts empty
+        self.assertEqual(1, bucket.reserve(100))
+        # Later reservations wait for the earlier ones
+        self.assertEqual(1.5, bucket.reserve(50))
+        mock_monotonic.return_value = 103.5
+        self.assertEqual(0, bucket.reserve(100))
+        # Tokens don't accumulate over the burst
+        mock_monotonic.return_value = 200.0
+        self.assertEqual(0, bucket.reserve(100))
+        self.assertEqual(0.5, bucket.reserve(50))
+
+    def test_set_rate(self, mock_monotonic):
+        bucket = throttling.TokenBucket(100)
+        mock_monotonic.return_value = 101.0
+        bucket.set_rate(50, burst=10)
+        self.assertEqual(0, bucket.reserve(10))
+        self.assertEqual(0.2, bucket.reserve(10))
+        bucket.set_rate(0)
+        self.assertEqual(0, bucket.reserve(10))
+
+
+@mock.patch.object(throttling.time, 'sleep')
+@mock.patch.object(throttling.time, 'monotonic', return_value=100.0)
+class StreamThrottleTestCase(test.TestCase):
+
+    def test_unlimited(self, mock_monotonic, mock_sleep):
+        throttle = throttling.StreamThrottle()
+        throttle.consume('backend1', 10 ** 12)
+        mock_sleep.assert_not_called()
+
+    def test_consume_pieces(self, mock_monotonic, mock_sleep):
+        throttle = throttling.StreamThrottle(bps_limit=100)
+        throttle.consume(None, 250)
+        self.assertEqual([mock.call(1.0), mock.call(2.0), mock.call(2.5)],
+                         mock_sleep.call_args_list)
+
+    def test_consume_iops(self, mock_monotonic, mock_sleep):
+        throttle = throttling.StreamThrottle(iops_limit=10)
+        throttle.consume(None, 10 ** 12, ops=5)
+        mock_sleep.assert_called_once_with(0.5)
+
+    def test_consume_backends(self, mock_monotonic, mock_sleep):
+        throttle = throttling.StreamThrottle(bps_limit=1000,
+                                             backend_bps_limit=100)
+        throttle.consume('backend1', 100)
+        throttle.consume('backend2', 100)
+        # Each backend has its own budget within the global one
+        self.assertEqual([mock.call(1.0), mock.call(1.0)],
+                         mock_sleep.call_args_list)
+        mock_sleep.reset_mock()
+        throttle.consume('backend1', 100)
+        mock_sleep.assert_called_once_with(2.0)
+
+    def test_set_limits(self, mock_monotonic, mock_sleep):
+        throttle = throttling.StreamThrottle(backend_bps_limit=100)
+        throttle.consume('backend1', 100)
+        mock_sleep.reset_mock()
+        throttle.set_limits(bps_limit=10, backend_bps_limit=0,
+                            iops_limit=None)
+        self.assertEqual({'bps_limit': 10, 'iops_limit': 0,
+                          'backend_bps_limit': 0, 'backend_iops_limit': 0},
+                         throttle.get_limits())
+        throttle.consume('backend1', 10)
+        mock_sleep.assert_called_once_with(1.0)
+
+    def test_set_limits_invalid(self, mock_monotonic, mock_sleep):
+        throttle = throttling.StreamThrottle()
+        self.assertRaises(exception.InvalidInput, throttle.set_limits,
+                          bps_limit=-1)
+        self.assertRaises(exception.InvalidInput, throttle.set_limits,
+                          foo_limit=1)
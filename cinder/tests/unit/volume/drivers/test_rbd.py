@@ -3492,6 +3492,31 @@ class RBDTestCase(test.TestCase):
         ret = driver.get_backup_device(self.context, backup)
         self.assertEqual(ret, (self.volume_a, False))
 
+    @ddt.data(False, True)
+    @common_mocks
+    def test_get_changed_extents(self, to_snapshot):
+        image = self.mock_proxy.return_value.__enter__.return_value
+        image.size.return_value = 8 * units.Mi
+
+        def _diff_iterate(offset, length, from_snapshot, iterate_cb,
+                          whole_object=False):
+            iterate_cb(0, 4 * units.Mi, True)
+            iterate_cb(6 * units.Mi, units.Mi, False)
+
+        image.diff_iterate.side_effect = _diff_iterate
+        snapshot = self.snapshot_b if to_snapshot else None
+
+        res = self.driver.get_changed_extents(self.context, self.volume_a,
+                                              self.snapshot,
+                                              snapshot=snapshot)
+
+        self.assertEqual([[0, 4 * units.Mi], [6 * units.Mi, units.Mi]], res)
+        self.mock_proxy.assert_called_once_with(
+            self.driver, self.volume_a.name,
+            snapshot=snapshot.name if to_snapshot else None, read_only=True)
+        image.diff_iterate.assert_called_once_with(
+            0, 8 * units.Mi, self.snapshot.name, mock.ANY, whole_object=True)
+
     def _create_backup_db_entry(self, backupid, volid, size,
                                 userid=str(uuid.uuid4()),
                                 projectid=str(uuid.uuid4())):
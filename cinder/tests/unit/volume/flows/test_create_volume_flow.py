@@ -22,6 +22,7 @@ from castellan.common import exception as castellan_exc
 from castellan.tests.unit.key_manager import mock_key_manager
 import ddt
 from oslo_utils import imageutils
+from oslo_utils import units
 
 from cinder import context
 from cinder import exception
@@ -1182,6 +1183,58 @@ class CreateVolumeFlowManagerTestCase(test.TestCase):
                                                      image_meta=image_meta)
         mock_cleanup_cg.assert_called_once_with(volume)
 
+    @mock.patch('cinder.volume.flows.manager.create_volume.'
+                'CreateVolumeFromSpecTask.'
+                '_cleanup_cg_in_volume')
+    @mock.patch('cinder.volume.flows.manager.create_volume.'
+                'CreateVolumeFromSpecTask.'
+                '_handle_bootable_volume_glance_meta')
+    @mock.patch('cinder.image.image_utils.TemporaryImages.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.check_virtual_size')
+    def test_create_volume_from_streamable_image(self,
+                                                 mock_check_size,
+                                                 mock_qemu_img,
+                                                 mock_fetch_img,
+                                                 mock_handle_bootable,
+                                                 mock_cleanup_cg):
+        self.flags(image_stream_to_volume=True,
+                   verify_glance_signatures='enabled')
+        fake_db = mock.MagicMock()
+        fake_driver = mock.MagicMock()
+        fake_driver.capabilities = {}
+        fake_volume_manager = mock.MagicMock()
+        fake_cache = mock.MagicMock()
+        fake_manager = create_volume_manager.CreateVolumeFromSpecTask(
+            fake_volume_manager, fake_db, fake_driver, fake_cache)
+        fake_driver.clone_image.return_value = (None, False)
+        volume = fake_volume.fake_volume_obj(self.ctxt,
+                                             host='host@backend#pool')
+
+        fake_image_service = fake_image.FakeImageService()
+        image_id = fakes.IMAGE_ID
+        image_meta = {'id': image_id,
+                      'status': 'active',
+                      'size': units.Gi,
+                      'disk_format': 'raw',
+                      'container_format': 'bare'}
+
+        fake_db.volume_update.return_value = volume
+        fake_manager._create_from_image(self.ctxt, volume,
+                                        'abc', image_id,
+                                        image_meta, fake_image_service)
+
+        # The image is downloaded only once, by the driver
+        mock_fetch_img.assert_not_called()
+        mock_qemu_img.assert_not_called()
+        mock_check_size.assert_called_once_with(units.Gi, volume.size,
+                                                image_id)
+        fake_db.volume_glance_metadata_bulk_create.assert_called_once_with(
+            self.ctxt, volume.id, {'signature_verified': False})
+        fake_driver.copy_image_to_volume.assert_called_once_with(
+            self.ctxt, volume, fake_image_service, image_id,
+            disable_sparse=False)
+
     @mock.patch('cinder.volume.flows.manager.create_volume.'
                 'CreateVolumeFromSpecTask.'
                 '_cleanup_cg_in_volume')
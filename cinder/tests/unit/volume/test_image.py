@@ -20,9 +20,11 @@ import os
 import tempfile
 from unittest import mock
 
+import ddt
 from oslo_utils import imageutils
 from oslo_utils import units
 
+from cinder.common import constants
 from cinder.db import api as db
 from cinder import exception
 from cinder.image import image_utils
@@ -414,6 +416,7 @@ class CopyVolumeToImageTestCase(base.BaseVolumeTestCase):
             self.assertIsNotNone(cache_entry)
 
 
+@ddt.ddt
 class ImageVolumeCacheTestCase(base.BaseVolumeTestCase):
 
     def setUp(self):
@@ -425,7 +428,12 @@ class ImageVolumeCacheTestCase(base.BaseVolumeTestCase):
         opts = {
             'image_volume_cache_enabled': True,
             'image_volume_cache_max_size_gb': 100,
-            'image_volume_cache_max_count': 20
+            'image_volume_cache_max_count': 20,
+            'image_volume_cache_background_eviction': True,
+            'image_volume_cache_high_watermark': 80,
+            'image_volume_cache_low_watermark': 60,
+            'image_volume_cache_admission_policy': 'popularity',
+            'image_volume_cache_prewarm_images': [fake.IMAGE_ID],
         }
 
         def conf_get(option):
@@ -448,6 +456,133 @@ class ImageVolumeCacheTestCase(base.BaseVolumeTestCase):
         self.assertIsNotNone(manager.image_volume_cache)
         self.assertEqual(100, manager.image_volume_cache.max_cache_size_gb)
         self.assertEqual(20, manager.image_volume_cache.max_cache_size_count)
+        self.assertTrue(manager.image_volume_cache.background_eviction)
+        self.assertEqual(80, manager.image_volume_cache.high_watermark)
+        self.assertEqual(60, manager.image_volume_cache.low_watermark)
+        self.assertEqual('popularity',
+                         manager.image_volume_cache.admission_policy)
+        self.assertEqual({fake.IMAGE_ID},
+                         manager.image_volume_cache.prewarm_images)
+
+    @ddt.data((None, {'host': 'host@backend'}),
+              ('cluster@backend', {'cluster_name': 'cluster@backend'}))
+    @ddt.unpack
+    def test_evict_image_volume_cache(self, cluster, filters):
+        self.volume.host = 'host@backend'
+        self.volume.cluster = cluster
+        self.volume.image_volume_cache = mock.Mock(background_eviction=True)
+
+        self.volume._evict_image_volume_cache(self.context)
+
+        evict = self.volume.image_volume_cache.evict_over_watermark
+        evict.assert_called_once_with(self.context, **filters)
+
+    @ddt.data(('a@backend', False), ('z@backend', True))
+    @ddt.unpack
+    def test_evict_image_volume_cache_cluster(self, other_host, evicts):
+        self.volume.host = 'host@backend'
+        self.volume.cluster = 'cluster@backend'
+        self.volume.image_volume_cache = mock.Mock(background_eviction=True)
+        for host in (self.volume.host, other_host):
+            tests_utils.create_service(self.context,
+                                       {'host': host,
+                                        'binary': constants.VOLUME_BINARY,
+                                        'cluster_name': self.volume.cluster})
+
+        self.volume._evict_image_volume_cache(self.context)
+
+        # Only the first service of the cluster evicts its entries
+        evict = self.volume.image_volume_cache.evict_over_watermark
+        self.assertEqual(evicts, evict.called)
+
+    def test_evict_image_volume_cache_disabled(self):
+        self.volume.image_volume_cache = mock.Mock(background_eviction=False)
+
+        self.volume._evict_image_volume_cache(self.context)
+
+        evict = self.volume.image_volume_cache.evict_over_watermark
+        evict.assert_not_called()
+
+    def test_prewarm_image_volume_cache_task(self):
+        self.volume.image_volume_cache = mock.Mock()
+        self.mock_object(self.volume.driver.configuration, 'safe_get',
+                         return_value=[fake.IMAGE_ID])
+        mock_add = self.mock_object(self.volume, '_add_to_threadpool')
+
+        self.volume._prewarm_image_volume_cache(self.context)
+
+        mock_add.assert_called_once_with(
+            self.volume.prewarm_image_volume_cache, self.context,
+            fake.IMAGE_ID)
+
+    @mock.patch('cinder.context.get_internal_tenant_context')
+    def test_prewarm_image_volume_cache(self, mock_get_context):
+        self.volume.image_volume_cache = mock.Mock(prewarm_images=set())
+        self.mock_object(self.volume, '_get_pool_names',
+                         return_value=['pool1', 'pool2'])
+        mock_prewarm = self.mock_object(
+            self.volume, '_prewarm_image',
+            side_effect=[exception.VolumeLimitExceeded(allowed=1), None])
+
+        self.volume.prewarm_image_volume_cache(self.context, fake.IMAGE_ID)
+
+        # A failure on a pool doesn't stop the other pools from pre-warming
+        internal_context = mock_get_context.return_value
+        mock_prewarm.assert_has_calls([
+            mock.call(internal_context, fake.IMAGE_ID, 'pool1'),
+            mock.call(internal_context, fake.IMAGE_ID, 'pool2')])
+        self.assertEqual({fake.IMAGE_ID},
+                         self.volume.image_volume_cache.prewarm_images)
+
+        mock_prewarm.reset_mock(side_effect=True)
+        self.volume.prewarm_image_volume_cache(self.context, fake.IMAGE_ID,
+                                               pool='pool2')
+        mock_prewarm.assert_called_once_with(internal_context, fake.IMAGE_ID,
+                                             'pool2')
+
+    @mock.patch('cinder.context.get_internal_tenant_context',
+                return_value=None)
+    def test_prewarm_image_volume_cache_no_internal_tenant(
+            self, mock_get_context):
+        self.volume.image_volume_cache = mock.Mock(prewarm_images=set())
+        mock_prewarm = self.mock_object(self.volume, '_prewarm_image')
+
+        self.volume.prewarm_image_volume_cache(self.context, fake.IMAGE_ID)
+
+        mock_prewarm.assert_not_called()
+        self.assertEqual(set(), self.volume.image_volume_cache.prewarm_images)
+
+    @ddt.data(True, False)
+    @mock.patch('cinder.image.glance.get_remote_image_service')
+    def test_prewarm_image(self, cached, mock_get_service):
+        image_service = mock.Mock()
+        image_service.show.return_value = {'size': 2 * units.Gi + 1,
+                                           'min_disk': 1}
+        mock_get_service.return_value = (image_service, fake.IMAGE_ID)
+        self.volume.host = 'host@backend'
+        self.volume.image_volume_cache = mock.Mock()
+        self.volume.image_volume_cache.find_entry.return_value = (
+            {'volume_id': fake.VOLUME_ID} if cached else None)
+        mock_create = self.mock_object(self.volume, 'create_volume')
+        mock_delete = self.mock_object(self.volume, 'delete_volume')
+
+        self.volume._prewarm_image(self.context, fake.IMAGE_ID, 'pool')
+
+        find = self.volume.image_volume_cache.find_entry
+        volume = find.call_args[0][1]
+        self.assertEqual('host@backend#pool', volume.host)
+        self.assertEqual(3, volume.size)
+        if cached:
+            mock_create.assert_not_called()
+            mock_delete.assert_not_called()
+            return
+        mock_create.assert_called_once_with(self.context, volume,
+                                            request_spec=mock.ANY,
+                                            allow_reschedule=False)
+        self.assertEqual(fake.IMAGE_ID,
+                         mock_create.call_args[1]['request_spec'].image_id)
+        # The volume is only created to fill the cache
+        mock_delete.assert_called_once_with(self.context, volume)
 
     def test_delete_image_volume(self):
         volume_params = {
@@ -468,6 +468,33 @@ class VolumeRPCAPITestCase(test.RPCAPITestCase):
                            expected_retval=backup_device_obj,
                            version='3.0')
 
+    @ddt.data(None, 'mycluster')
+    def test_get_changed_extents(self, cluster_name):
+        self._change_cluster_name(self.fake_volume_obj, cluster_name)
+        self._test_rpc_api('get_changed_extents',
+                           rpc_method='call',
+                           server=cluster_name or self.fake_volume_obj.host,
+                           volume=self.fake_volume_obj,
+                           base_snapshot=self.fake_snapshot,
+                           snapshot=None,
+                           retval=[[0, 4096]],
+                           version='3.21')
+
+    def test_publish_service_capabilities(self):
+        self._test_rpc_api('publish_service_capabilities',
+                           rpc_method='cast',
+                           fanout=True,
+                           expected_kwargs_diff={'full': True},
+                           version='3.22')
+
+    def test_publish_service_capabilities_host(self):
+        self._test_rpc_api('publish_service_capabilities',
+                           rpc_method='cast',
+                           server='fake_host@backend',
+                           host='fake_host@backend',
+                           expected_kwargs_diff={'full': True},
+                           version='3.22')
+
     @ddt.data(None, 'mycluster')
     def test_secure_file_operations_enabled(self, cluster_name):
         self._change_cluster_name(self.fake_volume_obj, cluster_name)
@@ -690,3 +717,13 @@ class VolumeRPCAPITestCase(test.RPCAPITestCase):
                                        'disk_format': 'fake_format'},
                            image_snap='fake_snap',
                            version=version)
+
+    @ddt.data(('host@backend', None), ('cluster@backend#pool', 'pool'))
+    @ddt.unpack
+    def test_prewarm_image_volume_cache(self, backend, pool):
+        self._test_rpc_api('prewarm_image_volume_cache', rpc_method='cast',
+                           server=backend,
+                           backend=backend,
+                           image_id=fake.IMAGE_ID,
+                           expected_kwargs_diff={'pool': pool},
+                           version='3.23')
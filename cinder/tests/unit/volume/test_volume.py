@@ -2531,6 +2531,61 @@ class VolumeTestCase(base.BaseVolumeTestCase):
                           'name',
                           'description')
 
+    @mock.patch.object(QUOTAS, "rollback")
+    @mock.patch.object(QUOTAS, "commit")
+    @mock.patch.object(QUOTAS, "reserve", return_value=["RESERVATION"])
+    def test_create_volumes(self, *_unused_quota_mocks):
+        volume_api = cinder.volume.api.API()
+
+        with mock.patch.object(volume_api, 'scheduler_rpcapi') as sched:
+            volumes = volume_api.create_volumes(self.context, 3, 1, 'name',
+                                                'description',
+                                                volume_type=self.vol_type)
+
+        self.assertEqual(3, len(volumes))
+        sched.create_volume.assert_not_called()
+        sched.create_volumes.assert_called_once_with(
+            self.context, mock.ANY, mock.ANY, mock.ANY)
+        sent, request_specs, filter_properties = (
+            sched.create_volumes.call_args[0][1:])
+        self.assertEqual([v.id for v in volumes], [v.id for v in sent])
+        self.assertEqual([v.id for v in volumes],
+                         [spec.volume_id for spec in request_specs])
+        self.assertEqual(3, len(filter_properties))
+
+    @mock.patch.object(QUOTAS, "rollback")
+    @mock.patch.object(QUOTAS, "commit")
+    @mock.patch.object(QUOTAS, "reserve",
+                       side_effect=[["RESERVATION"],
+                                    exception.OverQuota(
+                                        overs=['volumes'],
+                                        usages={'volumes': {'reserved': 0,
+                                                            'in_use': 1}},
+                                        quotas={'volumes': 1})])
+    def test_create_volumes_partial(self, *_unused_quota_mocks):
+        volume_api = cinder.volume.api.API()
+
+        with mock.patch.object(volume_api, 'scheduler_rpcapi') as sched:
+            self.assertRaises(exception.VolumeLimitExceeded,
+                              volume_api.create_volumes, self.context, 2, 1,
+                              'name', 'description',
+                              volume_type=self.vol_type)
+
+        # The volume created before the failure is still scheduled
+        sched.create_volumes.assert_called_once_with(
+            self.context, mock.ANY, mock.ANY, mock.ANY)
+        self.assertEqual(1, len(sched.create_volumes.call_args[0][1]))
+
+    @ddt.data(0, -1, 'two')
+    def test_create_volumes_invalid_count(self, count):
+        volume_api = cinder.volume.api.API()
+
+        with mock.patch.object(volume_api, 'scheduler_rpcapi') as sched:
+            self.assertRaises(exception.InvalidInput,
+                              volume_api.create_volumes, self.context, count,
+                              1, 'name', 'description')
+        sched.create_volumes.assert_not_called()
+
     def test_create_volume_with_float_fails(self):
         """Test volume creation with invalid float size."""
         volume_api = cinder.volume.api.API()
@@ -102,6 +102,26 @@ QUOTAS = quota.QUOTAS
 AO_LIST = objects.VolumeAttachmentList
 
 
+class _VolumeScheduleBatch(object):
+    """Collects volume creations cast to the scheduler to send them at once.
+
+    Used in place of the scheduler RPC API when creating volumes, see
+    API.create_volumes.
+    """
+
+    def __init__(self) -> None:
+        self.volumes: list = []
+        self.request_spec_list: list = []
+        self.filter_properties_list: list = []
+
+    def create_volume(self, ctxt, volume, snapshot_id=None, image_id=None,
+                      request_spec=None, filter_properties=None,
+                      backup_id=None) -> None:
+        self.volumes.append(volume)
+        self.request_spec_list.append(request_spec)
+        self.filter_properties_list.append(filter_properties)
+
+
 class API(base.Base):
     """API for interacting with the volume manager."""
 
@@ -235,7 +255,8 @@ class API(base.Base):
                group: Optional[objects.Group] = None,
                group_snapshot=None,
                source_group=None,
-               backup: Optional[objects.Backup] = None):
+               backup: Optional[objects.Backup] = None,
+               schedule_batch: Optional[_VolumeScheduleBatch] = None):
 
         if image_id:
             context.authorize(vol_policy.CREATE_FROM_IMAGE_POLICY)
@@ -345,7 +366,7 @@ class API(base.Base):
             'backup': backup,
         }
         try:
-            sched_rpcapi = (self.scheduler_rpcapi if (
+            sched_rpcapi = ((schedule_batch or self.scheduler_rpcapi) if (
                             not cgsnapshot and not source_cg and
                             not group_snapshot and not source_group)
                             else None)
@@ -384,6 +405,52 @@ class API(base.Base):
                     self.list_availability_zones(enable_cache=True,
                                                  refresh_cache=True)
 
+    def create_volumes(self,
+                       context: context.RequestContext,
+                       count: int,
+                       size: Union[str, int],
+                       name: Optional[str],
+                       description: Optional[str],
+                       volume_type: Optional[objects.VolumeType] = None,
+                       metadata: Optional[dict] = None,
+                       availability_zone: Optional[str] = None,
+                       scheduler_hints=None) -> list[objects.Volume]:
+        """Create several identical volumes scheduled in a single request.
+
+        Each volume is created like create() does, but instead of sending
+        every volume to the scheduler on its own, they are all sent in one
+        create_volumes request, so the scheduler can filter and weigh the
+        backends once for all of them.
+
+        There is no REST API for this yet, it is only available to the
+        code calling the volume API.
+        """
+        if not strutils.is_int_like(count) or int(count) <= 0:
+            msg = _('Invalid number of volumes provided for create request: '
+                    '%s (count must be an integer greater than '
+                    'zero).') % count
+            raise exception.InvalidInput(reason=msg)
+
+        batch = _VolumeScheduleBatch()
+        volumes = []
+        try:
+            for _i in range(int(count)):
+                volumes.append(self.create(
+                    context, size, name, description,
+                    volume_type=volume_type,
+                    metadata=metadata,
+                    availability_zone=availability_zone,
+                    scheduler_hints=scheduler_hints,
+                    schedule_batch=batch))
+        finally:
+            # Volumes created before a failure, for example because the
+            # quota was exceeded, must still be scheduled.
+            if batch.volumes:
+                self.scheduler_rpcapi.create_volumes(
+                    context, batch.volumes, batch.request_spec_list,
+                    batch.filter_properties_list)
+        return volumes
+
     def revert_to_snapshot(self,
                            context: context.RequestContext,
                            volume: objects.Volume,
@@ -2747,6 +2814,37 @@ class API(base.Base):
                                    image_meta,
                                    image_snap=image_snap)
 
+    def prewarm_image_volume_cache(self,
+                                   context: context.RequestContext,
+                                   image_id: str,
+                                   host: Optional[str] = None,
+                                   cluster_name: Optional[str] = None) -> None:
+        """Add an image to the image volume cache of a backend.
+
+        The image is cached on the pool of host or cluster_name if they have
+        one, and on all the pools of the backend otherwise.
+        """
+        svc_host = host and volume_utils.extract_host(host, 'backend')
+        svc_cluster = cluster_name and volume_utils.extract_host(cluster_name,
+                                                                 'backend')
+        service = objects.Service.get_by_id(context.elevated(), None,
+                                            host=svc_host,
+                                            binary=constants.VOLUME_BINARY,
+                                            cluster_name=svc_cluster)
+        if not service.is_up:
+            LOG.error('Unable to pre-warm the image-volume cache of a '
+                      'service that is down.')
+            raise exception.ServiceUnavailable()
+
+        # Fail early on images that don't exist
+        self.image_service.show(context, image_id)
+
+        LOG.info('Pre-warming image %(image_id)s in the image-volume cache '
+                 'of %(backend)s.',
+                 {'image_id': image_id, 'backend': cluster_name or host})
+        self.volume_rpcapi.prewarm_image_volume_cache(
+            context, cluster_name or host, image_id)
+
 
 class HostAPI(base.Base):
     """Sub-set of the Volume Manager API for managing host operations."""
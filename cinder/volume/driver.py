@@ -373,6 +373,49 @@ image_opts = [
                default=0,
                help='Max number of entries allowed in the image volume cache. '
                     '0 => unlimited.'),
+    cfg.BoolOpt('image_volume_cache_background_eviction',
+                default=False,
+                help='Evict image volume cache entries of this backend in a '
+                     'periodic task, so creating new entries seldom has to '
+                     'wait for evictions. The task evicts the least recently '
+                     'used entries of the pools whose cache is over '
+                     'image_volume_cache_high_watermark percent of its '
+                     'limits, until it is under '
+                     'image_volume_cache_low_watermark percent of them. '
+                     'Entries are still evicted when creating a new entry '
+                     'would exceed the limits. In a cluster, only the up '
+                     'service with the first host name runs the task.'),
+    cfg.IntOpt('image_volume_cache_high_watermark',
+               default=90,
+               min=1,
+               max=100,
+               help='Percentage of the image volume cache limits over which '
+                    'the background eviction evicts entries.'),
+    cfg.IntOpt('image_volume_cache_low_watermark',
+               default=75,
+               min=0,
+               max=100,
+               help='Percentage of the image volume cache limits the '
+                    'background eviction evicts entries down to.'),
+    cfg.StrOpt('image_volume_cache_admission_policy',
+               default='always',
+               choices=[('always', 'Every image is cached, evicting the '
+                                   'least recently used entries.'),
+                        ('popularity', 'An image is only cached if the '
+                                       'entries it would evict are not '
+                                       'of more requested images.')],
+               help='Policy deciding which images are added to the image '
+                    'volume cache of this backend when it is full. The '
+                    'popularity of the images is the number of times they '
+                    'were requested from the cache, halving every day, '
+                    'so images used once do not evict often used ones.'),
+    cfg.ListOpt('image_volume_cache_prewarm_images',
+                default=[],
+                help='IDs of the images kept in the image volume cache of '
+                     'every pool of this backend. Missing entries are '
+                     'created every image_volume_cache_prewarm_interval '
+                     'seconds, and these images are always admitted in the '
+                     'cache. Requires the Cinder internal tenant.'),
     cfg.BoolOpt('use_multipath_for_image_xfer',
                 default=False,
                 help='Do we attach/detach volumes in cinder using multipath '
@@ -1278,6 +1321,26 @@ class BaseVD(object, metaclass=abc.ABCMeta):
             is_snapshot = False
         return (backup_device, is_snapshot)
 
+    def get_changed_extents(self, context, volume, base_snapshot,
+                            snapshot=None):
+        """Get the extents of a volume changed since a snapshot.
+
+        Lets the backup service read only the data changed since the snapshot
+        an incremental backup's parent was taken from, instead of the whole
+        volume. Drivers whose backend tracks changed blocks should override
+        this method.
+
+        :param context: the context of the caller.
+        :param volume: the volume the snapshots belong to.
+        :param base_snapshot: the snapshot to compare against.
+        :param snapshot: the snapshot to get the changes up to, or None to
+                         compare against the current contents of the volume.
+        :returns: a list of [offset, length] byte ranges, which may include
+                  unchanged data but must not miss any changed data, or None
+                  if the changes can't be determined.
+        """
+        return None
+
     def _get_backup_volume_temp_volume(self, context, backup):
         """Return a volume to do backup.
 
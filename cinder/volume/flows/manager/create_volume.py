@@ -11,6 +11,7 @@
 #    under the License.
 
 import binascii
+import contextlib
 import traceback
 import typing
 from typing import Any, Optional
@@ -987,15 +988,25 @@ class CreateVolumeFromSpecTask(flow_utils.CinderTask):
         backend_name = volume_utils.extract_host(volume.service_topic_queue)
         try:
             if not cloned:
+                # NOTE: Images that are streamed onto the volume or that
+                # are in the image file cache are not fetched beforehand,
+                # the driver downloads them at most once.
+                image_size = image_utils.get_virtual_size_without_download(
+                    image_id, image_meta)
+                prefetched = image_size is None
+                if prefetched:
+                    prefetch = image_utils.TemporaryImages.fetch(
+                        image_service, context, image_id, backend_name)
+                else:
+                    prefetch = contextlib.nullcontext()
                 try:
-                    with image_utils.TemporaryImages.fetch(
-                            image_service, context, image_id,
-                            backend_name) as tmp_image:
+                    with prefetch as tmp_image:
                         if CONF.verify_glance_signatures != 'disabled':
                             # Verify image signature via reading content from
                             # temp image, and store the verification flag if
-                            # required.
-                            verified = \
+                            # required. Images that are not prefetched are
+                            # not signed.
+                            verified = prefetched and \
                                 image_utils.verify_glance_image_signature(
                                     context, image_service,
                                     image_id, tmp_image)
@@ -1005,10 +1016,12 @@ class CreateVolumeFromSpecTask(flow_utils.CinderTask):
                         # Try to create the volume as the minimal size,
                         # then we can extend once the image has been
                         # downloaded.
-                        data = image_utils.qemu_img_info(tmp_image)
+                        if prefetched:
+                            image_size = image_utils.qemu_img_info(
+                                tmp_image).virtual_size
 
                         virtual_size = image_utils.check_virtual_size(
-                            data.virtual_size, volume.size, image_id)
+                            image_size, volume.size, image_id)
 
                         if should_create_cache_entry:
                             if virtual_size and virtual_size != original_size:
@@ -36,6 +36,7 @@ intact.
 """
 
 import functools
+import math
 import threading
 import time
 import typing
@@ -79,6 +80,7 @@ from cinder.objects import cgsnapshot
 from cinder.objects import consistencygroup
 from cinder.objects import fields
 from cinder import quota
+from cinder.scheduler import capability_delta
 from cinder import utils
 from cinder import volume as cinder_volume
 from cinder.volume import configuration as config
@@ -138,6 +140,21 @@ volume_manager_opts = [
                     'from the backend.  Be aware that generating usage '
                     'statistics is expensive for some backends, so setting '
                     'this value too low may adversely affect performance.'),
+    cfg.IntOpt('backend_stats_full_report_interval',
+               default=10,
+               min=0,
+               help='Number of consecutive reports of the backend '
+                    'capabilities to the schedulers that only contain what '
+                    'changed since the previous report, before a report '
+                    'with all the capabilities is sent again. Schedulers '
+                    'that miss a report ask for all the capabilities. Set '
+                    '0 to always send all the capabilities.'),
+    cfg.IntOpt('image_volume_cache_prewarm_interval',
+               default=3600,
+               min=60,
+               help='Time in seconds between checks that the images of '
+                    'image_volume_cache_prewarm_images are in the image '
+                    'volume cache of their backends.'),
 ]
 
 volume_backend_opts = [
@@ -270,6 +287,8 @@ class VolumeManager(manager.CleanableManager,
             self.configuration.backend_native_threads_pool_size)
         self.stats: dict = {}
         self.service_uuid = None
+        self.capabilities_reporter = capability_delta.CapabilitiesReporter(
+            CONF.backend_stats_full_report_interval)
 
         self.cluster: str
         self.host: str
@@ -355,7 +374,17 @@ class VolumeManager(manager.CleanableManager,
                 self.db,
                 cinder_volume.API(),
                 max_cache_size,
-                max_cache_entries
+                max_cache_entries,
+                background_eviction=self.driver.configuration.safe_get(
+                    'image_volume_cache_background_eviction'),
+                high_watermark=self.driver.configuration.safe_get(
+                    'image_volume_cache_high_watermark'),
+                low_watermark=self.driver.configuration.safe_get(
+                    'image_volume_cache_low_watermark'),
+                admission_policy=self.driver.configuration.safe_get(
+                    'image_volume_cache_admission_policy'),
+                prewarm_images=self.driver.configuration.safe_get(
+                    'image_volume_cache_prewarm_images'),
             )
             LOG.info('Image-volume cache enabled for host %(host)s.',
                      {'host': self.host})
@@ -1593,7 +1622,8 @@ class VolumeManager(manager.CleanableManager,
 
         image_volume = None
         try:
-            if not self.image_volume_cache.ensure_space(ctx, volume_ref):
+            if not self.image_volume_cache.ensure_space(ctx, volume_ref,
+                                                        image_id):
                 LOG.warning('Unable to ensure space for image-volume in'
                             ' cache. Will skip creating entry for image'
                             ' %(image)s on %(service)s.',
@@ -2900,10 +2930,164 @@ class VolumeManager(manager.CleanableManager,
 
     @periodic_task.periodic_task(spacing=CONF.backend_stats_polling_interval)
     def publish_service_capabilities(self,
-                                     context: context.RequestContext) -> None:
-        """Collect driver status and then publish."""
+                                     context: context.RequestContext,
+                                     full: bool = False) -> None:
+        """Collect driver status and then publish.
+
+        :param full: send all the capabilities, even if only the changes
+                     since the last report would be sent otherwise.
+        """
         self._report_driver_status(context)
-        self._publish_service_capabilities(context)
+        self._publish_service_capabilities(context, full=full)
+
+    @periodic_task.periodic_task
+    def _evict_image_volume_cache(self,
+                                  context: context.RequestContext) -> None:
+        """Evict image volume cache entries of pools over the watermark."""
+        if not (self.image_volume_cache and
+                self.image_volume_cache.background_eviction):
+            return
+
+        if self.cluster:
+            # The services of the cluster share the entries, let the first
+            # one that is up evict them
+            services = objects.ServiceList.get_all(
+                context, {'cluster_name': self.cluster,
+                          'binary': constants.VOLUME_BINARY,
+                          'is_up': True})
+            hosts = [service.host for service in services]
+            if self.host in hosts and self.host != min(hosts):
+                return
+            filters = {'cluster_name': self.cluster}
+        else:
+            filters = {'host': self.host}
+        try:
+            self.image_volume_cache.evict_over_watermark(context, **filters)
+        except exception.CinderException as e:
+            LOG.warning('Failed to evict image-volume cache entries. '
+                        'Error: %(exception)s', {'exception': e})
+
+    @periodic_task.periodic_task(
+        spacing=CONF.image_volume_cache_prewarm_interval)
+    def _prewarm_image_volume_cache(self,
+                                    context: context.RequestContext) -> None:
+        """Add the images to pre-warm to the image volume cache."""
+        if not self.image_volume_cache:
+            return
+        images = self.driver.configuration.safe_get(
+            'image_volume_cache_prewarm_images') or []
+        for image_id in images:
+            # Copying images takes long, don't hold the other periodic tasks
+            self._add_to_threadpool(self.prewarm_image_volume_cache,
+                                    context, image_id)
+
+    def prewarm_image_volume_cache(self,
+                                   ctxt: context.RequestContext,
+                                   image_id: str,
+                                   pool: Optional[str] = None) -> None:
+        """Add an image to the image volume cache before it's requested.
+
+        The image is cached on the given pool, or on all the pools of the
+        backend, and it's always admitted in the cache from then on.
+        """
+        if not self.image_volume_cache:
+            LOG.warning('Cannot pre-warm image %(image_id)s, the '
+                        'image-volume cache is disabled for host %(host)s.',
+                        {'image_id': image_id, 'host': self.host})
+            return
+
+        internal_context = context.get_internal_tenant_context()
+        if not internal_context:
+            LOG.warning('Unable to get Cinder internal context, will not '
+                        'pre-warm image %(image_id)s.',
+                        {'image_id': image_id})
+            return
+
+        self.image_volume_cache.prewarm_images.add(image_id)
+        for pool_name in [pool] if pool else self._get_pool_names():
+            try:
+                self._prewarm_image(internal_context, image_id, pool_name)
+            except exception.CinderException as e:
+                LOG.warning('Failed to pre-warm image %(image_id)s in the '
+                            'image-volume cache of pool %(pool)s. Error: '
+                            '%(exception)s',
+                            {'image_id': image_id, 'pool': pool_name,
+                             'exception': e})
+
+    def _get_pool_names(self) -> list[str]:
+        stats = self.driver.get_volume_stats(refresh=False) or {}
+        pools = [pool['pool_name'] for pool in stats.get('pools') or []]
+        if pools:
+            return pools
+        # Backends without pools are a single pool named after the backend,
+        # like the scheduler names them.
+        return [stats.get('volume_backend_name') or
+                volume_utils.extract_host(self.host, 'pool', True)]
+
+    def _prewarm_image(self,
+                       ctx: context.RequestContext,
+                       image_id: str,
+                       pool_name: str) -> None:
+        """Cache an image on a pool by creating a volume from it.
+
+        On a cache miss, creating a volume from an image adds the image to
+        the cache. The volume itself is deleted once created.
+        """
+        assert self.image_volume_cache is not None
+        image_service, image_id = glance.get_remote_image_service(ctx,
+                                                                  image_id)
+        image_meta = image_service.show(ctx, image_id)
+
+        volume_type = volume_types.get_default_volume_type(ctx)
+        # The volume has to fit the image, whose virtual size glance may
+        # not know yet.
+        size_gb = max(
+            image_meta.get('min_disk') or 0,
+            math.ceil(max(image_meta.get('virtual_size') or 0,
+                          image_meta.get('size') or 0) / units.Gi),
+            1)
+        volume = objects.Volume(
+            context=ctx,
+            host=volume_utils.append_host(self.host, pool_name),
+            cluster_name=(self.cluster and
+                          volume_utils.append_host(self.cluster, pool_name)),
+            availability_zone=self.availability_zone,
+            size=size_gb,
+            status='creating',
+            attach_status=fields.VolumeAttachStatus.DETACHED,
+            user_id=ctx.user_id,
+            project_id=ctx.project_id,
+            display_name='image-prewarm-%s' % image_id,
+            volume_type_id=volume_type['id'])
+
+        if self.image_volume_cache.find_entry(ctx, volume, image_id,
+                                              image_meta):
+            LOG.debug('Image %(image_id)s is already in the image-volume '
+                      'cache of pool %(pool)s.',
+                      {'image_id': image_id, 'pool': pool_name})
+            return
+
+        LOG.info('Pre-warming image %(image_id)s in the image-volume cache '
+                 'of pool %(pool)s.', {'image_id': image_id,
+                                       'pool': pool_name})
+        reserve_opts = {'volumes': 1, 'gigabytes': size_gb}
+        QUOTAS.add_volume_type_opts(ctx, reserve_opts,
+                                    volume.volume_type_id)
+        reservations = QUOTAS.reserve(ctx, **reserve_opts)
+        try:
+            volume.create()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                QUOTAS.rollback(ctx, reservations)
+        QUOTAS.commit(ctx, reservations)
+
+        try:
+            self.create_volume(ctx, volume,
+                               request_spec=objects.RequestSpec(
+                                   image_id=image_id),
+                               allow_reschedule=False)
+        finally:
+            self.delete_volume(ctx, volume)
 
     def _notify_about_volume_usage(self,
                                    context: context.RequestContext,
@@ -4858,6 +5042,17 @@ class VolumeManager(manager.CleanableManager,
             # so we fallback to returning the value itself.
             return backup_device
 
+    def get_changed_extents(
+            self,
+            ctxt: context.RequestContext,
+            volume: objects.Volume,
+            base_snapshot: objects.Snapshot,
+            snapshot: Optional[objects.Snapshot] = None) -> Optional[list]:
+        """Return the extents of a volume changed since base_snapshot."""
+        utils.require_driver_initialized(self.driver)
+        return self.driver.get_changed_extents(ctxt, volume, base_snapshot,
+                                               snapshot=snapshot)
+
     def secure_file_operations_enabled(
             self,
             ctxt: context.RequestContext,
@@ -140,9 +140,13 @@ class VolumeAPI(rpc.RPCAPI):
         3.18 - Add reimage method
         3.19 - Add extend_volume_completion method
         3.20 - Add image_snap parameter to reimage method
+        3.21 - Add get_changed_extents method
+        3.22 - Add full parameter to publish_service_capabilities, and allow
+               sending it to a single host
+        3.23 - Add prewarm_image_volume_cache method
     """
 
-    RPC_API_VERSION = '3.20'
+    RPC_API_VERSION = '3.23'
     RPC_DEFAULT_VERSION = '3.0'
     TOPIC = constants.VOLUME_TOPIC
     BINARY = constants.VOLUME_BINARY
@@ -258,9 +262,17 @@ class VolumeAPI(rpc.RPCAPI):
         else:
             cctxt.cast(ctxt, 'remove_export', volume_id=volume.id)
 
-    def publish_service_capabilities(self, ctxt):
-        cctxt = self._get_cctxt(fanout=True)
-        cctxt.cast(ctxt, 'publish_service_capabilities')
+    def publish_service_capabilities(self, ctxt, host=None):
+        """Ask volume services to send all their capabilities.
+
+        Asks all the services, or only the one of the given host.
+        """
+        if self.client.can_send_version('3.22'):
+            cctxt = self._get_cctxt(host, version='3.22', fanout=not host)
+            cctxt.cast(ctxt, 'publish_service_capabilities', full=True)
+        else:
+            cctxt = self._get_cctxt(host, fanout=not host)
+            cctxt.cast(ctxt, 'publish_service_capabilities')
 
     def accept_transfer(self, ctxt, volume, new_user, new_project,
                         no_snapshots=False):
@@ -386,6 +398,12 @@ class VolumeAPI(rpc.RPCAPI):
                                                                  ctxt)
         return backup_obj
 
+    @rpc.assert_min_rpc_version('3.21')
+    def get_changed_extents(self, ctxt, volume, base_snapshot, snapshot=None):
+        cctxt = self._get_cctxt(volume.service_topic_queue, version='3.21')
+        return cctxt.call(ctxt, 'get_changed_extents', volume=volume,
+                          base_snapshot=base_snapshot, snapshot=snapshot)
+
     def secure_file_operations_enabled(self, ctxt, volume):
         cctxt = self._get_cctxt(volume.service_topic_queue)
         return cctxt.call(ctxt, 'secure_file_operations_enabled',
@@ -553,3 +571,10 @@ class VolumeAPI(rpc.RPCAPI):
                        image_snap=image_snap)
         else:
             cctxt.cast(ctxt, 'reimage', volume=volume, image_meta=image_meta)
+
+    @rpc.assert_min_rpc_version('3.23')
+    def prewarm_image_volume_cache(self, ctxt, backend, image_id):
+        """Add an image to the image volume cache of a backend or pool."""
+        cctxt = self._get_cctxt(backend, version='3.23')
+        cctxt.cast(ctxt, 'prewarm_image_volume_cache', image_id=image_id,
+                   pool=volume_utils.extract_host(backend, 'pool'))
@@ -17,11 +17,14 @@
 
 
 import contextlib
+import threading
+import time
 
 from oslo_concurrency import processutils
 from oslo_log import log as logging
 
 from cinder import exception
+from cinder.i18n import _
 import cinder.privsep.cgroup
 from cinder import utils
 
@@ -127,3 +130,115 @@ class BlkioCgroup(Throttle):
             yield {'prefix': ['cgexec', '-g', 'blkio:%s' % self.cgroup]}
         finally:
             self._dec_device(srcdev, dstdev)
+
+
+class TokenBucket(object):
+    """Token bucket limiting the rate of in-process operations.
+
+    The rate is in units, such as bytes or operations, per second, and 0
+    means unlimited.  Units are reserved in the order they are requested, so
+    concurrent users of a bucket share its rate fairly.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate, burst defaults to one second worth of units."""
+        with self._lock:
+            self.rate = rate
+            self.burst = burst or rate
+            self._tokens = min(self._tokens, self.burst)
+
+    def reserve(self, amount):
+        """Reserve amount units and return the seconds to wait for them."""
+        with self._lock:
+            if not self.rate:
+                return 0
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class StreamThrottle(object):
+    """Limit the bandwidth and IOPS of in-process data streams.
+
+    Each stream belongs to a backend and is limited both by a global budget
+    and by the budget of its backend.  Large transfers are accounted in
+    pieces of at most one second worth of bandwidth, so concurrent streams
+    interleave instead of waiting for each other's whole transfers.
+    """
+
+    LIMITS = ('bps_limit', 'iops_limit', 'backend_bps_limit',
+              'backend_iops_limit')
+
+    def __init__(self, bps_limit=0, iops_limit=0, backend_bps_limit=0,
+                 backend_iops_limit=0):
+        self._lock = threading.Lock()
+        self._limits = dict.fromkeys(self.LIMITS, 0)
+        self._bps = TokenBucket()
+        self._iops = TokenBucket()
+        self._backends = {}
+        self.set_limits(bps_limit=bps_limit, iops_limit=iops_limit,
+                        backend_bps_limit=backend_bps_limit,
+                        backend_iops_limit=backend_iops_limit)
+
+    def set_limits(self, **limits):
+        """Change some of the limits, None values are ignored."""
+        for name, value in limits.items():
+            if name not in self.LIMITS:
+                raise exception.InvalidInput(
+                    reason=_('Unknown throttle limit %s.') % name)
+            if value is not None and value < 0:
+                raise exception.InvalidInput(
+                    reason=_('Throttle limit %s must not be negative.') % name)
+        with self._lock:
+            self._limits.update((name, value)
+                                for name, value in limits.items()
+                                if value is not None)
+            self._bps.set_rate(self._limits['bps_limit'])
+            self._iops.set_rate(self._limits['iops_limit'])
+            for bps, iops in self._backends.values():
+                bps.set_rate(self._limits['backend_bps_limit'])
+                iops.set_rate(self._limits['backend_iops_limit'])
+
+    def get_limits(self):
+        with self._lock:
+            return dict(self._limits)
+
+    def _get_buckets(self, backend):
+        with self._lock:
+            buckets = [(self._bps, self._iops)]
+            if backend is not None:
+                if backend not in self._backends:
+                    self._backends[backend] = (
+                        TokenBucket(self._limits['backend_bps_limit']),
+                        TokenBucket(self._limits['backend_iops_limit']))
+                buckets.append(self._backends[backend])
+            return buckets
+
+    def consume(self, backend, nbytes, ops=1):
+        """Wait until nbytes in ops operations fit the backend's budgets."""
+        buckets = self._get_buckets(backend)
+        delay = max(iops.reserve(ops) for _bps, iops in buckets)
+        while True:
+            piece = nbytes
+            for bps, _iops in buckets:
+                if bps.rate:
+                    piece = min(piece, bps.burst)
+            nbytes -= piece
+            delay = max([delay] +
+                        [bps.reserve(piece) for bps, _iops in buckets])
+            if delay > 0:
+                time.sleep(delay)
+            if nbytes <= 0:
+                break
+            delay = 0
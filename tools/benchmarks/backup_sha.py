@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the sha256 block hashing of chunked backup drivers.
+
+Hashes a chunk of random data with several backup_sha_block_size_bytes and
+backup_sha_workers values, to help choosing them for a backup node:
+
+    python tools/benchmarks/backup_sha.py --chunk-mb 64 \
+        --block-kb 4,32,256,1024 --workers 1,2,4
+"""
+
+import argparse
+import hashlib
+import os
+import time
+
+from cinder.backup import chunkeddriver
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def _best_time(func, repeat):
+    best = None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk-mb', type=int, default=64,
+                        help='Size of the hashed chunk in MiB.')
+    parser.add_argument('--block-kb', type=_int_list, default=[4, 32, 256],
+                        help='Comma separated block sizes in KiB.')
+    parser.add_argument('--workers', type=_int_list, default=[1, 2, 4],
+                        help='Comma separated numbers of workers.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of each case, the best one is reported.')
+    args = parser.parse_args()
+
+    data = os.urandom(args.chunk_mb * 1024 * 1024)
+    size_mb = len(data) / (1024 * 1024)
+
+    baseline = _best_time(lambda: hashlib.sha256(data).hexdigest(),
+                          args.repeat)
+    print('%-12s %-8s %10s %10s %12s' % ('block size', 'workers', 'seconds',
+                                         'MiB/s', 'vs 1 block'))
+    print('%-12s %-8s %10.4f %10.1f %12s' % ('whole chunk', 1, baseline,
+                                             size_mb / baseline, '1.00x'))
+    for block_kb in args.block_kb:
+        for workers in args.workers:
+            with chunkeddriver._BlockHasher(block_kb * 1024,
+                                            workers) as hasher:
+                elapsed = _best_time(lambda: hasher.calculate(data),
+                                     args.repeat)
+            print('%-12s %-8d %10.4f %10.1f %11.2fx' % (
+                '%d KiB' % block_kb, workers, elapsed, size_mb / elapsed,
+                elapsed / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#! /usr/bin/env python3
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the CapacityWeigher on synthetic pools.
+
+Weighs the pools that passed the filters of a request, computing their
+virtual free capacity on every request as the weigher used to do, and
+reading the values computed when the pool stats were updated:
+
+    python tools/benchmarks/scheduler_capacity_weigher.py --pools 10000 \
+        --filtered 0.5
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from cinder import objects
+# The scheduler modules need the objects registered to be imported
+objects.register_all()
+from cinder.scheduler import base_weight  # noqa: E402
+from cinder.scheduler import host_manager  # noqa: E402
+from cinder.scheduler import sched_utils  # noqa: E402
+from cinder.scheduler import weights  # noqa: E402
+from cinder.scheduler.weights import capacity  # noqa: E402
+
+
+def _best_time(func, repeat):
+    best = None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _pool_states(count):
+    timestamp = datetime.datetime.utcnow()
+    pools = []
+    for i in range(count):
+        total = random.randint(1024, 102400)
+        pool = host_manager.PoolState('host%d@backend' % (i // 10), None,
+                                      None, 'pool%d' % i)
+        pool.update_from_volume_capability({
+            'total_capacity_gb': total,
+            'free_capacity_gb': random.randint(0, total),
+            'provisioned_capacity_gb': random.randint(0, total * 2),
+            'reserved_percentage': random.choice([0, 5, 10]),
+            'thin_provisioning_support': random.choice([True, False]),
+            'max_over_subscription_ratio': random.choice([1.0, 2.0, 20.0]),
+            'timestamp': timestamp})
+        pools.append(pool)
+    return pools
+
+
+def _recomputed_weights(pools, weight_properties):
+    """Weigh the pools computing their virtual free capacity."""
+    vol_type = weight_properties.get('volume_type', {}) or {}
+    thin = vol_type.get('extra_specs', {}).get(
+        'provisioning:type') != 'thick'
+    weighed = [weights.WeighedHost(pool, 0.0) for pool in pools]
+    free = [sched_utils.calculate_virtual_free_capacity(
+        pool.total_capacity_gb, pool.free_capacity_gb,
+        pool.provisioned_capacity_gb, pool.thin_provisioning_support,
+        pool.max_over_subscription_ratio, pool.reserved_percentage, thin)
+        for pool in pools]
+    for obj, weight in zip(weighed, base_weight.normalize(free)):
+        obj.weight = weight
+    weighed.sort(key=lambda x: x.weight, reverse=True)
+    return weighed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pools', type=int, default=10000,
+                        help='Number of pools reported to the scheduler.')
+    parser.add_argument('--filtered', type=float, default=1.0,
+                        help='Fraction of the pools that passed the '
+                             'filters and are weighed.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs of each case, the best one is reported.')
+    args = parser.parse_args()
+
+    pools = _pool_states(args.pools)
+    filtered = random.sample(pools, int(args.pools * args.filtered))
+    weight_properties = {'size': 1, 'volume_type': {'extra_specs': {}}}
+    handler = base_weight.BaseWeightHandler(weights.BaseHostWeigher,
+                                            'cinder.scheduler.weights')
+
+    def recomputed():
+        _recomputed_weights(filtered, weight_properties)
+
+    def precomputed():
+        handler.get_weighed_objects([capacity.CapacityWeigher], filtered,
+                                    weight_properties)
+
+    print('%-12s %10s %14s %10s' % ('path', 'seconds', 'us per pool',
+                                    'speedup'))
+    baseline = _best_time(recomputed, args.repeat)
+    elapsed = _best_time(precomputed, args.repeat)
+    for name, seconds in (('recomputed', baseline),
+                          ('precomputed', elapsed)):
+        print('%-12s %10.4f %14.2f %9.1fx' % (
+            name, seconds, seconds * 1e6 / max(len(filtered), 1),
+            baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
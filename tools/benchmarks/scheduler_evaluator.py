@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the evaluation of scheduler filter and goodness functions.
+
+Evaluates an expression for a number of pools, parsing it for every pool as
+the scheduler used to do, and reusing the cached parsed expression:
+
+    python tools/benchmarks/scheduler_evaluator.py --pools 1000 \
+        --expression "stats.free_capacity_gb > volume.size * 2"
+"""
+
+import argparse
+import random
+import time
+
+from cinder.scheduler.evaluator import evaluator
+
+
+DEFAULT_EXPRESSION = ('stats.free_capacity_gb > volume.size * 2 and '
+                      'capabilities.max_over_subscription_ratio >= 1.5 ? '
+                      'max(100 - stats.allocated_capacity_gb / 10, 0) : 0')
+
+
+def _best_time(func, repeat):
+    best = None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _pool_variables(count):
+    pools = []
+    for _i in range(count):
+        pools.append({
+            'stats': {'free_capacity_gb': random.randint(0, 1000),
+                      'allocated_capacity_gb': random.randint(0, 1000)},
+            'capabilities': {'max_over_subscription_ratio':
+                             random.choice([1.0, 2.0, 20.0])},
+            'volume': {'size': random.randint(1, 100)},
+        })
+    return pools
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pools', type=int, default=1000,
+                        help='Number of pools the expression is evaluated '
+                             'for.')
+    parser.add_argument('--expression', default=DEFAULT_EXPRESSION,
+                        help='Filter or goodness function to evaluate.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs of each case, the best one is reported.')
+    args = parser.parse_args()
+
+    pools = _pool_variables(args.pools)
+    parse = evaluator._parse_expression.__wrapped__
+
+    def uncached():
+        for variables in pools:
+            parse(args.expression).eval(variables)
+
+    def cached():
+        for variables in pools:
+            evaluator.evaluate(args.expression, **variables)
+
+    print('%-10s %10s %14s %10s' % ('path', 'seconds', 'us per pool',
+                                    'speedup'))
+    baseline = _best_time(uncached, args.repeat)
+    elapsed = _best_time(cached, args.repeat)
+    for name, seconds in (('parse', baseline), ('cached', elapsed)):
+        print('%-10s %10.4f %14.1f %9.1fx' % (
+            name, seconds, seconds * 1e6 / args.pools, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark drawing distinct backends with the stochastic weight handler.
+
+Draws k distinct pools out of weighed pools, scanning the cumulative weights
+of the pools left for every draw, and with the cumulative weights tree
+StochasticWeighedObjectList draws the pools of a batch with:
+
+    python tools/benchmarks/scheduler_stochastic_sample.py --pools 10000 \
+        --draws 100
+"""
+
+import argparse
+import random
+import time
+
+from cinder import objects
+# The scheduler modules need the objects registered to be imported
+objects.register_all()
+from cinder.scheduler.weights import stochastic  # noqa: E402
+
+
+def _best_time(func, repeat):
+    best = None
+    for _i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _linear_sample(weights, k):
+    """Draw k distinct indexes scanning the weights for every draw."""
+    weights = list(weights)
+    drawn = []
+    for _i in range(k):
+        total = sum(weights)
+        winning_value = random.random() * total
+        cumulative = 0.0
+        for index, weight in enumerate(weights):
+            cumulative += weight
+            if cumulative > winning_value:
+                break
+        drawn.append(index)
+        weights[index] = 0.0
+    return drawn
+
+
+def _tree_sample(weights, k):
+    """Draw k distinct indexes with the cumulative weights tree."""
+    tree = stochastic.CumulativeWeights(weights)
+    drawn = []
+    for _i in range(k):
+        index = tree.find(random.random() * tree.total)
+        drawn.append(index)
+        tree.set(index, 0.0)
+    return drawn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pools', type=int, default=10000,
+                        help='Number of weighed pools.')
+    parser.add_argument('--draws', type=int, default=100,
+                        help='Number of distinct pools to draw.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs of each case, the best one is reported.')
+    args = parser.parse_args()
+
+    weights = [random.uniform(0, 100) for _i in range(args.pools)]
+    draws = min(args.draws, args.pools)
+
+    print('%-8s %10s %14s %10s' % ('path', 'seconds', 'us per draw',
+                                   'speedup'))
+    baseline = _best_time(lambda: _linear_sample(weights, draws),
+                          args.repeat)
+    elapsed = _best_time(lambda: _tree_sample(weights, draws), args.repeat)
+    for name, seconds in (('linear', baseline), ('tree', elapsed)):
+        print('%-8s %10.4f %14.2f %9.1fx' % (
+            name, seconds, seconds * 1e6 / draws, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()